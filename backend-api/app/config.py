@@ -49,6 +49,8 @@ class Settings(BaseSettings):
     MEDIA_MEMORY_LIMIT_GB: float = Field(default=10.0, gt=0, le=1024)
     MAX_BATCH_FILES: int = Field(default=200)
     BATCH_METADATA_TTL_HOURS: int = Field(default=24)
+    # Upload and Folder Watch probes share a dedicated pool of this size.
+    PROBE_CONCURRENCY: int = Field(default=2, ge=1, le=64)
 
     # --- Worker ---
     # ``auto`` selects a conservative count from live CPU/RAM/GPU capacity;
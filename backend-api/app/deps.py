@@ -17,12 +17,14 @@ import threading
 import time
 import uuid
 from pathlib import Path
+from typing import Any, Awaitable, Callable
 
 import orjson
 import psutil
 from fastapi import HTTPException, UploadFile
 from redis.asyncio import Redis
 
+from shared import container_probe, probe_cache
 from shared.subprocess_utils import hidden_process_kwargs
 from shared.concurrency import resolve_worker_concurrency
 
@@ -501,26 +503,66 @@ def _parse_finite_float(value: object) -> float | None:
     return parsed if math.isfinite(parsed) else None
 
 
-def ffprobe(input_path: Path) -> dict:
-    cmd = [
-        "ffprobe", "-v", "error",
-        "-show_entries",
-        "format=duration:stream=index,codec_type,codec_name,bit_rate,width,height,avg_frame_rate,r_frame_rate",
-        "-of", "json",
-        str(input_path),
-    ]
+def _probe_json(input_path: Path) -> Any:
+    """Run the worker's tiered probe (reduced fallback) and share the result."""
     try:
         proc = subprocess.run(
-            cmd, capture_output=True, text=True, timeout=30, **hidden_process_kwargs()
+            probe_cache.header_probe_command(str(input_path)), capture_output=True, text=True,
+            timeout=45, **hidden_process_kwargs(),
         )
     except subprocess.TimeoutExpired as exc:
         raise RuntimeError("ffprobe timed out while analyzing the upload") from exc
-    if proc.returncode != 0:
-        raise RuntimeError(proc.stderr)
+    if proc.returncode == 0:
+        try:
+            data = json.loads(proc.stdout)
+        except json.JSONDecodeError:
+            data = None
+        if probe_cache.deep_probe_reason(data) is None:
+            probe_cache.put(input_path, data, complete=True, tier="header")
+            return data
+    try:
+        proc = subprocess.run(
+            probe_cache.full_probe_command(str(input_path)), capture_output=True, text=True,
+            timeout=45, **hidden_process_kwargs(),
+        )
+    except subprocess.TimeoutExpired as exc:
+        raise RuntimeError("ffprobe timed out while analyzing the upload") from exc
+    complete = proc.returncode == 0
+    if not complete:
+        cmd = [
+            "ffprobe", "-v", "error",
+            "-show_entries",
+            "format=duration:stream=index,codec_type,codec_name,bit_rate,width,height,avg_frame_rate,r_frame_rate",
+            "-of", "json",
+            str(input_path),
+        ]
+        try:
+            proc = subprocess.run(
+                cmd, capture_output=True, text=True, timeout=30, **hidden_process_kwargs()
+            )
+        except subprocess.TimeoutExpired as exc:
+            raise RuntimeError("ffprobe timed out while analyzing the upload") from exc
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr)
     try:
         data = json.loads(proc.stdout)
     except json.JSONDecodeError as exc:
         raise RuntimeError("ffprobe returned invalid JSON") from exc
+    if isinstance(data, dict):
+        probe_cache.put(input_path, data, complete=complete, tier="deep" if complete else "reduced")
+    return data
+
+
+def ffprobe(input_path: Path) -> dict:
+    data = container_probe.probe(input_path)
+    if data is None:
+        cached = probe_cache.get(input_path)
+        data = cached["data"] if cached is not None else _probe_json(input_path)
+    return summarize_probe(data)
+
+
+def summarize_probe(data: Any) -> dict:
+    """Reduce ffprobe-shaped JSON to the fields the upload estimate needs."""
     if not isinstance(data, dict):
         raise RuntimeError("ffprobe returned an unexpected JSON shape")
     duration = _parse_finite_float((data.get("format") or {}).get("duration"))
@@ -592,6 +634,7 @@ async def save_upload_file(
     destination: Path,
     *,
     allow_dynamic_storage: bool = False,
+    on_chunk: Callable[[bytes], Awaitable[None]] | None = None,
 ) -> Path:
     reservation: int | None = None
     if allow_dynamic_storage:
@@ -636,6 +679,8 @@ async def save_upload_file(
                         detail=f"File too large. Max size: {MAX_UPLOAD_SIZE_BYTES // (1024 * 1024)}MB",
                     )
                 out.write(chunk)
+                if on_chunk is not None:
+                    await on_chunk(chunk)
     except HTTPException:
         # The file handle must be closed before unlinking on Windows.  Keeping
         # cleanup outside the ``with`` block also guarantees a partial upload
@@ -16,7 +16,7 @@ import uuid
 from pathlib import Path
 from typing import Any
 
-from . import settings_manager
+from . import probe_scheduler, settings_manager
 from .celery_app import celery_app
 from .deps import VIDEO_EXTENSIONS, build_output_name, ffprobe, store_job_metadata
 
@@ -193,7 +193,7 @@ class FolderWatchService:
         profile = next((item for item in profiles.get('profiles', []) if item.get('name') == profile_name), None)
         if profile is None:
             raise RuntimeError('Folder Watch has no valid compression profile')
-        await asyncio.to_thread(ffprobe, path)
+        await probe_scheduler.run(ffprobe, path, probe_scheduler.FOLDER_WATCH)
 
         fingerprint = (int(stat.st_size), int(stat.st_mtime_ns))
         task_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f'8mblocal-folder-watch:{_key(path)}:{fingerprint[0]}:{fingerprint[1]}'))
@@ -239,6 +239,8 @@ class FolderWatchService:
                     'preset': str(profile.get('preset', 'p4')),
                     'tune': str(profile.get('tune', 'hq')),
                     'max_output_fps': profile.get('max_output_fps'),
+                    'frame_decimation': profile.get('frame_decimation'),
+                    'fallback_preset': profile.get('fallback_preset'),
                 },
             )
         except Exception:
@@ -260,7 +262,7 @@ class FolderWatchService:
             if state == 'SUCCESS':
                 output = Path(record['output_path'])
                 try:
-                    await asyncio.to_thread(ffprobe, output)
+                    await probe_scheduler.run(ffprobe, output, probe_scheduler.RECONCILE)
                     if not output.exists() or output.stat().st_size <= 0:
                         raise RuntimeError('validated output is empty')
                     await asyncio.to_thread(self._apply_original_behavior, Path(record['input_path']), output)
@@ -13,6 +13,17 @@ class UploadResponse(BaseModel):
     estimate_total_kbps: float
     estimate_video_kbps: float
     warn_low_quality: bool
+    # True for the early answer read from the container header mid-upload.
+    provisional: bool = False
+
+class CompressTarget(BaseModel):
+    """One output of a multi-target request."""
+    target_size_mb: float = Field(gt=0, le=51200)
+    # None keeps the request's video_codec.
+    video_codec: Optional[str] = None
+    # Output height cap for this target (e.g. 720); None keeps the request's scaling.
+    target_resolution: Optional[int] = Field(default=None, gt=0, le=16384)
+
 
 class CompressRequest(BaseModel):
     job_id: str
@@ -41,6 +52,34 @@ class CompressRequest(BaseModel):
     audio_only: Optional[bool] = False        # Convert to audio-only output (.m4a) ignoring video settings
     # When set (>0), output frame rate is capped to this value if the source is faster (no increase for low-fps sources).
     max_output_fps: Optional[float] = Field(default=None, ge=0, le=1000)
+    # Halve (or divide further) the frame rate of high-fps sources when the budget leaves too few
+    # bits per pixel per frame at the output size. A lower max_output_fps still applies.
+    auto_fps: Optional[bool] = False
+    # Detect stable black borders on a few sampled seconds and crop them before scaling.
+    # None keeps the worker default (AUTO_CROP environment variable).
+    auto_crop: Optional[bool] = None
+    # Drop repeated frames (mpdecimate) and write variable frame rate: 'on', 'off', or 'auto' when
+    # the content analysis finds mostly repeated frames. None keeps the worker default (FRAME_DECIMATION).
+    frame_decimation: Optional[Literal['auto', 'on', 'off']] = None
+    # CPU encoders only: encode keyframe-aligned segments concurrently and join them losslessly.
+    # None keeps the worker default (SEGMENT_PARALLEL environment variable).
+    segment_parallel: Optional[bool] = None
+    # Size-target mode: encode a few short samples first and pick the CRF/CQ value or bitrate
+    # that lands on target. None keeps the worker default (CALIBRATION environment variable).
+    calibrate: Optional[bool] = None
+    # libx264/libx265 only: two-pass ABR; pass-1 statistics are reused by retries and later jobs
+    # on the same source. None keeps the worker default (TWO_PASS environment variable).
+    two_pass: Optional[bool] = None
+    # Finish within this many minutes: the worker picks the slowest preset whose measured
+    # throughput for this encoder and resolution fits, instead of the requested one.
+    deadline_minutes: Optional[float] = Field(default=None, gt=0, le=10080)
+    # CPU preset when a hardware encoder falls back to the CPU: 'auto' sizes it to the hardware
+    # encoder's expected speed, 'keep' reuses the requested level, 'p1'..'p7' pin it.
+    # None keeps the worker default (CPU_FALLBACK_PRESET environment variable).
+    fallback_preset: Optional[Literal['auto', 'keep', 'p1', 'p2', 'p3', 'p4', 'p5', 'p6', 'p7']] = None
+    # Several size targets encoded from one decode of the source; each output gets its own
+    # task ID, download URL and history row. Replaces target_size_mb when set.
+    targets: Optional[list[CompressTarget]] = Field(default=None, min_length=1, max_length=4)
 
 class StatusResponse(BaseModel):
     state: str
@@ -59,9 +98,15 @@ class StatusResponse(BaseModel):
     render_device: Optional[str] = None
     hardware_device: Optional[str] = None
     decoder: Optional[dict] = None
+    # Structured records for optional encode optimizations (segment plans,
+    # size models, fast paths); keyed by optimization name.
+    optimizations: Optional[dict] = None
 
 class ProgressEvent(BaseModel):
-    type: Literal['progress','log','done','error','retry','canceled','connected','ping','telemetry']
+    type: Literal[
+        'progress','log','done','error','retry','canceled','connected','ping','telemetry',
+        'size_projection','early_abort',
+    ]
     task_id: str
     progress: Optional[float] = None
     message: Optional[str] = None
@@ -69,6 +114,11 @@ class ProgressEvent(BaseModel):
     telemetry: Optional[dict] = None
     phase: Optional[str] = None
     download_url: Optional[str] = None
+    # size_projection / early_abort: projected output size during a pass.
+    done_fraction: Optional[float] = None
+    projected_mb: Optional[float] = None
+    target_mb: Optional[float] = None
+    time_saved_s: Optional[float] = None
 
 class AuthSettings(BaseModel):
     auth_enabled: bool
@@ -134,6 +184,10 @@ class PresetProfile(BaseModel):
     container: Literal['mp4','mkv']
     tune: Literal['hq','ll','ull','lossless']
     max_output_fps: Optional[float] = Field(default=None, ge=0, le=1000)
+    # 'auto' lets the worker decimate repeated frames when the source is mostly static.
+    frame_decimation: Optional[Literal['auto', 'on', 'off']] = None
+    # CPU preset policy if this profile's hardware encoder falls back to the CPU.
+    fallback_preset: Optional[Literal['auto', 'keep', 'p1', 'p2', 'p3', 'p4', 'p5', 'p6', 'p7']] = None
 
 
 class PresetProfilesResponse(BaseModel):
@@ -194,6 +248,7 @@ class JobMetadata(BaseModel):
     fallback_reason: Optional[str] = None
     hardware_type: Optional[str] = None
     decoder: Optional[dict] = None
+    optimizations: Optional[dict] = None
     # Time estimation fields
     last_progress_update: Optional[float] = None  # Timestamp of last progress update
     estimated_completion_time: Optional[float] = None  # Estimated Unix timestamp when job will complete
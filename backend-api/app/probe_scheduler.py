@@ -0,0 +1,171 @@
+"""Bounded, prioritized probe execution for the API process.
+
+Uploads, batch uploads and Folder Watch used to call
+``asyncio.to_thread(ffprobe, path)`` directly.  A burst of batch uploads
+then filled the default thread pool, which status polling, SSE replay and
+Redis helpers also use, and started one ffprobe process per file at once.
+
+Probes now run on a dedicated pool capped at ``PROBE_CONCURRENCY``.  Waiting
+requests start in priority order: interactive upload, then batch upload,
+then Folder Watch discovery, then Folder Watch output validation.  A request
+for a file that is already queued or running joins that request.  If the new
+caller has a higher priority, the queued request is promoted.
+:func:`snapshot` reports queue depth, coalescing and wait/run latency per
+class for ``/api/system/probe-scheduler``.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import os
+import statistics
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable
+
+from .config import settings
+
+INTERACTIVE = 0
+BATCH = 1
+FOLDER_WATCH = 2
+RECONCILE = 3
+PRIORITY_NAMES = {
+    INTERACTIVE: "interactive",
+    BATCH: "batch",
+    FOLDER_WATCH: "folder_watch",
+    RECONCILE: "reconcile",
+}
+_LATENCY_SAMPLES = 256
+
+
+@dataclass
+class _Request:
+    key: tuple[Any, str]
+    fn: Callable[[Path], Any]
+    path: Path
+    priority: int
+    future: asyncio.Future
+    loop: asyncio.AbstractEventLoop
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class _ClassStats:
+    submitted: int = 0
+    coalesced: int = 0
+    completed: int = 0
+    failed: int = 0
+    wait_ms: deque = field(default_factory=lambda: deque(maxlen=_LATENCY_SAMPLES))
+    run_ms: deque = field(default_factory=lambda: deque(maxlen=_LATENCY_SAMPLES))
+
+
+def _percentiles(samples: deque) -> dict[str, float | None]:
+    if not samples:
+        return {"p50": None, "p95": None, "max": None}
+    ordered = sorted(samples)
+    return {
+        "p50": round(statistics.median(ordered), 1),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+        "max": round(ordered[-1], 1),
+    }
+
+
+class ProbeScheduler:
+    def __init__(self, concurrency: int) -> None:
+        self.concurrency = max(1, int(concurrency))
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="probe")
+        self._heap: list[tuple[int, int, _Request]] = []
+        self._queued: dict[tuple[Any, str], _Request] = {}
+        self._running: dict[tuple[Any, str], _Request] = {}
+        self._sequence = itertools.count()
+        self._stats = {priority: _ClassStats() for priority in PRIORITY_NAMES}
+        self._max_depth = 0
+
+    async def run(self, fn: Callable[[Path], Any], path: Path, priority: int = INTERACTIVE) -> Any:
+        """Run ``fn(path)`` on the probe pool and return its result."""
+        if priority not in PRIORITY_NAMES:
+            raise ValueError(f"unknown probe priority {priority!r}")
+        stats = self._stats[priority]
+        stats.submitted += 1
+        key = (fn, os.path.normcase(os.path.abspath(str(path))))
+        request = self._running.get(key) or self._queued.get(key)
+        if request is not None:
+            stats.coalesced += 1
+            if key in self._queued and priority < request.priority:
+                request.priority = priority
+                heapq.heappush(self._heap, (priority, next(self._sequence), request))
+        else:
+            loop = asyncio.get_running_loop()
+            request = _Request(key, fn, Path(path), priority, loop.create_future(), loop)
+            # Mark the result retrieved even when every waiter was cancelled.
+            request.future.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._queued[key] = request
+            heapq.heappush(self._heap, (priority, next(self._sequence), request))
+            self._max_depth = max(self._max_depth, len(self._queued))
+        self._pump()
+        # Shield the shared request from one caller's cancellation.
+        return await asyncio.shield(request.future)
+
+    def _pump(self) -> None:
+        while self._heap and len(self._running) < self.concurrency:
+            priority, _, request = heapq.heappop(self._heap)
+            if self._queued.get(request.key) is not request or priority != request.priority:
+                continue  # superseded by a promotion
+            del self._queued[request.key]
+            self._running[request.key] = request
+            started = time.monotonic()
+            self._stats[request.priority].wait_ms.append((started - request.queued_at) * 1000.0)
+            task = request.loop.run_in_executor(self._executor, request.fn, request.path)
+            task.add_done_callback(lambda done, request=request, started=started: self._finish(request, started, done))
+
+    def _finish(self, request: _Request, started: float, done: asyncio.Future) -> None:
+        self._running.pop(request.key, None)
+        stats = self._stats[request.priority]
+        stats.run_ms.append((time.monotonic() - started) * 1000.0)
+        if done.cancelled():
+            stats.failed += 1
+            request.future.cancel()
+        elif done.exception() is not None:
+            stats.failed += 1
+            request.future.set_exception(done.exception())
+        else:
+            stats.completed += 1
+            request.future.set_result(done.result())
+        self._pump()
+
+    def snapshot(self) -> dict[str, Any]:
+        classes = {}
+        for priority, name in PRIORITY_NAMES.items():
+            stats = self._stats[priority]
+            classes[name] = {
+                "queued": sum(1 for request in self._queued.values() if request.priority == priority),
+                "running": sum(1 for request in self._running.values() if request.priority == priority),
+                "submitted": stats.submitted,
+                "coalesced": stats.coalesced,
+                "completed": stats.completed,
+                "failed": stats.failed,
+                "wait_ms": _percentiles(stats.wait_ms),
+                "run_ms": _percentiles(stats.run_ms),
+            }
+        return {
+            "concurrency": self.concurrency,
+            "queue_depth": len(self._queued),
+            "max_queue_depth": self._max_depth,
+            "running": len(self._running),
+            "classes": classes,
+        }
+
+
+scheduler = ProbeScheduler(settings.PROBE_CONCURRENCY)
+
+
+async def run(fn: Callable[[Path], Any], path: Path, priority: int = INTERACTIVE) -> Any:
+    return await scheduler.run(fn, path, priority)
+
+
+def snapshot() -> dict[str, Any]:
+    return scheduler.snapshot()
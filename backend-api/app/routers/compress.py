@@ -8,6 +8,8 @@ import uuid
 import orjson
 from fastapi import APIRouter, Depends, HTTPException
 
+from shared.constants import MULTI_TARGET_ENCODERS
+
 from ..auth import basic_auth
 from ..celery_app import celery_app
 from ..deps import (
@@ -23,7 +25,6 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["compress"])
 
-
 @router.post("/api/compress", dependencies=[Depends(basic_auth)])
 async def compress(req: CompressRequest):
     logger.debug(
@@ -38,6 +39,18 @@ async def compress(req: CompressRequest):
         logger.warning("compress: input missing: %s", input_path)
         raise HTTPException(status_code=404, detail="Input not found")
 
+    if req.targets and len(req.targets) > 1:
+        return await _compress_multi(req, input_path)
+    if req.targets:
+        # A single entry is an ordinary job with that target's settings.
+        target = req.targets[0]
+        req = req.model_copy(update={
+            "target_size_mb": target.target_size_mb,
+            "video_codec": target.video_codec or req.video_codec,
+            "target_resolution": target.target_resolution or req.target_resolution,
+            "targets": None,
+        })
+
     task_id = str(uuid.uuid4())
 
     output_name = build_output_name(input_path, task_id, req.container, bool(req.audio_only or False))
@@ -98,6 +111,14 @@ async def compress(req: CompressRequest):
                 target_resolution=req.target_resolution,
                 audio_only=bool(req.audio_only or False),
                 max_output_fps=req.max_output_fps,
+                segment_parallel=req.segment_parallel,
+                calibrate=req.calibrate,
+                two_pass=req.two_pass,
+                auto_fps=bool(req.auto_fps or False),
+                auto_crop=req.auto_crop,
+                frame_decimation=req.frame_decimation,
+                deadline_minutes=req.deadline_minutes,
+                fallback_preset=req.fallback_preset,
                 transient_input=True,
             ),
         )
@@ -121,6 +142,110 @@ async def compress(req: CompressRequest):
     return {"task_id": task.id}
 
 
+async def _compress_multi(req: CompressRequest, input_path) -> dict:
+    """Queue one decode for several targets; every output is its own job."""
+    if req.audio_only or (req.target_video_bitrate_kbps or 0) > 0:
+        raise HTTPException(
+            status_code=422,
+            detail="targets cannot be combined with audio_only or target_video_bitrate_kbps",
+        )
+    outputs = []
+    for target in req.targets:
+        codec = target.video_codec or req.video_codec
+        if codec not in MULTI_TARGET_ENCODERS:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Multi-target jobs support CPU, NVENC and AMF encoders, not {codec}",
+            )
+        output_task_id = str(uuid.uuid4())
+        output_name = build_output_name(input_path, output_task_id, req.container)
+        outputs.append({
+            "task_id": output_task_id,
+            "output_path": str(OUTPUTS_DIR / output_name),
+            "target_size_mb": target.target_size_mb,
+            "video_codec": codec,
+            "target_resolution": target.target_resolution or req.target_resolution,
+        })
+    task_ids = [output["task_id"] for output in outputs]
+    task_id = task_ids[0]
+
+    try:
+        for output in outputs:
+            await store_job_metadata(
+                output["task_id"], req.job_id, req.filename, output["target_size_mb"],
+                output["video_codec"], str(input_path), output["output_path"],
+            )
+    except Exception as exc:
+        # Same cleanup as a single job, for every record written so far.
+        for output_task_id in task_ids:
+            try:
+                await redis.delete(f"job:{output_task_id}")
+                await redis.zrem("jobs:active", output_task_id)
+            except Exception:
+                pass
+        try:
+            input_path.unlink(missing_ok=True)
+        except OSError:
+            logger.warning("compress: could not remove unqueued input %s", input_path)
+        logger.exception("compress: failed to persist queue metadata for %s", task_id)
+        raise HTTPException(status_code=500, detail="Failed to record compression job") from exc
+
+    logger.info(
+        "compress: dispatching multi-target task_id=%s targets=%s in=%s",
+        task_id, [(o["target_size_mb"], o["video_codec"]) for o in outputs], input_path.name,
+    )
+    try:
+        celery_app.send_task(
+            "worker.worker.compress_video_multi",
+            task_id=task_id,
+            kwargs=dict(
+                job_id=req.job_id,
+                input_path=str(input_path),
+                outputs=outputs,
+                audio_codec=req.audio_codec,
+                audio_bitrate_kbps=req.audio_bitrate_kbps,
+                preset=req.preset,
+                tune=req.tune,
+                max_width=req.max_width,
+                max_height=req.max_height,
+                start_time=req.start_time,
+                end_time=req.end_time,
+                max_output_fps=req.max_output_fps,
+                transient_input=True,
+            ),
+        )
+    except Exception as exc:
+        try:
+            for output_task_id in task_ids:
+                await redis.set(f"cancel:{output_task_id}", "1", ex=3600)
+            celery_app.control.revoke(task_id, terminate=False)
+        except Exception:
+            pass
+        logger.exception("compress: failed to enqueue task %s", task_id)
+        raise HTTPException(status_code=503, detail="Failed to enqueue compression job") from exc
+    for output_task_id in task_ids:
+        try:
+            await redis.publish(
+                f"progress:{output_task_id}",
+                orjson.dumps({"type": "log", "message": "Job queued – waiting for worker…"}).decode(),
+            )
+        except Exception:
+            pass
+
+    return {
+        "task_id": task_id,
+        "task_ids": task_ids,
+        "outputs": [
+            {
+                "task_id": output["task_id"],
+                "target_size_mb": output["target_size_mb"],
+                "download_url": f"/api/jobs/{output['task_id']}/download",
+            }
+            for output in outputs
+        ],
+    }
+
+
 @router.post("/api/jobs/{task_id}/cancel", dependencies=[Depends(basic_auth)])
 async def cancel_job(task_id: str):
     """Signal a running job to cancel and attempt to stop ffmpeg."""
@@ -207,6 +332,7 @@ async def queue_status():
                                 'requested_encoder', 'resolved_encoder', 'actual_encoder',
                                 'hardware_used', 'hardware_device', 'fallback_occurred',
                                 'fallback_stage', 'fallback_reason', 'hardware_type', 'decoder',
+                                'optimizations',
                             ):
                                 if meta.get(telemetry_key) is not None:
                                     setattr(job_meta, telemetry_key, meta[telemetry_key])
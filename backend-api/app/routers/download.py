@@ -108,6 +108,7 @@ async def job_status(task_id: str):
         "requested_encoder", "resolved_encoder", "actual_encoder",
         "hardware_used", "hardware_type", "hardware_device", "render_device",
         "fallback_occurred", "fallback_stage", "fallback_reason", "decoder",
+        "optimizations",
     )
     try:
         durable_raw = await redis.get(f"job:{task_id}")
@@ -148,6 +149,7 @@ async def job_status(task_id: str):
         render_device=meta.get("render_device"),
         hardware_device=meta.get("hardware_device", meta.get("render_device")),
         decoder=meta.get("decoder"),
+        optimizations=meta.get("optimizations"),
     )
 
 
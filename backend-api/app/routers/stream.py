@@ -23,6 +23,7 @@ _TELEMETRY_KEYS = (
     "requested_encoder", "resolved_encoder", "actual_encoder",
     "hardware_used", "hardware_type", "hardware_device", "render_device",
     "fallback_occurred", "fallback_stage", "fallback_reason", "decoder",
+    "optimizations",
 )
 
 
@@ -99,6 +100,11 @@ async def _sse_event_generator(task_id: str) -> AsyncGenerator[bytes, None]:
                         "task_id": task_id,
                         "telemetry": telemetry,
                     }).decode())
+        # A streaming upload may have published its header analysis before
+        # this subscriber connected.
+        provisional = await redis.get(f"upload_probe:{task_id}")
+        if provisional:
+            await queue.put(provisional)
     except Exception as exc:
         logger.debug("[SSE %s] status replay unavailable: %s", task_id[:8], exc)
 
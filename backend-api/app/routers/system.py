@@ -11,6 +11,7 @@ from pathlib import Path
 
 from fastapi import APIRouter, Depends, HTTPException
 
+from shared import overshoot_model, throughput_model
 from shared.subprocess_utils import hidden_process_kwargs
 
 from ..auth import basic_auth
@@ -27,7 +28,7 @@ from ..deps import (
     set_hw_info_cache,
     sync_codec_settings_from_tests,
 )
-from .. import settings_manager
+from .. import probe_scheduler, settings_manager
 from ..models import AvailableCodecsResponse
 
 logger = logging.getLogger(__name__)
@@ -224,6 +225,24 @@ async def system_capabilities():
     return _deps_mod.SYSTEM_CAPS_CACHE
 
 
+@router.get("/api/system/overshoot-model", dependencies=[Depends(basic_auth)])
+async def system_overshoot_model():
+    """Return the learned size-overshoot corrections and retry rates before/after them."""
+    return await asyncio.to_thread(overshoot_model.snapshot)
+
+
+@router.get("/api/system/throughput-model", dependencies=[Depends(basic_auth)])
+async def system_throughput_model():
+    """Return the measured encoder speeds and how often deadline jobs finished in time."""
+    return await asyncio.to_thread(throughput_model.snapshot)
+
+
+@router.get("/api/system/probe-scheduler", dependencies=[Depends(basic_auth)])
+async def system_probe_scheduler():
+    """Return probe queue depth, coalescing and wait/run latency per priority class."""
+    return probe_scheduler.snapshot()
+
+
 @router.get("/api/system/encoder-tests", dependencies=[Depends(basic_auth)])
 async def system_encoder_tests():
     """Return encoder startup test results and a simple summary."""
@@ -7,10 +7,14 @@ import time
 import uuid
 import asyncio
 from pathlib import Path
+from typing import Literal
 
 import orjson
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, UploadFile
 
+from shared import container_probe
+
+from .. import probe_scheduler
 from ..auth import basic_auth
 from ..celery_app import celery_app, group
 from ..deps import (
@@ -28,6 +32,7 @@ from ..deps import (
     safe_filename,
     save_upload_file,
     store_job_metadata,
+    summarize_probe,
 )
 from ..models import (
     BatchCreateResponse,
@@ -52,6 +57,10 @@ _VALID_PRESETS = frozenset({"p1", "p2", "p3", "p4", "p5", "p6", "p7", "extraqual
 _VALID_CONTAINERS = frozenset({"mp4", "mkv"})
 _VALID_TUNES = frozenset({"hq", "ll", "ull", "lossless"})
 
+# Header bytes kept in memory while waiting for moov / Tracks to land.
+_PROVISIONAL_PROBE_LIMIT = 32 * 1024 * 1024
+_PROVISIONAL_TTL_SECONDS = 600
+
 
 def _validate_batch_options(
     video_codec: str,
@@ -99,34 +108,63 @@ def _validate_batch_options(
         raise HTTPException(status_code=422, detail="max_output_fps must be between 0 and 1000")
 
 
-@router.post("/api/upload", response_model=UploadResponse, dependencies=[Depends(basic_auth)])
-async def upload(
-    file: UploadFile = File(...),
-    target_size_mb: float = Form(19.7),
-    audio_bitrate_kbps: int = Form(128),
-):
+def _validate_upload_options(target_size_mb: float, audio_bitrate_kbps: int) -> None:
     if not math.isfinite(target_size_mb) or target_size_mb <= 0 or target_size_mb > 51200:
         raise HTTPException(status_code=422, detail="target_size_mb must be between 0 and 51200")
     if audio_bitrate_kbps < 0 or audio_bitrate_kbps > 2000:
         raise HTTPException(status_code=422, detail="audio_bitrate_kbps must be between 0 and 2000")
 
-    job_id = str(uuid.uuid4())
-    safe_name = safe_filename(file.filename)
-    dest = UPLOADS_DIR / f"{job_id}_{safe_name}"
-    dest = await save_upload_file(file, dest, allow_dynamic_storage=True)
 
+def _upload_response(
+    job_id: str,
+    filename: str,
+    info: dict,
+    target_size_mb: float,
+    audio_bitrate_kbps: int,
+    *,
+    provisional: bool = False,
+) -> UploadResponse:
+    total_kbps, video_kbps, warn = calc_bitrates(target_size_mb, info["duration"], audio_bitrate_kbps)
+    if warn and not provisional:
+        logger.warning(
+            "upload: low-quality warning for job_id=%s target_mb=%s duration=%.2fs -> total=%.1fkbps video=%.1fkbps",
+            job_id, target_size_mb, info["duration"], total_kbps, video_kbps,
+        )
+    return UploadResponse(
+        job_id=job_id,
+        filename=filename,
+        duration_s=info["duration"],
+        original_video_bitrate_kbps=info["video_bitrate_kbps"],
+        original_audio_bitrate_kbps=info["audio_bitrate_kbps"],
+        original_width=info.get("width"),
+        original_height=info.get("height"),
+        original_video_fps=info.get("video_fps"),
+        estimate_total_kbps=total_kbps,
+        estimate_video_kbps=video_kbps,
+        warn_low_quality=warn,
+        provisional=provisional,
+    )
+
+
+async def _analyze_upload(
+    job_id: str,
+    dest: Path,
+    original_filename: str | None,
+    target_size_mb: float,
+    audio_bitrate_kbps: int,
+) -> UploadResponse:
     try:
         saved_bytes = dest.stat().st_size
     except OSError:
         saved_bytes = -1
     logger.info(
         "upload: job_id=%s filename=%r size=%s bytes target_mb=%s audio_kbps=%s",
-        job_id, file.filename, saved_bytes, target_size_mb, audio_bitrate_kbps,
+        job_id, original_filename, saved_bytes, target_size_mb, audio_bitrate_kbps,
     )
     logger.debug("upload: saved %s (%d bytes) — probing with ffprobe", dest.name, saved_bytes)
 
     try:
-        info = await asyncio.to_thread(ffprobe, dest)
+        info = await probe_scheduler.run(ffprobe, dest, probe_scheduler.INTERACTIVE)
     except Exception as exc:
         # Do not leave an unprocessable upload behind until the retention
         # scheduler runs. This is especially important for large files and
@@ -144,25 +182,142 @@ async def upload(
         info.get("video_bitrate_kbps"), info.get("audio_bitrate_kbps"),
         info.get("video_fps"),
     )
-    total_kbps, video_kbps, warn = calc_bitrates(target_size_mb, info["duration"], audio_bitrate_kbps)
-    if warn:
-        logger.warning(
-            "upload: low-quality warning for job_id=%s target_mb=%s duration=%.2fs -> total=%.1fkbps video=%.1fkbps",
-            job_id, target_size_mb, info["duration"], total_kbps, video_kbps,
+    return _upload_response(job_id, dest.name, info, target_size_mb, audio_bitrate_kbps)
+
+
+@router.post("/api/upload", response_model=UploadResponse, dependencies=[Depends(basic_auth)])
+async def upload(
+    file: UploadFile = File(...),
+    target_size_mb: float = Form(19.7),
+    audio_bitrate_kbps: int = Form(128),
+):
+    _validate_upload_options(target_size_mb, audio_bitrate_kbps)
+
+    job_id = str(uuid.uuid4())
+    safe_name = safe_filename(file.filename)
+    dest = UPLOADS_DIR / f"{job_id}_{safe_name}"
+    dest = await save_upload_file(file, dest, allow_dynamic_storage=True)
+    return await _analyze_upload(job_id, dest, file.filename, target_size_mb, audio_bitrate_kbps)
+
+
+class _RequestBody:
+    """``UploadFile``-style reader over a raw request body.
+
+    Multipart bodies are spooled completely before the route runs; reading
+    ``request.stream()`` hands each chunk to ``save_upload_file`` as it
+    arrives.
+    """
+
+    def __init__(self, request: Request) -> None:
+        self._stream = request.stream()
+        self._pending = b""
+        length = request.headers.get("content-length") or ""
+        self.size = int(length) if length.isdigit() else None
+
+    async def read(self, size: int) -> bytes:
+        while len(self._pending) < size:
+            try:
+                self._pending += await self._stream.__anext__()
+            except StopAsyncIteration:
+                break
+        chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+    async def close(self) -> None:
+        self._pending = b""
+
+
+class _ProvisionalProbe:
+    """Answer from the container header while the rest of the upload arrives.
+
+    Front-loaded MP4/MOV (``moov`` before ``mdat``) and Matroska headers are
+    parsed from the buffered prefix after each chunk.  The provisional
+    ``UploadResponse`` is published as an ``upload_probe`` event on the job's
+    progress channel and kept briefly for SSE clients that subscribe late.
+    Files with the header at the end give up here and are probed after the
+    upload, as before.  The prefix is only re-parsed once it reaches the
+    length the last attempt asked for, so a slow header costs a few parses
+    rather than one per chunk.
+    """
+
+    def __init__(self, job_id: str, filename: str, target_size_mb: float, audio_bitrate_kbps: int) -> None:
+        self.job_id = job_id
+        self.filename = filename
+        self.target_size_mb = target_size_mb
+        self.audio_bitrate_kbps = audio_bitrate_kbps
+        self.response: UploadResponse | None = None
+        self._prefix = bytearray()
+        self._needed = 0
+        self._done = False
+
+    async def feed(self, chunk: bytes) -> None:
+        if self._done:
+            return
+        self._prefix += chunk[:_PROVISIONAL_PROBE_LIMIT - len(self._prefix)]
+        if len(self._prefix) < min(self._needed, _PROVISIONAL_PROBE_LIMIT):
+            return
+        data, final, self._needed = await asyncio.to_thread(container_probe.probe_prefix, self._prefix)
+        if data is None:
+            if final or len(self._prefix) >= _PROVISIONAL_PROBE_LIMIT:
+                self._finish()
+            return
+        self._finish()
+        try:
+            info = summarize_probe(data)
+        except RuntimeError:
+            return
+        self.response = _upload_response(
+            self.job_id, self.filename, info, self.target_size_mb, self.audio_bitrate_kbps, provisional=True,
         )
-    return UploadResponse(
-        job_id=job_id,
-        filename=dest.name,
-        duration_s=info["duration"],
-        original_video_bitrate_kbps=info["video_bitrate_kbps"],
-        original_audio_bitrate_kbps=info["audio_bitrate_kbps"],
-        original_width=info.get("width"),
-        original_height=info.get("height"),
-        original_video_fps=info.get("video_fps"),
-        estimate_total_kbps=total_kbps,
-        estimate_video_kbps=video_kbps,
-        warn_low_quality=warn,
+        event = orjson.dumps({
+            "type": "upload_probe",
+            "task_id": self.job_id,
+            "upload": self.response.dict(),
+        }).decode()
+        logger.debug("upload: provisional probe job_id=%s duration=%.2fs", self.job_id, info["duration"])
+        try:
+            await redis.setex(f"upload_probe:{self.job_id}", _PROVISIONAL_TTL_SECONDS, event)
+            await redis.publish(f"progress:{self.job_id}", event)
+        except Exception as exc:
+            logger.debug("upload: provisional probe not published for job_id=%s: %s", self.job_id, exc)
+
+    def _finish(self) -> None:
+        self._done = True
+        self._prefix = bytearray()
+
+
+@router.post("/api/upload/stream", response_model=UploadResponse, dependencies=[Depends(basic_auth)])
+async def upload_stream(
+    request: Request,
+    filename: str = Query(...),
+    target_size_mb: float = Query(19.7),
+    audio_bitrate_kbps: int = Query(128),
+    job_id: str | None = Query(None),
+):
+    """Raw-body upload that probes the header before the body finishes.
+
+    The client may choose ``job_id`` (a UUID) and open ``/api/stream/{job_id}``
+    first to receive the provisional ``upload_probe`` event.  The response is
+    the final analysis of the complete file, exactly as ``/api/upload``.
+    """
+    _validate_upload_options(target_size_mb, audio_bitrate_kbps)
+    if job_id is None:
+        job_id = str(uuid.uuid4())
+    else:
+        try:
+            job_id = str(uuid.UUID(job_id))
+        except ValueError:
+            raise HTTPException(status_code=422, detail="job_id must be a UUID")
+
+    safe_name = safe_filename(filename)
+    dest = UPLOADS_DIR / f"{job_id}_{safe_name}"
+    if dest.exists():
+        raise HTTPException(status_code=409, detail="job_id is already in use")
+    provisional = _ProvisionalProbe(job_id, dest.name, target_size_mb, audio_bitrate_kbps)
+    dest = await save_upload_file(
+        _RequestBody(request), dest, allow_dynamic_storage=True, on_chunk=provisional.feed,
     )
+    return await _analyze_upload(job_id, dest, filename, target_size_mb, audio_bitrate_kbps)
 
 
 @router.post("/api/batches/upload", response_model=BatchCreateResponse, dependencies=[Depends(basic_auth)])
@@ -187,6 +342,14 @@ async def upload_batch(
     audio_only: bool = Form(False),
     target_video_bitrate_kbps: float | None = Form(None),
     max_output_fps: float | None = Form(None),
+    segment_parallel: bool | None = Form(None),
+    calibrate: bool | None = Form(None),
+    two_pass: bool | None = Form(None),
+    auto_fps: bool = Form(False),
+    auto_crop: bool | None = Form(None),
+    frame_decimation: Literal["auto", "on", "off"] | None = Form(None),
+    deadline_minutes: float | None = Form(None),
+    fallback_preset: Literal["auto", "keep", "p1", "p2", "p3", "p4", "p5", "p6", "p7"] | None = Form(None),
 ):
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
@@ -232,7 +395,7 @@ async def upload_batch(
             saved_files.append(input_path)
 
             try:
-                await asyncio.to_thread(ffprobe, input_path)
+                await probe_scheduler.run(ffprobe, input_path, probe_scheduler.BATCH)
             except Exception:
                 # A corrupt item should not discard valid files in the same
                 # batch. Keep a terminal item for the UI, but remove the bad
@@ -283,6 +446,14 @@ async def upload_batch(
                 audio_only=bool(audio_only),
                 target_video_bitrate_kbps=target_video_bitrate_kbps,
                 max_output_fps=max_output_fps,
+                segment_parallel=segment_parallel,
+                calibrate=calibrate,
+                two_pass=two_pass,
+                auto_fps=bool(auto_fps),
+                auto_crop=auto_crop,
+                frame_decimation=frame_decimation,
+                deadline_minutes=deadline_minutes,
+                fallback_preset=fallback_preset,
                 transient_input=True,
             )
 
@@ -435,10 +435,11 @@ def update_default_presets(
         'container': container,
         'tune': tune,
     }
-    # This form does not expose the profile frame-rate control. Preserve a cap
-    # previously saved through the profile editor instead of silently erasing it.
-    if existing_profile and 'max_output_fps' in existing_profile:
-        new_values['max_output_fps'] = existing_profile['max_output_fps']
+    # This form does not expose the profile frame-rate controls. Preserve values
+    # previously saved through the profile editor instead of silently erasing them.
+    for key in ('max_output_fps', 'frame_decimation', 'fallback_preset'):
+        if existing_profile and key in existing_profile:
+            new_values[key] = existing_profile[key]
     replaced = False
     for i, p in enumerate(data['preset_profiles']):
         if p.get('name') == default_name:
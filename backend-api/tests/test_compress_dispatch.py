@@ -77,6 +77,74 @@ class CompressDispatchTests(unittest.TestCase):
         self.assertFalse(source.exists())
         self.assertEqual(dispatched, [])
 
+    def test_targets_share_one_task_with_per_output_records(self):
+        stored = []
+        sent = []
+        published = []
+
+        async def store_metadata(task_id, job_id, filename, target_size_mb, video_codec, *args):
+            stored.append((task_id, target_size_mb, video_codec))
+
+        def send_task(name, **kwargs):
+            sent.append((name, kwargs))
+            return SimpleNamespace(id=kwargs['task_id'])
+
+        class FakeRedis:
+            async def publish(self, channel, *args, **kwargs):
+                published.append(channel)
+
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            source = root / 'input.mp4'
+            source.write_bytes(b'video')
+            request = CompressRequest(
+                job_id='job-1', filename=source.name, video_codec='libx264',
+                targets=[
+                    {'target_size_mb': 8, 'target_resolution': 720},
+                    {'target_size_mb': 25},
+                    {'target_size_mb': 50, 'video_codec': 'hevc_nvenc'},
+                ],
+            )
+            fake_celery = SimpleNamespace(send_task=send_task)
+            with patch.object(compress_router, 'resolve_uploaded_path', return_value=source), \
+                    patch.object(compress_router, 'OUTPUTS_DIR', root), \
+                    patch.object(compress_router, 'store_job_metadata', new=store_metadata), \
+                    patch.object(compress_router, 'celery_app', fake_celery), \
+                    patch.object(compress_router, 'redis', FakeRedis()):
+                result = asyncio.run(compress_router.compress(request))
+
+        self.assertEqual(len(sent), 1)
+        name, kwargs = sent[0]
+        self.assertEqual(name, 'worker.worker.compress_video_multi')
+        outputs = kwargs['kwargs']['outputs']
+        self.assertEqual([o['task_id'] for o in outputs], result['task_ids'])
+        self.assertEqual(kwargs['task_id'], result['task_id'])
+        self.assertEqual(stored, [
+            (outputs[0]['task_id'], 8, 'libx264'),
+            (outputs[1]['task_id'], 25, 'libx264'),
+            (outputs[2]['task_id'], 50, 'hevc_nvenc'),
+        ])
+        self.assertEqual(outputs[0]['target_resolution'], 720)
+        self.assertEqual(len({o['output_path'] for o in outputs}), 3)
+        self.assertEqual(
+            [o['download_url'] for o in result['outputs']],
+            [f"/api/jobs/{task_id}/download" for task_id in result['task_ids']],
+        )
+        self.assertEqual(published, [f"progress:{task_id}" for task_id in result['task_ids']])
+
+    def test_targets_reject_encoders_that_cannot_share_a_graph(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = Path(directory) / 'input.mp4'
+            source.write_bytes(b'video')
+            request = CompressRequest(
+                job_id='job-1', filename=source.name, video_codec='h264_qsv',
+                targets=[{'target_size_mb': 8}, {'target_size_mb': 25}],
+            )
+            with patch.object(compress_router, 'resolve_uploaded_path', return_value=source):
+                with self.assertRaises(HTTPException) as raised:
+                    asyncio.run(compress_router.compress(request))
+        self.assertEqual(raised.exception.status_code, 422)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,76 @@
+"""Probe scheduler ordering, coalescing and metrics."""
+from __future__ import annotations
+
+import asyncio
+import threading
+import unittest
+from pathlib import Path
+
+from app import probe_scheduler
+
+
+class TestProbeScheduler(unittest.TestCase):
+    def test_queued_probes_start_by_priority_and_duplicates_share_one_run(self):
+        scheduler = probe_scheduler.ProbeScheduler(1)
+        release = threading.Event()
+        calls: list[str] = []
+
+        def fake_probe(path: Path) -> dict:
+            calls.append(path.name)
+            if path.name == "blocker.mp4":
+                release.wait(5)
+            return {"path": path.name}
+
+        async def scenario():
+            blocker = asyncio.create_task(scheduler.run(fake_probe, Path("blocker.mp4"), probe_scheduler.INTERACTIVE))
+            await asyncio.sleep(0.05)
+            reconcile = asyncio.create_task(scheduler.run(fake_probe, Path("output.mp4"), probe_scheduler.RECONCILE))
+            watch = asyncio.create_task(scheduler.run(fake_probe, Path("watched.mp4"), probe_scheduler.FOLDER_WATCH))
+            batch = [
+                asyncio.create_task(scheduler.run(fake_probe, Path("batch.mp4"), probe_scheduler.BATCH))
+                for _ in range(3)
+            ]
+            # An interactive request for a queued Folder Watch file promotes it.
+            promoted = asyncio.create_task(scheduler.run(fake_probe, Path("watched.mp4"), probe_scheduler.INTERACTIVE))
+            await asyncio.sleep(0.05)
+            snapshot = scheduler.snapshot()
+            release.set()
+            results = await asyncio.gather(blocker, reconcile, watch, *batch, promoted)
+            return snapshot, results
+
+        snapshot, results = asyncio.run(scenario())
+
+        self.assertEqual(calls, ["blocker.mp4", "watched.mp4", "batch.mp4", "output.mp4"])
+        self.assertEqual([r["path"] for r in results[3:6]], ["batch.mp4"] * 3)
+        self.assertEqual(results[2], results[6])
+        self.assertEqual(snapshot["running"], 1)
+        self.assertEqual(snapshot["queue_depth"], 3)
+        self.assertEqual(snapshot["classes"]["interactive"]["queued"], 1)
+        self.assertEqual(snapshot["classes"]["batch"]["coalesced"], 2)
+
+        final = scheduler.snapshot()
+        self.assertEqual(final["queue_depth"], 0)
+        self.assertEqual(final["classes"]["batch"]["completed"], 1)
+        self.assertEqual(final["classes"]["interactive"]["coalesced"], 1)
+        self.assertIsNotNone(final["classes"]["reconcile"]["wait_ms"]["p95"])
+
+    def test_failures_reach_every_waiter(self):
+        scheduler = probe_scheduler.ProbeScheduler(2)
+
+        def broken_probe(_path: Path) -> dict:
+            raise RuntimeError("Input has no usable media duration")
+
+        async def scenario():
+            return await asyncio.gather(
+                scheduler.run(broken_probe, Path("bad.mp4"), probe_scheduler.BATCH),
+                scheduler.run(broken_probe, Path("bad.mp4"), probe_scheduler.BATCH),
+                return_exceptions=True,
+            )
+
+        results = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertEqual(scheduler.snapshot()["classes"]["batch"]["failed"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
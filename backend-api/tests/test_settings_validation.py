@@ -137,6 +137,8 @@ class TestSettingsValidation(unittest.TestCase):
                 profile = dict(data["preset_profiles"][0])
                 profile["name"] = "Capped default"
                 profile["max_output_fps"] = 30.0
+                profile["frame_decimation"] = "auto"
+                profile["fallback_preset"] = "keep"
                 data["preset_profiles"] = [profile]
                 data["default_preset"] = profile["name"]
                 settings_manager._write_settings(data)
@@ -153,6 +155,8 @@ class TestSettingsValidation(unittest.TestCase):
                 saved = settings_manager._read_settings()
 
             self.assertEqual(saved["preset_profiles"][0]["max_output_fps"], 30.0)
+            self.assertEqual(saved["preset_profiles"][0]["frame_decimation"], "auto")
+            self.assertEqual(saved["preset_profiles"][0]["fallback_preset"], "keep")
 
     def test_deleting_profiles_keeps_default_selection_valid(self):
         with tempfile.TemporaryDirectory() as directory:
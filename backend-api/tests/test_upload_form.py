@@ -4,6 +4,7 @@ from __future__ import annotations
 import os
 import asyncio
 import io
+import json
 import tempfile
 import unittest
 from pathlib import Path
@@ -18,6 +19,19 @@ from fastapi.testclient import TestClient
 from app import main
 from app import deps
 from app.routers import upload
+from shared.tests.test_container_probe import h264_sps, matrix, mp4_audio_trak, mp4_file, mp4_video_trak
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.published = []
+        self.stored = {}
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    async def setex(self, key, _ttl, value):
+        self.stored[key] = value
 
 
 class TestUploadMultipartForm(unittest.TestCase):
@@ -64,6 +78,81 @@ class TestUploadMultipartForm(unittest.TestCase):
             calc.assert_called_once_with(0.5, 10.0, 48)
             self.assertEqual(response.json()["estimate_total_kbps"], 1234.0)
 
+    def _stream_upload(self, body: bytes):
+        job_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+        fake_redis = _FakeRedis()
+        with tempfile.TemporaryDirectory(prefix="8mb-upload-stream-test-") as temp_dir, \
+                patch.dict(os.environ, {"FAST_PROBE": "1", "PROBE_CACHE": "0"}), \
+                patch.object(upload, "UPLOADS_DIR", Path(temp_dir)), \
+                patch.object(deps, "choose_upload_destination", side_effect=lambda dest, _size: (dest, None)), \
+                patch.object(upload, "redis", fake_redis):
+            response = TestClient(main.app).post(
+                "/api/upload/stream",
+                params={"filename": "clip.mp4", "target_size_mb": "8", "audio_bitrate_kbps": "96", "job_id": job_id},
+                content=body,
+                headers={"Content-Type": "application/octet-stream"},
+            )
+        return job_id, fake_redis, response
+
+    def test_stream_upload_publishes_provisional_analysis_from_front_loaded_header(self):
+        body = mp4_file(mp4_video_trak(h264_sps(320, 240), rotation_matrix=matrix(1, 0, 0, 1)), mp4_audio_trak())
+        job_id, fake_redis, response = self._stream_upload(body)
+
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(response.json()["job_id"], job_id)
+        self.assertFalse(response.json()["provisional"])
+        self.assertEqual(len(fake_redis.published), 1)
+        channel, message = fake_redis.published[0]
+        self.assertEqual(channel, f"progress:{job_id}")
+        self.assertEqual(fake_redis.stored[f"upload_probe:{job_id}"], message)
+        event = json.loads(message)
+        self.assertEqual(event["type"], "upload_probe")
+        self.assertTrue(event["upload"]["provisional"])
+        self.assertEqual(event["upload"]["duration_s"], 2.0)
+        self.assertEqual(event["upload"]["filename"], response.json()["filename"])
+
+    def test_stream_upload_with_moov_at_end_only_answers_after_the_body(self):
+        front = mp4_file(mp4_video_trak(h264_sps(320, 240), rotation_matrix=matrix(1, 0, 0, 1)))
+        ftyp_end, mdat_start = front.index(b"moov") - 4, front.index(b"mdat") - 4
+        body = front[:ftyp_end] + front[mdat_start:] + front[ftyp_end:mdat_start]
+        _job_id, fake_redis, response = self._stream_upload(body)
+
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(response.json()["duration_s"], 2.0)
+        self.assertEqual(fake_redis.published, [])
+
+    def test_provisional_probe_answers_once_the_header_chunk_lands(self):
+        body = mp4_file(mp4_video_trak(h264_sps(320, 240), rotation_matrix=matrix(1, 0, 0, 1)))
+        header_end = body.index(b"mdat") - 4
+        probe = upload._ProvisionalProbe("job", "job_clip.mp4", 8.0, 96)
+        with patch.dict(os.environ, {"FAST_PROBE": "1"}), patch.object(upload, "redis", _FakeRedis()):
+            asyncio.run(probe.feed(body[:header_end - 10]))
+            self.assertIsNone(probe.response)
+            asyncio.run(probe.feed(body[header_end - 10:header_end]))
+        self.assertTrue(probe.response.provisional)
+        self.assertEqual(probe.response.original_width, 320)
+
+    def test_provisional_probe_waits_for_the_missing_header_bytes(self):
+        body = mp4_file(mp4_video_trak(h264_sps(320, 240), rotation_matrix=matrix(1, 0, 0, 1)))
+        header_end = body.index(b"mdat") - 4
+        probe = upload._ProvisionalProbe("job", "job_clip.mp4", 8.0, 96)
+        calls = []
+
+        def counted(prefix):
+            calls.append(len(prefix))
+            return probe_prefix(prefix)
+
+        probe_prefix = upload.container_probe.probe_prefix
+        with (
+            patch.dict(os.environ, {"FAST_PROBE": "1"}),
+            patch.object(upload, "redis", _FakeRedis()),
+            patch.object(upload.container_probe, "probe_prefix", counted),
+        ):
+            for offset in range(0, header_end, 16):
+                asyncio.run(probe.feed(body[offset:min(offset + 16, header_end)]))
+        self.assertIsNotNone(probe.response)
+        self.assertLessEqual(len(calls), 4)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,10 +1,11 @@
 import { env } from '$env/dynamic/public';
-import type { BatchUploadPayload } from './types';
+import type { BatchUploadPayload, ProbeResult } from './types';
+import { openProgressStream, parseSSEData } from './sse';
 
 export type { BatchUploadPayload };
 
 // Re-export SSE helpers so existing imports from '$lib/api' keep working.
-export { openProgressStream } from './sse';
+export { openProgressStream };
 
 // Prefer same-origin when PUBLIC_BACKEND_URL is empty or unset (for baked SPA inside the container)
 const RAW = (env.PUBLIC_BACKEND_URL as string | undefined) || '';
@@ -22,7 +23,19 @@ export async function upload(file: File, targetSizeMB: number, audioKbps = 128,
   return res.json();
 }
 
-// XHR-based upload to report client-side progress
+// crypto.randomUUID() needs a secure context; LAN installs are often plain HTTP.
+function newUploadId(): string {
+  if (typeof crypto.randomUUID === 'function') return crypto.randomUUID();
+  const b = crypto.getRandomValues(new Uint8Array(16));
+  b[6] = (b[6] & 0x0f) | 0x40;
+  b[8] = (b[8] & 0x3f) | 0x80;
+  const hex = Array.from(b, (x) => x.toString(16).padStart(2, '0')).join('');
+  return `${hex.slice(0, 8)}-${hex.slice(8, 12)}-${hex.slice(12, 16)}-${hex.slice(16, 20)}-${hex.slice(20)}`;
+}
+
+// XHR-based upload to report client-side progress. With onProvisional the
+// raw file goes to /api/upload/stream, which reports the header analysis over
+// SSE while the rest of the file is still uploading.
 export function uploadWithProgress(
   file: File,
   targetSizeMB: number,
@@ -31,23 +44,49 @@ export function uploadWithProgress(
     auth?: { user: string; pass: string };
     onProgress?: (percent: number) => void;
     onUploadComplete?: () => void;
+    onProvisional?: (info: ProbeResult) => void;
     timeoutMs?: number;
   }
 ): Promise<any> {
   return new Promise((resolve, reject) => {
-    const fd = new FormData();
-    fd.append('file', file);
-    fd.append('target_size_mb', String(targetSizeMB));
-    fd.append('audio_bitrate_kbps', String(audioKbps));
-
     const xhr = new XMLHttpRequest();
+    let body: FormData | File;
+    let events: EventSource | null = null;
     let settled = false;
     const settle = (fn: (value?: any) => void, value?: any) => {
       if (settled) return;
       settled = true;
+      events?.close();
       fn(value);
     };
-    xhr.open('POST', `${BACKEND}/api/upload`);
+    if (opts?.onProvisional) {
+      const jobId = newUploadId();
+      const params = new URLSearchParams({
+        filename: file.name,
+        target_size_mb: String(targetSizeMB),
+        audio_bitrate_kbps: String(audioKbps),
+        job_id: jobId,
+      });
+      xhr.open('POST', `${BACKEND}/api/upload/stream?${params}`);
+      xhr.setRequestHeader('Content-Type', 'application/octet-stream');
+      events = openProgressStream(jobId, opts.auth);
+      events.onmessage = (e) => {
+        const event = parseSSEData(e.data);
+        if (event?.type !== 'upload_probe') return;
+        events?.close();
+        if (!settled) opts.onProvisional?.(event.upload);
+      };
+      events.onerror = () => events?.close();
+      body = file;
+    } else {
+      const fd = new FormData();
+      fd.append('file', file);
+      fd.append('target_size_mb', String(targetSizeMB));
+      fd.append('audio_bitrate_kbps', String(audioKbps));
+      xhr.open('POST', `${BACKEND}/api/upload`);
+      body = fd;
+    }
+
     // Large local uploads can legitimately take minutes. This timeout is for
     // a stalled upload/analysis response, not a short request deadline.
     xhr.timeout = Math.max(60_000, opts?.timeoutMs ?? 30 * 60 * 1000);
@@ -75,7 +114,7 @@ export function uploadWithProgress(
     xhr.onerror = () => settle(reject, new Error('Network error while uploading or analyzing'));
     xhr.onabort = () => settle(reject, new Error('Upload canceled'));
     xhr.ontimeout = () => settle(reject, new Error('Upload or server analysis timed out. The server may still be processing the file; check the queue before retrying.'));
-    xhr.send(fd);
+    xhr.send(body);
   });
 }
 
@@ -125,6 +164,14 @@ export function uploadBatchWithProgress(
     appendMaybe('audio_only', payload.audio_only);
     appendMaybe('target_video_bitrate_kbps', payload.target_video_bitrate_kbps);
     appendMaybe('max_output_fps', payload.max_output_fps);
+    appendMaybe('segment_parallel', payload.segment_parallel);
+    appendMaybe('calibrate', payload.calibrate);
+    appendMaybe('two_pass', payload.two_pass);
+    appendMaybe('auto_fps', payload.auto_fps);
+    appendMaybe('auto_crop', payload.auto_crop);
+    appendMaybe('frame_decimation', payload.frame_decimation);
+    appendMaybe('deadline_minutes', payload.deadline_minutes);
+    appendMaybe('fallback_preset', payload.fallback_preset);
 
     const xhr = new XMLHttpRequest();
     let settled = false;
@@ -159,7 +206,7 @@ export function uploadBatchWithProgress(
     xhr.onerror = () => settle(reject, new Error('Network error while uploading or analyzing'));
     xhr.onabort = () => settle(reject, new Error('Batch upload canceled'));
     xhr.ontimeout = () => settle(reject, new Error('Batch upload or server analysis timed out. Check the batch queue before retrying.'));
-    xhr.send(fd);
+    xhr.send(body);
   });
 }
 
@@ -8,7 +8,7 @@
  */
 
 import { env } from '$env/dynamic/public';
-import type { CompressStats } from './types';
+import type { CompressStats, ProbeResult } from './types';
 
 const RAW = (env.PUBLIC_BACKEND_URL as string | undefined) || '';
 const BACKEND = RAW && RAW.trim() !== '' ? RAW.replace(/\/$/, '') : '';
@@ -61,6 +61,30 @@ export interface SSEPingEvent {
 	ts: number;
 }
 
+/** Projected final size of the running pass, published every ~5% of progress. */
+export interface SSESizeProjectionEvent {
+	type: 'size_projection';
+	done_fraction: number;
+	projected_mb: number;
+	target_mb: number;
+}
+
+/** The pass was stopped early because its projection is over target; it restarts. */
+export interface SSEEarlyAbortEvent {
+	type: 'early_abort';
+	done_fraction: number;
+	projected_mb: number;
+	target_mb: number;
+	time_saved_s: number;
+}
+
+/** Header analysis published by POST /api/upload/stream before the body finishes. */
+export interface SSEUploadProbeEvent {
+	type: 'upload_probe';
+	task_id: string;
+	upload: ProbeResult;
+}
+
 export type SSEEvent =
 	| SSEConnectedEvent
 	| SSEProgressEvent
@@ -69,7 +93,10 @@ export type SSEEvent =
 	| SSEErrorEvent
 	| SSERetryEvent
 	| SSECanceledEvent
-	| SSEPingEvent;
+	| SSEPingEvent
+	| SSESizeProjectionEvent
+	| SSEEarlyAbortEvent
+	| SSEUploadProbeEvent;
 
 // ---------------------------------------------------------------------------
 // Connection helpers
@@ -19,6 +19,8 @@ export interface ProbeResult {
 	estimate_total_kbps: number;
 	estimate_video_kbps: number;
 	warn_low_quality: boolean;
+	/** Early answer from the container header while the upload is still running */
+	provisional?: boolean;
 }
 
 /** Request body for POST /api/compress. */
@@ -44,6 +46,33 @@ export interface CompressOptions {
 	audio_only?: boolean;
 	target_video_bitrate_kbps?: number | null;
 	max_output_fps?: number | null;
+	/** Reduce the frame rate of high-fps sources when bits per pixel per frame are too low. */
+	auto_fps?: boolean;
+	/** Crop stable black borders detected on sampled seconds (null = server default). */
+	auto_crop?: boolean | null;
+	/** Drop repeated frames with VFR output: 'auto' decides from content analysis (null = server default). */
+	frame_decimation?: FrameDecimation | null;
+	/** Finish within this many minutes; the worker picks the preset from measured throughput. */
+	deadline_minutes?: number | null;
+	/** CPU preset if the hardware encoder falls back to the CPU (null = server default). */
+	fallback_preset?: FallbackPreset | null;
+	/** CPU encoders: encode keyframe-aligned segments in parallel (null = server default). */
+	segment_parallel?: boolean | null;
+	/** Size target: calibrate CRF/bitrate on short samples before encoding (null = server default). */
+	calibrate?: boolean | null;
+	/** libx264/libx265: two-pass ABR with reusable pass-1 statistics (null = server default). */
+	two_pass?: boolean | null;
+	/** Several size targets from one decode; each output is its own job (replaces target_size_mb). */
+	targets?: CompressTarget[] | null;
+}
+
+/** One output of a multi-target POST /api/compress request. */
+export interface CompressTarget {
+	target_size_mb: number;
+	/** CPU, NVENC or AMF encoder; null keeps the request's video_codec. */
+	video_codec?: string | null;
+	/** Output height cap, e.g. 720 (null keeps the request's scaling). */
+	target_resolution?: number | null;
 }
 
 /** Response from GET /api/jobs/{task_id}/status. */
@@ -62,6 +91,7 @@ export interface JobStatus {
 	fallback_stage?: string | null;
 	fallback_reason?: string | null;
 	decoder?: Record<string, unknown> | null;
+	optimizations?: Record<string, unknown> | null;
 }
 
 /** Response from GET /api/codecs/available. */
@@ -98,6 +128,14 @@ export interface BatchUploadPayload {
 	audio_only?: boolean;
 	target_video_bitrate_kbps?: number | null;
 	max_output_fps?: number | null;
+	segment_parallel?: boolean | null;
+	calibrate?: boolean | null;
+	two_pass?: boolean | null;
+	auto_fps?: boolean;
+	auto_crop?: boolean | null;
+	frame_decimation?: FrameDecimation | null;
+	deadline_minutes?: number | null;
+	fallback_preset?: FallbackPreset | null;
 }
 
 /** Individual item within a batch status response. */
@@ -149,6 +187,7 @@ export interface CompressStats {
 	fallback_reason?: string | null;
 	hardware_type?: string | null;
 	decoder?: Record<string, unknown> | null;
+	optimizations?: Record<string, unknown> | null;
 }
 
 /** Preset profile as returned by the settings API. */
@@ -163,8 +202,15 @@ export interface PresetProfile {
 	tune: string;
 	/** Optional cap; omitted or null = same as source when applying preset */
 	max_output_fps?: number | null;
+	/** Repeated-frame decimation for jobs using this profile (null = server default). */
+	frame_decimation?: FrameDecimation | null;
+	/** CPU preset policy if the hardware encoder falls back to the CPU (null = server default). */
+	fallback_preset?: FallbackPreset | null;
 }
 
+export type FrameDecimation = 'auto' | 'on' | 'off';
+export type FallbackPreset = 'auto' | 'keep' | 'p1' | 'p2' | 'p3' | 'p4' | 'p5' | 'p6' | 'p7';
+
 /** Hardware info from GET /api/hardware. */
 export interface HardwareInfo {
 	type: string;
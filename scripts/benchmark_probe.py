@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Measure per-file probe latency: in-process header reader versus ffprobe.
+
+Without ``--media-dir`` the deterministic corpus from
+``tests/media/generate_media.py`` is generated into a temporary directory.
+Each file is probed ``--iterations`` times both ways and the median latency
+is reported; ``fallback`` marks files the header reader hands to ffprobe.
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+GENERATOR = ROOT / "tests" / "media" / "generate_media.py"
+sys.path.insert(0, str(ROOT))
+
+from shared import container_probe, probe_cache  # noqa: E402
+
+
+def _median_ms(fn, iterations: int) -> float:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000.0)
+    return statistics.median(samples)
+
+
+def _ffprobe(path: Path) -> None:
+    subprocess.run(
+        ["ffprobe", "-v", "error", *probe_cache.FULL_PROBE_ARGS, str(path)],
+        check=True, capture_output=True,
+    )
+
+
+def benchmark(paths: list[Path], iterations: int, ffprobe: bool) -> list[dict]:
+    rows = []
+    for path in paths:
+        answered = container_probe.probe(path) is not None
+        row = {
+            "file": path.name,
+            "bytes": path.stat().st_size,
+            "fast_probe_ms": round(_median_ms(lambda: container_probe.probe(path), iterations), 3),
+            "fallback": not answered,
+        }
+        if ffprobe:
+            row["ffprobe_ms"] = round(_median_ms(lambda: _ffprobe(path), max(1, iterations // 10)), 3)
+            row["speedup"] = round(row["ffprobe_ms"] / max(row["fast_probe_ms"], 1e-6), 1)
+        rows.append(row)
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--media-dir", type=Path, help="probe these files instead of the generated corpus")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--no-ffprobe", action="store_true", help="only time the header reader")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        if args.media_dir:
+            paths = sorted(p for p in args.media_dir.iterdir() if p.is_file())
+        else:
+            spec = importlib.util.spec_from_file_location("generate_media", GENERATOR)
+            generator = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(generator)
+            paths = generator.generate(Path(scratch), "ffmpeg", "ffprobe", "extended")
+        rows = benchmark(paths, max(1, args.iterations), not args.no_ffprobe)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    columns = ["file", "bytes", "fast_probe_ms", "fallback"] + ([] if args.no_ffprobe else ["ffprobe_ms", "speedup"])
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) if rows else len(c) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(widths[c]) for c in columns))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
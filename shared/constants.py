@@ -0,0 +1,11 @@
+"""Constants the API and the worker must agree on."""
+from __future__ import annotations
+
+# Encoders that take software frames and can therefore share one decoded
+# ``split`` graph in a multi-target job: CPU, NVENC and AMF.  QSV/VAAPI need
+# a hardware upload per branch and stay single-target.
+MULTI_TARGET_ENCODERS: frozenset[str] = frozenset({
+    "libx264", "libx265", "libsvtav1",
+    "h264_nvenc", "hevc_nvenc", "av1_nvenc",
+    "h264_amf", "hevc_amf", "av1_amf",
+})
@@ -0,0 +1,1035 @@
+"""In-process MP4/MOV/MKV header reader used before starting ffprobe.
+
+Starting ffprobe costs tens of milliseconds per file before it reads a byte,
+and the worker, API and Folder Watch probe every input.  For the common
+containers the answer is in the headers: ``moov`` (MP4/MOV) or the Segment
+``Info``/``Tracks`` elements (Matroska/WebM), plus the H.264/HEVC sequence
+parameter set in the codec configuration.  :func:`probe` memory-maps the
+file, reads those structures and returns the subset of ffprobe's
+``-show_format -show_streams`` JSON that ``ffprobe_info`` reads, so callers
+parse it with the same code and get the same dict, including
+``rotation_degrees`` and the display dimensions.
+
+Values follow FFmpeg 6.1: stream bit rates from the sample sizes, frame
+rates from ``stts`` or ``DefaultDuration``, rotation from the track matrix,
+colour from the SPS VUI over the container's ``colr``/``Colour``.  Anything
+this reader cannot answer the way ffprobe would (fragmented MP4, other video
+codecs, cover art, variable frame rate, truncated files) returns ``None`` and
+the caller runs ffprobe.  ``FAST_PROBE=0`` disables the reader.
+
+:func:`probe_prefix` reads the leading bytes of a file that is still being
+uploaded, so the API can answer as soon as a front-loaded header has landed.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+from fractions import Fraction
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+MP4_FORMAT_NAME = "mov,mp4,m4a,3gp,3g2,mj2"
+MKV_FORMAT_NAME = "matroska,webm"
+_MP4_TOP_LEVEL = frozenset({b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot", b"uuid"})
+_EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+
+# H.264 Table E-1 / HEVC Table E-1 sample aspect ratios.
+_SAR_TABLE = (
+    (0, 1), (1, 1), (12, 11), (10, 11), (16, 11), (40, 33), (24, 11), (20, 11), (32, 11),
+    (80, 33), (18, 11), (15, 11), (64, 33), (160, 99), (4, 3), (3, 2), (2, 1),
+)
+# FFmpeg names for the ISO/IEC 23091-2 code points (2 = unspecified, omitted).
+_PRIMARIES = {
+    1: "bt709", 4: "bt470m", 5: "bt470bg", 6: "smpte170m", 7: "smpte240m", 8: "film",
+    9: "bt2020", 10: "smpte428", 11: "smpte431", 12: "smpte432", 22: "ebu3213",
+}
+_TRANSFERS = {
+    1: "bt709", 4: "gamma22", 5: "gamma28", 6: "smpte170m", 7: "smpte240m", 8: "linear",
+    9: "log100", 10: "log316", 11: "iec61966-2-4", 12: "bt1361e", 13: "iec61966-2-1",
+    14: "bt2020-10", 15: "bt2020-12", 16: "smpte2084", 17: "smpte428", 18: "arib-std-b67",
+}
+_MATRICES = {
+    0: "gbr", 1: "bt709", 4: "fcc", 5: "bt470bg", 6: "smpte170m", 7: "smpte240m", 8: "ycgco",
+    9: "bt2020nc", 10: "bt2020c", 11: "smpte2085", 12: "chroma-derived-nc",
+    13: "chroma-derived-c", 14: "ictcp",
+}
+_H264_HIGH_PROFILES = frozenset({100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135})
+_H264_PROFILES = {
+    66: "Baseline", 77: "Main", 88: "Extended", 100: "High", 110: "High 10", 122: "High 4:2:2",
+    244: "High 4:4:4 Predictive", 44: "CAVLC 4:4:4", 118: "Multiview High", 128: "Stereo High",
+}
+_HEVC_PROFILES = {1: "Main", 2: "Main 10", 3: "Main Still Picture", 4: "Rext"}
+
+# Audio codecs whose decoders leave the container's bit rate alone; the MP3,
+# AC-3, DTS and Vorbis decoders replace it with their own in ffprobe output.
+_MP4_AUDIO = {b"Opus": "opus", b"fLaC": "flac", b"alac": "alac"}
+# MPEG-4 objectTypeIndication in esds.
+_MP4_OBJECT_TYPES = {0x40: "aac", 0x66: "aac", 0x67: "aac", 0x68: "aac", 0xAD: "opus"}
+_MP4_SUBTITLES = {b"tx3g": "mov_text", b"wvtt": "webvtt", b"c608": "eia_608", b"stpp": "ttml"}
+_MP4_SUBTITLE_HANDLERS = frozenset({b"sbtl", b"subt", b"clcp"})
+
+_MKV_AUDIO = {"A_AAC": "aac", "A_OPUS": "opus", "A_FLAC": "flac"}
+_MKV_SUBTITLES = {
+    "S_TEXT/UTF8": "subrip", "S_TEXT/ASS": "ass", "S_TEXT/SSA": "ass", "S_TEXT/WEBVTT": "webvtt",
+    "S_HDMV/PGS": "hdmv_pgs_subtitle", "S_VOBSUB": "dvd_subtitle", "S_DVBSUB": "dvb_subtitle",
+}
+
+# Matroska element IDs (marker bits included).
+_MKV_SEGMENT = 0x18538067
+_MKV_SEEKHEAD, _MKV_SEEK, _MKV_SEEK_ID, _MKV_SEEK_POSITION = 0x114D9B74, 0x4DBB, 0x53AB, 0x53AC
+_MKV_INFO, _MKV_TIMECODE_SCALE, _MKV_DURATION = 0x1549A966, 0x2AD7B1, 0x4489
+_MKV_TRACKS, _MKV_TRACK_ENTRY = 0x1654AE6B, 0xAE
+_MKV_TRACK_TYPE, _MKV_CODEC_ID, _MKV_CODEC_PRIVATE = 0x83, 0x86, 0x63A2
+_MKV_DEFAULT_DURATION, _MKV_CONTENT_ENCODINGS = 0x23E383, 0x6D80
+_MKV_VIDEO, _MKV_PIXEL_WIDTH, _MKV_PIXEL_HEIGHT = 0xE0, 0xB0, 0xBA
+_MKV_DISPLAY_WIDTH, _MKV_DISPLAY_HEIGHT, _MKV_DISPLAY_UNIT = 0x54B0, 0x54BA, 0x54B2
+_MKV_COLOUR, _MKV_PROJECTION = 0x55B0, 0x7670
+_MKV_MATRIX, _MKV_RANGE, _MKV_TRANSFER, _MKV_PRIMARIES = 0x55B1, 0x55B9, 0x55BA, 0x55BB
+_MKV_CLUSTER, _MKV_TAGS, _MKV_ATTACHMENTS = 0x1F43B675, 0x1254C367, 0x1941A469
+_MKV_TAG, _MKV_SIMPLE_TAG, _MKV_TAG_NAME = 0x7373, 0x67C8, 0x45A3
+
+
+class _Unsupported(Exception):
+    """The headers cannot be answered the way ffprobe would answer them."""
+
+
+class _NeedMore(Exception):
+    """The header has not fully arrived yet (prefix mode only).
+
+    ``needed`` is the prefix length the parser must see before another
+    attempt can get further, or 0 when that is not known.
+    """
+
+    def __init__(self, needed: int = 0) -> None:
+        super().__init__(needed)
+        self.needed = needed
+
+
+def fast_probe_enabled() -> bool:
+    return os.getenv("FAST_PROBE", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def probe(path: str | os.PathLike) -> Optional[dict[str, Any]]:
+    """Return ffprobe-shaped ``{"format", "streams"}`` JSON, or ``None`` to run ffprobe."""
+    if not fast_probe_enabled():
+        return None
+    try:
+        with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if buf[:4] == _EBML_MAGIC:
+                return _probe_mkv(buf)
+            if len(buf) >= 8 and buf[4:8] in _MP4_TOP_LEVEL:
+                return _probe_mp4(buf)
+            return None
+    except (
+        _Unsupported, OSError, ValueError, IndexError, KeyError, OverflowError, ZeroDivisionError,
+        StopIteration, struct.error,
+    ) as exc:
+        logger.debug("fast probe: %s: %s", path, exc)
+        return None
+
+
+def probe_prefix(data: bytes | bytearray) -> tuple[Optional[dict[str, Any]], bool, int]:
+    """Probe the first bytes of a file whose tail has not arrived yet.
+
+    Returns ``(result, final, needed)``.  ``(None, False, needed)`` means the
+    header may still be on its way and is worth probing again once the prefix
+    is ``needed`` bytes long: the end of the box or element being read, or
+    twice the current length when the parser cannot tell.  ``(None, True, 0)``
+    means it will not help (``moov`` after ``mdat``, Info/Tracks after the
+    first Cluster, or a header :func:`probe` would decline).  Matroska Tags
+    that SeekHead places at the end are not checked, so the result is
+    provisional until the whole file is probed.
+    """
+    if not fast_probe_enabled():
+        return None, True, 0
+    if len(data) < 16:
+        return None, False, 16
+    data = bytes(data)
+    try:
+        if data[:4] == _EBML_MAGIC:
+            return _probe_mkv(data, partial=True), True, 0
+        if data[4:8] in _MP4_TOP_LEVEL:
+            return _probe_mp4(data, partial=True), True, 0
+        return None, True, 0
+    except _NeedMore as exc:
+        return None, False, exc.needed if exc.needed > len(data) else 2 * len(data)
+    except (IndexError, struct.error):
+        return None, False, 2 * len(data)
+    except (_Unsupported, ValueError, KeyError, OverflowError, ZeroDivisionError, StopIteration) as exc:
+        logger.debug("fast probe: upload prefix: %s", exc)
+        return None, True, 0
+
+
+# --- bitstream helpers ---------------------------------------------------------
+
+
+class _BitReader:
+    def __init__(self, data: bytes) -> None:
+        self._data = data
+        self._pos = 0
+
+    def bits(self, count: int) -> int:
+        value = 0
+        for _ in range(count):
+            byte = self._data[self._pos >> 3]
+            value = (value << 1) | ((byte >> (7 - (self._pos & 7))) & 1)
+            self._pos += 1
+        return value
+
+    def flag(self) -> bool:
+        return self.bits(1) == 1
+
+    def skip(self, count: int) -> None:
+        self._pos += count
+
+    def ue(self) -> int:
+        zeros = 0
+        while self.bits(1) == 0:
+            zeros += 1
+            if zeros > 31:
+                raise _Unsupported("invalid exp-Golomb code")
+        return (1 << zeros) - 1 + self.bits(zeros)
+
+    def se(self) -> int:
+        value = self.ue()
+        return (value + 1) // 2 if value & 1 else -(value // 2)
+
+
+def _rbsp(nal_payload: bytes) -> bytes:
+    """Strip emulation-prevention bytes (00 00 03 -> 00 00)."""
+    return re.sub(b"\x00\x00\x03", b"\x00\x00", nal_payload)
+
+
+def _vui_prefix(reader: _BitReader) -> dict[str, Any]:
+    """Read the aspect-ratio and video-signal part shared by H.264 and HEVC VUI."""
+    vui: dict[str, Any] = {}
+    if reader.flag():
+        idc = reader.bits(8)
+        if idc == 255:
+            vui["sar"] = (reader.bits(16), reader.bits(16))
+        elif idc < len(_SAR_TABLE):
+            vui["sar"] = _SAR_TABLE[idc]
+        else:
+            raise _Unsupported("reserved aspect_ratio_idc")
+    if reader.flag():
+        reader.skip(1)
+    if reader.flag():
+        reader.skip(3)
+        vui["full_range"] = reader.flag()
+        if reader.flag():
+            vui["primaries"] = reader.bits(8)
+            vui["transfer"] = reader.bits(8)
+            vui["matrix"] = reader.bits(8)
+    return vui
+
+
+def _pix_fmt(chroma_format_idc: int, bit_depth: int, matrix: Optional[int], jpeg_range: bool) -> str:
+    if not 8 <= bit_depth <= 14:
+        raise _Unsupported(f"{bit_depth}-bit video")
+    suffix = "" if bit_depth == 8 else f"{bit_depth}le"
+    if chroma_format_idc == 0:
+        return "gray" if bit_depth == 8 else f"gray{suffix}"
+    if chroma_format_idc == 3 and matrix == 0:
+        return f"gbrp{suffix}"
+    layout = {1: "420", 2: "422", 3: "444"}[chroma_format_idc]
+    if jpeg_range and bit_depth == 8:
+        return f"yuvj{layout}p"
+    return f"yuv{layout}p{suffix}"
+
+
+def _h264_sps(nal: bytes) -> dict[str, Any]:
+    if len(nal) < 4 or nal[0] & 0x1F != 7:
+        raise _Unsupported("no H.264 SPS")
+    reader = _BitReader(_rbsp(nal[1:]))
+    profile_idc = reader.bits(8)
+    constraints = reader.bits(8)
+    reader.skip(8)  # level_idc
+    reader.ue()  # seq_parameter_set_id
+    chroma_format_idc, bit_depth = 1, 8
+    if profile_idc in _H264_HIGH_PROFILES:
+        chroma_format_idc = reader.ue()
+        if chroma_format_idc == 3 and reader.flag():
+            raise _Unsupported("separate colour planes")
+        bit_depth = reader.ue() + 8
+        reader.ue()  # bit_depth_chroma_minus8
+        reader.skip(1)  # qpprime_y_zero_transform_bypass_flag
+        if reader.flag():
+            for index in range(8 if chroma_format_idc != 3 else 12):
+                if reader.flag():
+                    last = following = 8
+                    for _ in range(16 if index < 6 else 64):
+                        if following:
+                            following = (last + reader.se()) % 256
+                        last = following or last
+    reader.ue()  # log2_max_frame_num_minus4
+    poc_type = reader.ue()
+    if poc_type == 0:
+        reader.ue()
+    elif poc_type == 1:
+        reader.skip(1)
+        reader.se()
+        reader.se()
+        for _ in range(reader.ue()):
+            reader.se()
+    reader.ue()  # max_num_ref_frames
+    reader.skip(1)  # gaps_in_frame_num_value_allowed_flag
+    width_mbs = reader.ue() + 1
+    height_map_units = reader.ue() + 1
+    frame_mbs_only = reader.flag()
+    if not frame_mbs_only:
+        reader.skip(1)
+    reader.skip(1)  # direct_8x8_inference_flag
+    crop = (0, 0, 0, 0)
+    if reader.flag():
+        crop = (reader.ue(), reader.ue(), reader.ue(), reader.ue())
+    vui = _vui_prefix(reader) if reader.flag() else {}
+    frame_factor = 1 if frame_mbs_only else 2
+    if chroma_format_idc == 0:
+        unit_x, unit_y = 1, frame_factor
+    else:
+        unit_x = 1 if chroma_format_idc == 3 else 2
+        unit_y = (2 if chroma_format_idc == 1 else 1) * frame_factor
+    name = _H264_PROFILES.get(profile_idc)
+    if name is None:
+        raise _Unsupported(f"H.264 profile_idc {profile_idc}")
+    if chroma_format_idc == 0:
+        raise _Unsupported("monochrome H.264")
+    if profile_idc == 66 and constraints & 0x40:
+        name = "Constrained Baseline"
+    elif profile_idc in (110, 122, 244) and constraints & 0x10:
+        name = {110: "High 10 Intra", 122: "High 4:2:2 Intra", 244: "High 4:4:4 Intra"}[profile_idc]
+    return {
+        "codec": "h264",
+        "profile": name,
+        "chroma_format_idc": chroma_format_idc,
+        "bit_depth": bit_depth,
+        "width": width_mbs * 16 - unit_x * (crop[0] + crop[1]),
+        "height": height_map_units * 16 * frame_factor - unit_y * (crop[2] + crop[3]),
+        "vui": vui,
+    }
+
+
+def _hevc_st_ref_pic_sets(reader: _BitReader, count: int) -> None:
+    delta_pocs: list[int] = []
+    for index in range(count):
+        if index and reader.flag():  # inter_ref_pic_set_prediction_flag
+            reader.skip(1)  # delta_rps_sign
+            reader.ue()  # abs_delta_rps_minus1
+            used = 0
+            for _ in range(delta_pocs[index - 1] + 1):
+                if reader.flag() or reader.flag():
+                    used += 1
+            delta_pocs.append(used)
+            continue
+        negative, positive = reader.ue(), reader.ue()
+        if negative > 16 or positive > 16:
+            raise _Unsupported("invalid short-term reference picture set")
+        for _ in range(negative + positive):
+            reader.ue()
+            reader.skip(1)
+        delta_pocs.append(negative + positive)
+
+
+def _hevc_sps(nal: bytes) -> dict[str, Any]:
+    if len(nal) < 4 or (nal[0] >> 1) & 0x3F != 33:
+        raise _Unsupported("no HEVC SPS")
+    reader = _BitReader(_rbsp(nal[2:]))
+    reader.skip(4)  # sps_video_parameter_set_id
+    max_sub_layers = reader.bits(3)
+    reader.skip(1)
+    reader.skip(3)  # general_profile_space, general_tier_flag
+    profile_idc = reader.bits(5)
+    compatibility = reader.bits(32)
+    reader.skip(48 + 8)  # constraint flags, general_level_idc
+    if profile_idc == 0:
+        profile_idc = next((j for j in range(1, 32) if compatibility & (1 << (31 - j))), 0)
+    sub_layers = [(reader.flag(), reader.flag()) for _ in range(max_sub_layers)]
+    if max_sub_layers:
+        reader.skip(2 * (8 - max_sub_layers))
+    for profile_present, level_present in sub_layers:
+        reader.skip((88 if profile_present else 0) + (8 if level_present else 0))
+    reader.ue()  # sps_seq_parameter_set_id
+    chroma_format_idc = reader.ue()
+    if chroma_format_idc == 3 and reader.flag():
+        raise _Unsupported("separate colour planes")
+    width, height = reader.ue(), reader.ue()
+    if reader.flag():
+        sub_w = 2 if chroma_format_idc in (1, 2) else 1
+        sub_h = 2 if chroma_format_idc == 1 else 1
+        left, right, top, bottom = reader.ue(), reader.ue(), reader.ue(), reader.ue()
+        width -= sub_w * (left + right)
+        height -= sub_h * (top + bottom)
+    bit_depth = reader.ue() + 8
+    reader.ue()  # bit_depth_chroma_minus8
+    log2_max_poc_lsb = reader.ue() + 4
+    ordering_all = reader.flag()
+    for _ in range(0 if ordering_all else max_sub_layers, max_sub_layers + 1):
+        reader.ue()
+        reader.ue()
+        reader.ue()
+    for _ in range(6):  # coding/transform block sizes and hierarchy depths
+        reader.ue()
+    if reader.flag() and reader.flag():  # scaling_list_enabled, sps_scaling_list_data_present
+        for size_id in range(4):
+            for _ in range(0, 6, 3 if size_id == 3 else 1):
+                if not reader.flag():
+                    reader.ue()
+                    continue
+                if size_id > 1:
+                    reader.se()
+                for _ in range(min(64, 1 << (4 + (size_id << 1)))):
+                    reader.se()
+    reader.skip(2)  # amp_enabled_flag, sample_adaptive_offset_enabled_flag
+    if reader.flag():  # pcm_enabled_flag
+        reader.skip(8)
+        reader.ue()
+        reader.ue()
+        reader.skip(1)
+    _hevc_st_ref_pic_sets(reader, reader.ue())
+    if reader.flag():  # long_term_ref_pics_present_flag
+        for _ in range(reader.ue()):
+            reader.skip(log2_max_poc_lsb + 1)
+    reader.skip(2)  # sps_temporal_mvp_enabled_flag, strong_intra_smoothing_enabled_flag
+    vui = _vui_prefix(reader) if reader.flag() else {}
+    name = _HEVC_PROFILES.get(profile_idc)
+    if name is None:
+        raise _Unsupported(f"HEVC profile_idc {profile_idc}")
+    return {
+        "codec": "hevc",
+        "profile": name,
+        "chroma_format_idc": chroma_format_idc,
+        "bit_depth": bit_depth,
+        "width": width,
+        "height": height,
+        "vui": vui,
+    }
+
+
+def _avcc_sps(config: bytes) -> dict[str, Any]:
+    if len(config) < 8 or config[0] != 1 or not config[5] & 0x1F:
+        raise _Unsupported("avcC without SPS")
+    (length,) = struct.unpack_from(">H", config, 6)
+    return _h264_sps(bytes(config[8:8 + length]))
+
+
+def _hvcc_sps(config: bytes) -> dict[str, Any]:
+    if len(config) < 23:
+        raise _Unsupported("short hvcC")
+    pos = 23
+    for _ in range(config[22]):
+        nal_type = config[pos] & 0x3F
+        (count,) = struct.unpack_from(">H", config, pos + 1)
+        pos += 3
+        for _ in range(count):
+            (length,) = struct.unpack_from(">H", config, pos)
+            if nal_type == 33:
+                return _hevc_sps(bytes(config[pos + 2:pos + 2 + length]))
+            pos += 2 + length
+    raise _Unsupported("hvcC without SPS")
+
+
+def _video_stream(
+    sps: dict[str, Any],
+    container_sar: Optional[tuple[int, int]],
+    container_colour: dict[str, Any],
+) -> dict[str, Any]:
+    """Build the stream fields FFmpeg's decoder reports for ``sps``."""
+    vui = sps["vui"]
+    colour = dict(container_colour)
+    if sps["codec"] == "hevc":
+        # The HEVC decoder always exports its own colour description.
+        if "primaries" not in vui and any(k in colour for k in ("primaries", "transfer", "matrix")):
+            raise _Unsupported("container colour without HEVC VUI colour description")
+        colour = {"full_range": vui.get("full_range", False)}
+        colour.update({k: vui[k] for k in ("primaries", "transfer", "matrix") if k in vui})
+    else:
+        if "full_range" in vui:
+            colour["full_range"] = vui["full_range"]
+        colour.update({k: vui[k] for k in ("primaries", "transfer", "matrix") if k in vui})
+    stream: dict[str, Any] = {
+        "codec_name": sps["codec"],
+        "profile": sps["profile"],
+        "codec_type": "video",
+        "width": sps["width"],
+        "height": sps["height"],
+        "pix_fmt": _pix_fmt(
+            sps["chroma_format_idc"], sps["bit_depth"], colour.get("matrix"),
+            sps["codec"] == "h264" and colour.get("full_range") is True,
+        ),
+    }
+    if "full_range" in colour:
+        stream["color_range"] = "pc" if colour["full_range"] else "tv"
+    for key, field, names in (
+        ("matrix", "color_space", _MATRICES),
+        ("transfer", "color_transfer", _TRANSFERS),
+        ("primaries", "color_primaries", _PRIMARIES),
+    ):
+        code = colour.get(key)
+        if code is None or code == 2:
+            continue
+        if code not in names:
+            raise _Unsupported(f"reserved {field} {code}")
+        stream[field] = names[code]
+    if sps["codec"] == "h264":
+        stream["bits_per_raw_sample"] = str(sps["bit_depth"])
+    sar = container_sar if container_sar and all(container_sar) else vui.get("sar")
+    if sar and all(sar) and stream["width"] > 0 and stream["height"] > 0:
+        sar_q = Fraction(*sar)
+        dar = Fraction(stream["width"] * sar_q.numerator, stream["height"] * sar_q.denominator)
+        stream["sample_aspect_ratio"] = f"{sar_q.numerator}:{sar_q.denominator}"
+        stream["display_aspect_ratio"] = f"{dar.numerator}:{dar.denominator}"
+    return stream
+
+
+def _rate(value: Fraction) -> str:
+    return f"{value.numerator}/{value.denominator}"
+
+
+def _limit_rational(value: Fraction, limit: int) -> Fraction:
+    """Closest fraction with numerator and denominator <= ``limit`` (like ``av_reduce``)."""
+    if value.numerator <= limit and value.denominator <= limit:
+        return value
+    if value > 1:
+        return 1 / (1 / value).limit_denominator(limit)
+    return value.limit_denominator(limit)
+
+
+# --- MP4 / MOV -----------------------------------------------------------------
+
+
+def _boxes(buf, start: int, end: int):
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", buf, pos)
+        header = 8
+        if size == 1:
+            (size,) = struct.unpack_from(">Q", buf, pos + 8)
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise _Unsupported(f"truncated {kind!r} box")
+        yield kind, pos + header, pos + size
+        pos += size
+
+
+def _child(buf, start: int, end: int, kind: bytes) -> Optional[tuple[int, int]]:
+    for found, child_start, child_end in _boxes(buf, start, end):
+        if found == kind:
+            return child_start, child_end
+    return None
+
+
+def _require(buf, start: int, end: int, *path: bytes) -> tuple[int, int]:
+    for kind in path:
+        found = _child(buf, start, end, kind)
+        if found is None:
+            raise _Unsupported(f"missing {kind!r} box")
+        start, end = found
+    return start, end
+
+
+def _matrix(buf, pos: int) -> list[list[float]]:
+    values = struct.unpack_from(">9i", buf, pos)
+    return [
+        [values[0] / 65536, values[1] / 65536, values[2] / (1 << 30)],
+        [values[3] / 65536, values[4] / 65536, values[5] / (1 << 30)],
+        [values[6] / 65536, values[7] / 65536, values[8] / (1 << 30)],
+    ]
+
+
+def _rotation(track: list[list[float]], movie: list[list[float]]) -> Optional[int]:
+    """``av_display_rotation_get`` of the combined matrix; ``None`` for identity."""
+    combined = [[sum(track[i][e] * movie[e][j] for e in range(3)) for j in range(3)] for i in range(3)]
+    identity = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+    if all(math.isclose(combined[i][j], identity[i][j], abs_tol=1e-9) for i in range(3) for j in range(3)):
+        return None
+    scale_x = math.hypot(combined[0][0], combined[1][0])
+    scale_y = math.hypot(combined[0][1], combined[1][1])
+    if not (math.isclose(scale_x, 1.0, abs_tol=0.01) and math.isclose(scale_y, 1.0, abs_tol=0.01)):
+        raise _Unsupported("scaled track matrix")
+    angle = -math.degrees(math.atan2(combined[0][1] / scale_y, combined[0][0] / scale_x))
+    return int(round(angle))
+
+
+def _mp4_colour(buf, start: int, end: int) -> dict[str, Any]:
+    found = _child(buf, start, end, b"colr")
+    if found is None:
+        return {}
+    pos, box_end = found
+    kind = bytes(buf[pos:pos + 4])
+    if kind not in (b"nclx", b"nclc") or pos + 10 > box_end:
+        return {}
+    primaries, transfer, matrix = struct.unpack_from(">3H", buf, pos + 4)
+    colour: dict[str, Any] = {"primaries": primaries, "transfer": transfer, "matrix": matrix}
+    if kind == b"nclx" and pos + 11 <= box_end:
+        colour["full_range"] = bool(buf[pos + 10] & 0x80)
+    return colour
+
+
+def _mp4_video_entry(buf, kind: bytes, start: int, end: int) -> dict[str, Any]:
+    children = start + 78
+    if kind in (b"avc1", b"avc3"):
+        config = _require(buf, children, end, b"avcC")
+        sps = _avcc_sps(buf[config[0]:config[1]])
+    elif kind in (b"hvc1", b"hev1"):
+        config = _require(buf, children, end, b"hvcC")
+        sps = _hvcc_sps(buf[config[0]:config[1]])
+    else:
+        raise _Unsupported(f"video sample entry {kind!r}")
+    sar = None
+    pasp = _child(buf, children, end, b"pasp")
+    if pasp is not None and pasp[1] - pasp[0] >= 8:
+        sar = struct.unpack_from(">II", buf, pasp[0])
+    return _video_stream(sps, sar, _mp4_colour(buf, children, end))
+
+
+def _esds_codec(buf, start: int, end: int) -> Optional[str]:
+    pos = start + 4  # version/flags
+
+    def descriptor(at: int) -> tuple[int, int]:
+        tag = buf[at]
+        length = 0
+        at += 1
+        for _ in range(4):
+            byte = buf[at]
+            at += 1
+            length = (length << 7) | (byte & 0x7F)
+            if not byte & 0x80:
+                break
+        return tag, at
+
+    tag, pos = descriptor(pos)
+    if tag != 0x03:
+        return None
+    flags = buf[pos + 2]
+    pos += 3
+    if flags & 0x80:
+        pos += 2
+    if flags & 0x40:
+        pos += 1 + buf[pos]
+    if flags & 0x20:
+        pos += 2
+    tag, pos = descriptor(pos)
+    if tag != 0x04 or pos >= end:
+        return None
+    return _MP4_OBJECT_TYPES.get(buf[pos])
+
+
+def _mp4_audio_codec(buf, kind: bytes, start: int, end: int) -> str:
+    if kind in _MP4_AUDIO:
+        return _MP4_AUDIO[kind]
+    if kind != b"mp4a":
+        raise _Unsupported(f"audio sample entry {kind!r}")
+    (version,) = struct.unpack_from(">H", buf, start + 8)
+    children = start + 28 + {0: 0, 1: 16, 2: 36}.get(version, 0)
+    esds = _child(buf, children, end, b"esds")
+    if esds is None:
+        wave = _child(buf, children, end, b"wave")
+        esds = _child(buf, wave[0], wave[1], b"esds") if wave else None
+    codec = _esds_codec(buf, *esds) if esds else None
+    if codec is None:
+        raise _Unsupported("mp4a without a known esds object type")
+    return codec
+
+
+def _full_box_u32_or_u64(buf, pos: int, version: int) -> tuple[int, int]:
+    if version == 1:
+        return struct.unpack_from(">Q", buf, pos)[0], pos + 8
+    return struct.unpack_from(">I", buf, pos)[0], pos + 4
+
+
+def _mp4_track(buf, start: int, end: int, movie_matrix, movie_timescale: int) -> Optional[dict[str, Any]]:
+    mdia = _require(buf, start, end, b"mdia")
+    hdlr = _require(buf, *mdia, b"hdlr")
+    handler = bytes(buf[hdlr[0] + 8:hdlr[0] + 12])
+    if handler == b"text":
+        # QuickTime chapter tracks and text subtitles share this handler.
+        raise _Unsupported("QuickTime text track")
+    if handler not in (b"vide", b"soun") and handler not in _MP4_SUBTITLE_HANDLERS:
+        return None
+    mdhd = _require(buf, *mdia, b"mdhd")
+    version = buf[mdhd[0]]
+    pos = mdhd[0] + (20 if version == 1 else 12)
+    (timescale,) = struct.unpack_from(">I", buf, pos)
+    media_duration, _ = _full_box_u32_or_u64(buf, pos + 4, version)
+    stbl = _require(buf, *mdia, b"minf", b"stbl")
+    stsd = _require(buf, *stbl, b"stsd")
+    (entry_count,) = struct.unpack_from(">I", buf, stsd[0] + 4)
+    if entry_count != 1:
+        raise _Unsupported("multiple sample descriptions")
+    entry = next(_boxes(buf, stsd[0] + 8, stsd[1]), None)
+    if entry is None:
+        raise _Unsupported("empty sample description")
+    kind, entry_start, entry_end = entry
+    if kind in (b"encv", b"enca"):
+        raise _Unsupported("encrypted track")
+
+    if handler in _MP4_SUBTITLE_HANDLERS:
+        stream: dict[str, Any] = {"codec_type": "subtitle"}
+        if kind in _MP4_SUBTITLES:
+            stream["codec_name"] = _MP4_SUBTITLES[kind]
+        return stream
+    if timescale <= 0 or media_duration <= 0:
+        raise _Unsupported("track without duration")
+    if _child(buf, *stbl, b"stz2") is not None:
+        raise _Unsupported("compact sample sizes")
+    stsz = _require(buf, *stbl, b"stsz")
+    sample_size, sample_count = struct.unpack_from(">II", buf, stsz[0] + 4)
+    if sample_size:
+        data_size = sample_size * sample_count
+    else:
+        data_size = sum(struct.unpack_from(f">{sample_count}I", buf, stsz[0] + 12))
+
+    # FFmpeg trims the stream duration to a single edit when the edit is shorter.
+    duration = media_duration
+    edts = _child(buf, start, end, b"edts")
+    elst = _child(buf, *edts, b"elst") if edts else None
+    if elst is not None and movie_timescale > 0:
+        elst_version = buf[elst[0]]
+        (edits,) = struct.unpack_from(">I", buf, elst[0] + 4)
+        entry_size = 20 if elst_version == 1 else 12
+        segments = []
+        for index in range(edits):
+            at = elst[0] + 8 + index * entry_size
+            if elst_version == 1:
+                segment, media_time = struct.unpack_from(">Qq", buf, at)
+            else:
+                segment, media_time = struct.unpack_from(">Ii", buf, at)
+            if media_time != -1:
+                segments.append(segment)
+        if len(segments) == 1 and segments[0] > 0:
+            duration = min(duration, segments[0] * timescale // movie_timescale)
+
+    if handler == b"soun":
+        return {
+            "codec_name": _mp4_audio_codec(buf, kind, entry_start, entry_end),
+            "codec_type": "audio",
+            "bit_rate": str(data_size * 8 * timescale // duration),
+        }
+
+    stream = _mp4_video_entry(buf, kind, entry_start, entry_end)
+    stts = _require(buf, *stbl, b"stts")
+    (stts_count,) = struct.unpack_from(">I", buf, stts[0] + 4)
+    runs = [struct.unpack_from(">II", buf, stts[0] + 8 + 8 * i) for i in range(stts_count)]
+    if not runs or not (stts_count == 1 or (stts_count == 2 and runs[1][0] == 1)) or runs[0][1] <= 0:
+        # ffprobe estimates r_frame_rate from timestamps for variable frame rate.
+        raise _Unsupported("variable frame rate")
+    frames = sum(count for count, delta in runs if delta > 0)
+    total = sum(count * delta for count, delta in runs if delta > 0)
+    stream["r_frame_rate"] = _rate(Fraction(timescale, runs[0][1]))
+    stream["avg_frame_rate"] = _rate(Fraction(timescale * frames, total))
+    stream["bit_rate"] = str(data_size * 8 * timescale // duration)
+
+    tkhd = _require(buf, start, end, b"tkhd")
+    matrix_at = tkhd[0] + (52 if buf[tkhd[0]] == 1 else 40)
+    rotation = _rotation(_matrix(buf, matrix_at), movie_matrix)
+    if rotation is not None:
+        stream["side_data_list"] = [{"side_data_type": "Display Matrix", "rotation": rotation}]
+    return stream
+
+
+def _mp4_prefix_boxes(buf):
+    # Top-level walk over a growing file: stop at moov, give up at mdat.
+    pos = 0
+    while True:
+        if pos + 16 > len(buf):
+            raise _NeedMore(pos + 16)
+        size, kind = struct.unpack_from(">I4s", buf, pos)
+        header = 8
+        if size == 1:
+            (size,) = struct.unpack_from(">Q", buf, pos + 8)
+            header = 16
+        elif size == 0:
+            raise _Unsupported(f"{kind!r} box runs to end of file")
+        if size < header:
+            raise _Unsupported(f"truncated {kind!r} box")
+        if kind in (b"mdat", b"moof"):
+            raise _Unsupported("moov is not at the front")
+        if pos + size > len(buf):
+            raise _NeedMore(pos + size)
+        yield kind, pos + header, pos + size
+        if kind == b"moov":
+            return
+        pos += size
+
+
+def _probe_mp4(buf, partial: bool = False) -> dict[str, Any]:
+    ftyp = moov = None
+    for kind, start, end in _mp4_prefix_boxes(buf) if partial else _boxes(buf, 0, len(buf)):
+        if kind == b"ftyp":
+            ftyp = (start, end)
+        elif kind == b"moov":
+            moov = (start, end)
+        elif kind == b"moof":
+            raise _Unsupported("fragmented MP4")
+    if moov is None:
+        raise _Unsupported("no moov box")
+    if _child(buf, *moov, b"mvex") is not None or _child(buf, *moov, b"cmov") is not None:
+        raise _Unsupported("fragmented or compressed moov")
+    if buf.find(b"covr", *moov) != -1:
+        # Cover art becomes an attached-picture video stream in ffprobe.
+        raise _Unsupported("cover art")
+    mvhd = _require(buf, *moov, b"mvhd")
+    version = buf[mvhd[0]]
+    pos = mvhd[0] + (20 if version == 1 else 12)
+    (movie_timescale,) = struct.unpack_from(">I", buf, pos)
+    movie_duration, _ = _full_box_u32_or_u64(buf, pos + 4, version)
+    if movie_timescale <= 0 or movie_duration <= 0:
+        raise _Unsupported("movie without duration")
+    movie_matrix = _matrix(buf, mvhd[0] + (48 if version == 1 else 36))
+
+    streams = []
+    for kind, start, end in _boxes(buf, *moov):
+        if kind == b"trak":
+            stream = _mp4_track(buf, start, end, movie_matrix, movie_timescale)
+            if stream is not None:
+                stream["index"] = len(streams)
+                streams.append(stream)
+    tags: dict[str, str] = {}
+    if ftyp is not None and ftyp[1] - ftyp[0] >= 8:
+        raw = bytes(buf[ftyp[0]:ftyp[1]])
+        tags["major_brand"] = raw[:4].decode("latin-1")
+        tags["minor_version"] = str(struct.unpack_from(">I", raw, 4)[0])
+        tags["compatible_brands"] = raw[8:].decode("latin-1")
+    # av_rescale(duration, AV_TIME_BASE, timescale), rounded to nearest.
+    micros = (movie_duration * 2_000_000 + movie_timescale) // (2 * movie_timescale)
+    return {
+        "streams": streams,
+        "format": {"format_name": MP4_FORMAT_NAME, "duration": f"{micros / 1_000_000:.6f}", "tags": tags},
+    }
+
+
+# --- Matroska / WebM -----------------------------------------------------------
+
+
+def _ebml_id(buf, pos: int) -> tuple[int, int]:
+    first = buf[pos]
+    length = 1
+    while length <= 4 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 4:
+        raise _Unsupported("invalid EBML ID")
+    return int.from_bytes(buf[pos:pos + length], "big"), pos + length
+
+
+def _ebml_size(buf, pos: int) -> tuple[Optional[int], int]:
+    first = buf[pos]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8:
+        raise _Unsupported("invalid EBML size")
+    value = first & (0xFF >> length)
+    for byte in buf[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    if value == (1 << (7 * length)) - 1:
+        return None, pos + length
+    return value, pos + length
+
+
+def _elements(buf, start: int, end: int, truncated: type[Exception] = _Unsupported):
+    pos = start
+    while pos < end:
+        element_id, pos = _ebml_id(buf, pos)
+        size, pos = _ebml_size(buf, pos)
+        if size is None:
+            if element_id != _MKV_CLUSTER:
+                raise _Unsupported("unknown-size element")
+            yield element_id, pos, None
+            return
+        if pos + size > end:
+            if element_id == _MKV_CLUSTER and truncated is _NeedMore:
+                # A growing file: the caller stops here without reading the Cluster.
+                yield element_id, pos, end
+                return
+            if truncated is _NeedMore:
+                raise _NeedMore(pos + size)
+            raise truncated("truncated element")
+        yield element_id, pos, pos + size
+        pos += size
+
+
+def _ebml_uint(buf, start: int, end: int) -> int:
+    return int.from_bytes(buf[start:end], "big")
+
+
+def _ebml_float(buf, start: int, end: int) -> float:
+    if end - start == 4:
+        return struct.unpack_from(">f", buf, start)[0]
+    if end - start == 8:
+        return struct.unpack_from(">d", buf, start)[0]
+    if end == start:
+        return 0.0
+    raise _Unsupported("invalid EBML float")
+
+
+def _mkv_track(buf, start: int, end: int) -> Optional[dict[str, Any]]:
+    fields: dict[int, tuple[int, int]] = {}
+    for element_id, child_start, child_end in _elements(buf, start, end):
+        fields.setdefault(element_id, (child_start, child_end))
+    if _MKV_CONTENT_ENCODINGS in fields:
+        raise _Unsupported("compressed or encrypted track")
+    track_type = _ebml_uint(buf, *fields[_MKV_TRACK_TYPE]) if _MKV_TRACK_TYPE in fields else 0
+    codec_id = bytes(buf[slice(*fields[_MKV_CODEC_ID])]).decode("ascii", "replace").rstrip("\0") \
+        if _MKV_CODEC_ID in fields else ""
+    if track_type == 2:
+        codec = _MKV_AUDIO.get(codec_id) or ("aac" if codec_id.startswith("A_AAC") else None)
+        if codec is None:
+            raise _Unsupported(f"audio codec {codec_id}")
+        return {"codec_name": codec, "codec_type": "audio"}
+    if track_type == 17:
+        stream: dict[str, Any] = {"codec_type": "subtitle"}
+        if codec_id in _MKV_SUBTITLES:
+            stream["codec_name"] = _MKV_SUBTITLES[codec_id]
+        return stream
+    if track_type != 1:
+        return None
+    private = bytes(buf[slice(*fields[_MKV_CODEC_PRIVATE])]) if _MKV_CODEC_PRIVATE in fields else b""
+    if codec_id == "V_MPEG4/ISO/AVC":
+        sps = _avcc_sps(private)
+    elif codec_id == "V_MPEGH/ISO/HEVC":
+        sps = _hvcc_sps(private)
+    else:
+        raise _Unsupported(f"video codec {codec_id}")
+    if _MKV_DEFAULT_DURATION not in fields:
+        raise _Unsupported("no DefaultDuration")
+    video: dict[int, tuple[int, int]] = {}
+    if _MKV_VIDEO in fields:
+        for element_id, child_start, child_end in _elements(buf, *fields[_MKV_VIDEO]):
+            video.setdefault(element_id, (child_start, child_end))
+    if _MKV_PROJECTION in video:
+        raise _Unsupported("projection")
+    pixel_w = _ebml_uint(buf, *video[_MKV_PIXEL_WIDTH]) if _MKV_PIXEL_WIDTH in video else 0
+    pixel_h = _ebml_uint(buf, *video[_MKV_PIXEL_HEIGHT]) if _MKV_PIXEL_HEIGHT in video else 0
+    display_unit = _ebml_uint(buf, *video[_MKV_DISPLAY_UNIT]) if _MKV_DISPLAY_UNIT in video else 0
+    if display_unit != 0:
+        raise _Unsupported("display unit")
+    display_w = _ebml_uint(buf, *video[_MKV_DISPLAY_WIDTH]) if _MKV_DISPLAY_WIDTH in video else pixel_w
+    display_h = _ebml_uint(buf, *video[_MKV_DISPLAY_HEIGHT]) if _MKV_DISPLAY_HEIGHT in video else pixel_h
+    colour: dict[str, Any] = {}
+    if _MKV_COLOUR in video:
+        for element_id, child_start, child_end in _elements(buf, *video[_MKV_COLOUR]):
+            value = _ebml_uint(buf, child_start, child_end)
+            if element_id == _MKV_MATRIX and value != 2:
+                colour["matrix"] = value
+            elif element_id == _MKV_TRANSFER and value != 2:
+                colour["transfer"] = value
+            elif element_id == _MKV_PRIMARIES and value != 2:
+                colour["primaries"] = value
+            elif element_id == _MKV_RANGE and value in (1, 2):
+                colour["full_range"] = value == 2
+    sar = None
+    if pixel_w and pixel_h and display_w and display_h:
+        sar = (pixel_h * display_w, pixel_w * display_h)
+    stream = _video_stream(sps, sar, colour)
+    default_duration = _ebml_uint(buf, *fields[_MKV_DEFAULT_DURATION])
+    if default_duration <= 0:
+        raise _Unsupported("zero DefaultDuration")
+    fps = _limit_rational(Fraction(1_000_000_000, default_duration), 30000)
+    if not 5 < fps < 1000:
+        raise _Unsupported("frame rate outside the range FFmpeg trusts")
+    stream["avg_frame_rate"] = stream["r_frame_rate"] = _rate(fps)
+    return stream
+
+
+def _mkv_has_bitrate_tags(buf, start: int, end: int) -> bool:
+    # Statistics tags (mkvmerge) carry BPS, which ffprobe may turn into a stream bit rate.
+    for element_id, tag_start, tag_end in _elements(buf, start, end):
+        if element_id != _MKV_TAG:
+            continue
+        for child_id, child_start, child_end in _elements(buf, tag_start, tag_end):
+            if child_id != _MKV_SIMPLE_TAG:
+                continue
+            for name_id, name_start, name_end in _elements(buf, child_start, child_end):
+                if name_id == _MKV_TAG_NAME and bytes(buf[name_start:name_end]).upper().startswith(b"BPS"):
+                    return True
+    return False
+
+
+def _probe_mkv(buf, partial: bool = False) -> dict[str, Any]:
+    pos = 0
+    header_id, pos = _ebml_id(buf, pos)
+    header_size, pos = _ebml_size(buf, pos)
+    if header_size is None:
+        raise _Unsupported("unknown-size EBML header")
+    pos += header_size
+    segment_id, pos = _ebml_id(buf, pos)
+    segment_size, pos = _ebml_size(buf, pos)
+    if segment_id != _MKV_SEGMENT:
+        raise _Unsupported("no Segment")
+    segment_start = pos
+    segment_end = len(buf) if segment_size is None else segment_start + segment_size
+    if segment_end > len(buf):
+        if not partial:
+            raise _Unsupported("truncated Segment")
+        segment_end = len(buf)
+
+    info = tracks = tags = None
+    seek_targets: dict[int, int] = {}
+    for element_id, start, end in _elements(buf, segment_start, segment_end, _NeedMore if partial else _Unsupported):
+        if element_id == _MKV_CLUSTER:
+            break
+        if element_id == _MKV_INFO:
+            info = (start, end)
+        elif element_id == _MKV_TRACKS:
+            tracks = (start, end)
+        elif element_id == _MKV_TAGS:
+            tags = (start, end)
+        elif element_id == _MKV_ATTACHMENTS:
+            raise _Unsupported("attachments")
+        elif element_id == _MKV_SEEKHEAD:
+            for seek_id, seek_start, seek_end in _elements(buf, start, end):
+                if seek_id != _MKV_SEEK:
+                    continue
+                target = position = None
+                for child_id, child_start, child_end in _elements(buf, seek_start, seek_end):
+                    if child_id == _MKV_SEEK_ID:
+                        target = _ebml_uint(buf, child_start, child_end)
+                    elif child_id == _MKV_SEEK_POSITION:
+                        position = _ebml_uint(buf, child_start, child_end)
+                if target is not None and position is not None:
+                    seek_targets[target] = segment_start + position
+    else:
+        if partial:
+            # Metadata may still precede the first Cluster.
+            raise _NeedMore()
+    if _MKV_ATTACHMENTS in seek_targets:
+        raise _Unsupported("attachments")
+    if tags is None and _MKV_TAGS in seek_targets and not partial:
+        tag_id, tag_pos = _ebml_id(buf, seek_targets[_MKV_TAGS])
+        tag_size, tag_pos = _ebml_size(buf, tag_pos)
+        if tag_id != _MKV_TAGS or tag_size is None or tag_pos + tag_size > len(buf):
+            raise _Unsupported("Tags not where SeekHead points")
+        tags = (tag_pos, tag_pos + tag_size)
+    if info is None or tracks is None:
+        raise _Unsupported("Info or Tracks after the first Cluster")
+    if tags is not None and _mkv_has_bitrate_tags(buf, *tags):
+        raise _Unsupported("BPS statistics tags")
+
+    timecode_scale, duration = 1_000_000, None
+    for element_id, start, end in _elements(buf, *info):
+        if element_id == _MKV_TIMECODE_SCALE:
+            timecode_scale = _ebml_uint(buf, start, end)
+        elif element_id == _MKV_DURATION:
+            duration = _ebml_float(buf, start, end)
+    if not duration or duration <= 0 or not math.isfinite(duration):
+        raise _Unsupported("no Segment duration")
+
+    streams = []
+    for element_id, start, end in _elements(buf, *tracks):
+        if element_id == _MKV_TRACK_ENTRY:
+            stream = _mkv_track(buf, start, end)
+            if stream is not None:
+                stream["index"] = len(streams)
+                streams.append(stream)
+    micros = int(duration * timecode_scale / 1000)
+    return {
+        "streams": streams,
+        "format": {"format_name": MKV_FORMAT_NAME, "duration": f"{micros / 1_000_000:.6f}", "tags": {}},
+    }
@@ -0,0 +1,122 @@
+"""Small JSON state files shared by the API and worker processes.
+
+Prefork Celery children, the API, and the desktop runtime can all touch the
+same learned-state file.  Each read/modify/write happens under a per-file
+OS lock plus a process-local lock, and writes are atomic replacements, the
+same scheme ``history_manager`` uses for ``history.json``.
+"""
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+_PROCESS_LOCK = threading.RLock()
+
+
+def state_path(env_name: str, filename: str) -> Path:
+    """Return ``$env_name`` or ``$APP_DATA_DIR/filename``."""
+    override = os.getenv(env_name, "").strip()
+    if override:
+        return Path(override)
+    return Path(os.getenv("APP_DATA_DIR", "/app")) / filename
+
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lock_path = path.with_name(f".{path.name}.lock")
+    with open(lock_path, "a+b") as lock_handle:
+        lock_handle.seek(0, os.SEEK_END)
+        if lock_handle.tell() == 0:
+            lock_handle.write(b"0")
+            lock_handle.flush()
+        lock_handle.seek(0)
+        if os.name == "nt":
+            import msvcrt
+
+            msvcrt.locking(lock_handle.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(lock_handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                import msvcrt
+
+                lock_handle.seek(0)
+                msvcrt.locking(lock_handle.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(lock_handle.fileno(), fcntl.LOCK_UN)
+
+
+def _read_unlocked(path: Path, default: Any) -> Any:
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            value = json.load(handle)
+    except (FileNotFoundError, json.JSONDecodeError, OSError, TypeError, ValueError):
+        return default
+    return value if isinstance(value, type(default)) else default
+
+
+def _write_unlocked(path: Path, value: Any) -> None:
+    temporary_name: str | None = None
+    try:
+        with tempfile.NamedTemporaryFile(
+            mode="w",
+            encoding="utf-8",
+            dir=str(path.parent),
+            prefix=f".{path.name}.",
+            suffix=".tmp",
+            delete=False,
+        ) as temporary:
+            temporary_name = temporary.name
+            json.dump(value, temporary, indent=2, sort_keys=True)
+            temporary.flush()
+            os.fsync(temporary.fileno())
+        os.replace(temporary_name, path)
+        temporary_name = None
+    finally:
+        if temporary_name:
+            try:
+                os.remove(temporary_name)
+            except OSError:
+                pass
+
+
+def read_json(path: Path, default: Any) -> Any:
+    """Read a state file; missing or corrupt files return ``default``."""
+    with _PROCESS_LOCK:
+        try:
+            with _file_lock(path):
+                return _read_unlocked(path, default)
+        except OSError:
+            return default
+
+
+def update_json(path: Path, mutate: Callable[[Any], Any], default: Any) -> Any:
+    """Apply ``mutate`` to the stored value atomically and return the result.
+
+    ``mutate`` may modify the value in place (returning ``None``) or return
+    a replacement.  Storage failures are swallowed: learned state is an
+    optimization and must never fail the job that produced it.
+    """
+    with _PROCESS_LOCK:
+        try:
+            with _file_lock(path):
+                value = _read_unlocked(path, default)
+                replacement = mutate(value)
+                if replacement is not None:
+                    value = replacement
+                _write_unlocked(path, value)
+                return value
+        except OSError:
+            return default
@@ -340,6 +340,7 @@ def record_worker_event(task_id: str, event: dict[str, Any]) -> None:
         "requested_encoder", "resolved_encoder", "actual_encoder",
         "hardware_used", "hardware_type", "hardware_device", "render_device",
         "fallback_occurred", "fallback_stage", "fallback_reason", "decoder",
+        "optimizations",
     )
     kind = str(event.get("type") or "log")
     task_state = {
@@ -360,7 +361,7 @@ def record_worker_event(task_id: str, event: dict[str, Any]) -> None:
             "output_path", "final_size_mb", "duration_s", "target_size_mb", "encoder",
             "requested_encoder", "resolved_encoder", "actual_encoder", "hardware_used",
             "hardware_device", "render_device", "fallback_occurred", "fallback_stage",
-            "fallback_reason", "hardware_type", "decoder",
+            "fallback_reason", "hardware_type", "decoder", "optimizations",
         ):
             if stats.get(key) is not None:
                 info[key] = stats[key]
@@ -0,0 +1,144 @@
+"""Learned encoder overshoot model used to pre-compensate target bitrates.
+
+Every size-targeted job records how far its first pass landed from the size
+its requested video bitrate implied.  Ratios are kept as an exponentially
+weighted average per (encoder, preset, output-resolution bucket, duration
+bucket).  Once a bucket has enough samples, the worker scales the next
+job's video bitrate by the inverse ratio so the size retry (a full second
+encode) is rarely needed.
+
+The file also keeps retry counters split by whether a correction was
+applied, which is what ``GET /api/system/overshoot-model`` reports as the
+retry rate before and after the model.
+"""
+from __future__ import annotations
+
+import os
+import time
+from typing import Any
+
+from shared.json_store import read_json, state_path, update_json
+
+MIN_SAMPLES = 3
+EWMA_ALPHA = 0.25
+# Never cut more than 30% or add more than 5% on the model's word alone; the
+# post-encode size check remains the safety net for outliers.
+MIN_CORRECTION = 0.70
+MAX_CORRECTION = 1.05
+# Ratios outside this band are failed/odd encodes, not rate-control error.
+_RATIO_BOUNDS = (0.2, 5.0)
+
+
+def model_path():
+    return state_path("OVERSHOOT_MODEL_FILE", "overshoot_model.json")
+
+
+def model_enabled() -> bool:
+    return os.getenv("OVERSHOOT_MODEL", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def resolution_bucket(height: int | float | None) -> str:
+    if not height or height <= 0:
+        return "unknown"
+    for limit, label in ((480, "sd"), (720, "720p"), (1080, "1080p"), (1440, "1440p")):
+        if height <= limit:
+            return label
+    return "2160p+"
+
+
+def duration_bucket(seconds: float | None) -> str:
+    if not seconds or seconds <= 0:
+        return "unknown"
+    for limit, label in ((60, "<1m"), (300, "1-5m"), (1200, "5-20m"), (3600, "20-60m")):
+        if seconds < limit:
+            return label
+    return "60m+"
+
+
+def model_key(encoder: str, preset: str, height: int | float | None, duration_s: float | None) -> str:
+    return "|".join((
+        str(encoder or "unknown"),
+        str(preset or "default").lower(),
+        resolution_bucket(height),
+        duration_bucket(duration_s),
+    ))
+
+
+def _empty() -> dict[str, Any]:
+    return {"entries": {}, "retries": {}}
+
+
+def correction_factor(
+    encoder: str,
+    preset: str,
+    height: int | float | None,
+    duration_s: float | None,
+) -> tuple[float, dict[str, Any] | None]:
+    """Return ``(scale, entry)`` for a job; ``scale`` is 1.0 when unknown."""
+    if not model_enabled():
+        return 1.0, None
+    data = read_json(model_path(), _empty())
+    entry = (data.get("entries") or {}).get(model_key(encoder, preset, height, duration_s))
+    if not isinstance(entry, dict) or int(entry.get("samples", 0)) < MIN_SAMPLES:
+        return 1.0, entry if isinstance(entry, dict) else None
+    ratio = float(entry.get("ratio") or 1.0)
+    if ratio <= 0:
+        return 1.0, entry
+    return max(MIN_CORRECTION, min(MAX_CORRECTION, 1.0 / ratio)), entry
+
+
+def record_result(
+    encoder: str,
+    preset: str,
+    height: int | float | None,
+    duration_s: float | None,
+    ratio: float,
+    *,
+    compensated: bool,
+    retried: bool,
+) -> None:
+    """Fold one first-pass measurement into the model and retry counters."""
+    key = model_key(encoder, preset, height, duration_s)
+    usable = _RATIO_BOUNDS[0] <= ratio <= _RATIO_BOUNDS[1]
+
+    def mutate(data: dict[str, Any]) -> None:
+        entries = data.setdefault("entries", {})
+        if usable:
+            entry = entries.setdefault(key, {"ratio": ratio, "samples": 0})
+            previous = float(entry.get("ratio") or ratio)
+            entry["ratio"] = round(
+                ratio if entry["samples"] == 0 else (EWMA_ALPHA * ratio + (1.0 - EWMA_ALPHA) * previous),
+                5,
+            )
+            entry["samples"] = int(entry.get("samples", 0)) + 1
+            entry["last_ratio"] = round(ratio, 5)
+            entry["updated_at"] = time.time()
+        counters = data.setdefault("retries", {}).setdefault(
+            "after" if compensated else "before", {"jobs": 0, "retries": 0},
+        )
+        counters["jobs"] = int(counters.get("jobs", 0)) + 1
+        counters["retries"] = int(counters.get("retries", 0)) + (1 if retried else 0)
+
+    update_json(model_path(), mutate, _empty())
+
+
+def snapshot() -> dict[str, Any]:
+    """Return the model entries plus retry rates without/with compensation."""
+    data = read_json(model_path(), _empty())
+    retry_rate: dict[str, Any] = {}
+    for phase in ("before", "after"):
+        counters = (data.get("retries") or {}).get(phase) or {}
+        jobs = int(counters.get("jobs", 0))
+        retries = int(counters.get("retries", 0))
+        retry_rate[phase] = {
+            "jobs": jobs,
+            "retries": retries,
+            "rate": round(retries / jobs, 4) if jobs else None,
+        }
+    return {
+        "enabled": model_enabled(),
+        "min_samples": MIN_SAMPLES,
+        "correction_bounds": [MIN_CORRECTION, MAX_CORRECTION],
+        "entries": data.get("entries") or {},
+        "retry_rate": retry_rate,
+    }
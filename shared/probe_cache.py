@@ -0,0 +1,187 @@
+"""Content-addressed ffprobe cache shared by the API, Folder Watch and worker.
+
+An upload used to be probed by the API when it arrived and again by the
+worker before encoding; Folder Watch files were probed on dispatch and
+again on reconcile.  Every caller now runs the same tiered probe and stores
+the raw ffprobe JSON here, keyed by the file's ``(device, inode, size,
+mtime_ns)``; a later caller parses the stored result instead of starting
+another ffprobe process.
+
+The first tier (:data:`HEADER_PROBE_ARGS`) reads only FFmpeg's default
+probe window.  :func:`deep_probe_reason` decides whether its result leaves
+duration, stream layout or display rotation in doubt; only then does the
+caller run the deep probe (:data:`FULL_PROBE_ARGS`, up to 100 MB).
+
+Entries live in Redis (or the desktop runtime's local store) for
+``PROBE_CACHE_TTL_S`` and record the ``tier`` that produced them.
+``complete`` is false for results of the reduced fallback probe, which lack
+fields the worker needs; the worker probes again in that case.  Cache
+failures are misses, never errors.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+PROBE_CACHE_TTL_S = 24 * 3600
+_KEY_PREFIX = "probe"
+# Large probesize helps read moov/trak metadata for rotation on phone MP4/MOV (default probe can miss tags).
+# Full -show_streams (not selective -show_entries) so side_data_list includes Display Matrix rotation
+# for HEVC/Android MP4; selective entries have been observed to omit rotation while ffmpeg -i shows it.
+FULL_PROBE_ARGS = (
+    "-probesize", "100M",
+    "-analyzeduration", "20M",
+    "-show_format",
+    "-show_streams",
+    "-of", "json",
+)
+
+# Header tier: FFmpeg's default probe window (5 MB, 5 s), enough for
+# ordinary files; deep_probe_reason escalates the rest.
+HEADER_PROBE_ARGS = (
+    "-probesize", "5M",
+    "-analyzeduration", "5M",
+    "-show_format",
+    "-show_streams",
+    "-of", "json",
+)
+PROBE_TIERS = ("container", "header", "deep", "reduced")
+# Coded sizes phones record portrait video in (rotation carried in metadata).
+_LANDSCAPE_PHONE_RASTERS = frozenset({(1920, 1080), (1280, 720), (3840, 2160)})
+
+_CLIENT: Any = None
+
+
+def probe_cache_enabled() -> bool:
+    return os.getenv("PROBE_CACHE", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def full_probe_command(path: str) -> list[str]:
+    return ["ffprobe", "-v", "error", *FULL_PROBE_ARGS, str(path)]
+
+
+def header_probe_command(path: str) -> list[str]:
+    return ["ffprobe", "-v", "error", *HEADER_PROBE_ARGS, str(path)]
+
+
+def _positive(value: Any) -> Optional[float]:
+    try:
+        parsed = float(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if math.isfinite(parsed) and parsed > 0 else None
+
+
+def _has_rotation_metadata(stream: dict[str, Any]) -> bool:
+    if any("rotat" in str(key).lower() for key in (stream.get("tags") or {})):
+        return True
+    return any(isinstance(sd, dict) and "rotation" in sd for sd in stream.get("side_data_list") or [])
+
+
+def _rate_known(value: Any) -> bool:
+    numerator, _, denominator = str(value or "").partition("/")
+    return _positive(numerator) is not None and (not denominator or _positive(denominator) is not None)
+
+
+def deep_probe_reason(data: Any) -> Optional[str]:
+    """Return why a header-tier result needs the deep probe, or ``None`` if it is enough."""
+    if not isinstance(data, dict):
+        return "unexpected output"
+    fmt = data.get("format") or {}
+    if _positive(fmt.get("duration")) is None:
+        return "missing duration"
+    streams = [s for s in data.get("streams") or [] if isinstance(s, dict)]
+    video = [s for s in streams if s.get("codec_type") == "video"]
+    if not video:
+        return "no video stream"
+    for stream in streams:
+        if stream.get("codec_type") in ("video", "audio") and not stream.get("codec_name"):
+            return "unidentified stream"
+    for stream in video:
+        if not (_positive(stream.get("width")) and _positive(stream.get("height")) and stream.get("pix_fmt")):
+            return "incomplete video stream"
+        if not (_rate_known(stream.get("avg_frame_rate")) or _rate_known(stream.get("r_frame_rate"))):
+            return "no frame rate"
+    first = video[0]
+    if _has_rotation_metadata(first):
+        return None
+    width, height = _positive(first.get("width")), _positive(first.get("height"))
+    tags = fmt.get("tags") or {}
+    brands = f"{tags.get('major_brand', '')} {tags.get('compatible_brands', '')}".lower()
+    phone = "qt" in brands or any(str(key).lower().startswith(("com.apple", "com.android")) for key in tags)
+    if phone and (int(width), int(height)) in _LANDSCAPE_PHONE_RASTERS:
+        return "phone file without rotation metadata"
+    dar = str(first.get("display_aspect_ratio") or "")
+    dar_w, _, dar_h = dar.partition(":")
+    dar_w, dar_h = _positive(dar_w), _positive(dar_h)
+    if dar_w and dar_h and (dar_w > dar_h) != (width >= height) and dar_w != dar_h:
+        return "display aspect ratio disagrees with coded size"
+    return None
+
+
+def fingerprint(path: str | os.PathLike) -> Optional[str]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _client() -> Any:
+    global _CLIENT
+    if _CLIENT is None:
+        if os.getenv("LOCAL_RUNTIME", "").strip().lower() in {"1", "true", "yes", "on"}:
+            from shared.local_runtime import get_sync_redis
+
+            _CLIENT = get_sync_redis()
+        else:
+            from redis import Redis
+
+            _CLIENT = Redis.from_url(
+                os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0"),
+                decode_responses=True, socket_connect_timeout=1, socket_timeout=1,
+            )
+    return _CLIENT
+
+
+def get(path: str | os.PathLike) -> Optional[dict[str, Any]]:
+    """Return ``{"data": <ffprobe JSON>, "complete": bool, "tier": str}`` or ``None``."""
+    if not probe_cache_enabled():
+        return None
+    key = fingerprint(path)
+    if key is None:
+        return None
+    try:
+        stored = _client().get(f"{_KEY_PREFIX}:{key}")
+    except Exception as exc:
+        logger.debug("probe cache: store unavailable: %s", exc)
+        return None
+    if not stored:
+        return None
+    try:
+        entry = json.loads(stored)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(entry, dict) or not isinstance(entry.get("data"), dict):
+        return None
+    return entry
+
+
+def put(path: str | os.PathLike, data: dict[str, Any], *, complete: bool, tier: str = "deep") -> None:
+    if not probe_cache_enabled():
+        return
+    key = fingerprint(path)
+    if key is None:
+        return
+    try:
+        _client().setex(
+            f"{_KEY_PREFIX}:{key}", PROBE_CACHE_TTL_S,
+            json.dumps({"data": data, "complete": bool(complete), "tier": tier}),
+        )
+    except Exception as exc:
+        logger.debug("probe cache: could not store %s: %s", path, exc)
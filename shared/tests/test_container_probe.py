@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import os
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from shared import container_probe
+
+
+class _BitWriter:
+    def __init__(self) -> None:
+        self.bits: list[int] = []
+
+    def u(self, count: int, value: int) -> None:
+        self.bits.extend((value >> (count - 1 - i)) & 1 for i in range(count))
+
+    def ue(self, value: int) -> None:
+        code = value + 1
+        self.u(code.bit_length() * 2 - 1, code)
+
+    def payload(self) -> bytes:
+        bits = self.bits + [1]
+        bits += [0] * (-len(bits) % 8)
+        return bytes(int("".join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8))
+
+
+def h264_sps(width: int, height: int, *, full_range: bool = False) -> bytes:
+    w = _BitWriter()
+    w.u(8, 100)  # High
+    w.u(8, 0)
+    w.u(8, 13)
+    w.ue(0)
+    w.ue(1)  # chroma_format_idc 4:2:0
+    w.ue(0)
+    w.ue(0)
+    w.u(1, 0)
+    w.u(1, 0)
+    w.ue(0)
+    w.ue(0)  # pic_order_cnt_type
+    w.ue(2)
+    w.ue(4)
+    w.u(1, 0)
+    w.ue(width // 16 - 1)
+    w.ue(height // 16 - 1)
+    w.u(1, 1)  # frame_mbs_only_flag
+    w.u(1, 1)
+    w.u(1, 0)  # no cropping
+    w.u(1, 1)  # vui_parameters_present_flag
+    w.u(1, 1)
+    w.u(8, 1)  # SAR 1:1
+    w.u(1, 0)
+    w.u(1, 1)  # video_signal_type_present_flag
+    w.u(3, 5)
+    w.u(1, 1 if full_range else 0)
+    w.u(1, 1)
+    w.u(8, 1)
+    w.u(8, 1)
+    w.u(8, 1)
+    return b"\x67" + w.payload()
+
+
+def box(kind: bytes, *parts: bytes) -> bytes:
+    payload = b"".join(parts)
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def matrix(a: int, b: int, c: int, d: int) -> bytes:
+    return struct.pack(">9i", a << 16, b << 16, 0, c << 16, d << 16, 0, 0, 0, 1 << 30)
+
+
+def mp4_video_trak(sps: bytes, *, rotation_matrix: bytes, frames: int = 48, frame_size: int = 1000) -> bytes:
+    avcc = bytes([1, 100, 0, 13, 0xFF, 0xE1]) + struct.pack(">H", len(sps)) + sps + b"\x01\x00\x04\x68\xee\x3c\x80"
+    sample_entry = bytes(6) + struct.pack(">H", 1) + bytes(16) + struct.pack(">HH", 320, 240) + bytes(50)
+    stsd = box(b"stsd", bytes(4), struct.pack(">I", 1), box(b"avc1", sample_entry, box(b"avcC", avcc)))
+    stts = box(b"stts", bytes(4), struct.pack(">III", 1, frames, 512))
+    stsz = box(b"stsz", bytes(4), struct.pack(">II", 0, frames), struct.pack(f">{frames}I", *([frame_size] * frames)))
+    stbl = box(b"stbl", stsd, stts, stsz)
+    mdhd = box(b"mdhd", bytes(4), bytes(8), struct.pack(">II", 12288, frames * 512), bytes(4))
+    hdlr = box(b"hdlr", bytes(8), b"vide", bytes(13))
+    tkhd = box(b"tkhd", bytes(4), bytes(36), rotation_matrix, struct.pack(">II", 320 << 16, 240 << 16))
+    return box(b"trak", tkhd, box(b"mdia", mdhd, hdlr, box(b"minf", stbl)))
+
+
+def mp4_audio_trak(frames: int = 94, frame_size: int = 256) -> bytes:
+    esds = box(
+        b"esds", bytes(4),
+        bytes([0x03, 25]), struct.pack(">HB", 1, 0),
+        bytes([0x04, 17, 0x40, 0x15]), bytes(15),
+    )
+    sample_entry = bytes(6) + struct.pack(">H", 1) + bytes(8) + struct.pack(">HHHHI", 2, 16, 0, 0, 48000 << 16)
+    stsd = box(b"stsd", bytes(4), struct.pack(">I", 1), box(b"mp4a", sample_entry, esds))
+    stts = box(b"stts", bytes(4), struct.pack(">III", 1, frames, 1024))
+    stsz = box(b"stsz", bytes(4), struct.pack(">II", frame_size, frames))
+    stbl = box(b"stbl", stsd, stts, stsz)
+    mdhd = box(b"mdhd", bytes(4), bytes(8), struct.pack(">II", 48000, frames * 1024), bytes(4))
+    hdlr = box(b"hdlr", bytes(8), b"soun", bytes(13))
+    tkhd = box(b"tkhd", bytes(4), bytes(36), matrix(1, 0, 0, 1), bytes(8))
+    return box(b"trak", tkhd, box(b"mdia", mdhd, hdlr, box(b"minf", stbl)))
+
+
+def mp4_file(*traks: bytes, extra_moov: bytes = b"") -> bytes:
+    ftyp = box(b"ftyp", b"isom", struct.pack(">I", 512), b"isomiso2avc1mp41")
+    mvhd = box(b"mvhd", bytes(4), bytes(8), struct.pack(">II", 1000, 2000), bytes(16), matrix(1, 0, 0, 1), bytes(28))
+    return ftyp + box(b"moov", mvhd, *traks, extra_moov) + box(b"mdat", bytes(64))
+
+
+def ebml(element_id: int, payload: bytes) -> bytes:
+    id_bytes = element_id.to_bytes((element_id.bit_length() + 7) // 8, "big")
+    return id_bytes + b"\x01" + len(payload).to_bytes(7, "big") + payload
+
+
+def ebml_uint(element_id: int, value: int) -> bytes:
+    return ebml(element_id, value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big"))
+
+
+def mkv_file(sps: bytes) -> bytes:
+    header = ebml(0x1A45DFA3, ebml(0x4282, b"matroska"))
+    info = ebml(0x1549A966, ebml_uint(0x2AD7B1, 1_000_000) + ebml(0x4489, struct.pack(">d", 2000.0)))
+    avcc = bytes([1, 100, 0, 13, 0xFF, 0xE1]) + struct.pack(">H", len(sps)) + sps
+    video_track = ebml(0xAE, (
+        ebml_uint(0xD7, 1) + ebml_uint(0x83, 1) + ebml(0x86, b"V_MPEG4/ISO/AVC") + ebml(0x63A2, avcc)
+        + ebml_uint(0x23E383, 41_666_667)
+        + ebml(0xE0, ebml_uint(0xB0, 320) + ebml_uint(0xBA, 240))
+    ))
+    audio_track = ebml(0xAE, ebml_uint(0xD7, 2) + ebml_uint(0x83, 2) + ebml(0x86, b"A_OPUS"))
+    tracks = ebml(0x1654AE6B, video_track + audio_track)
+    cluster = ebml(0x1F43B675, ebml_uint(0xE7, 0))
+    return header + ebml(0x18538067, info + tracks + cluster)
+
+
+class TestContainerProbe(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        env = patch.dict(os.environ, {"FAST_PROBE": "1"})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def write(self, name: str, data: bytes) -> Path:
+        path = Path(self._tmp.name) / name
+        path.write_bytes(data)
+        return path
+
+    def test_mp4_header_matches_ffprobe_shape(self):
+        path = self.write("clip.mp4", mp4_file(
+            mp4_video_trak(h264_sps(320, 240), rotation_matrix=matrix(0, 1, -1, 0)),
+            mp4_audio_trak(),
+        ))
+        data = container_probe.probe(path)
+        self.assertIsNotNone(data)
+        self.assertEqual(data["format"]["duration"], "2.000000")
+        self.assertEqual(data["format"]["tags"]["major_brand"], "isom")
+        video, audio = data["streams"]
+        self.assertEqual(video["codec_name"], "h264")
+        self.assertEqual(video["profile"], "High")
+        self.assertEqual(video["pix_fmt"], "yuv420p")
+        self.assertEqual((video["width"], video["height"]), (320, 240))
+        self.assertEqual(video["color_range"], "tv")
+        self.assertEqual(video["color_primaries"], "bt709")
+        self.assertEqual(video["display_aspect_ratio"], "4:3")
+        self.assertEqual(video["r_frame_rate"], "24/1")
+        self.assertEqual(video["avg_frame_rate"], "24/1")
+        self.assertEqual(video["bit_rate"], str(48 * 1000 * 8 // 2))
+        self.assertEqual(video["side_data_list"][0]["rotation"], -90)
+        self.assertEqual(audio["codec_name"], "aac")
+        self.assertEqual(audio["bit_rate"], str(94 * 256 * 8 * 48000 // (94 * 1024)))
+
+    def test_full_range_h264_reports_jpeg_pixel_format(self):
+        path = self.write("full.mp4", mp4_file(
+            mp4_video_trak(h264_sps(320, 240, full_range=True), rotation_matrix=matrix(1, 0, 0, 1)),
+        ))
+        video = container_probe.probe(path)["streams"][0]
+        self.assertEqual(video["pix_fmt"], "yuvj420p")
+        self.assertEqual(video["color_range"], "pc")
+        self.assertNotIn("side_data_list", video)
+
+    def test_declines_what_ffprobe_would_answer_differently(self):
+        cover = box(b"udta", box(b"meta", bytes(4), box(b"ilst", box(b"covr", bytes(8)))))
+        cases = {
+            "cover.m4a": mp4_file(mp4_audio_trak(), extra_moov=cover),
+            "fragmented.mp4": mp4_file(mp4_audio_trak(), extra_moov=box(b"mvex")),
+            "truncated.mp4": mp4_file(mp4_video_trak(h264_sps(320, 240), rotation_matrix=matrix(1, 0, 0, 1)))[:-20],
+            "text.mp4": b"not a container at all",
+            "empty.mp4": b"",
+        }
+        for name, data in cases.items():
+            with self.subTest(name=name):
+                self.assertIsNone(container_probe.probe(self.write(name, data)))
+        self.assertIsNone(container_probe.probe(Path(self._tmp.name) / "missing.mp4"))
+
+    def test_matroska_header(self):
+        data = container_probe.probe(self.write("clip.mkv", mkv_file(h264_sps(320, 240))))
+        self.assertIsNotNone(data)
+        self.assertEqual(data["format"]["duration"], "2.000000")
+        video, audio = data["streams"]
+        self.assertEqual(video["codec_name"], "h264")
+        self.assertEqual(video["avg_frame_rate"], "24/1")
+        self.assertEqual(video["display_aspect_ratio"], "4:3")
+        self.assertNotIn("bit_rate", video)
+        self.assertEqual(audio["codec_name"], "opus")
+
+    def test_prefix_waits_for_the_header_and_gives_up_on_trailing_moov(self):
+        mkv = mkv_file(h264_sps(320, 240))
+        cluster = mkv.index(bytes.fromhex("1F43B675"))
+        data, final, _needed = container_probe.probe_prefix(mkv[:cluster])
+        self.assertEqual((data, final), (None, False))
+        data, final, _needed = container_probe.probe_prefix(mkv[:cluster + 12])
+        self.assertTrue(final)
+        self.assertEqual(data["format"]["duration"], "2.000000")
+
+        mp4 = mp4_file(mp4_video_trak(h264_sps(320, 240), rotation_matrix=matrix(1, 0, 0, 1)))
+        moov, mdat = mp4.index(b"moov") - 4, mp4.index(b"mdat") - 4
+        self.assertEqual(container_probe.probe_prefix(mp4[:mdat - 1]), (None, False, mdat))
+        self.assertEqual(
+            container_probe.probe_prefix(mp4[:mdat]),
+            (container_probe.probe(self.write("a.mp4", mp4)), True, 0),
+        )
+        moov_last = mp4[:moov] + mp4[mdat:] + mp4[moov:mdat]
+        self.assertEqual(container_probe.probe_prefix(moov_last[:moov + 16]), (None, True, 0))
+
+    def test_prefix_reports_how_much_header_is_still_missing(self):
+        mp4 = mp4_file(mp4_video_trak(h264_sps(320, 240), rotation_matrix=matrix(1, 0, 0, 1)))
+        moov, mdat = mp4.index(b"moov") - 4, mp4.index(b"mdat") - 4
+        # Inside a box the parser waits for its end, then for the next header.
+        self.assertEqual(container_probe.probe_prefix(mp4[:20])[2], moov)
+        self.assertEqual(container_probe.probe_prefix(mp4[:moov + 4])[2], moov + 16)
+        self.assertEqual(container_probe.probe_prefix(mp4[:moov + 100])[2], mdat)
+        self.assertEqual(container_probe.probe_prefix(mp4[:4]), (None, False, 16))
+
+    def test_disabled_by_env(self):
+        path = self.write("clip.mkv", mkv_file(h264_sps(320, 240)))
+        with patch.dict(os.environ, {"FAST_PROBE": "0"}):
+            self.assertIsNone(container_probe.probe(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
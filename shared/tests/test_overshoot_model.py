@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from shared import overshoot_model
+
+
+class TestOvershootModel(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        env = patch.dict(os.environ, {
+            "OVERSHOOT_MODEL_FILE": str(Path(self._tmp.name) / "model.json"),
+            "OVERSHOOT_MODEL": "1",
+        })
+        env.start()
+        self.addCleanup(env.stop)
+
+    def _record(self, ratio, *, compensated=False, retried=False, duration=120.0):
+        overshoot_model.record_result(
+            "libx264", "medium", 720, duration, ratio,
+            compensated=compensated, retried=retried,
+        )
+
+    def test_no_correction_until_enough_samples(self):
+        for _ in range(overshoot_model.MIN_SAMPLES - 1):
+            self._record(1.10)
+        factor, entry = overshoot_model.correction_factor("libx264", "medium", 720, 120.0)
+        self.assertEqual(factor, 1.0)
+        self.assertEqual(entry["samples"], overshoot_model.MIN_SAMPLES - 1)
+
+    def test_consistent_overshoot_scales_bitrate_down(self):
+        for _ in range(overshoot_model.MIN_SAMPLES):
+            self._record(1.10)
+        factor, _ = overshoot_model.correction_factor("libx264", "medium", 720, 120.0)
+        self.assertAlmostEqual(factor, 1 / 1.10, places=3)
+        # Other buckets are unaffected.
+        other, _ = overshoot_model.correction_factor("libx264", "medium", 2160, 120.0)
+        self.assertEqual(other, 1.0)
+
+    def test_correction_is_clamped_and_outliers_ignored(self):
+        for _ in range(overshoot_model.MIN_SAMPLES):
+            self._record(2.5)
+        self._record(40.0)
+        factor, entry = overshoot_model.correction_factor("libx264", "medium", 720, 120.0)
+        self.assertEqual(factor, overshoot_model.MIN_CORRECTION)
+        self.assertEqual(entry["samples"], overshoot_model.MIN_SAMPLES)
+
+    def test_snapshot_reports_retry_rates_before_and_after(self):
+        self._record(1.2, retried=True)
+        self._record(1.2, retried=False)
+        self._record(1.0, compensated=True, retried=False)
+        snap = overshoot_model.snapshot()
+        self.assertEqual(snap["retry_rate"]["before"], {"jobs": 2, "retries": 1, "rate": 0.5})
+        self.assertEqual(snap["retry_rate"]["after"], {"jobs": 1, "retries": 0, "rate": 0.0})
+        self.assertIn("libx264|medium|720p|1-5m", snap["entries"])
+
+    def test_disabled_model_never_corrects(self):
+        for _ in range(overshoot_model.MIN_SAMPLES):
+            self._record(1.3)
+        with patch.dict(os.environ, {"OVERSHOOT_MODEL": "0"}):
+            self.assertEqual(overshoot_model.correction_factor("libx264", "medium", 720, 120.0)[0], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from shared import local_runtime, probe_cache
+
+
+class TestProbeCache(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        env = patch.dict(os.environ, {"LOCAL_RUNTIME": "1", "PROBE_CACHE": "1"})
+        env.start()
+        self.addCleanup(env.stop)
+        client = patch.object(probe_cache, "_CLIENT", None)
+        client.start()
+        self.addCleanup(client.stop)
+        local_runtime.reset_for_tests()
+        self.addCleanup(local_runtime.reset_for_tests)
+        self.path = Path(self._tmp.name) / "clip.mp4"
+        self.path.write_bytes(b"video")
+
+    def test_round_trip_keyed_by_file_identity(self):
+        data = {"format": {"duration": "2.0"}, "streams": []}
+        self.assertIsNone(probe_cache.get(self.path))
+        probe_cache.put(self.path, data, complete=True, tier="header")
+        self.assertEqual(probe_cache.get(str(self.path)), {"data": data, "complete": True, "tier": "header"})
+
+    def test_modified_file_misses(self):
+        probe_cache.put(self.path, {"format": {}}, complete=False)
+        self.path.write_bytes(b"longer video")
+        self.assertIsNone(probe_cache.get(self.path))
+
+    def test_missing_file_and_disabled_cache_miss(self):
+        probe_cache.put(Path(self._tmp.name) / "gone.mp4", {"format": {}}, complete=True)
+        self.assertIsNone(probe_cache.get(Path(self._tmp.name) / "gone.mp4"))
+        probe_cache.put(self.path, {"format": {}}, complete=True)
+        with patch.dict(os.environ, {"PROBE_CACHE": "0"}):
+            self.assertIsNone(probe_cache.get(self.path))
+
+    def test_full_probe_command_matches_worker_probe(self):
+        command = probe_cache.full_probe_command("in.mp4")
+        self.assertEqual(command[:3], ["ffprobe", "-v", "error"])
+        self.assertIn("-show_streams", command)
+        self.assertEqual(command[-1], "in.mp4")
+
+    def test_deep_probe_only_for_doubtful_header_results(self):
+        video = {
+            "codec_type": "video", "codec_name": "h264", "width": 1920, "height": 1080,
+            "pix_fmt": "yuv420p", "avg_frame_rate": "30/1",
+        }
+        ok = {"format": {"duration": "4.0", "tags": {"major_brand": "isom"}}, "streams": [video]}
+        self.assertIsNone(probe_cache.deep_probe_reason(ok))
+        cases = {
+            "missing duration": {"format": {"duration": "N/A"}, "streams": [video]},
+            "no video stream": {"format": {"duration": "4.0"}, "streams": [{"codec_type": "audio", "codec_name": "aac"}]},
+            "incomplete video stream": {"format": {"duration": "4.0"}, "streams": [{**video, "pix_fmt": None}]},
+            "no frame rate": {"format": {"duration": "4.0"}, "streams": [{**video, "avg_frame_rate": "0/0"}]},
+            "phone file without rotation metadata": {
+                "format": {"duration": "4.0", "tags": {"major_brand": "qt  "}}, "streams": [video],
+            },
+            "display aspect ratio disagrees with coded size": {
+                "format": {"duration": "4.0"}, "streams": [{**video, "display_aspect_ratio": "9:16"}],
+            },
+        }
+        for reason, data in cases.items():
+            with self.subTest(reason=reason):
+                self.assertEqual(probe_cache.deep_probe_reason(data), reason)
+        rotated = {**video, "side_data_list": [{"side_data_type": "Display Matrix", "rotation": -90}]}
+        phone = {"format": {"duration": "4.0", "tags": {"major_brand": "qt  "}}, "streams": [rotated]}
+        self.assertIsNone(probe_cache.deep_probe_reason(phone))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from shared import throughput_model
+
+
+class TestThroughputModel(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        env = patch.dict(os.environ, {
+            "THROUGHPUT_MODEL_FILE": str(Path(self._tmp.name) / "throughput.json"),
+            "THROUGHPUT_MODEL": "1",
+        })
+        env.start()
+        self.addCleanup(env.stop)
+
+    def _measure(self, preset, speed, *, samples=throughput_model.MIN_SAMPLES):
+        for _ in range(samples):
+            throughput_model.record_throughput("libx264", preset, 1080, 600.0, 600.0 / speed)
+
+    def test_requested_preset_kept_without_history(self):
+        preset, decision = throughput_model.choose_preset("libx264", 1080, 600.0, 300.0, "p5")
+        self.assertEqual(preset, "p5")
+        self.assertEqual(decision["reason"], "no throughput history")
+        self.assertIsNone(decision["predicted_s"])
+
+    def test_slowest_preset_that_fits_is_chosen(self):
+        self._measure("p4", 2.0)  # 600 s of media in 300 s
+        # 400 s budget, planned at 340 s: p4 (300 s) fits, p5 (400 s) does not.
+        preset, decision = throughput_model.choose_preset("libx264", 1080, 600.0, 400.0, "p7")
+        self.assertEqual(preset, "p4")
+        self.assertTrue(decision["measured"])
+        self.assertEqual(decision["predicted_s"], 300.0)
+        # A generous deadline allows the slowest preset, estimated from p4.
+        preset, decision = throughput_model.choose_preset("libx264", 1080, 600.0, 3600.0, "p1")
+        self.assertEqual(preset, "p7")
+        self.assertFalse(decision["measured"])
+        self.assertEqual(decision["predicted_s"], 1000.0)
+
+    def test_unreachable_deadline_uses_fastest_preset(self):
+        self._measure("p4", 1.0)
+        preset, decision = throughput_model.choose_preset("libx264", 1080, 600.0, 60.0, "p4")
+        self.assertEqual(preset, "p1")
+        self.assertIn("cannot be met", decision["reason"])
+
+    def test_nearest_measured_preset_drives_estimates(self):
+        self._measure("p2", 4.0)
+        self._measure("p6", 0.5)
+        speeds = throughput_model.predicted_speeds("libx264", 1080)
+        self.assertEqual(speeds["p6"], (0.5, True))
+        self.assertAlmostEqual(speeds["p7"][0], 0.5 * 0.3 / 0.5)
+        self.assertAlmostEqual(speeds["p3"][0], 4.0 * 1.4 / 1.9)
+        # Other encoders and resolutions have no history.
+        self.assertEqual(throughput_model.predicted_speeds("libx264", 480), {})
+        self.assertEqual(throughput_model.predicted_speeds("libx265", 1080), {})
+
+    def test_short_and_unmeasured_runs_are_ignored(self):
+        throughput_model.record_throughput("libx264", "p4", 1080, 10.0, 0.5)
+        self._measure("p4", 2.0, samples=throughput_model.MIN_SAMPLES - 1)
+        self.assertEqual(throughput_model.predicted_speeds("libx264", 1080), {})
+
+    def test_segment_parallel_and_two_pass_runs_are_not_recorded(self):
+        for mode in ("segments", "two_pass", "segments_fallback"):
+            for _ in range(throughput_model.MIN_SAMPLES):
+                throughput_model.record_throughput("libx264", "p4", 1080, 600.0, 60.0, run_mode=mode)
+        self.assertEqual(throughput_model.predicted_speeds("libx264", 1080), {})
+        for _ in range(throughput_model.MIN_SAMPLES):
+            throughput_model.record_throughput("libx264", "p4", 1080, 600.0, 300.0, run_mode="single")
+        self.assertEqual(throughput_model.predicted_speeds("libx264", 1080)["p4"], (2.0, True))
+
+    def test_snapshot_reports_deadline_hit_rate(self):
+        self._measure("p4", 2.0)
+        throughput_model.record_deadline(True)
+        throughput_model.record_deadline(False)
+        snap = throughput_model.snapshot()
+        self.assertEqual(snap["deadlines"], {"jobs": 2, "met": 1, "rate": 0.5})
+        self.assertEqual(snap["entries"]["libx264|p4|1080p"]["samples"], throughput_model.MIN_SAMPLES)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+"""Measured encoder throughput used to pick presets for deadline jobs.
+
+Every successful main encode records its speed (media seconds encoded per
+wall-clock second) as an exponentially weighted average per (encoder,
+preset, output-resolution bucket).  A job submitted with a deadline asks
+:func:`choose_preset` for the slowest preset whose predicted encode time
+fits the remaining time.  Presets that have not been measured yet for an
+encoder/resolution are estimated from the nearest measured preset with
+fixed relative speeds, so one measured preset is enough to steer.
+
+The file also counts deadline jobs and how many finished in time, which
+``GET /api/system/throughput-model`` reports as the hit rate.
+"""
+from __future__ import annotations
+
+import os
+import time
+from typing import Any
+
+from shared.json_store import read_json, state_path, update_json
+from shared.overshoot_model import resolution_bucket
+
+PRESETS = ("p1", "p2", "p3", "p4", "p5", "p6", "p7")
+# Typical speed of each preset relative to p4, used only to extrapolate
+# from a measured preset to unmeasured ones.
+RELATIVE_SPEED = {"p1": 2.4, "p2": 1.9, "p3": 1.4, "p4": 1.0, "p5": 0.75, "p6": 0.5, "p7": 0.3}
+MIN_SAMPLES = 2
+EWMA_ALPHA = 0.3
+# Plan against this share of the remaining time; the rest absorbs muxing,
+# audio and run-to-run variance.
+DEADLINE_HEADROOM = 0.85
+# Shorter encodes are dominated by process start-up, not encoder speed.
+MIN_WALL_SECONDS = 2.0
+_SPEED_BOUNDS = (0.005, 2000.0)
+
+
+def model_path():
+    return state_path("THROUGHPUT_MODEL_FILE", "throughput_model.json")
+
+
+def model_enabled() -> bool:
+    return os.getenv("THROUGHPUT_MODEL", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def model_key(encoder: str, preset: str, height: int | float | None) -> str:
+    return "|".join((str(encoder or "unknown"), str(preset or "default").lower(), resolution_bucket(height)))
+
+
+def _empty() -> dict[str, Any]:
+    return {"entries": {}, "deadlines": {}}
+
+
+def predicted_speeds(
+    encoder: str,
+    height: int | float | None,
+    entries: dict[str, Any] | None = None,
+) -> dict[str, tuple[float, bool]]:
+    """Return ``{preset: (speed, measured)}`` for every preset that can be predicted."""
+    if entries is None:
+        entries = read_json(model_path(), _empty()).get("entries") or {}
+    measured: dict[str, float] = {}
+    for preset in PRESETS:
+        entry = entries.get(model_key(encoder, preset, height))
+        if isinstance(entry, dict) and int(entry.get("samples", 0)) >= MIN_SAMPLES and float(entry.get("speed") or 0) > 0:
+            measured[preset] = float(entry["speed"])
+    if not measured:
+        return {}
+    speeds: dict[str, tuple[float, bool]] = {}
+    for position, preset in enumerate(PRESETS):
+        if preset in measured:
+            speeds[preset] = (measured[preset], True)
+            continue
+        nearest = min(measured, key=lambda known: (abs(PRESETS.index(known) - position), PRESETS.index(known)))
+        speeds[preset] = (measured[nearest] * RELATIVE_SPEED[preset] / RELATIVE_SPEED[nearest], False)
+    return speeds
+
+
+def choose_preset(
+    encoder: str,
+    height: int | float | None,
+    duration_s: float,
+    budget_s: float,
+    requested: str,
+    *,
+    entries: dict[str, Any] | None = None,
+) -> tuple[str, dict[str, Any]]:
+    """Return ``(preset, decision)`` for a job that must finish within ``budget_s``.
+
+    Without any measurement for this encoder and resolution the requested
+    preset is kept.  When even ``p1`` is predicted to miss, ``p1`` is used.
+    """
+    decision: dict[str, Any] = {"requested_preset": requested, "preset": requested, "predicted_s": None}
+    speeds = predicted_speeds(encoder, height, entries) if model_enabled() else {}
+    if not speeds or duration_s <= 0:
+        decision["reason"] = "no throughput history"
+        return requested, decision
+    planned = max(budget_s, 0.0) * DEADLINE_HEADROOM
+    chosen = None
+    for preset in reversed(PRESETS):
+        if preset in speeds and duration_s / speeds[preset][0] <= planned:
+            chosen = preset
+            break
+    if chosen is None:
+        chosen = min(speeds, key=PRESETS.index)
+        decision["reason"] = "deadline cannot be met; fastest preset"
+    else:
+        decision["reason"] = "slowest preset predicted to fit"
+    speed, measured = speeds[chosen]
+    decision.update({
+        "preset": chosen,
+        "predicted_s": round(duration_s / speed, 1),
+        "predicted_speed": round(speed, 3),
+        "measured": measured,
+    })
+    return chosen, decision
+
+
+def record_throughput(
+    encoder: str,
+    preset: str,
+    height: int | float | None,
+    media_s: float,
+    wall_s: float,
+    run_mode: str = "single",
+) -> None:
+    """Fold one main-encode measurement into the model.
+
+    Only a single FFmpeg pass measures the preset: a segment-parallel run
+    encodes several pieces at once and a two-pass run adds (or reuses) a
+    first pass, so their wall times are not recorded.
+    """
+    if run_mode != "single" or not model_enabled() or media_s <= 0 or wall_s < MIN_WALL_SECONDS:
+        return
+    speed = media_s / wall_s
+    if not _SPEED_BOUNDS[0] <= speed <= _SPEED_BOUNDS[1]:
+        return
+    key = model_key(encoder, preset, height)
+
+    def mutate(data: dict[str, Any]) -> None:
+        entry = data.setdefault("entries", {}).setdefault(key, {"speed": speed, "samples": 0})
+        previous = float(entry.get("speed") or speed)
+        entry["speed"] = round(
+            speed if entry["samples"] == 0 else (EWMA_ALPHA * speed + (1.0 - EWMA_ALPHA) * previous),
+            5,
+        )
+        entry["samples"] = int(entry.get("samples", 0)) + 1
+        entry["last_speed"] = round(speed, 5)
+        entry["updated_at"] = time.time()
+
+    update_json(model_path(), mutate, _empty())
+
+
+def record_deadline(met: bool) -> None:
+    def mutate(data: dict[str, Any]) -> None:
+        counters = data.setdefault("deadlines", {})
+        counters["jobs"] = int(counters.get("jobs", 0)) + 1
+        counters["met"] = int(counters.get("met", 0)) + (1 if met else 0)
+
+    update_json(model_path(), mutate, _empty())
+
+
+def snapshot() -> dict[str, Any]:
+    """Return the measured speeds plus the deadline hit rate."""
+    data = read_json(model_path(), _empty())
+    counters = data.get("deadlines") or {}
+    jobs = int(counters.get("jobs", 0))
+    met = int(counters.get("met", 0))
+    return {
+        "enabled": model_enabled(),
+        "min_samples": MIN_SAMPLES,
+        "entries": data.get("entries") or {},
+        "deadlines": {"jobs": jobs, "met": met, "rate": round(met / jobs, 4) if jobs else None},
+    }
@@ -0,0 +1,93 @@
+"""Compare the in-process header reader with ffprobe on the generated corpus."""
+from __future__ import annotations
+
+import importlib.util
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from shared import container_probe
+from worker.app.utils import ffprobe_info
+
+
+ROOT = Path(__file__).resolve().parents[1]
+GENERATOR = ROOT / "tests" / "media" / "generate_media.py"
+FFMPEG = shutil.which("ffmpeg")
+FFPROBE = shutil.which("ffprobe")
+APPROXIMATE = {
+    # Sample-size bit rates differ from ffprobe only through edit-list rounding.
+    "video_bitrate_kbps": 0.03,
+    "audio_bitrate_kbps": 0.03,
+    "video_fps": 0.001,
+    "video_r_fps": 0.001,
+    "duration": 0.001,
+}
+
+
+def _load_generator():
+    spec = importlib.util.spec_from_file_location("generate_media", GENERATOR)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@unittest.skipUnless(FFMPEG and FFPROBE, "ffmpeg/ffprobe not installed")
+class ContainerProbeConformanceTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmp = tempfile.TemporaryDirectory()
+        output_dir = Path(cls._tmp.name)
+        cls.corpus = _load_generator().generate(output_dir, FFMPEG, FFPROBE, "extended")
+        baseline = output_dir / "baseline.mp4"
+        extra = {
+            "baseline.mkv": ["-i", str(baseline), "-c", "copy"],
+            "rotated.mp4": ["-display_rotation:v:0", "90", "-i", str(baseline), "-c", "copy"],
+        }
+        for name, args in extra.items():
+            target = output_dir / name
+            proc = subprocess.run(
+                [FFMPEG, "-hide_banner", "-loglevel", "error", "-y", *args, str(target)],
+                capture_output=True,
+            )
+            # -display_rotation needs FFmpeg 6.0+; older builds just skip that file.
+            if proc.returncode == 0:
+                cls.corpus.append(target)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._tmp.cleanup()
+
+    def _reference(self, path: Path, audio_only: bool) -> dict:
+        with patch.dict(os.environ, {"FAST_PROBE": "0", "PROBE_CACHE": "0"}):
+            return ffprobe_info(str(path), allow_audio_only=audio_only)
+
+    def test_fast_probe_matches_ffprobe(self):
+        for path in self.corpus:
+            audio_only = path.suffix == ".m4a"
+            with self.subTest(file=path.name):
+                with patch.dict(os.environ, {"FAST_PROBE": "1", "PROBE_CACHE": "0"}):
+                    self.assertIsNotNone(container_probe.probe(path), "header reader declined a corpus file")
+                    with patch("worker.app.utils.subprocess.run", side_effect=AssertionError("ffprobe ran")):
+                        fast = ffprobe_info(str(path), allow_audio_only=audio_only)
+                expected = self._reference(path, audio_only)
+                self.assertEqual(set(fast), set(expected))
+                for key, value in expected.items():
+                    if key == "probe":
+                        continue
+                    tolerance = APPROXIMATE.get(key)
+                    if tolerance is not None and value is not None and fast[key] is not None:
+                        self.assertTrue(
+                            math.isclose(fast[key], value, rel_tol=tolerance, abs_tol=1e-6),
+                            f"{key}: {fast[key]} != {value}",
+                        )
+                    else:
+                        self.assertEqual(fast[key], value, key)
+
+
+if __name__ == "__main__":
+    unittest.main()
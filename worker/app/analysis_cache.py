@@ -0,0 +1,86 @@
+"""Per-upload cache of content analysis results.
+
+Analysis stages (complexity sampling, crop detection, …) run once per
+upload; retries, multi-target outputs and re-submissions of the same API
+upload read the stored answer.  Results live in ``<input>.8mbanalysis``,
+a JSON object keyed by analysis name, stamped with the source size and
+mtime so a changed source is analysed again.  Like the packet index, only
+API uploads persist the file; other sources are analysed per job.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_SUFFIX = ".8mbanalysis"
+
+
+def analysis_path(input_path: str) -> str:
+    return f"{input_path}{ANALYSIS_SUFFIX}"
+
+
+def _stamp(input_path: str) -> Optional[list[int]]:
+    try:
+        st = os.stat(input_path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _read(input_path: str, stamp: list[int]) -> dict:
+    try:
+        with open(analysis_path(input_path), "r", encoding="utf-8") as handle:
+            data = json.load(handle)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("source") != stamp:
+        return {}
+    results = data.get("results")
+    return results if isinstance(results, dict) else {}
+
+
+def cached_analysis(
+    input_path: str,
+    name: str,
+    compute: Callable[[], Any],
+    *,
+    persist: bool = True,
+) -> tuple[Any, bool]:
+    """Return ``(result, cached)`` for analysis ``name`` of ``input_path``.
+
+    ``compute`` runs on a miss; a ``None`` result is not stored, so a failed
+    analysis is tried again by the next job.
+    """
+    stamp = _stamp(input_path) if persist else None
+    results = _read(input_path, stamp) if stamp else {}
+    if name in results:
+        return results[name], True
+    result = compute()
+    if stamp and result is not None:
+        results[name] = result
+        path = analysis_path(input_path)
+        temporary = f"{path}.tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as handle:
+                json.dump({"source": stamp, "results": results}, handle)
+            os.replace(temporary, path)
+        except (OSError, TypeError, ValueError) as exc:
+            logger.info("analysis cache: could not store %s for %s: %s", name, input_path, exc)
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+    return result, False
+
+
+def remove_analysis(input_path: str) -> None:
+    try:
+        os.remove(analysis_path(input_path))
+    except FileNotFoundError:
+        pass
+    except OSError as exc:
+        logger.debug("analysis cache: could not remove results of %s: %s", input_path, exc)
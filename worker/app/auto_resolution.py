@@ -10,6 +10,7 @@ def choose_auto_resolution(
     target_video_kbps: float,
     min_height: int = 240,
     explicit_target_height: Optional[int] = None,
+    complexity: Optional[float] = None,
 ) -> Tuple[Optional[int], Optional[int]]:
     """
     Choose a reasonable target resolution (width,height) given original dimensions,
@@ -23,6 +24,8 @@ def choose_auto_resolution(
       - target_video_kbps: video bitrate budget after audio (kbps)
       - min_height: do not go below this height (default 240)
       - explicit_target_height: if provided, clamp to this height (e.g., 1080)
+      - complexity: optional content factor scaling the density thresholds
+        (< 1 for static content, > 1 for high motion; see complexity.py)
 
     Returns (max_width, max_height) for ffmpeg scale filter, or (None,None) to keep original.
     """
@@ -41,8 +44,9 @@ def choose_auto_resolution(
     # Use a less aggressive heuristic:
     # - Prefer keeping original unless target density is clearly low
     # - Limit drop to 1-2 rungs unless severely starved
-    MIN_OK = 550         # preferred density threshold (kbps per MPix)
-    MIN_FALLBACK = 350   # acceptable floor in severe cases
+    scale = float(complexity) if complexity and complexity > 0 else 1.0
+    MIN_OK = 550 * scale         # preferred density threshold (kbps per MPix)
+    MIN_FALLBACK = 350 * scale   # acceptable floor in severe cases
 
     # Compute current megapixels (per frame)
     orig_mp = (orig_width * orig_height) / 1_000_000.0
@@ -67,7 +71,7 @@ def choose_auto_resolution(
     except StopIteration:
         orig_idx = len(ladder) - 1
 
-    if kbps_per_mpix_orig >= (MIN_OK + 300):
+    if kbps_per_mpix_orig >= (MIN_OK + 300 * scale):
         # Plenty of bitrate density: keep original height
         return (None, ladder[orig_idx])
     elif kbps_per_mpix_orig >= MIN_OK:
@@ -118,9 +122,7 @@ def choose_auto_resolution(
         mp = height_to_mp(h)
         return target_video_kbps / mp if mp > 0 else 0.0
 
-    MIN_OK = 550
-    MIN_FALLBACK = 350
-    EXTREME_FLOOR = 220  # Only allow <720p if below this at 720p
+    EXTREME_FLOOR = 220 * scale  # Only allow <720p if below this at 720p
 
     # Prefer 1080p when source >= 1440p and 1080p has acceptable density
     if orig_height >= 1440 and limited_h < 1080:
@@ -135,3 +137,60 @@ def choose_auto_resolution(
 
     # Width will be derived by ffmpeg scale; return height-only constraint
     return (None, limited_h)
+
+
+# Bits per pixel per frame below which a high-frame-rate source is starved.
+MIN_BITS_PER_PIXEL_FRAME = 0.04
+# Never reduce below this rate; it would read as stutter rather than savings.
+MIN_AUTO_FPS = 24.0
+
+
+def choose_auto_frame_rate(
+    source_fps: Optional[float],
+    width: Optional[int],
+    height: Optional[int],
+    target_video_kbps: float,
+    complexity: Optional[float] = None,
+) -> Tuple[Optional[float], dict]:
+    """
+    Choose a reduced output frame rate for bitrate-starved high-fps sources.
+
+    The source rate is divided by the smallest whole number (60→30, 50→25,
+    120→60 or 30) that lifts bits per pixel per frame at the output size
+    above the threshold, or that reaches ~30 fps.  Whole divisors keep an
+    even frame cadence.  ``complexity`` scales the threshold like the
+    resolution thresholds.
+
+    Returns (fps, decision) where fps is None to keep the source rate, and
+    decision records the inputs and the reason for telemetry.
+    """
+    decision: dict = {"source_fps": source_fps, "fps": None}
+    if not source_fps or source_fps <= 0 or not width or not height or target_video_kbps <= 0:
+        decision["reason"] = "source frame rate or output size unknown"
+        return None, decision
+    threshold = MIN_BITS_PER_PIXEL_FRAME * (float(complexity) if complexity and complexity > 0 else 1.0)
+
+    def bppf(fps: float) -> float:
+        return target_video_kbps * 1000.0 / (width * height * fps)
+
+    decision["threshold"] = round(threshold, 4)
+    decision["bits_per_pixel_frame"] = round(bppf(source_fps), 4)
+    if bppf(source_fps) >= threshold:
+        decision["reason"] = "enough bits per pixel per frame"
+        return None, decision
+    chosen: Optional[float] = None
+    divisor = 2
+    while source_fps / divisor >= MIN_AUTO_FPS - 0.01:
+        chosen = source_fps / divisor
+        if bppf(chosen) >= threshold or chosen <= 30.5:
+            break
+        divisor += 1
+    if chosen is None:
+        decision["reason"] = f"halving {source_fps:g} fps would drop below {MIN_AUTO_FPS:g} fps"
+        return None, decision
+    decision["fps"] = round(chosen, 3)
+    decision["bits_per_pixel_frame_after"] = round(bppf(chosen), 4)
+    decision["reason"] = (
+        f"{decision['bits_per_pixel_frame']:g} bits per pixel per frame is below {threshold:g}"
+    )
+    return chosen, decision
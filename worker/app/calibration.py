@@ -0,0 +1,180 @@
+"""Sample-based rate calibration before a size-targeted encode.
+
+``calc_bitrates`` only knows target size and duration; how many bits a
+given source needs at a given setting depends on its content.  The
+calibration stage encodes a few short, evenly spaced samples of the job's
+range (bounded to a small fraction of the duration) at candidate settings:
+
+* the planned ABR bitrate, which measures how far this encoder lands from
+  the requested rate on this content, and
+* for encoders with a constant-quality mode, two CRF/CQ values, which fit a
+  log-linear bitrate-vs-quality model for this content.
+
+When the quality model interpolates cleanly, the full encode uses the
+CRF/CQ value predicted to land on the target (with a VBV cap as a guard),
+which spends bits where the content needs them; otherwise the ABR bitrate
+is corrected by the measured ratio.  The post-encode size check remains the
+safety net either way.
+"""
+from __future__ import annotations
+
+import math
+import os
+from typing import Optional, Sequence
+
+from .constants import AV1_NVENC, H264_NVENC, HEVC_NVENC, LIBX264, LIBX265, SVT_AV1
+from .ffmpeg_helpers import remove_option_pairs, replace_bitrate_args
+
+# Encoded sample seconds (all candidates together) never exceed this share
+# of the job's duration.
+CALIBRATION_BUDGET = 0.06
+MIN_SAMPLE_SECONDS = 2.0
+MAX_SAMPLE_SECONDS = 6.0
+MAX_SAMPLES = 5
+# Shorter jobs encode quickly enough that a blind first pass plus the size
+# check is cheaper than calibrating.
+MIN_CALIBRATION_DURATION = 90.0
+# ABR corrections outside this band are sample noise rather than signal.
+ABR_CORRECTION_BOUNDS = (0.75, 1.10)
+# Aim constant-quality encodes slightly under target: their rate varies
+# more across content than ABR does.
+QUALITY_TARGET_MARGIN = 0.95
+# VBV cap for constant-quality encodes, relative to the target video rate.
+QUALITY_MAXRATE_FACTOR = 1.5
+
+# Encoder -> (quality option, low/high probe values, allowed range, step).
+QUALITY_MODES: dict[str, tuple[str, tuple[float, float], tuple[float, float], float]] = {
+    LIBX264: ("-crf", (22.0, 30.0), (12.0, 42.0), 0.5),
+    LIBX265: ("-crf", (24.0, 32.0), (12.0, 42.0), 0.5),
+    SVT_AV1: ("-crf", (30.0, 42.0), (15.0, 58.0), 1.0),
+    H264_NVENC: ("-cq:v", (24.0, 32.0), (12.0, 45.0), 1.0),
+    HEVC_NVENC: ("-cq:v", (26.0, 34.0), (12.0, 45.0), 1.0),
+    AV1_NVENC: ("-cq:v", (30.0, 40.0), (12.0, 50.0), 1.0),
+}
+
+_QUALITY_OPTIONS = frozenset({"-crf", "-cq", "-cq:v", "-rc", "-rc:v", "-qp", "-global_quality"})
+
+
+def calibration_enabled(requested: bool | None) -> bool:
+    """Resolve the per-request flag, defaulting to ``CALIBRATION``."""
+    if requested is not None:
+        return bool(requested)
+    return os.getenv("CALIBRATION", "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def sample_windows(
+    start_s: float,
+    duration_s: float,
+    candidates: int,
+    *,
+    budget: float = CALIBRATION_BUDGET,
+) -> list[tuple[float, float]]:
+    """Return evenly spaced ``(start, length)`` windows within the budget.
+
+    Each window is encoded once per candidate, so the per-candidate share of
+    the budget decides how many windows fit.  Windows sit at the centres of
+    equal slices so the opening and closing seconds do not dominate.
+    """
+    if duration_s < MIN_CALIBRATION_DURATION or candidates <= 0:
+        return []
+    per_candidate = duration_s * budget / candidates
+    count = min(MAX_SAMPLES, int(per_candidate // MIN_SAMPLE_SECONDS))
+    if count < 2:
+        return []
+    length = min(MAX_SAMPLE_SECONDS, per_candidate / count)
+    slice_s = duration_s / count
+    return [
+        (start_s + slice_s * (index + 0.5) - length / 2.0, length)
+        for index in range(count)
+    ]
+
+
+def quality_args(encoder: str, value: float, cap_kbps: Optional[float]) -> list[str]:
+    """Rate-control arguments for a constant-quality encode at ``value``."""
+    option = QUALITY_MODES[encoder][0]
+    text = f"{value:g}"
+    if encoder in {H264_NVENC, HEVC_NVENC, AV1_NVENC}:
+        args = ["-rc:v", "vbr", option, text, "-b:v", "0"]
+    else:
+        args = [option, text]
+    if cap_kbps and encoder != SVT_AV1:
+        maxrate = int(cap_kbps)
+        args += ["-maxrate", f"{maxrate}k", "-bufsize", f"{maxrate * 2}k"]
+    return args
+
+
+def _strip_rate_control(command: Sequence[str]) -> list[str]:
+    return remove_option_pairs(list(command), _QUALITY_OPTIONS | {"-b:v", "-maxrate", "-bufsize"})
+
+
+def quality_command(command: Sequence[str], encoder: str, value: float, cap_kbps: Optional[float]) -> list[str]:
+    """Return ``command`` switched to constant quality ``value``."""
+    stripped = _strip_rate_control(command)
+    return [*stripped[:-1], *quality_args(encoder, value, cap_kbps), stripped[-1]]
+
+
+def abr_command(command: Sequence[str], encoder: str, video_kbps: int) -> list[str]:
+    """Return ``command`` in average-bitrate mode, whatever mode it was in."""
+    if "-b:v" in command and not any(option in command for option in _QUALITY_OPTIONS):
+        return replace_bitrate_args(list(command), int(video_kbps))
+    stripped = _strip_rate_control(command)
+    args = ["-b:v", f"{int(video_kbps)}k"]
+    if encoder != SVT_AV1:
+        args += ["-maxrate", f"{int(video_kbps * 1.2)}k", "-bufsize", f"{int(video_kbps * 2)}k"]
+    return [*stripped[:-1], *args, stripped[-1]]
+
+
+def sample_kbps(sizes: Sequence[Optional[int]], lengths: Sequence[float]) -> Optional[float]:
+    """Average video bitrate of encoded samples in kbps (1000 bits)."""
+    if not sizes or any(size is None or size <= 0 for size in sizes):
+        return None
+    seconds = sum(lengths)
+    if seconds <= 0:
+        return None
+    return sum(int(size) for size in sizes) * 8.0 / 1000.0 / seconds
+
+
+def abr_correction(requested_kbps: float, measured_kbps: Optional[float]) -> float:
+    """Scale for the ABR bitrate so this content lands on the requested rate."""
+    if not measured_kbps or requested_kbps <= 0:
+        return 1.0
+    low, high = ABR_CORRECTION_BOUNDS
+    return max(low, min(high, requested_kbps / measured_kbps))
+
+
+def fit_quality(
+    encoder: str,
+    points: Sequence[tuple[float, float]],
+    target_kbps: float,
+) -> Optional[float]:
+    """Fit ``ln(kbps) = a + b * q`` through two probes and solve for target.
+
+    Returns ``None`` when the probes are unusable (bitrate not falling with
+    q) or the answer would be far outside the probed range, where the
+    log-linear model is no longer trustworthy.
+    """
+    if encoder not in QUALITY_MODES or len(points) != 2 or target_kbps <= 0:
+        return None
+    (q_lo, kbps_lo), (q_hi, kbps_hi) = sorted(points)
+    if kbps_lo <= 0 or kbps_hi <= 0 or q_hi <= q_lo or kbps_hi >= kbps_lo:
+        return None
+    slope = (math.log(kbps_hi) - math.log(kbps_lo)) / (q_hi - q_lo)
+    value = q_lo + (math.log(target_kbps) - math.log(kbps_lo)) / slope
+    span = q_hi - q_lo
+    if value < q_lo - span or value > q_hi + span:
+        return None
+    _, _, (allowed_lo, allowed_hi), step = QUALITY_MODES[encoder]
+    value = min(max(value, allowed_lo), allowed_hi)
+    # Round towards higher q (fewer bits) so rounding never causes overshoot.
+    return math.ceil(value / step) * step
+
+
+def predicted_kbps(points: Sequence[tuple[float, float]], value: float) -> Optional[float]:
+    """Bitrate the log-linear fit predicts at quality ``value``."""
+    if len(points) != 2:
+        return None
+    (q_lo, kbps_lo), (q_hi, kbps_hi) = sorted(points)
+    if q_hi <= q_lo or kbps_lo <= 0 or kbps_hi <= 0:
+        return None
+    slope = (math.log(kbps_hi) - math.log(kbps_lo)) / (q_hi - q_lo)
+    return math.exp(math.log(kbps_lo) + slope * (value - q_lo))
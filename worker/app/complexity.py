@@ -0,0 +1,181 @@
+"""Fast content-complexity analysis for auto resolution.
+
+``choose_auto_resolution`` compares the bitrate budget per megapixel with
+fixed thresholds, which is too strict for screen recordings (almost every
+frame repeats the previous one) and too lenient for high-motion footage.
+This module samples a few short runs of frames at evenly spaced points of
+the job's range, decoded by FFmpeg to tiny greyscale raw frames in a single
+process, and scores them with vectorised NumPy:
+
+* ``spatial``: mean absolute horizontal + vertical gradient (detail),
+* ``temporal``: mean absolute difference between consecutive frames of a
+  sample (motion), and
+* ``duplicate_ratio``: share of consecutive frames that barely change.
+
+:func:`density_factor` turns these into a multiplier for the kbps-per-MPix
+thresholds.  NumPy is optional; without it the analysis is skipped and the
+fixed thresholds apply.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Optional, Sequence
+
+from shared.subprocess_utils import hidden_process_kwargs
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on the install
+    np = None
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_WIDTH = 96
+SAMPLE_HEIGHT = 54
+FRAMES_PER_SAMPLE = 8
+# Too short to pay for the sampling process; the fixed thresholds apply.
+MIN_ANALYSIS_SECONDS = 30.0
+# Mean absolute frame difference (0-255 grey levels) treated as a repeat.
+DUPLICATE_DIFF = 0.5
+MIN_FACTOR = 0.6
+MAX_FACTOR = 1.6
+
+
+def complexity_analysis_enabled() -> bool:
+    if np is None:
+        return False
+    return os.getenv("COMPLEXITY_ANALYSIS", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def sample_count(duration_s: float) -> int:
+    """One sample point per minute, between 3 and 6."""
+    return min(max(int(duration_s // 60), 3), 6)
+
+
+def sample_times(start_s: float, duration_s: float, count: int) -> list[float]:
+    """``count`` points evenly spaced inside the range, away from its ends."""
+    step = duration_s / (count + 1)
+    return [start_s + step * (index + 1) for index in range(count)]
+
+
+def sample_command(input_path: str, times: list[float], outputs: Sequence[str]) -> list[str]:
+    """One FFmpeg process decoding ``FRAMES_PER_SAMPLE`` frames at each time.
+
+    Each sample goes to its own raw file in ``outputs``, so a sample cut
+    short by the end of the source keeps its real frame count.
+    """
+    command = ["ffmpeg", "-hide_banner", "-v", "error"]
+    for time_s in times:
+        command += ["-ss", f"{time_s:.3f}", "-i", input_path]
+    chains = [
+        f"[{index}:v:0]trim=end_frame={FRAMES_PER_SAMPLE},"
+        f"scale={SAMPLE_WIDTH}:{SAMPLE_HEIGHT}:flags=area,format=gray,setsar=1[s{index}]"
+        for index in range(len(times))
+    ]
+    command += ["-filter_complex", ";".join(chains)]
+    for index, output in enumerate(outputs):
+        command += ["-map", f"[s{index}]", "-f", "rawvideo", "-pix_fmt", "gray", "-y", str(output)]
+    return command
+
+
+def score_frames(
+    raw: bytes,
+    *,
+    frames_per_sample: int = FRAMES_PER_SAMPLE,
+    sample_frames: Optional[Sequence[int]] = None,
+) -> Optional[dict]:
+    """Spatial/temporal scores of concatenated ``SAMPLE_WIDTH`` x ``SAMPLE_HEIGHT`` grey frames.
+
+    ``sample_frames`` gives the frame count of each concatenated sample;
+    without it every sample is ``frames_per_sample`` frames long.
+    """
+    if np is None:
+        return None
+    frame_size = SAMPLE_WIDTH * SAMPLE_HEIGHT
+    count = len(raw) // frame_size
+    if count < 2:
+        return None
+    if sample_frames is None:
+        starts = set(range(frames_per_sample, count, frames_per_sample))
+    else:
+        starts = set(np.cumsum(list(sample_frames))[:-1].tolist())
+    frames = np.frombuffer(raw, dtype=np.uint8, count=count * frame_size)
+    frames = frames.reshape(count, SAMPLE_HEIGHT, SAMPLE_WIDTH).astype(np.float32)
+    spatial = float(
+        np.abs(np.diff(frames, axis=2)).mean() + np.abs(np.diff(frames, axis=1)).mean()
+    )
+    diffs = np.abs(np.diff(frames, axis=0)).mean(axis=(1, 2))
+    # Drop the pairs that straddle two sample points.
+    within = np.array([index not in starts for index in range(1, count)], dtype=bool)
+    diffs = diffs[within]
+    if diffs.size == 0:
+        return None
+    return {
+        "spatial": round(spatial, 3),
+        "temporal": round(float(diffs.mean()), 3),
+        "duplicate_ratio": round(float((diffs < DUPLICATE_DIFF).mean()), 3),
+        "frames": int(count),
+    }
+
+
+def density_factor(scores: Optional[dict]) -> Optional[float]:
+    """Multiplier for the kbps-per-MPix thresholds, ``None`` without scores.
+
+    Motion dominates: a near-static screen recording (factor 0.6) keeps its
+    resolution on a budget that would drop camera footage a rung, and
+    high-motion footage (up to 1.6) drops earlier.  Fine detail only adds to
+    the factor when it also moves.
+    """
+    if not scores:
+        return None
+    temporal = float(scores.get("temporal") or 0.0)
+    spatial = float(scores.get("spatial") or 0.0)
+    if float(scores.get("duplicate_ratio") or 0.0) >= 0.8:
+        return MIN_FACTOR
+    factor = 0.6 + 0.08 * temporal
+    if temporal >= 2.0:
+        factor *= 1.0 + min(max((spatial - 20.0) / 100.0, 0.0), 0.2)
+    return round(min(max(factor, MIN_FACTOR), MAX_FACTOR), 3)
+
+
+def analyze_complexity(
+    input_path: str,
+    start_s: float,
+    duration_s: float,
+    *,
+    env: dict | None = None,
+    timeout: float = 30.0,
+) -> Optional[dict]:
+    """Sample and score the range; ``None`` when skipped or on failure."""
+    if not complexity_analysis_enabled() or duration_s < MIN_ANALYSIS_SECONDS:
+        return None
+    times = sample_times(start_s, duration_s, sample_count(duration_s))
+    frame_size = SAMPLE_WIDTH * SAMPLE_HEIGHT
+    with tempfile.TemporaryDirectory(prefix="8mblocal-complexity-") as scratch:
+        outputs = [Path(scratch) / f"sample_{index}.gray" for index in range(len(times))]
+        try:
+            result = subprocess.run(
+                sample_command(input_path, times, outputs), capture_output=True, timeout=timeout, env=env,
+                **hidden_process_kwargs(),
+            )
+        except (OSError, subprocess.TimeoutExpired) as exc:
+            logger.info("complexity: sampling failed for %s: %s", input_path, exc)
+            return None
+        if result.returncode != 0:
+            logger.info("complexity: ffmpeg rc=%s for %s", result.returncode, input_path)
+            return None
+        samples = []
+        for output in outputs:
+            try:
+                data = output.read_bytes()
+            except OSError:
+                data = b""
+            samples.append(data[:len(data) // frame_size * frame_size])
+    scores = score_frames(b"".join(samples), sample_frames=[len(data) // frame_size for data in samples])
+    if scores is not None:
+        scores["samples"] = len(times)
+    return scores
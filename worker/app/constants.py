@@ -104,6 +104,31 @@ CPU_PRESET_MAP: dict[str, str] = {
     "veryslow": "veryslow",
 }
 
+# SVT-AV1 uses numeric presets 0 (slowest/best) .. 13 (fastest).
+# p1 fastest -> 12, p7 slowest -> 4.
+SVT_AV1_PRESET_MAP: dict[str, str] = {
+    "p1": "12", "p2": "10", "p3": "9", "p4": "8",
+    "p5": "7", "p6": "6", "p7": "4",
+}
+
+# libaom-av1 uses -cpu-used 0 (slowest) .. 8 (fastest).
+AOM_CPU_USED_MAP: dict[str, str] = {
+    "p1": "8", "p2": "7", "p3": "6", "p4": "5",
+    "p5": "4", "p6": "4", "p7": "2",
+}
+
+# Intel Quick Sync presets.
+QSV_PRESET_MAP: dict[str, str] = {
+    "p1": "veryfast", "p2": "faster", "p3": "fast",
+    "p4": "medium", "p5": "slow", "p6": "slower", "p7": "veryslow",
+}
+
+# AMF -quality levels every AMF encoder accepts (av1_amf adds high_quality).
+AMF_QUALITY_MAP: dict[str, str] = {
+    "p1": "speed", "p2": "speed", "p3": "balanced", "p4": "balanced",
+    "p5": "balanced", "p6": "quality", "p7": "quality",
+}
+
 # ---------------------------------------------------------------------------
 # Audio defaults
 # ---------------------------------------------------------------------------
@@ -0,0 +1,135 @@
+"""Sampled black-border detection for letterboxed and pillarboxed sources.
+
+Black bars cost bits and encoder time and carry nothing.  Before the filter
+chain is built, ``cropdetect`` runs on a few seconds at several points of
+the job range.  All samples are decoded by one FFmpeg process, each in its
+own filter chain, so every sample's ``Parsed_cropdetect_N`` instance reports
+its own accumulated rectangle.  The crop is applied only when the samples
+agree, and only when it removes a meaningful share of the frame.
+
+The detection decodes like the software encode path (autorotate on), so the
+rectangle is in display orientation and belongs in front of the scale
+filter.  Jobs that crop therefore keep software decode.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import subprocess
+from typing import Optional, Sequence
+
+from shared.subprocess_utils import hidden_process_kwargs
+
+from .complexity import sample_times
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_COUNT = 3
+SAMPLE_SECONDS = 2.0
+# Samples may disagree by this much (per edge) and still count as stable.
+STABLE_TOLERANCE_PX = 4
+# Crops that keep more than this share of the frame area are not worth it.
+MAX_KEPT_AREA = 0.97
+# Rectangles smaller than this share of a side are dark scenes, not bars.
+MIN_KEPT_SIDE = 0.3
+
+_CROP_LINE = re.compile(r"\[Parsed_cropdetect_(\d+) @ [^\]]+\].*crop=(-?\d+):(-?\d+):(-?\d+):(-?\d+)")
+
+
+def auto_crop_enabled(requested: bool | None) -> bool:
+    """Resolve the per-request flag, defaulting to ``AUTO_CROP``."""
+    if requested is not None:
+        return bool(requested)
+    return os.getenv("AUTO_CROP", "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def cropdetect_command(input_path: str, times: Sequence[float], seconds: float = SAMPLE_SECONDS) -> list[str]:
+    command = ["ffmpeg", "-hide_banner", "-nostats"]
+    for time_s in times:
+        command += ["-ss", f"{time_s:.3f}", "-t", f"{seconds:.3f}", "-i", input_path]
+    graph = ";".join(
+        f"[{index}:v:0]cropdetect=limit=24:round=2:reset=0[c{index}]" for index in range(len(times))
+    )
+    command += ["-filter_complex", graph]
+    for index in range(len(times)):
+        command += ["-map", f"[c{index}]", "-f", "null", "-"]
+    return command
+
+
+def parse_cropdetect(stderr: str) -> dict[int, tuple[int, int, int, int]]:
+    """Last reported ``(w, h, x, y)`` per sample (filter instance)."""
+    crops: dict[int, tuple[int, int, int, int]] = {}
+    for match in _CROP_LINE.finditer(stderr or ""):
+        crops[int(match.group(1))] = tuple(int(value) for value in match.group(2, 3, 4, 5))
+    return crops
+
+
+def agree_crop(
+    crops: Sequence[tuple[int, int, int, int]],
+    width: int,
+    height: int,
+    *,
+    tolerance: int = STABLE_TOLERANCE_PX,
+) -> tuple[Optional[tuple[int, int, int, int]], str]:
+    """Return ``(rectangle, reason)``; the rectangle is ``None`` when not cropping.
+
+    Stable samples are merged into the smallest rectangle containing all of
+    them, so no sample loses picture.
+    """
+    valid = [
+        crop for crop in crops
+        if crop[0] >= width * MIN_KEPT_SIDE and crop[1] >= height * MIN_KEPT_SIDE
+    ]
+    if len(valid) < min(2, len(crops)) or not valid:
+        return None, "too few usable samples"
+    left = [x for _w, _h, x, _y in valid]
+    top = [y for _w, _h, _x, y in valid]
+    right = [x + w for w, _h, x, _y in valid]
+    bottom = [y + h for _w, h, _x, y in valid]
+    if any(max(edge) - min(edge) > tolerance for edge in (left, top, right, bottom)):
+        return None, "samples disagree"
+    x, y = min(left), min(top)
+    w = (min(max(right), width) - x) // 2 * 2
+    h = (min(max(bottom), height) - y) // 2 * 2
+    if w * h > width * height * MAX_KEPT_AREA:
+        return None, "borders too small"
+    return (w, h, x, y), "stable borders"
+
+
+def detect_crop(
+    input_path: str,
+    start_s: float,
+    duration_s: float,
+    width: int,
+    height: int,
+    *,
+    env: dict | None = None,
+    timeout: float = 60.0,
+) -> Optional[dict]:
+    """Run the sampled detection; ``None`` when it could not run.
+
+    The returned dict always has ``crop`` (``[w, h, x, y]`` or ``None``) and
+    ``reason``, so a negative answer can be cached too.
+    """
+    if duration_s <= 0 or not width or not height:
+        return None
+    if duration_s < SAMPLE_SECONDS * (SAMPLE_COUNT + 1):
+        times, seconds = [start_s], duration_s
+    else:
+        times, seconds = sample_times(start_s, duration_s, SAMPLE_COUNT), SAMPLE_SECONDS
+    try:
+        result = subprocess.run(
+            cropdetect_command(input_path, times, seconds),
+            capture_output=True, text=True, timeout=timeout, env=env,
+            **hidden_process_kwargs(),
+        )
+    except (OSError, subprocess.TimeoutExpired) as exc:
+        logger.info("crop detect: sampling failed for %s: %s", input_path, exc)
+        return None
+    if result.returncode != 0:
+        logger.info("crop detect: ffmpeg rc=%s for %s", result.returncode, input_path)
+        return None
+    crops = parse_cropdetect(result.stderr)
+    rectangle, reason = agree_crop([crops[index] for index in sorted(crops)], int(width), int(height))
+    return {"crop": list(rectangle) if rectangle else None, "reason": reason, "samples": len(times)}
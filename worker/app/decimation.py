@@ -0,0 +1,49 @@
+"""Duplicate-frame decimation for screen recordings and slideshows.
+
+Screen captures repeat the same frame for seconds at a time, yet every copy
+is scaled and encoded.  ``mpdecimate`` drops frames that barely differ from
+the last kept one, and ``-fps_mode vfr`` keeps the survivors' timestamps so
+playback timing is unchanged.  Both output containers (MP4, MKV) store
+variable frame rates; other containers keep every frame.
+
+``frame_decimation`` is ``on``, ``off`` or ``auto``; ``auto`` decimates when
+the content analysis found a high share of repeated frames.  Preset profiles
+can carry the same value.
+"""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Optional
+
+DECIMATION_MODES = ("auto", "on", "off")
+# Share of repeated consecutive frames in the analysis that makes auto decimate.
+AUTO_DUPLICATE_RATIO = 0.6
+VFR_CONTAINERS = frozenset({".mp4", ".mkv"})
+DECIMATE_FILTER = "mpdecimate"
+
+
+def decimation_mode(requested: Optional[str]) -> str:
+    """Resolve the per-request mode, defaulting to ``FRAME_DECIMATION``."""
+    mode = (requested or os.getenv("FRAME_DECIMATION", "off")).strip().lower()
+    return mode if mode in DECIMATION_MODES else "off"
+
+
+def should_decimate(mode: str, output_path: str, scores: Optional[dict]) -> tuple[bool, str]:
+    """Return ``(decimate, reason)`` for the resolved ``mode``."""
+    if mode == "off":
+        return False, "off"
+    if Path(output_path).suffix.lower() not in VFR_CONTAINERS:
+        return False, "container cannot store variable frame rate"
+    if mode == "on":
+        return True, "requested"
+    if not scores:
+        return False, "no content analysis"
+    ratio = float(scores.get("duplicate_ratio") or 0.0)
+    if ratio >= AUTO_DUPLICATE_RATIO:
+        return True, f"{ratio * 100:.0f}% repeated frames"
+    return False, f"only {ratio * 100:.0f}% repeated frames"
+
+
+def vfr_output_args() -> list[str]:
+    return ["-fps_mode", "vfr"]
@@ -0,0 +1,116 @@
+"""Learned hardware-decode failures, so matching sources go straight to software.
+
+When a hardware decoder fails and the software-decode retry then succeeds,
+the failed first attempt was wasted.  Its decoder and source class (codec,
+profile, pixel format, resolution class: the :func:`capability_key` of the
+decoder cache) are recorded here together with the time the attempt cost.
+Once a class has failed ``MIN_FAILURES`` times, jobs on the same hardware
+skip that hardware decoder and report the skip and the time saved.
+
+The store is a JSON state file tagged with the hardware ``probe_generation``
+and a signature of the detected hardware.  A worker restart creates a new
+generation; entries carry over when the signature is unchanged.  A manual
+hardware rerun (Settings) forgets them, as does a later successful hardware
+decode of the same class.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from typing import Any, Optional
+
+from shared.json_store import read_json, state_path, update_json
+
+MIN_FAILURES = 2
+# Failures older than this no longer route jobs to software decode.
+FAILURE_TTL_S = 14 * 24 * 3600
+
+
+def store_path():
+    return state_path("DECODE_FAILURE_FILE", "decode_failures.json")
+
+
+def decode_failure_memory_enabled() -> bool:
+    return os.getenv("DECODE_FAILURE_MEMORY", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def hardware_signature(hw_info: dict) -> str:
+    """Stable digest of the detected hardware (unlike the per-detection generation)."""
+    material = {
+        key: hw_info.get(key)
+        for key in ("type", "available_types", "available_encoders", "encoder_devices", "vaapi_device")
+    }
+    return hashlib.sha1(json.dumps(material, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def _empty() -> dict[str, Any]:
+    return {"generation": None, "signature": None, "entries": {}}
+
+
+def _current_entries(data: dict[str, Any], generation: str, signature: str) -> dict[str, Any]:
+    if data.get("generation") == generation or data.get("signature") == signature:
+        entries = data.get("entries")
+        return entries if isinstance(entries, dict) else {}
+    return {}
+
+
+def known_failure(generation: str, signature: str, key: str) -> Optional[dict[str, Any]]:
+    """Return the entry for ``key`` when it should skip hardware decode."""
+    if not decode_failure_memory_enabled():
+        return None
+    entry = _current_entries(read_json(store_path(), _empty()), generation, signature).get(key)
+    if not isinstance(entry, dict) or int(entry.get("failures", 0)) < MIN_FAILURES:
+        return None
+    if time.time() - float(entry.get("last_failure") or 0) > FAILURE_TTL_S:
+        return None
+    return entry
+
+
+def _update(generation: str, signature: str, change) -> None:
+    def mutate(data: dict[str, Any]) -> dict[str, Any]:
+        entries = _current_entries(data, generation, signature)
+        change(entries)
+        return {"generation": generation, "signature": signature, "entries": entries}
+
+    update_json(store_path(), mutate, _empty())
+
+
+def record_failure(generation: str, signature: str, key: str, lost_s: float) -> None:
+    """Record a hardware-decode attempt of ``key`` that only software decode could finish."""
+    def change(entries: dict[str, Any]) -> None:
+        entry = entries.setdefault(key, {"failures": 0, "lost_s": 0.0, "skips": 0, "saved_s": 0.0})
+        failures = int(entry.get("failures", 0))
+        # Average cost of one failed attempt, the estimate for every later skip.
+        entry["lost_s"] = round((float(entry.get("lost_s") or 0.0) * failures + max(lost_s, 0.0)) / (failures + 1), 2)
+        entry["failures"] = failures + 1
+        entry["last_failure"] = time.time()
+
+    _update(generation, signature, change)
+
+
+def record_skip(generation: str, signature: str, key: str) -> float:
+    """Count a skipped attempt; return the time it is estimated to save."""
+    saved: list[float] = []
+
+    def change(entries: dict[str, Any]) -> None:
+        entry = entries.get(key)
+        if isinstance(entry, dict):
+            saved.append(float(entry.get("lost_s") or 0.0))
+            entry["skips"] = int(entry.get("skips", 0)) + 1
+            entry["saved_s"] = round(float(entry.get("saved_s") or 0.0) + saved[0], 2)
+
+    _update(generation, signature, change)
+    return saved[0] if saved else 0.0
+
+
+def forget(generation: str, signature: str, key: str) -> None:
+    """Drop ``key`` after a hardware decode of its class succeeded."""
+    data = read_json(store_path(), _empty())
+    if key in _current_entries(data, generation, signature):
+        _update(generation, signature, lambda entries: entries.pop(key, None))
+
+
+def forget_all() -> None:
+    update_json(store_path(), lambda _data: _empty(), _empty())
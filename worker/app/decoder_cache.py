@@ -0,0 +1,189 @@
+"""Decoder capability cache shared by jobs and Celery prefork children.
+
+Choosing a hardware decoder used to cost every job an ``ffmpeg -decoders``
+listing plus a short probe decode of the source.  Whether a decoder handles
+a source depends on the decoder and the stream's codec, profile, pixel
+format and size class, not on the particular file, so the answers are
+cached under that key:
+
+* in the process (the decoder listing and every probe answer), and
+* in Redis (or the desktop runtime's local store) as
+  ``decoder_cap:{probe_generation}:{key}``, so the first child to probe a
+  class answers for every other child and later job.
+
+Keys include the hardware ``probe_generation``; a Settings rerun or a new
+worker snapshot therefore starts from an empty cache.  Negative answers
+expire quickly because a single damaged file can fail a probe that the
+hardware would pass on the next one.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from shared.subprocess_utils import hidden_process_kwargs
+
+logger = logging.getLogger(__name__)
+
+POSITIVE_TTL_S = 7 * 24 * 3600
+NEGATIVE_TTL_S = 3600
+_KEY_PREFIX = "decoder_cap"
+
+_LOCK = threading.Lock()
+_DECODER_LISTS: dict[str, str] = {}
+# generation -> key -> (capable, expires_at); only the current generation is kept.
+_CAPABILITIES: dict[str, dict[str, tuple[bool, float]]] = {}
+
+
+def _reset_lock_after_fork() -> None:
+    global _LOCK
+    _LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_lock_after_fork)
+
+
+def resolution_class(width: Any, height: Any) -> str:
+    """Bucket by the longer side; decoder limits are per maximum dimension."""
+    try:
+        longest = max(int(width or 0), int(height or 0))
+    except (TypeError, ValueError):
+        longest = 0
+    if longest <= 0:
+        return "unknown"
+    for limit, label in ((1920, "fhd"), (4096, "4k"), (8192, "8k")):
+        if longest <= limit:
+            return label
+    return "8k+"
+
+
+def capability_key(decoder: str, info: dict) -> str:
+    """Key for ``decoder`` on a source described by an ``ffprobe_info`` result."""
+    return ":".join(
+        str(part or "unknown").lower().replace(":", "_")
+        for part in (
+            decoder,
+            info.get("video_codec"),
+            info.get("video_profile"),
+            info.get("video_pix_fmt"),
+            resolution_class(info.get("width"), info.get("height")),
+        )
+    )
+
+
+def decoder_listed(
+    decoder: str,
+    generation: str,
+    *,
+    env: Optional[dict] = None,
+    runner: Callable[..., Any] = subprocess.run,
+) -> bool:
+    """Return whether ``ffmpeg -decoders`` lists ``decoder`` (listed once per generation)."""
+    with _LOCK:
+        listing = _DECODER_LISTS.get(generation)
+    if listing is None:
+        try:
+            result = runner(
+                ["ffmpeg", "-hide_banner", "-decoders"],
+                capture_output=True, text=True, timeout=5, env=env, **hidden_process_kwargs(),
+            )
+        except Exception:
+            return False
+        if result.returncode != 0:
+            return False
+        listing = result.stdout or ""
+        with _LOCK:
+            _DECODER_LISTS.clear()
+            _DECODER_LISTS[generation] = listing
+    return decoder in listing
+
+
+def cached_capability(
+    generation: str,
+    key: str,
+    probe: Callable[[], bool],
+    *,
+    redis_factory: Optional[Callable[[], Any]] = None,
+) -> tuple[bool, str]:
+    """Return ``(capable, source)``; ``source`` is ``process``, ``shared`` or ``probe``."""
+    full_key = f"{_KEY_PREFIX}:{generation}:{key}"
+    now = time.time()
+    with _LOCK:
+        entry = _CAPABILITIES.get(generation, {}).get(key)
+    if entry is not None and entry[1] > now:
+        return entry[0], "process"
+
+    client = None
+    if redis_factory is not None:
+        try:
+            client = redis_factory()
+            stored = client.get(full_key)
+        except Exception as exc:
+            logger.debug("decoder cache: shared store unavailable: %s", exc)
+            client, stored = None, None
+        if stored in ("1", "0", b"1", b"0"):
+            value = stored in ("1", b"1")
+            _remember(generation, key, value, now)
+            return value, "shared"
+
+    value = bool(probe())
+    _remember(generation, key, value, now)
+    if client is not None:
+        try:
+            client.setex(full_key, POSITIVE_TTL_S if value else NEGATIVE_TTL_S, "1" if value else "0")
+        except Exception as exc:
+            logger.debug("decoder cache: could not store %s: %s", full_key, exc)
+    return value, "probe"
+
+
+def _remember(generation: str, key: str, value: bool, now: float) -> None:
+    with _LOCK:
+        if generation not in _CAPABILITIES:
+            _CAPABILITIES.clear()
+            _CAPABILITIES[generation] = {}
+        _CAPABILITIES[generation][key] = (value, now + (POSITIVE_TTL_S if value else NEGATIVE_TTL_S))
+
+
+def clear() -> None:
+    with _LOCK:
+        _DECODER_LISTS.clear()
+        _CAPABILITIES.clear()
+
+
+def _probe_decode(command: list[str], fail_patterns: tuple[str, ...], env: Optional[dict]) -> bool:
+    try:
+        result = subprocess.run(
+            command, capture_output=True, text=True, timeout=10, env=env, **hidden_process_kwargs(),
+        )
+    except Exception:
+        return False
+    stderr = (result.stderr or "").lower()
+    if any(pattern in stderr for pattern in fail_patterns):
+        return False
+    return result.returncode == 0 and "error" not in stderr
+
+
+def probe_av1_cuvid_decode(path: str, env: Optional[dict] = None) -> bool:
+    """Decode 0.1 s of ``path`` with ``av1_cuvid`` into CUDA frames."""
+    return _probe_decode(
+        [
+            "ffmpeg", "-hide_banner", "-v", "error",
+            "-hwaccel", "cuda", "-hwaccel_output_format", "cuda",
+            "-c:v", "av1_cuvid",
+            "-ss", "0",
+            "-t", "0.1",
+            "-i", path,
+            "-f", "null", "-",
+        ],
+        (
+            "not found", "unknown decoder", "cannot load", "init failed",
+            "device not present", "not supported", "invalid argument",
+            "error while opening decoder", "no decoder surface",
+        ),
+        env,
+    )
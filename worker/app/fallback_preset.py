@@ -0,0 +1,115 @@
+"""Preset choice for jobs that fall back from a hardware encoder to the CPU.
+
+A hardware preset says little about CPU cost: ``p6`` on NVENC runs at many
+times real time, while the same level on libx265 can take twenty times
+longer than the job would have on the GPU.  With the ``auto`` policy the
+fallback keeps a throughput budget instead: the CPU encode may be at most
+``CPU_FALLBACK_SLOWDOWN`` times slower than the hardware encode was
+expected to be, and the slowest CPU preset (never slower than the one
+requested) predicted to stay within that budget is used.
+
+Speeds come from the measured throughput model when it has data for the
+encoder and output size, otherwise from rough priors for 1080p scaled by
+pixel count.  ``keep`` reuses the requested level; ``p1``..``p7`` pin it.
+Profiles and requests carry the policy as ``fallback_preset``.
+"""
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+from shared import throughput_model
+from shared.throughput_model import PRESETS, RELATIVE_SPEED
+
+from .constants import LIBX264, LIBX265, SVT_AV1
+
+FALLBACK_PRESET_MODES = ("auto", "keep", *PRESETS)
+DEFAULT_SLOWDOWN = 3.0
+# Media seconds per wall second at 1080p and p4, by hardware family and CPU
+# encoder; only used until the throughput model has measured the encoder.
+HARDWARE_PRIOR_SPEED = {"_nvenc": 8.0, "_qsv": 5.0, "_amf": 5.0, "_vaapi": 4.0}
+CPU_PRIOR_SPEED = {LIBX264: 2.0, LIBX265: 0.5, SVT_AV1: 0.8, "libaom-av1": 0.1}
+
+
+def fallback_preset_mode(requested: Optional[str]) -> str:
+    """Resolve the per-request/profile policy, defaulting to ``CPU_FALLBACK_PRESET``."""
+    mode = (requested or os.getenv("CPU_FALLBACK_PRESET", "auto")).strip().lower()
+    return mode if mode in FALLBACK_PRESET_MODES else "auto"
+
+
+def fallback_slowdown() -> float:
+    try:
+        return max(float(os.getenv("CPU_FALLBACK_SLOWDOWN", DEFAULT_SLOWDOWN)), 1.0)
+    except ValueError:
+        return DEFAULT_SLOWDOWN
+
+
+def _prior_speed(encoder: str, preset: str, height: int | float | None) -> Optional[float]:
+    base = CPU_PRIOR_SPEED.get(encoder)
+    if base is None:
+        base = next((speed for suffix, speed in HARDWARE_PRIOR_SPEED.items() if encoder.endswith(suffix)), None)
+    if base is None:
+        return None
+    scale = (1080.0 / float(height)) ** 2 if height and height > 0 else 1.0
+    return base * RELATIVE_SPEED[preset] * min(max(scale, 0.1), 10.0)
+
+
+def expected_speed(encoder: str, preset: str, height: int | float | None) -> tuple[Optional[float], str]:
+    """Return ``(speed, source)``; ``source`` is ``measured``, ``extrapolated`` or ``prior``."""
+    speeds = throughput_model.predicted_speeds(encoder, height) if throughput_model.model_enabled() else {}
+    if preset in speeds:
+        speed, measured = speeds[preset]
+        return speed, "measured" if measured else "extrapolated"
+    return _prior_speed(encoder, preset, height), "prior"
+
+
+def choose_fallback_preset(
+    hardware_encoder: str,
+    cpu_encoder: str,
+    preset: str,
+    height: int | float | None,
+    mode: str,
+) -> tuple[str, dict]:
+    """Return ``(preset, decision)`` for the CPU encode replacing ``hardware_encoder``."""
+    decision: dict = {
+        "policy": mode,
+        "hardware_encoder": hardware_encoder,
+        "cpu_encoder": cpu_encoder,
+        "requested_preset": preset,
+        "preset": preset,
+    }
+    if preset not in PRESETS:
+        decision["reason"] = "not a p1-p7 preset"
+        return preset, decision
+    if mode == "keep":
+        decision["reason"] = "requested preset kept"
+        return preset, decision
+    if mode in PRESETS:
+        decision.update({"preset": mode, "reason": "preset pinned by profile or request"})
+        return mode, decision
+    hardware_speed, hardware_source = expected_speed(hardware_encoder, preset, height)
+    if not hardware_speed:
+        decision["reason"] = "no expected hardware speed"
+        return preset, decision
+    budget = hardware_speed / fallback_slowdown()
+    decision.update({
+        "hardware_speed": round(hardware_speed, 3),
+        "hardware_speed_source": hardware_source,
+        "budget_speed": round(budget, 3),
+    })
+    chosen = None
+    for candidate in reversed(PRESETS[:PRESETS.index(preset) + 1]):
+        speed, source = expected_speed(cpu_encoder, candidate, height)
+        if speed is not None and speed >= budget:
+            chosen = (candidate, speed, source)
+            break
+    if chosen is None:
+        speed, source = expected_speed(cpu_encoder, "p1", height)
+        chosen = ("p1", speed, source)
+        decision["reason"] = "no CPU preset meets the budget; fastest preset"
+    else:
+        decision["reason"] = "slowest CPU preset within the throughput budget"
+    decision["preset"] = chosen[0]
+    if chosen[1] is not None:
+        decision.update({"cpu_speed": round(chosen[1], 3), "cpu_speed_source": chosen[2]})
+    return chosen[0], decision
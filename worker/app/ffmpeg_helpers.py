@@ -33,6 +33,28 @@ def ffmpeg_rejected_color_metadata(stderr_lines: list[str] | tuple[str, ...] | s
     return has_color_option and has_rejection
 
 
+def ffmpeg_rejected_moov_reservation(stderr_lines: list[str] | tuple[str, ...] | str) -> bool:
+    """Recognize the MP4 muxer failing because ``-moov_size`` was too small."""
+    text = "\n".join(stderr_lines) if not isinstance(stderr_lines, str) else stderr_lines
+    return "reserved_moov_size is too small" in text.casefold()
+
+
+def faststart_instead_of_reserved_moov(command: list[str]) -> list[str]:
+    """Return ``command`` with ``-moov_size`` replaced by ``+faststart``."""
+    if "-moov_size" not in command:
+        return list(command)
+    updated = remove_option_pairs(command[:-1], {"-moov_size"})
+    return [*updated, "-movflags", "+faststart", command[-1]]
+
+
+def reserved_moov_bytes(command: list[str]) -> int:
+    """Bytes ``-moov_size`` reserves at the head of the output, or 0."""
+    try:
+        return max(int(command[command.index("-moov_size") + 1]), 0)
+    except (ValueError, IndexError):
+        return 0
+
+
 def cpu_filter_chain(filters: list[str] | None) -> list[str]:
     """Convert a hardware-frame filter chain to a CPU-safe chain.
 
@@ -82,3 +104,59 @@ def replace_bitrate_args(command: list[str], video_kbps: int) -> list[str]:
         updated.append(token)
         i += 1
     return updated
+
+
+# Source audio codec names (ffprobe) accepted as-is for a requested encoder.
+_AUDIO_COPY_FAMILIES = {
+    "aac": frozenset({"aac"}),
+    "libopus": frozenset({"opus"}),
+}
+
+
+def audio_passthrough_ok(
+    info: dict,
+    chosen_audio_codec: str | None,
+    output_path: str,
+    audio_bitrate_kbps: float,
+) -> bool:
+    """Return True when the source audio can be copied instead of re-encoded.
+
+    The source must carry exactly one audio stream in the requested codec
+    family, the output container must accept it (Opus only in MKV, matching
+    the encoder choice), and its bitrate must be known and within the
+    requested bitrate so the size budget stays valid.
+    """
+    if not chosen_audio_codec or not info.get("has_audio"):
+        return False
+    if int(info.get("audio_streams") or 0) != 1:
+        return False
+    source_codec = str(info.get("audio_codec") or "").lower()
+    if source_codec not in _AUDIO_COPY_FAMILIES.get(chosen_audio_codec, frozenset()):
+        return False
+    if source_codec == "opus" and not str(output_path).lower().endswith(".mkv"):
+        return False
+    source_kbps = info.get("audio_bitrate_kbps")
+    try:
+        return 0 < float(source_kbps) <= float(audio_bitrate_kbps) * 1.02
+    except (TypeError, ValueError):
+        return False
+
+
+def reuse_audio_from(command: list[str], audio_source: str) -> list[str]:
+    """Return ``command`` muxing audio from ``audio_source`` instead of encoding it.
+
+    ``audio_source`` is added as a second input right after the first one, so
+    seek and hardware decode options keep applying to the video input only;
+    the audio encode options are replaced by explicit maps and ``-c:a copy``.
+    """
+    first_input = command.index("-i")
+    updated = remove_option_pairs(command[first_input + 2:-1], {"-c:a", "-b:a"})
+    updated = [token for token in updated if token != "-an"]
+    return [
+        *command[:first_input + 2],
+        "-i", audio_source,
+        "-map", "0:v:0", "-map", "1:a:0?",
+        *updated,
+        "-c:a", "copy",
+        command[-1],
+    ]
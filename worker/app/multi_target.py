@@ -0,0 +1,139 @@
+"""Several size targets from one decode of the source.
+
+Users often submit the same upload at 8, 25 and 50 MB.  As separate jobs
+each of them decodes (and usually scales) the full source again, which is
+most of the CPU cost of a software-decode job.  A multi-target job runs one
+FFmpeg process instead: the decoded frames go through a ``split`` filter
+into one scaler/encoder branch per output, and every output is then checked
+against its own size target.
+
+Only encoders that accept software frames share the graph (CPU, NVENC and
+AMF); QSV/VAAPI need a hardware upload per branch and stay single-target.
+"""
+from __future__ import annotations
+
+from typing import Optional, Sequence
+
+from shared.constants import MULTI_TARGET_ENCODERS
+
+from .constants import (
+    AMF_ENCODERS,
+    AMF_QUALITY_MAP,
+    CPU_PRESET_MAP,
+    LIBX264,
+    LIBX265,
+    SIZE_OVERAGE_THRESHOLD_PERCENT,
+    SVT_AV1,
+    SVT_AV1_PRESET_MAP,
+)
+
+SHARED_GRAPH_ENCODERS: frozenset[str] = MULTI_TARGET_ENCODERS
+MAX_TARGETS = 4
+# Aim a per-output retry slightly under the target, like the single-target retry.
+RETRY_MARGIN = 0.97
+
+
+def preset_flags(encoder: str, preset: str, tune: str) -> list[str]:
+    """Preset/tune flags for a shared-graph encoder (size-target ABR only)."""
+    preset = (preset or "p4").lower()
+    if preset == "extraquality":
+        # The CRF/CQ extra-quality modes cannot hold a size target.
+        preset = "p7"
+    if encoder.endswith("_nvenc"):
+        return ["-preset", preset, "-tune", (tune or "hq").lower()]
+    if encoder in (LIBX264, LIBX265):
+        flags = ["-preset", CPU_PRESET_MAP.get(preset, "medium")]
+        if encoder == LIBX264:
+            flags += ["-tune", "film"]
+        return flags
+    if encoder == SVT_AV1:
+        return ["-preset", SVT_AV1_PRESET_MAP.get(preset, "8")]
+    if encoder in AMF_ENCODERS:
+        return ["-quality", AMF_QUALITY_MAP.get(preset, "balanced")]
+    return []
+
+
+def split_filter_graph(
+    heights: Sequence[Optional[int]],
+    *,
+    shared_filters: Sequence[str] = (),
+) -> tuple[str, list[str]]:
+    """Return ``(filter_complex, output_labels)`` for one branch per height.
+
+    ``shared_filters`` run once before the split (e.g. the frame-rate cap);
+    ``None`` keeps the decoded size for that branch.
+    """
+    head = ",".join([*shared_filters, f"split={len(heights)}"])
+    chains = ["[0:v:0]" + head + "".join(f"[s{index}]" for index in range(len(heights)))]
+    labels = []
+    for index, height in enumerate(heights):
+        if height:
+            chains.append(f"[s{index}]scale=-2:'min(ih,{int(height)})'[v{index}]")
+            labels.append(f"[v{index}]")
+        else:
+            labels.append(f"[s{index}]")
+    return ";".join(chains), labels
+
+
+def output_args(output: dict, label: str, *, preset: str, tune: str) -> list[str]:
+    """Per-output options for ``output`` fed from filter ``label``.
+
+    ``output`` holds ``encoder``, ``v_flags``, ``video_kbps``,
+    ``audio_codec`` (``None`` for mute), ``audio_bitrate_kbps`` and
+    ``output_path``.
+    """
+    encoder = output["encoder"]
+    video_kbps = int(output["video_kbps"])
+    args = ["-map", label]
+    if output.get("audio_codec"):
+        args += ["-map", "0:a:0?"]
+    args += ["-c:v", encoder, *output.get("v_flags", [])]
+    if encoder == SVT_AV1:
+        args += ["-b:v", f"{video_kbps}k"]
+    else:
+        args += ["-b:v", f"{video_kbps}k", "-maxrate", f"{int(video_kbps * 1.2)}k", "-bufsize", f"{video_kbps * 2}k"]
+    args += preset_flags(encoder, preset, tune)
+    if output.get("audio_codec"):
+        args += ["-c:a", output["audio_codec"], "-b:a", f"{int(output['audio_bitrate_kbps'])}k"]
+    else:
+        args += ["-an"]
+    if str(output["output_path"]).lower().endswith(".mp4"):
+        args += ["-movflags", "+faststart"]
+    return [*args, str(output["output_path"])]
+
+
+def multi_output_command(
+    input_path: str,
+    outputs: Sequence[dict],
+    *,
+    preset: str,
+    tune: str,
+    input_opts: Sequence[str] = (),
+    shared_filters: Sequence[str] = (),
+) -> list[str]:
+    """One FFmpeg command decoding ``input_path`` once for every output.
+
+    Trim options belong in ``input_opts`` (before ``-i``): after the input
+    they would only apply to the first output.
+    """
+    graph, labels = split_filter_graph([output.get("height") for output in outputs], shared_filters=shared_filters)
+    command = [
+        "ffmpeg", "-hide_banner", "-y", *input_opts, "-i", input_path,
+        "-filter_complex", graph, "-progress", "pipe:2",
+    ]
+    for output, label in zip(outputs, labels):
+        command += output_args(output, label, preset=preset, tune=tune)
+    return command
+
+
+def oversized(size_bytes: int, target_size_mb: float) -> bool:
+    target_bytes = float(target_size_mb) * 1024 * 1024
+    return target_bytes > 0 and size_bytes > target_bytes * (1 + SIZE_OVERAGE_THRESHOLD_PERCENT / 100.0)
+
+
+def retry_video_kbps(video_kbps: float, size_bytes: int, target_size_mb: float) -> float:
+    """Scale the video rate of an oversized output onto its target."""
+    target_bytes = float(target_size_mb) * 1024 * 1024
+    if size_bytes <= 0:
+        return float(video_kbps)
+    return max(float(video_kbps) * target_bytes / size_bytes * RETRY_MARGIN, 1.0)
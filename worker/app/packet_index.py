@@ -0,0 +1,248 @@
+"""Per-upload keyframe/packet index stored next to the input.
+
+Trims, segment planning, smart cut and size projection all need to know
+where the video keyframes are and how the bytes are spread over time;
+``ffprobe_info`` only has the summary, and every stage used to run its own
+keyframe probe.  The index is built once per input in a single packet-level
+ffprobe pass (a sequential read, no decode) and holds:
+
+* keyframe timestamps and their byte offsets in the file, and
+* the video packet bytes of every second of the stream.
+
+It is written as ``<input>.8mbidx``: a small header followed by the raw
+``array`` buffers, little-endian.  The header records the source size and
+mtime, so an index whose source changed is rebuilt rather than trusted.
+API uploads keep their index next to the file (and remove it with the
+upload); Folder Watch sources are indexed in memory only, so nothing is
+written into a watched folder.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import struct
+import subprocess
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Optional
+
+from shared.subprocess_utils import hidden_process_kwargs
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = ".8mbidx"
+_MAGIC = b"8MBIDX01"
+# magic, source size, source mtime_ns, keyframe count, second count
+_HEADER = struct.Struct("<8sQqII")
+
+
+def packet_index_enabled() -> bool:
+    return os.getenv("PACKET_INDEX", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def index_path(input_path: str) -> str:
+    return f"{input_path}{INDEX_SUFFIX}"
+
+
+def _source_stamp(input_path: str) -> Optional[tuple[int, int]]:
+    try:
+        st = os.stat(input_path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class PacketIndex:
+    """Keyframes and per-second video bytes of one source file."""
+
+    __slots__ = ("keyframe_times", "keyframe_offsets", "second_bytes", "source_size", "source_mtime_ns")
+
+    def __init__(
+        self,
+        keyframe_times: array,
+        keyframe_offsets: array,
+        second_bytes: array,
+        *,
+        source_size: int = 0,
+        source_mtime_ns: int = 0,
+    ):
+        self.keyframe_times = keyframe_times
+        self.keyframe_offsets = keyframe_offsets
+        self.second_bytes = second_bytes
+        self.source_size = source_size
+        self.source_mtime_ns = source_mtime_ns
+
+    def keyframes(self, start_s: float = 0.0, end_s: float | None = None) -> list[float]:
+        """Keyframe timestamps in ``[start_s, end_s]``."""
+        lo = bisect_left(self.keyframe_times, start_s)
+        hi = len(self.keyframe_times) if end_s is None else bisect_right(self.keyframe_times, end_s)
+        return list(self.keyframe_times[lo:hi])
+
+    def keyframe_before(self, time_s: float) -> Optional[tuple[float, int]]:
+        """``(timestamp, byte_offset)`` of the last keyframe at or before ``time_s``."""
+        position = bisect_right(self.keyframe_times, time_s) - 1
+        if position < 0:
+            return None
+        return self.keyframe_times[position], self.keyframe_offsets[position]
+
+    def video_bytes(self, start_s: float, end_s: float) -> int:
+        """Video packet bytes in ``[start_s, end_s)``; partial seconds pro rata."""
+        start_s, end_s = max(start_s, 0.0), min(end_s, float(len(self.second_bytes)))
+        total = 0.0
+        second = int(start_s)
+        while second < end_s:
+            covered = min(end_s, second + 1) - max(start_s, second)
+            total += self.second_bytes[second] * covered
+            second += 1
+        return int(total)
+
+
+def index_from_packets(lines: Iterable[str]) -> PacketIndex:
+    """Fold ffprobe ``pts_time,dts_time,size,pos,flags`` CSV rows into an index."""
+    keyframes: dict[float, int] = {}
+    second_bytes = array("Q")
+    for line in lines:
+        fields = line.strip().split(",")
+        if len(fields) < 5:
+            continue
+        pts, dts, size, pos, flags = fields[:5]
+        try:
+            timestamp = float(pts if pts not in ("", "N/A") else dts)
+            packet_bytes = int(size)
+        except ValueError:
+            continue
+        if timestamp < 0:
+            continue
+        second = int(timestamp)
+        if second >= len(second_bytes):
+            second_bytes.extend([0] * (second + 1 - len(second_bytes)))
+        second_bytes[second] += packet_bytes
+        if "K" in flags:
+            try:
+                offset = int(pos)
+            except ValueError:
+                offset = -1
+            keyframes.setdefault(timestamp, offset)
+    times = sorted(keyframes)
+    return PacketIndex(array("d", times), array("q", (keyframes[t] for t in times)), second_bytes)
+
+
+def build_packet_index(
+    input_path: str,
+    *,
+    env: dict | None = None,
+    timeout: float = 600.0,
+) -> Optional[PacketIndex]:
+    """Index ``input_path`` with one packet-level ffprobe pass."""
+    stamp = _source_stamp(input_path)
+    if stamp is None:
+        return None
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,dts_time,size,pos,flags",
+        "-of", "csv=p=0",
+        input_path,
+    ]
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, timeout=timeout, env=env,
+            **hidden_process_kwargs(),
+        )
+    except (OSError, subprocess.TimeoutExpired) as exc:
+        logger.info("packet index: probe failed for %s: %s", input_path, exc)
+        return None
+    if result.returncode != 0:
+        logger.info("packet index: ffprobe rc=%s for %s", result.returncode, input_path)
+        return None
+    index = index_from_packets((result.stdout or "").splitlines())
+    index.source_size, index.source_mtime_ns = stamp
+    return index
+
+
+def _little_endian(values: array) -> array:
+    if sys.byteorder == "little":
+        return values
+    swapped = array(values.typecode, values)
+    swapped.byteswap()
+    return swapped
+
+
+def write_packet_index(index: PacketIndex, path: str) -> bool:
+    temporary = f"{path}.tmp"
+    try:
+        with open(temporary, "wb") as handle:
+            handle.write(_HEADER.pack(
+                _MAGIC, index.source_size, index.source_mtime_ns,
+                len(index.keyframe_times), len(index.second_bytes),
+            ))
+            for values in (index.keyframe_times, index.keyframe_offsets, index.second_bytes):
+                _little_endian(values).tofile(handle)
+        os.replace(temporary, path)
+        return True
+    except OSError as exc:
+        logger.info("packet index: could not write %s: %s", path, exc)
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+        return False
+
+
+def read_packet_index(path: str) -> Optional[PacketIndex]:
+    try:
+        with open(path, "rb") as handle:
+            magic, size, mtime_ns, keyframe_count, second_count = _HEADER.unpack(handle.read(_HEADER.size))
+            if magic != _MAGIC:
+                return None
+            arrays = []
+            for typecode, count in (("d", keyframe_count), ("q", keyframe_count), ("Q", second_count)):
+                values = array(typecode)
+                values.fromfile(handle, count)
+                if sys.byteorder != "little":
+                    values.byteswap()
+                arrays.append(values)
+    except (OSError, EOFError, struct.error):
+        return None
+    return PacketIndex(*arrays, source_size=size, source_mtime_ns=mtime_ns)
+
+
+def load_packet_index(
+    input_path: str,
+    *,
+    persist: bool = True,
+    build: bool = True,
+    env: dict | None = None,
+) -> Optional[PacketIndex]:
+    """Return the index of ``input_path``, building it on first use.
+
+    With ``persist`` the index is read from / written to the sidecar file;
+    otherwise it is built in memory for the caller only.  ``build=False``
+    only returns an index that is already on disk.
+    """
+    if not packet_index_enabled():
+        return None
+    stamp = _source_stamp(input_path)
+    if stamp is None:
+        return None
+    sidecar = index_path(input_path)
+    if persist:
+        index = read_packet_index(sidecar)
+        if index is not None and (index.source_size, index.source_mtime_ns) == stamp:
+            return index
+    if not build:
+        return None
+    index = build_packet_index(input_path, env=env)
+    if index is not None and persist:
+        write_packet_index(index, sidecar)
+    return index
+
+
+def remove_packet_index(input_path: str) -> None:
+    try:
+        os.remove(index_path(input_path))
+    except FileNotFoundError:
+        pass
+    except OSError as exc:
+        logger.debug("packet index: could not remove index of %s: %s", input_path, exc)
@@ -122,3 +122,47 @@ def update_speed_ewma(
     if current is None:
         return new_speed
     return alpha * new_speed + (1.0 - alpha) * current
+
+
+# Early overshoot abort: stop a size-targeted pass once the projection is
+# clearly past the post-encode size tolerance instead of finishing it and
+# then running the size retry.
+EARLY_ABORT_MIN_FRACTION = 0.20
+EARLY_ABORT_TOLERANCE = 0.02
+EARLY_ABORT_MARGIN = 0.10
+
+
+def project_final_size(
+    size_bytes: int, out_time_s: float, duration_s: float, fixed_bytes: int = 0,
+) -> Optional[float]:
+    """Linearly project final output bytes from ``total_size`` at ``out_time``.
+
+    ``fixed_bytes`` (a ``-moov_size`` reservation) is counted in ``total_size``
+    from the first progress line and does not grow with encoded time.
+    """
+    if size_bytes <= 0 or out_time_s <= 0 or duration_s <= 0:
+        return None
+    fixed = min(max(int(fixed_bytes), 0), size_bytes)
+    return float(size_bytes - fixed) * duration_s / min(out_time_s, duration_s) + fixed
+
+
+def overshoot_abort_due(
+    projected_bytes: Optional[float],
+    target_bytes: float,
+    done_fraction: float,
+    *,
+    min_fraction: float = EARLY_ABORT_MIN_FRACTION,
+    tolerance: float = EARLY_ABORT_TOLERANCE,
+    margin: float = EARLY_ABORT_MARGIN,
+) -> bool:
+    """Return True when a projection is clearly over the size tolerance.
+
+    Early projections are noisy (scene changes, VBV buffer fill), so the
+    extra ``margin`` applies in full at ``min_fraction`` and shrinks
+    linearly to zero at the end of the encode.
+    """
+    if projected_bytes is None or target_bytes <= 0 or done_fraction < min_fraction:
+        return False
+    remaining = min(max(1.0 - done_fraction, 0.0), 1.0) / max(1.0 - min_fraction, 1e-9)
+    threshold = target_bytes * (1.0 + tolerance + margin * remaining)
+    return projected_bytes > threshold
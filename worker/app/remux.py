@@ -0,0 +1,151 @@
+"""Stream-copy fast path for sources that already satisfy the job.
+
+Many uploads are already below the requested size (or bitrate) in a codec
+the output container can carry.  Re-encoding those costs a full decode and
+encode for a result that is no smaller and no better.  Such jobs are
+remuxed with ``-c copy`` instead, which finishes in seconds and never takes
+an encode slot from the adaptive concurrency gate.
+
+Eligibility is decided in two steps: :func:`remux_candidate` is a cheap
+check on the task arguments and file size that the task decorator uses to
+defer slot acquisition, and :func:`remux_blockers` is the full check on the
+``ffprobe_info`` result made inside the task.
+"""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Optional
+
+# Codecs each output container can carry and common players decode.
+REMUX_VIDEO_CODECS: dict[str, frozenset[str]] = {
+    "mp4": frozenset({"h264", "hevc", "av1"}),
+    "mkv": frozenset({"h264", "hevc", "av1", "vp9", "vp8"}),
+}
+REMUX_AUDIO_CODECS: dict[str, frozenset[str]] = {
+    "mp4": frozenset({"aac", "mp3"}),
+    "mkv": frozenset({"aac", "mp3", "opus", "vorbis", "flac", "ac3", "eac3"}),
+}
+# 4:2:0 only: 4:2:2/4:4:4 sources are not broadly playable even when small.
+REMUX_PIXEL_FORMATS = frozenset({"yuv420p", "yuvj420p", "yuv420p10le", "nv12", "p010le"})
+# Container rewrites can shift the size slightly; keep a little headroom.
+REMUX_SIZE_HEADROOM = 0.98
+
+
+def remux_fast_path_enabled() -> bool:
+    return os.getenv("REMUX_FAST_PATH", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def _container(output_path: str) -> str:
+    return Path(str(output_path)).suffix.lower().lstrip(".")
+
+
+def _target_bytes(target_size_mb: float | None) -> float:
+    try:
+        return float(target_size_mb or 0) * 1024 * 1024
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def remux_candidate(
+    input_path: Optional[str],
+    output_path: Optional[str],
+    target_size_mb: float | None,
+    *,
+    audio_only: bool = False,
+    start_time: Optional[str] = None,
+    end_time: Optional[str] = None,
+    target_video_bitrate_kbps: float | None = None,
+) -> bool:
+    """Cheap pre-probe check; ``False`` means the job certainly re-encodes."""
+    if not remux_fast_path_enabled() or audio_only or start_time or end_time:
+        return False
+    if not input_path or _container(output_path or "") not in REMUX_VIDEO_CODECS:
+        return False
+    if target_video_bitrate_kbps:
+        return True
+    try:
+        size = os.path.getsize(input_path)
+    except OSError:
+        return False
+    return 0 < size <= _target_bytes(target_size_mb) * REMUX_SIZE_HEADROOM
+
+
+def remux_blockers(
+    info: dict,
+    *,
+    output_path: str,
+    input_size_bytes: int,
+    target_size_mb: float | None,
+    target_video_bitrate_kbps: float | None = None,
+    audio_codec: Optional[str] = None,
+    max_width: Optional[int] = None,
+    max_height: Optional[int] = None,
+    max_output_fps: float | None = None,
+    target_resolution: Optional[int] = None,
+    auto_crop: bool = False,
+    frame_decimation: str = "off",
+    check_size: bool = True,
+) -> list[str]:
+    """Return why the source cannot be stream-copied; empty means it can.
+
+    ``auto_crop`` and ``frame_decimation`` are the resolved settings
+    (``auto_crop_enabled`` / ``decimation_mode``).  ``check_size=False``
+    skips the byte comparison, so callers can rule a source out before
+    measuring how many bytes it would copy.
+    """
+    container = _container(output_path)
+    reasons: list[str] = []
+    video_codec = str(info.get("video_codec") or "").lower()
+    if video_codec not in REMUX_VIDEO_CODECS.get(container, frozenset()):
+        reasons.append(f"video codec {video_codec or 'unknown'} not copyable into {container}")
+    pix_fmt = str(info.get("video_pix_fmt") or "").lower()
+    if pix_fmt not in REMUX_PIXEL_FORMATS:
+        reasons.append(f"pixel format {pix_fmt or 'unknown'}")
+    if info.get("has_audio") and audio_codec != "none":
+        source_audio = str(info.get("audio_codec") or "").lower()
+        if source_audio not in REMUX_AUDIO_CODECS.get(container, frozenset()):
+            reasons.append(f"audio codec {source_audio or 'unknown'} not copyable into {container}")
+    if container == "mkv" and int(info.get("rotation_degrees") or 0) % 360:
+        # MP4 keeps the display matrix on copy; Matroska does not.
+        reasons.append("rotation metadata")
+    width = info.get("display_width") or info.get("width") or 0
+    height = info.get("display_height") or info.get("height") or 0
+    if (
+        (max_width and width > max_width)
+        or (max_height and height > max_height)
+        or (target_resolution and height > target_resolution)
+    ):
+        reasons.append("scaling requested")
+    if auto_crop:
+        reasons.append("auto crop requested")
+    if frame_decimation == "on":
+        reasons.append("frame decimation requested")
+    fps = info.get("video_fps")
+    if max_output_fps and fps and float(fps) > float(max_output_fps) + 0.01:
+        reasons.append("frame-rate cap requested")
+    if target_video_bitrate_kbps:
+        source_kbps = info.get("video_bitrate_kbps")
+        if not source_kbps or float(source_kbps) > float(target_video_bitrate_kbps):
+            reasons.append("source bitrate above target")
+    elif check_size and (
+        input_size_bytes <= 0 or input_size_bytes > _target_bytes(target_size_mb) * REMUX_SIZE_HEADROOM
+    ):
+        reasons.append("source larger than target")
+    return reasons
+
+
+def remux_command(input_path: str, output_path: str, info: dict, *, keep_audio: bool) -> list[str]:
+    """Build the ``-c copy`` command (first video plus first audio stream)."""
+    cmd = ["ffmpeg", "-hide_banner", "-y", "-i", input_path, "-map", "0:v:0"]
+    if keep_audio:
+        cmd += ["-map", "0:a:0?"]
+    cmd += ["-c", "copy", "-map_metadata", "0"]
+    if not keep_audio:
+        cmd += ["-an"]
+    if _container(output_path) == "mp4":
+        if str(info.get("video_codec") or "").lower() == "hevc":
+            cmd += ["-tag:v", "hvc1"]
+        cmd += ["-movflags", "+faststart"]
+    cmd.append(output_path)
+    return cmd
@@ -0,0 +1,486 @@
+"""Segment-parallel encoding for the CPU software encoders.
+
+A single x264/x265/SVT-AV1 process rarely saturates a large CPU-only host.
+This module splits the job's time range at source keyframes, derives one
+FFmpeg command per segment from the normal single-pass command, runs those
+commands concurrently, and joins the video-only results with the concat
+demuxer (``-c copy``) while the audio is encoded once from the source.
+
+Every segment keeps the job's average video bitrate, so each segment's byte
+budget is its duration share of the ``calc_bitrates`` budget.  The joined
+file then goes through the same size verification as a single-pass encode.
+
+Each segment is an independent encode that starts on an IDR frame and
+references nothing outside itself, so segments can also be replaced one by
+one.  When the joined file is over target, :func:`plan_rate_repair` picks
+the segments with the highest bits per second and only those are encoded
+again before re-joining, instead of a whole second pass.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional, Sequence
+
+from shared.subprocess_utils import hidden_process_kwargs
+
+from .constants import LIBX264, LIBX265, SVT_AV1
+from .progress import parse_ffmpeg_out_time
+
+SEGMENT_ENCODERS: frozenset[str] = frozenset({LIBX264, LIBX265, SVT_AV1})
+# Below this length the per-process startup/lookahead cost outweighs the
+# parallel speedup, and very short GOP runs hurt rate-control accuracy.
+MIN_SEGMENT_SECONDS = 20.0
+MAX_SEGMENTS = 16
+
+# Options that belong to the full-length output rather than to one segment.
+_OUTPUT_ONLY_OPTIONS = frozenset({
+    "-t", "-to", "-c:a", "-b:a", "-movflags", "-progress", "-tag:v", "-map",
+    "-moov_size",
+})
+_AUDIO_OPTIONS = frozenset({"-c:a", "-b:a"})
+
+
+def segment_parallel_enabled(requested: bool | None) -> bool:
+    """Resolve the per-request flag, defaulting to ``SEGMENT_PARALLEL``."""
+    if requested is not None:
+        return bool(requested)
+    return os.getenv("SEGMENT_PARALLEL", "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def segment_count(gate_limit: int, duration_s: float, *, max_segments: int = MAX_SEGMENTS) -> int:
+    """Follow the adaptive gate limit without producing tiny segments."""
+    if duration_s <= 0:
+        return 1
+    by_length = int(duration_s // MIN_SEGMENT_SECONDS)
+    return max(1, min(int(gate_limit or 1), by_length, int(max_segments)))
+
+
+def probe_keyframe_times(
+    input_path: str,
+    start_s: float = 0.0,
+    end_s: float | None = None,
+    *,
+    env: dict | None = None,
+    timeout: float = 120.0,
+) -> list[float]:
+    """Return video keyframe timestamps using packet flags only (no decode)."""
+    interval = f"{max(0.0, start_s):.3f}%" + (f"{end_s:.3f}" if end_s else "")
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-read_intervals", interval,
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        input_path,
+    ]
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, timeout=timeout, env=env,
+            **hidden_process_kwargs(),
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    if result.returncode != 0:
+        return []
+    times: list[float] = []
+    for line in (result.stdout or "").splitlines():
+        pts, _, flags = line.strip().partition(",")
+        if "K" not in flags:
+            continue
+        try:
+            times.append(float(pts))
+        except ValueError:
+            continue
+    return sorted(set(times))
+
+
+def probe_start_time(input_path: str, *, env: dict | None = None, timeout: float = 30.0) -> Optional[float]:
+    """Return the format start time ffmpeg's input ``-ss`` counts from.
+
+    ``None`` when ffprobe fails; a container without one reports ``0.0``.
+    """
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=start_time", "-of", "csv=p=0", input_path]
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, timeout=timeout, env=env,
+            **hidden_process_kwargs(),
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    value = (result.stdout or "").strip()
+    if value in {"", "N/A"}:
+        return 0.0
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def plan_segments(
+    start_s: float,
+    end_s: float,
+    count: int,
+    keyframes: Sequence[float] = (),
+) -> list[tuple[float, float]]:
+    """Split ``[start_s, end_s)`` into about ``count`` keyframe-aligned parts.
+
+    Ideal equal-length boundaries are snapped to the nearest keyframe inside
+    the range.  Boundaries that collapse onto the same keyframe, or that
+    would create a segment shorter than half ``MIN_SEGMENT_SECONDS``, are
+    dropped, so the result can contain fewer segments than requested.
+    """
+    span = end_s - start_s
+    if count <= 1 or span <= 0:
+        return [(start_s, end_s)]
+    inner = [k for k in keyframes if start_s < k < end_s]
+    min_gap = MIN_SEGMENT_SECONDS / 2.0
+    boundaries: list[float] = []
+    for index in range(1, count):
+        ideal = start_s + span * index / count
+        point = min(inner, key=lambda k: abs(k - ideal)) if inner else ideal
+        previous = boundaries[-1] if boundaries else start_s
+        if point - previous < min_gap or end_s - point < min_gap:
+            continue
+        boundaries.append(point)
+    edges = [start_s, *boundaries, end_s]
+    return [(edges[i], edges[i + 1]) for i in range(len(edges) - 1)]
+
+
+def output_video_encoder(command: Sequence[str]) -> str | None:
+    """Return the output ``-c:v`` value (the last one; earlier ones pick decoders)."""
+    encoder = None
+    for index, token in enumerate(command[:-1]):
+        if token == "-c:v":
+            encoder = command[index + 1]
+    return encoder
+
+
+def _split_command(command: Sequence[str]) -> tuple[list[str], str, list[str], str]:
+    """Split ``ffmpeg … -i INPUT … OUTPUT`` into its four parts."""
+    input_index = list(command).index("-i")
+    return (
+        list(command[1:input_index]),
+        command[input_index + 1],
+        list(command[input_index + 2:-1]),
+        command[-1],
+    )
+
+
+def _strip(options: Sequence[str], pairs: frozenset[str], singles: frozenset[str] = frozenset()) -> list[str]:
+    result: list[str] = []
+    index = 0
+    while index < len(options):
+        token = options[index]
+        if token in pairs and index + 1 < len(options):
+            index += 2
+            continue
+        if token in singles:
+            index += 1
+            continue
+        result.append(token)
+        index += 1
+    return result
+
+
+def segment_command(
+    command: Sequence[str],
+    start_s: float,
+    duration_s: float,
+    output: str,
+    *,
+    threads: int | None = None,
+) -> list[str]:
+    """Derive a video-only command encoding one segment of ``command``."""
+    pre_input, input_path, post_input, _ = _split_command(command)
+    pre_input = _strip(pre_input, frozenset({"-ss", "-t", "-to"}))
+    post_input = _strip(post_input, _OUTPUT_ONLY_OPTIONS, frozenset({"-an", "-vn"}))
+    segment = [
+        "ffmpeg", *pre_input,
+        "-ss", f"{start_s:.6f}",
+        "-i", input_path,
+        "-t", f"{duration_s:.6f}",
+        *post_input,
+    ]
+    if threads and output_video_encoder(command) == SVT_AV1:
+        # libsvtav1 sizes its thread pool from lp, not -threads.
+        segment = _with_svtav1_lp(segment, svtav1_level_of_parallelism(threads))
+    elif threads:
+        segment += ["-threads", str(int(threads))]
+    segment += ["-an", "-progress", "pipe:2", output]
+    return segment
+
+
+def concat_list_text(paths: Sequence[str]) -> str:
+    """Render a concat-demuxer list with single quotes escaped."""
+    lines = []
+    for path in paths:
+        escaped = str(Path(path).resolve()).replace("'", "'\\''")
+        lines.append(f"file '{escaped}'")
+    return "\n".join(lines) + "\n"
+
+
+def concat_command(
+    command: Sequence[str],
+    list_path: str,
+    start_s: float,
+    duration_s: float,
+    *,
+    audio_source: str | None = None,
+) -> list[str]:
+    """Join encoded segments losslessly and add the job's audio track.
+
+    Audio options, MP4 sample-entry tags, and MP4 finalize flags are taken
+    from ``command`` so the joined file matches what a single pass writes.
+    With ``audio_source`` (an earlier output of the same range) its audio is
+    copied instead of encoding the source audio again.
+    """
+    _, input_path, post_input, output = _split_command(command)
+    audio_args: list[str] = []
+    container_args: list[str] = []
+    index = 0
+    has_audio = "-an" not in post_input
+    while index < len(post_input):
+        token = post_input[index]
+        if index + 1 < len(post_input):
+            if token in _AUDIO_OPTIONS:
+                audio_args += [token, post_input[index + 1]]
+                index += 2
+                continue
+            if token in {"-tag:v", "-movflags", "-moov_size"}:
+                container_args += [token, post_input[index + 1]]
+                index += 2
+                continue
+        index += 1
+    joined = [
+        "ffmpeg", "-hide_banner", "-y",
+        "-f", "concat", "-safe", "0", "-i", list_path,
+    ]
+    if has_audio and audio_args and audio_source:
+        joined += ["-i", audio_source]
+        joined += ["-map", "0:v:0", "-map", "1:a:0?", "-c:v", "copy", "-c:a", "copy"]
+    elif has_audio and audio_args:
+        joined += ["-ss", f"{start_s:.6f}", "-t", f"{duration_s:.6f}", "-i", input_path]
+        joined += ["-map", "0:v:0", "-map", "1:a:0?", "-c:v", "copy", *audio_args]
+    else:
+        joined += ["-map", "0:v:0", "-c:v", "copy", "-an"]
+    joined += [*container_args, "-progress", "pipe:2", output]
+    return joined
+
+
+def command_video_kbps(command: Sequence[str]) -> float | None:
+    """Return the ``-b:v`` value of ``command`` in kbps."""
+    for index, token in enumerate(command[:-1]):
+        if token == "-b:v":
+            value = str(command[index + 1]).strip().lower()
+            try:
+                if value.endswith("k"):
+                    return float(value[:-1])
+                if value.endswith("m"):
+                    return float(value[:-1]) * 1000.0
+                return float(value) / 1000.0
+            except ValueError:
+                return None
+    return None
+
+
+def plan_rate_repair(
+    sizes: Sequence[int],
+    durations: Sequence[float],
+    excess_bytes: float,
+) -> dict[int, float]:
+    """Choose segments to re-encode so the joined file sheds ``excess_bytes``.
+
+    Segments are capped at a common bits-per-second ceiling: every segment
+    above it is re-encoded to exactly the ceiling and the rest are kept, so
+    the worst offenders are repaired first and as few as possible are
+    touched.  Returns ``{index: target_bytes}``; empty when nothing needs to
+    change or the excess cannot be removed.
+    """
+    if excess_bytes <= 0 or len(sizes) != len(durations) or not sizes:
+        return {}
+    order = sorted(
+        (i for i in range(len(sizes)) if durations[i] > 0 and sizes[i] > 0),
+        key=lambda i: sizes[i] / durations[i],
+        reverse=True,
+    )
+    total_bytes = 0.0
+    total_seconds = 0.0
+    for rank, index in enumerate(order):
+        total_bytes += sizes[index]
+        total_seconds += durations[index]
+        ceiling = (total_bytes - excess_bytes) / total_seconds
+        if ceiling <= 0:
+            continue
+        following = order[rank + 1] if rank + 1 < len(order) else None
+        if following is None or sizes[following] / durations[following] <= ceiling:
+            return {i: ceiling * durations[i] for i in order[:rank + 1]}
+    return {}
+
+
+def encoder_threads(encoder: str | None, segments: int) -> int | None:
+    """Share host threads between concurrent CPU-encoder segment processes."""
+    if encoder not in {LIBX264, LIBX265, SVT_AV1} or segments <= 1:
+        return None
+    return max(1, (os.cpu_count() or 1) // segments)
+
+
+def svtav1_level_of_parallelism(threads: int) -> int:
+    """SVT-AV1 ``lp`` level for a thread budget.
+
+    Level 1 is a single core, each level roughly doubles the pool, and 6 is
+    the widest.
+    """
+    return max(1, min(6, int(threads).bit_length()))
+
+
+def _with_svtav1_lp(options: list[str], level: int) -> list[str]:
+    # Merge into an existing -svtav1-params; an explicit lower lp wins.
+    for index, token in enumerate(options[:-1]):
+        if token == "-svtav1-params":
+            params = [item for item in options[index + 1].split(":") if item]
+            current = [item for item in params if item.startswith("lp=")]
+            try:
+                level = min(level, int(current[-1][3:])) if current else level
+            except ValueError:
+                pass
+            params = [item for item in params if not item.startswith("lp=")] + [f"lp={level}"]
+            return [*options[:index + 1], ":".join(params), *options[index + 2:]]
+    return [*options, "-svtav1-params", f"lp={level}"]
+
+
+def run_parallel(
+    commands: Sequence[Sequence[str]],
+    *,
+    env: dict | None = None,
+    cancelled: Callable[[], bool] = lambda: False,
+    stop: Callable[[subprocess.Popen], None] | None = None,
+    on_progress: Callable[[float, int], None] | None = None,
+    poll_interval: float = 0.25,
+) -> tuple[int, bool, list[str]]:
+    """Run FFmpeg commands concurrently and stop all of them on any failure.
+
+    Returns ``(returncode, cancelled, stderr_tail)``.  ``on_progress`` gets
+    the summed ``out_time`` of all processes in seconds and the number of
+    processes that finished successfully.
+    """
+    def _stop(proc: subprocess.Popen) -> None:
+        if stop is not None:
+            stop(proc)
+        elif proc.poll() is None:
+            proc.kill()
+
+    popen_kwargs: dict = {
+        "stderr": subprocess.PIPE,
+        "stdout": subprocess.DEVNULL,
+        "text": True,
+        "bufsize": 1,
+        "env": env,
+    }
+    if sys.platform != "win32":
+        popen_kwargs["start_new_session"] = True
+    popen_kwargs.update(hidden_process_kwargs())
+
+    progress = [0.0] * len(commands)
+    tails: list[list[str]] = [[] for _ in commands]
+    lock = threading.Lock()
+    finished: queue.Queue[int] = queue.Queue()
+    processes: list[subprocess.Popen] = []
+
+    def reader(index: int, proc: subprocess.Popen) -> None:
+        try:
+            assert proc.stderr is not None
+            for raw in proc.stderr:
+                line = raw.strip()
+                if not line:
+                    continue
+                key, _, value = line.partition("=")
+                if key == "out_time_ms":
+                    seconds = parse_ffmpeg_out_time(value)
+                    if seconds is not None:
+                        with lock:
+                            progress[index] = seconds
+                    continue
+                with lock:
+                    tails[index].append(line)
+                    del tails[index][:-20]
+        except Exception:
+            pass
+        finally:
+            proc.wait()
+            if proc.stderr is not None:
+                proc.stderr.close()
+            finished.put(index)
+
+    readers: list[threading.Thread] = []
+    try:
+        for index, command in enumerate(commands):
+            proc = subprocess.Popen(list(command), **popen_kwargs)
+            processes.append(proc)
+            thread = threading.Thread(target=reader, args=(index, proc), daemon=True)
+            thread.start()
+            readers.append(thread)
+
+        done = 0
+        returncode = 0
+        while done < len(processes):
+            if cancelled():
+                for proc in processes:
+                    _stop(proc)
+                return -1, True, _merge_tails(tails, lock)
+            try:
+                index = finished.get(timeout=poll_interval)
+            except queue.Empty:
+                index = None
+            if index is not None:
+                done += 1
+                rc = processes[index].returncode or 0
+                if rc != 0:
+                    returncode = rc
+                    for proc in processes:
+                        _stop(proc)
+                    break
+            if on_progress is not None:
+                with lock:
+                    total = sum(progress)
+                on_progress(total, done)
+        for proc in processes:
+            try:
+                proc.wait(timeout=20)
+            except subprocess.TimeoutExpired:
+                _stop(proc)
+        return returncode, False, _merge_tails(tails, lock)
+    finally:
+        for proc in processes:
+            if proc.poll() is None:
+                _stop(proc)
+        # Stopped processes reach EOF quickly; let the readers close the pipes.
+        for thread in readers:
+            thread.join(timeout=5)
+
+
+def _merge_tails(tails: list[list[str]], lock: threading.Lock) -> list[str]:
+    with lock:
+        return [line for tail in tails for line in tail]
+
+
+def wait_for_file(path: str, timeout: float = 5.0) -> Optional[int]:
+    """Return a finished segment's size, or ``None`` when it never appeared."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            size = os.path.getsize(path)
+            if size > 0:
+                return size
+        except OSError:
+            pass
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.1)
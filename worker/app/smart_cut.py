@@ -0,0 +1,174 @@
+"""Keyframe-aware smart cut for trimmed jobs whose source already fits.
+
+A trimmed job used to decode and encode the whole range even when the
+user only wanted a cut and the source bitrate over that range is already
+within the target.  Smart cut splits the range at the source keyframes:
+
+* the GOPs entirely inside the range are stream-copied, and
+* only the partial GOPs at the two edges are re-encoded, with the source
+  codec, resolution, pixel format, profile and bitrate.
+
+The pieces are written as MPEG-TS (Annex B, parameter sets in band) and
+joined with the concat demuxer.  The re-encoded edges carry their own
+SPS/PPS, so MP4 outputs use the ``avc3``/``hev1`` sample entries, which
+allow parameter sets inside the stream.  The copied middle assumes closed
+GOPs; the task verifies the joined duration and falls back to a normal
+encode when a source does not cut cleanly.
+"""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Optional, Sequence
+
+from .constants import LIBX264, LIBX265
+from .media_metadata import source_color_metadata_args
+
+# Source codec -> encoder for the re-encoded edges.
+SMART_CUT_ENCODERS: dict[str, str] = {"h264": LIBX264, "hevc": LIBX265}
+# Below this much copyable video the extra processes cost more than they save.
+MIN_COPY_SECONDS = 2.0
+# Keyframes closer than this to a range edge count as on the edge.
+EDGE_TOLERANCE_S = 0.002
+# Seek a little past the first copied keyframe so rounding cannot land on
+# the previous one and duplicate a whole GOP.
+COPY_SEEK_EPSILON_S = 0.001
+
+_PROFILES: dict[str, dict[str, str]] = {
+    "h264": {
+        "constrained baseline": "baseline", "baseline": "baseline", "main": "main",
+        "high": "high", "high 10": "high10", "high 4:2:2": "high422",
+    },
+    "hevc": {"main": "main", "main 10": "main10"},
+}
+_MP4_TAGS = {"h264": "avc3", "hevc": "hev1"}
+
+
+def smart_cut_enabled() -> bool:
+    return os.getenv("SMART_CUT", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def smart_cut_candidate(
+    start_time: Optional[str],
+    end_time: Optional[str],
+    *,
+    audio_only: bool = False,
+) -> bool:
+    """Cheap check on the task arguments; ``False`` means a normal encode."""
+    return smart_cut_enabled() and not audio_only and bool(start_time or end_time)
+
+
+def smart_cut_blockers(info: dict, available_cpu_encoders: set[str] | None = None) -> list[str]:
+    """Reasons the edges cannot be re-encoded to match the source."""
+    codec = str(info.get("video_codec") or "").lower()
+    encoder = SMART_CUT_ENCODERS.get(codec)
+    if encoder is None:
+        return [f"no matching edge encoder for {codec or 'unknown'}"]
+    if available_cpu_encoders and encoder not in available_cpu_encoders:
+        return [f"{encoder} unavailable for the edges"]
+    if int(info.get("rotation_degrees") or 0) % 360:
+        # MPEG-TS pieces drop the display matrix, and the re-encoded edges
+        # would be autorotated while the copied middle is not.
+        return ["rotation metadata"]
+    return []
+
+
+def range_bytes_estimate(input_size_bytes: int, source_duration_s: float, range_s: float) -> int:
+    """Share of the source file covered by ``range_s`` (average bitrate)."""
+    if input_size_bytes <= 0 or source_duration_s <= 0:
+        return 0
+    return int(input_size_bytes * min(max(range_s / source_duration_s, 0.0), 1.0))
+
+
+def plan_smart_cut(
+    keyframes: Sequence[float],
+    start_s: float,
+    end_s: float,
+    *,
+    origin_s: float = 0.0,
+    min_copy_s: float = MIN_COPY_SECONDS,
+) -> Optional[list[tuple[str, float, float]]]:
+    """Return ``[(kind, start, end), …]`` with ``kind`` ``encode`` or ``copy``.
+
+    The copy piece runs from the first keyframe at or after ``start_s`` to
+    the last keyframe at or before ``end_s``.  ``None`` when less than
+    ``min_copy_s`` of whole GOPs lies inside the range.
+
+    ``keyframes`` are container timestamps, while ``start_s``/``end_s`` and
+    the planned pieces count from ``origin_s``, the format start time that
+    ffmpeg's input ``-ss`` is relative to (about 1.4 s on MPEG-TS).
+    """
+    keyframes = [k - origin_s for k in keyframes]
+    inside = [k for k in keyframes if start_s - EDGE_TOLERANCE_S <= k <= end_s + EDGE_TOLERANCE_S]
+    if len(inside) < 2:
+        return None
+    first, last = inside[0], inside[-1]
+    if last >= end_s - EDGE_TOLERANCE_S:
+        last = end_s
+    if last - first < min_copy_s:
+        return None
+    plan: list[tuple[str, float, float]] = []
+    if first - start_s > EDGE_TOLERANCE_S:
+        plan.append(("encode", start_s, first))
+    plan.append(("copy", first, last))
+    if end_s - last > EDGE_TOLERANCE_S:
+        plan.append(("encode", last, end_s))
+    return plan
+
+
+def edge_command(input_path: str, start_s: float, end_s: float, output: str, info: dict) -> list[str]:
+    """Re-encode ``[start_s, end_s)`` with the source's video parameters."""
+    codec = str(info.get("video_codec") or "").lower()
+    encoder = SMART_CUT_ENCODERS[codec]
+    command = [
+        "ffmpeg", "-hide_banner", "-y",
+        "-ss", f"{start_s:.6f}", "-i", input_path, "-t", f"{end_s - start_s:.6f}",
+        "-map", "0:v:0", "-an", "-sn", "-c:v", encoder,
+    ]
+    pix_fmt = str(info.get("video_pix_fmt") or "")
+    if pix_fmt:
+        command += ["-pix_fmt", pix_fmt]
+    profile = _PROFILES.get(codec, {}).get(str(info.get("video_profile") or "").strip().lower())
+    if profile:
+        command += ["-profile:v", profile]
+    source_kbps = int(float(info.get("video_bitrate_kbps") or 0))
+    if source_kbps > 0:
+        command += ["-b:v", f"{source_kbps}k", "-maxrate", f"{int(source_kbps * 1.5)}k", "-bufsize", f"{source_kbps * 2}k"]
+    command += ["-preset", "medium", *source_color_metadata_args(info)]
+    return [*command, "-f", "mpegts", output]
+
+
+def copy_command(input_path: str, start_s: float, end_s: float, output: str) -> list[str]:
+    """Stream-copy the whole GOPs in ``[start_s, end_s)``."""
+    return [
+        "ffmpeg", "-hide_banner", "-y",
+        "-ss", f"{start_s + COPY_SEEK_EPSILON_S:.6f}", "-i", input_path,
+        "-t", f"{end_s - start_s:.6f}",
+        "-map", "0:v:0", "-an", "-sn", "-c:v", "copy",
+        "-f", "mpegts", output,
+    ]
+
+
+def join_command(
+    list_path: str,
+    input_path: str,
+    start_s: float,
+    duration_s: float,
+    output_path: str,
+    info: dict,
+    *,
+    keep_audio: bool,
+) -> list[str]:
+    """Concat the pieces and copy the source audio of the same range."""
+    command = ["ffmpeg", "-hide_banner", "-y", "-f", "concat", "-safe", "0", "-i", list_path]
+    if keep_audio:
+        command += ["-ss", f"{start_s:.6f}", "-t", f"{duration_s:.6f}", "-i", input_path]
+        command += ["-map", "0:v:0", "-map", "1:a:0?", "-c", "copy"]
+    else:
+        command += ["-map", "0:v:0", "-c", "copy", "-an"]
+    if Path(output_path).suffix.lower() == ".mp4":
+        tag = _MP4_TAGS.get(str(info.get("video_codec") or "").lower())
+        if tag:
+            command += ["-tag:v", tag]
+        command += ["-movflags", "+faststart"]
+    return [*command, output_path]
@@ -6,8 +6,10 @@ import math
 import os
 import queue
 import shlex
+import shutil
 import signal
 import subprocess
+import tempfile
 import threading
 import time
 import logging
@@ -17,6 +19,7 @@ from pathlib import Path
 from typing import Dict, Optional
 from redis import Redis
 
+from shared import overshoot_model, throughput_model
 from shared.subprocess_utils import hidden_process_kwargs
 from shared.concurrency import (
     AdaptiveConcurrencyGate,
@@ -26,22 +29,110 @@ from shared.concurrency import (
 
 from .celery_app import celery_app
 from .constants import (
-    CPU_FALLBACK, CPU_ENCODERS, HW_ENCODERS,
-    LIBAOM_AV1, SVT_AV1, LIBX264, LIBX265,
-    AMF_ENCODERS, QSV_ENCODERS, VAAPI_ENCODERS,
+    AMF_QUALITY_MAP, AOM_CPU_USED_MAP, CPU_FALLBACK, CPU_ENCODERS, CPU_PRESET_MAP, HW_ENCODERS,
+    LIBAOM_AV1, SVT_AV1_PRESET_MAP, SVT_AV1, LIBX264, LIBX265,
+    AMF_ENCODERS, QSV_ENCODERS, QSV_PRESET_MAP, VAAPI_ENCODERS,
 )
-from .utils import ffprobe_info, calc_bitrates
-from .auto_resolution import choose_auto_resolution
+from .utils import (
+    calc_bitrates,
+    container_overhead_kbps,
+    ffprobe_info,
+    mp4_moov_reserve_bytes,
+    reserved_moov_enabled,
+)
+from .auto_resolution import choose_auto_frame_rate, choose_auto_resolution
 from .hw_detect import get_hw_info, map_codec_to_hw, choose_best_codec, refresh_hw_info
 from .ffmpeg_helpers import (
     COLOR_METADATA_OPTIONS,
+    audio_passthrough_ok,
     cpu_filter_chain,
+    faststart_instead_of_reserved_moov,
     ffmpeg_rejected_color_metadata,
+    ffmpeg_rejected_moov_reservation,
     remove_option_pairs,
-    replace_bitrate_args,
+    reserved_moov_bytes,
+    reuse_audio_from,
 )
 from .startup_tests import run_startup_tests
-from .progress import parse_ffmpeg_out_time, parse_time_string
+from .decoder_cache import (
+    cached_capability,
+    capability_key,
+    decoder_listed,
+    probe_av1_cuvid_decode,
+)
+from . import decode_failures
+from .segments import (
+    SEGMENT_ENCODERS,
+    concat_command,
+    command_video_kbps,
+    concat_list_text,
+    encoder_threads,
+    output_video_encoder,
+    plan_rate_repair,
+    plan_segments,
+    probe_keyframe_times,
+    probe_start_time,
+    run_parallel,
+    segment_command,
+    segment_count,
+    segment_parallel_enabled,
+    wait_for_file,
+)
+from .progress import (
+    overshoot_abort_due,
+    parse_ffmpeg_out_time,
+    parse_time_string,
+    project_final_size,
+)
+from .remux import remux_blockers, remux_candidate, remux_command
+from .packet_index import load_packet_index, remove_packet_index
+from .analysis_cache import cached_analysis, remove_analysis
+from .complexity import analyze_complexity, density_factor
+from .crop_detect import auto_crop_enabled, detect_crop
+from .decimation import DECIMATE_FILTER, decimation_mode, should_decimate, vfr_output_args
+from .fallback_preset import choose_fallback_preset, fallback_preset_mode
+from .smart_cut import (
+    SMART_CUT_ENCODERS,
+    copy_command,
+    edge_command,
+    join_command,
+    plan_smart_cut,
+    range_bytes_estimate,
+    smart_cut_blockers,
+    smart_cut_candidate,
+)
+from .multi_target import (
+    SHARED_GRAPH_ENCODERS,
+    multi_output_command,
+    oversized,
+    retry_video_kbps,
+)
+from .two_pass import (
+    FIRST_PASS_WEIGHT,
+    STATS_NAME,
+    TWO_PASS_ENCODERS,
+    cached_stats,
+    discard_stats,
+    first_pass_command,
+    second_pass_command,
+    source_fingerprint,
+    stats_key,
+    store_stats,
+    two_pass_enabled,
+)
+from .calibration import (
+    QUALITY_MAXRATE_FACTOR,
+    QUALITY_MODES,
+    QUALITY_TARGET_MARGIN,
+    abr_command,
+    abr_correction,
+    calibration_enabled,
+    fit_quality,
+    predicted_kbps,
+    quality_command,
+    sample_kbps,
+    sample_windows,
+)
 from .qsv_filters import (
     hardware_input_pixel_format,
     hardware_profile_flags,
@@ -61,6 +152,12 @@ ENCODER_TEST_CACHE: Dict[str, bool] = {}
 _ENCODER_TEST_CACHE_LOCK = threading.RLock()
 _LAST_PUBLISH_WARNING_TS = 0.0
 _ENCODE_GATE: AdaptiveConcurrencyGate | None = None
+# Encode-slot state of the task running on this thread. Remux candidates
+# start without a slot and take one only when the fast path is ruled out.
+_ENCODE_SLOT = threading.local()
+# Scratch directories owned by the task running on this thread; removed when
+# the task ends, whatever the outcome.
+_TASK_SCRATCH = threading.local()
 
 _ENCODER_TELEMETRY_KEYS = (
     "requested_encoder",
@@ -74,6 +171,7 @@ _ENCODER_TELEMETRY_KEYS = (
     "fallback_stage",
     "fallback_reason",
     "decoder",
+    "optimizations",
 )
 
 
@@ -349,6 +447,8 @@ def cleanup_transient_input(input_path: str | Path | None, transient_input: bool
     """
     if not transient_input or input_path is None:
         return
+    remove_packet_index(str(input_path))
+    remove_analysis(str(input_path))
     try:
         Path(input_path).unlink(missing_ok=True)
         logger.info("windows-temp: removed transient input %s", input_path)
@@ -356,6 +456,30 @@ def cleanup_transient_input(input_path: str | Path | None, transient_input: bool
         logger.warning("windows-temp: could not remove transient input %s: %s", input_path, exc)
 
 
+def _acquire_encode_slot() -> None:
+    """Take an encode slot for the current task unless it already holds one."""
+    slot = getattr(_ENCODE_SLOT, "current", None)
+    if slot is None or slot["lease"] is not None:
+        return
+    gate = slot["gate"]
+    slot["lease"] = gate.acquire(cancelled=slot["cancelled"])
+    _check_cancelled(slot["task_id"], "waiting_for_encode_slot")
+    logger.info(
+        "adaptive concurrency: acquired encode slot task_id=%s limit=%s",
+        slot["task_id"],
+        gate.current_limit(),
+    )
+
+
+def _task_scratch_dir(prefix: str) -> str:
+    """Create a temporary directory that lives until the current task ends."""
+    path = tempfile.mkdtemp(prefix=prefix)
+    dirs = getattr(_TASK_SCRATCH, "dirs", None)
+    if dirs is not None:
+        dirs.append(path)
+    return path
+
+
 def _cleanup_transient_input_after_task(func):
     """Guarantee source cleanup after success, retry exhaustion, or failure."""
     @functools.wraps(func)
@@ -368,16 +492,21 @@ def _cleanup_transient_input_after_task(func):
         task_id = getattr(getattr(task, "request", None), "id", "?")
         cancelled = lambda: task_id != "?" and _is_cancelled(task_id)
         gate = _encode_gate()
-        lease = None
+        slot = {"gate": gate, "lease": None, "task_id": task_id, "cancelled": cancelled}
+        _ENCODE_SLOT.current = slot
+        _TASK_SCRATCH.dirs = []
         try:
             _check_cancelled(task_id, "queued")
-            lease = gate.acquire(cancelled=cancelled)
-            _check_cancelled(task_id, "waiting_for_encode_slot")
-            logger.info(
-                "adaptive concurrency: acquired encode slot task_id=%s limit=%s",
-                task_id,
-                gate.current_limit(),
-            )
+            if not remux_candidate(
+                kwargs.get("input_path"),
+                kwargs.get("output_path"),
+                kwargs.get("target_size_mb"),
+                audio_only=bool(kwargs.get("audio_only")),
+                start_time=kwargs.get("start_time"),
+                end_time=kwargs.get("end_time"),
+                target_video_bitrate_kbps=kwargs.get("target_video_bitrate_kbps"),
+            ):
+                _acquire_encode_slot()
             return func(*args, **kwargs)
         except JobCancellationRequested as exc:
             message = str(exc) or "Job canceled by user"
@@ -402,8 +531,12 @@ def _cleanup_transient_input_after_task(func):
 
             raise Ignore() from exc
         finally:
-            if lease is not None:
-                gate.release(lease)
+            _ENCODE_SLOT.current = None
+            if slot["lease"] is not None:
+                gate.release(slot["lease"])
+            for scratch_dir in _TASK_SCRATCH.dirs or []:
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+            _TASK_SCRATCH.dirs = None
             cleanup_transient_input(input_path, transient_input)
     return wrapper
 
@@ -433,6 +566,9 @@ def run_hardware_tests_task() -> dict:
         _hw_info = refresh_hw_info()
         cache = run_startup_tests(_hw_info)
         replace_encoder_test_cache(cache)
+        # A rerun usually follows a driver or device change; give hardware
+        # decode another chance on every source class.
+        decode_failures.forget_all()
         return {
             "status": "ok",
             "updated": len(cache),
@@ -453,18 +589,28 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
                    target_resolution: int | None = None, audio_only: bool = False,
                    target_video_bitrate_kbps: float | None = None,
                    max_output_fps: float | None = None,
+                   segment_parallel: bool | None = None,
+                   calibrate: bool | None = None,
+                   two_pass: bool | None = None,
+                   auto_fps: bool = False,
+                   auto_crop: bool | None = None,
+                   frame_decimation: str | None = None,
+                   deadline_minutes: float | None = None,
+                   fallback_preset: str | None = None,
                    transient_input: bool = False):
     task_id = self.request.id
+    task_started = time.time()
     _check_cancelled(task_id, "queued")
     logger.info(
         "compress_video START task_id=%s job_id=%s codec=%s target_mb=%s preset=%s tune=%s "
         "audio=%s@%skbps container=%s audio_only=%s auto_res=%s max_wh=%s/%s "
-        "target_res=%s fps_cap=%s force_hw_decode=%s fast_finalize=%s input=%s",
+        "target_res=%s fps_cap=%s auto_fps=%s auto_crop=%s decimation=%s force_hw_decode=%s fast_finalize=%s segments=%s calibrate=%s "
+        "two_pass=%s deadline_min=%s fallback_preset=%s input=%s",
         task_id, job_id, video_codec, target_size_mb, preset, tune,
         audio_codec, audio_bitrate_kbps,
         Path(output_path).suffix.lstrip("."), audio_only, auto_resolution,
-        max_width, max_height, target_resolution, max_output_fps,
-        force_hw_decode, fast_mp4_finalize, input_path,
+        max_width, max_height, target_resolution, max_output_fps, auto_fps, auto_crop, frame_decimation,
+        force_hw_decode, fast_mp4_finalize, segment_parallel, calibrate, two_pass, deadline_minutes, fallback_preset, input_path,
     )
 
     def remove_cancelled_output() -> None:
@@ -474,6 +620,34 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         except OSError:
             logger.warning("Could not remove canceled partial output: %s", output_path)
 
+    # Keyframe/packet index of the source, built on first use. API uploads
+    # keep it next to the file for retries and later stages.
+    source_index_state: dict = {}
+
+    def source_index(build: bool = True):
+        if "index" not in source_index_state and not build:
+            # Trims only use an index that is already on disk; building one
+            # reads the whole file, while an interval probe reads the range.
+            return load_packet_index(input_path, persist=transient_input, build=False)
+        if "index" not in source_index_state:
+            index_started = time.time()
+            source_index_state["index"] = load_packet_index(
+                input_path, persist=transient_input, env=get_gpu_env(),
+            )
+            index = source_index_state["index"]
+            optimizations["packet_index"] = None if index is None else {
+                "keyframes": len(index.keyframe_times),
+                "seconds": len(index.second_bytes),
+                "wall_s": round(time.time() - index_started, 2),
+            }
+        return source_index_state["index"]
+
+    def source_keyframes(start_s: float, end_s: float) -> list[float]:
+        index = source_index(build=not (start_time or end_time))
+        if index is not None:
+            return index.keyframes(start_s, end_s)
+        return probe_keyframe_times(input_path, start_s, end_s, env=get_gpu_env())
+
     # Detect hardware acceleration
     _publish(task_id, {"type": "progress", "progress": 0.0, "phase": "probing"})
     _publish(task_id, {"type": "log", "message": "Initializing: detecting hardware…"})
@@ -513,7 +687,10 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         total_kbps = video_kbps + float(audio_bitrate_kbps)
         _publish(self.request.id, {"type": "log", "message": f"Target video bitrate: {int(video_kbps)} kbps (fixed; not derived from file size)"})
     else:
-        total_kbps, video_kbps = calc_bitrates(target_size_mb, duration, audio_bitrate_kbps)
+        total_kbps, video_kbps = calc_bitrates(
+            target_size_mb, duration, audio_bitrate_kbps,
+            container=Path(output_path).suffix, fps=info.get("video_fps"),
+        )
     # Estimated size for progress / queue metadata when using fixed bitrate
     progress_target_mb = target_size_mb
     if bitrate_mode and duration > 0:
@@ -562,6 +739,12 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         "hardware_type": None,
         "device": None,
     }
+    # Structured per-job optimization records (segment plans, size models,
+    # fast paths).  Mirrored into telemetry and the final stats.
+    optimizations: dict = {}
+    if info.get("probe"):
+        # Which probe tier answered (container/header/deep) and why it escalated.
+        optimizations["probe"] = info["probe"]
     encoder_telemetry = {
         "requested_encoder": requested_encoder,
         "resolved_encoder": resolved_encoder,
@@ -580,6 +763,7 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         return {
             **encoder_telemetry,
             "decoder": dict(decoder_info),
+            "optimizations": dict(optimizations) if optimizations else None,
         }
 
     def _publish_telemetry() -> None:
@@ -591,6 +775,283 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
             state_meta.update(meta)
         self.update_state(state=state, meta=state_meta)
 
+    def finish_stream_copy(mode: str, encoder: str, final_mb: float, wall_s: float, keep_audio: bool) -> dict:
+        """Publish, record and return a job whose video was (mostly) stream-copied."""
+        encoder_telemetry.update({"actual_encoder": encoder, "hardware_used": False})
+        _publish_telemetry()
+        stats = {
+            "input_path": input_path,
+            "output_path": output_path,
+            "encoder": encoder,
+            "requested_encoder": requested_encoder,
+            "resolved_encoder": resolved_encoder,
+            "actual_encoder": encoder,
+            "hardware_used": False,
+            "fallback_occurred": False,
+            "fallback_stage": "none",
+            "fallback_reason": None,
+            "render_device": render_device,
+            "hardware_device": render_device,
+            "hardware_type": hw_info.get("type"),
+            "decoder": dict(decoder_info),
+            "duration_s": duration,
+            "target_size_mb": target_size_mb,
+            "final_size_mb": final_mb,
+            "target_video_bitrate_kbps": int(video_kbps) if bitrate_mode else None,
+            "optimizations": dict(optimizations),
+        }
+        try:
+            if os.getenv("HISTORY_ENABLED", "true").lower() in ("true", "1", "yes"):
+                import importlib
+
+                app_root = os.getenv("BACKEND_APP_ROOT", "/app")
+                sys.path.insert(0, app_root)
+                try:
+                    history = importlib.import_module("backend.history_manager")
+                except ModuleNotFoundError:
+                    history = importlib.import_module("app.history_manager")
+                history.add_history_entry(
+                    filename=_history_filename(job_id, input_path),
+                    original_size_mb=input_size_bytes / (1024 * 1024),
+                    compressed_size_mb=final_mb,
+                    video_codec=str(info.get("video_codec") or "copy"),
+                    audio_codec=str(info.get("audio_codec") or "none") if keep_audio else "none",
+                    target_mb=target_size_mb,
+                    preset=preset.lower(),
+                    duration=wall_s,
+                    task_id=task_id,
+                    container=Path(output_path).suffix.lstrip(".").lower(),
+                    tune=(tune or "hq").lower(),
+                    audio_bitrate_kbps=int(audio_bitrate_kbps),
+                    encoder=encoder,
+                    output_filename=Path(output_path).name,
+                )
+        except Exception as exc:
+            _publish(task_id, {"type": "log", "message": f"Failed to save {mode} history: {exc}"})
+        _publish(task_id, {"type": "progress", "progress": 100.0, "phase": "done"})
+        try:
+            _update_task_state("SUCCESS", {"output_path": output_path, "progress": 100.0, "detail": "done", **stats})
+        except Exception:
+            pass
+        logger.info(
+            "compress_video DONE (%s) task_id=%s codec=%s final=%sMB target=%sMB elapsed=%.1fs",
+            mode, task_id, info.get("video_codec"), final_mb, target_size_mb, wall_s,
+        )
+        _publish(task_id, {"type": "done", "stats": stats})
+        return stats
+
+    def try_remux() -> dict | None:
+        """Stream-copy the source into the output; ``None`` means encode instead."""
+        remux_started = time.time()
+        keep_audio = bool(info.get("has_audio")) and audio_codec != "none"
+        remux_cmd = remux_command(input_path, output_path, info, keep_audio=keep_audio)
+        _publish(task_id, {"type": "log", "message": (
+            f"Source already fits the target ({info.get('video_codec')}"
+            + (f"/{info.get('audio_codec')}" if keep_audio else "")
+            + f", {input_size_bytes / (1024 * 1024):.2f} MB) — remuxing with stream copy"
+        )})
+        _publish(task_id, {"type": "log", "message": f"FFmpeg (remux): {' '.join(remux_cmd)}"})
+        popen_kwargs: dict = {
+            "stdout": subprocess.DEVNULL,
+            "stderr": subprocess.PIPE,
+            "text": True,
+            "env": get_gpu_env(),
+        }
+        if sys.platform != "win32":
+            popen_kwargs["start_new_session"] = True
+        popen_kwargs.update(hidden_process_kwargs())
+        _check_cancelled(task_id, "remuxing")
+        remux_proc = subprocess.Popen(remux_cmd, **popen_kwargs)
+        remux_stderr = ""
+        while True:
+            if _is_cancelled(task_id):
+                _force_stop_ffmpeg(remux_proc)
+                remove_cancelled_output()
+                raise JobCancellationRequested("Job canceled during remux")
+            try:
+                _, remux_stderr = remux_proc.communicate(timeout=0.25)
+                break
+            except subprocess.TimeoutExpired:
+                continue
+        try:
+            remux_size = os.path.getsize(output_path) if remux_proc.returncode == 0 else 0
+        except OSError:
+            remux_size = 0
+        fits = bitrate_mode or remux_size <= target_size_mb * 1024 * 1024
+        if remux_size <= 0 or not fits:
+            tail = " ".join((remux_stderr or "").strip().splitlines()[-2:])[:300]
+            _publish(task_id, {"type": "log", "message": (
+                f"Stream copy did not produce a usable output (rc={remux_proc.returncode}, "
+                f"{remux_size / (1024 * 1024):.2f} MB){': ' + tail if tail else ''}; encoding instead"
+            )})
+            try:
+                Path(output_path).unlink(missing_ok=True)
+            except OSError:
+                pass
+            return None
+
+        remux_wall = max(time.time() - remux_started, 0.0)
+        final_mb = round(remux_size / (1024 * 1024), 2)
+        optimizations["remux"] = {
+            "video_codec": info.get("video_codec"),
+            "audio_codec": info.get("audio_codec") if keep_audio else None,
+            "input_mb": round(input_size_bytes / (1024 * 1024), 2),
+            "wall_s": round(remux_wall, 2),
+        }
+        return finish_stream_copy("remux", "copy", final_mb, remux_wall, keep_audio)
+
+    def try_smart_cut(start_s: float, end_s: float, origin_s: float) -> dict | None:
+        """Copy whole GOPs of the trim range and re-encode only its edges.
+
+        ``origin_s`` is the source start time; keyframes are looked up in
+        container time and planned relative to it.  ``None`` means the
+        range does not cut cleanly; the job then encodes normally.
+        """
+        cut_started = time.time()
+        keyframes = source_keyframes(max(origin_s + start_s - 1.0, 0.0), origin_s + end_s + 1.0)
+        plan = plan_smart_cut(keyframes, start_s, end_s, origin_s=origin_s)
+        if plan is None:
+            logger.info("smart cut skipped task_id=%s keyframes=%s: no whole GOPs to copy", task_id, len(keyframes))
+            return None
+        keep_audio = bool(info.get("has_audio")) and audio_codec != "none"
+        edge_encoder = SMART_CUT_ENCODERS[str(info.get("video_codec")).lower()]
+        scratch = _task_scratch_dir("8mblocal-smartcut-")
+        piece_paths = [os.path.join(scratch, f"piece_{index}.ts") for index in range(len(plan))]
+        commands = [
+            copy_command(input_path, start, end, path) if kind == "copy"
+            else edge_command(input_path, start, end, path, info)
+            for (kind, start, end), path in zip(plan, piece_paths)
+        ]
+        copied_s = sum(end - start for kind, start, end in plan if kind == "copy")
+        _publish(task_id, {"type": "log", "message": (
+            f"Smart cut: copying {copied_s:.1f}s of whole GOPs, re-encoding "
+            f"{(end_s - start_s) - copied_s:.2f}s at the edges with {edge_encoder}"
+        )})
+        _publish(task_id, {"type": "progress", "progress": 5.0, "phase": "encoding"})
+        rc, cancelled, tail = run_parallel(
+            commands, env=get_gpu_env(), cancelled=lambda: _is_cancelled(task_id), stop=_force_stop_ffmpeg,
+        )
+        if not cancelled and rc == 0 and all(wait_for_file(path) for path in piece_paths):
+            list_path = os.path.join(scratch, "pieces.txt")
+            with open(list_path, "w", encoding="utf-8") as handle:
+                handle.write(concat_list_text(piece_paths))
+            _publish(task_id, {"type": "progress", "progress": 80.0, "phase": "finalizing"})
+            rc, cancelled, tail = run_parallel(
+                [join_command(list_path, input_path, start_s, end_s - start_s, output_path, info, keep_audio=keep_audio)],
+                env=get_gpu_env(), cancelled=lambda: _is_cancelled(task_id), stop=_force_stop_ffmpeg,
+            )
+        if cancelled:
+            remove_cancelled_output()
+            raise JobCancellationRequested("Job canceled during smart cut")
+        try:
+            cut_size = os.path.getsize(output_path) if rc == 0 else 0
+            cut_duration = float(ffprobe_info(output_path).get("duration") or 0.0) if cut_size > 0 else 0.0
+        except Exception:
+            cut_size, cut_duration = 0, 0.0
+        fits = bitrate_mode or cut_size <= target_size_mb * 1024 * 1024
+        clean = abs(cut_duration - (end_s - start_s)) <= max(0.5, 0.02 * (end_s - start_s))
+        if cut_size <= 0 or not fits or not clean:
+            _publish(task_id, {"type": "log", "message": (
+                f"Smart cut did not produce a usable output (rc={rc}, {cut_size / (1024 * 1024):.2f} MB, "
+                f"{cut_duration:.2f}s){': ' + ' '.join(tail[-2:])[:300] if tail and rc else ''}; encoding instead"
+            )})
+            try:
+                Path(output_path).unlink(missing_ok=True)
+            except OSError:
+                pass
+            return None
+
+        cut_wall = max(time.time() - cut_started, 0.0)
+        optimizations["smart_cut"] = {
+            "edge_encoder": edge_encoder,
+            "copied_s": round(copied_s, 3),
+            "encoded_s": round((end_s - start_s) - copied_s, 3),
+            "pieces": [kind for kind, _start, _end in plan],
+            "wall_s": round(cut_wall, 2),
+        }
+        return finish_stream_copy("smart cut", edge_encoder, round(cut_size / (1024 * 1024), 2), cut_wall, keep_audio)
+
+    # Stream-copy fast path: the source already fits and needs no filtering,
+    # so skip decode/encode entirely. Candidates reach this point without an
+    # encode slot; every other path takes one below.
+    if remux_candidate(
+        input_path, output_path, target_size_mb,
+        audio_only=audio_only, start_time=start_time, end_time=end_time,
+        target_video_bitrate_kbps=target_video_bitrate_kbps,
+    ):
+        try:
+            input_size_bytes = os.path.getsize(input_path)
+        except OSError:
+            input_size_bytes = 0
+        remux_reasons = remux_blockers(
+            info,
+            output_path=output_path,
+            input_size_bytes=input_size_bytes,
+            target_size_mb=target_size_mb,
+            target_video_bitrate_kbps=target_video_bitrate_kbps,
+            audio_codec=audio_codec,
+            max_width=max_width,
+            max_height=max_height,
+            max_output_fps=max_output_fps,
+            target_resolution=target_resolution,
+            auto_crop=auto_crop_enabled(auto_crop),
+            frame_decimation=decimation_mode(frame_decimation),
+        )
+        if remux_reasons:
+            logger.info("remux fast path skipped task_id=%s reasons=%s", task_id, remux_reasons)
+        else:
+            remux_stats = try_remux()
+            if remux_stats is not None:
+                return remux_stats
+    _acquire_encode_slot()
+
+    # Smart cut: a trimmed range that already fits is cut at keyframes, and
+    # only the partial GOPs at its edges are encoded.
+    if smart_cut_candidate(start_time, end_time, audio_only=audio_only) and duration > 0:
+        try:
+            input_size_bytes = os.path.getsize(input_path)
+        except OSError:
+            input_size_bytes = 0
+        cut_start_s = parse_time_string(start_time) if start_time else 0.0
+        cut_options = dict(
+            output_path=output_path,
+            target_size_mb=target_size_mb,
+            target_video_bitrate_kbps=target_video_bitrate_kbps,
+            audio_codec=audio_codec,
+            max_width=max_width,
+            max_height=max_height,
+            max_output_fps=max_output_fps,
+            target_resolution=target_resolution,
+            auto_crop=auto_crop_enabled(auto_crop),
+            frame_decimation=decimation_mode(frame_decimation),
+        )
+        cut_reasons = remux_blockers(
+            info, input_size_bytes=0, check_size=False, **cut_options,
+        ) + smart_cut_blockers(info, available_cpu_encoders)
+        cut_origin_s = info.get("start_time")
+        if not cut_reasons and cut_origin_s is None:
+            # Keyframe and index times are container timestamps, but -ss/-t
+            # count from the format start time (MPEG-TS, MP4 edit lists).
+            cut_origin_s = probe_start_time(input_path, env=get_gpu_env())
+            if cut_origin_s is None:
+                cut_reasons = ["unknown start time"]
+        if not cut_reasons:
+            # Only a cut that can happen pays for measuring its range.
+            range_bytes = range_bytes_estimate(input_size_bytes, float(info.get("duration") or 0.0), duration)
+            cut_index = source_index(build=False)
+            if cut_index is not None and cut_index.second_bytes:
+                # Measured video bytes of the range rather than the file average.
+                audio_bytes = float(info.get("audio_bitrate_kbps") or 0.0) * 1000 / 8 * duration
+                index_start_s = cut_origin_s + cut_start_s
+                range_bytes = cut_index.video_bytes(index_start_s, index_start_s + duration) + int(audio_bytes)
+            cut_reasons = remux_blockers(info, input_size_bytes=range_bytes, **cut_options)
+        if cut_reasons:
+            logger.info("smart cut skipped task_id=%s reasons=%s", task_id, cut_reasons)
+        else:
+            cut_stats = try_smart_cut(cut_start_s, cut_start_s + duration, cut_origin_s)
+            if cut_stats is not None:
+                return cut_stats
+
     # If hardware mapping already selected a CPU encoder, expose that as a
     # resolved fallback immediately. The actual encoder is known because no
     # hardware process will be attempted in this case.
@@ -710,6 +1171,94 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         _publish(self.request.id, {"type": "log", "message": "Extra Quality uses constant-quality mode, not fixed bitrate — using P6 for this encode."})
         preset_val = "p6"
 
+    # Output height before auto resolution; keys the size and throughput models.
+    size_model_height = min(
+        (int(h) for h in (target_resolution, max_height, disp_h) if h),
+        default=None,
+    )
+
+    # Hardware requests already moved to a CPU encoder (detection or startup
+    # probe): size the CPU preset to the hardware encode's expected speed
+    # rather than reusing a level chosen for the GPU.
+    if (
+        fallback_occurred
+        and actual_encoder in CPU_ENCODERS
+        and not audio_only
+        and duration > 0
+        and preset_val in throughput_model.PRESETS
+    ):
+        hardware_encoder = original_encoder if _is_hardware_encoder(original_encoder) else requested_encoder
+        fallback_preset_val, fallback_record = choose_fallback_preset(
+            hardware_encoder, actual_encoder, preset_val, size_model_height,
+            fallback_preset_mode(fallback_preset),
+        )
+        optimizations["fallback_preset"] = {"stage": fallback_stage, **fallback_record}
+        if fallback_preset_val != preset_val:
+            _publish(task_id, {"type": "log", "message": (
+                f"CPU fallback ({actual_encoder}): preset {preset_val.upper()} → {fallback_preset_val.upper()} "
+                f"({fallback_record['reason']})"
+            )})
+            preset_val = fallback_preset_val
+
+    # Deadline jobs: the slowest preset whose measured throughput for this
+    # encoder and output size fits the time left replaces the requested one.
+    # Auto resolution may still lower the height, so the prediction errs on
+    # the slow side.
+    deadline_s = float(deadline_minutes) * 60.0 if deadline_minutes and deadline_minutes > 0 else None
+    if deadline_s and not audio_only and duration > 0 and preset_val in throughput_model.PRESETS:
+        budget_s = deadline_s - max(time.time() - task_started, 0.0)
+        chosen_preset, deadline_record = throughput_model.choose_preset(
+            actual_encoder, size_model_height, duration, budget_s, preset_val,
+        )
+        optimizations["deadline"] = {
+            "deadline_s": round(deadline_s, 1),
+            "budget_s": round(budget_s, 1),
+            **deadline_record,
+        }
+        if chosen_preset != preset_val:
+            _publish(task_id, {"type": "log", "message": (
+                f"Deadline {deadline_minutes:g} min: preset {preset_val.upper()} → {chosen_preset.upper()} "
+                f"(predicted encode ~{deadline_record['predicted_s']:.0f}s)"
+            )})
+            preset_val = chosen_preset
+        elif deadline_record.get("predicted_s") is None:
+            _publish(task_id, {"type": "log", "message": (
+                f"Deadline {deadline_minutes:g} min: no throughput history for {actual_encoder} yet; "
+                f"keeping preset {preset_val.upper()}"
+            )})
+
+    # Learned overshoot pre-compensation. Only size-targeted ABR encodes
+    # participate: fixed-bitrate jobs have no size goal and Extra Quality is
+    # constant-quality.
+    size_model_active = (
+        not bitrate_mode and not audio_only and duration > 0 and preset_val != "extraquality"
+    )
+    size_model_factor = 1.0
+    if size_model_active:
+        size_model_factor, size_model_entry = overshoot_model.correction_factor(
+            actual_encoder, preset_val, size_model_height, duration,
+        )
+        optimizations["overshoot_model"] = {
+            "key": overshoot_model.model_key(actual_encoder, preset_val, size_model_height, duration),
+            "factor": round(size_model_factor, 4),
+            "samples": int((size_model_entry or {}).get("samples", 0)),
+            "ratio": (size_model_entry or {}).get("ratio"),
+        }
+        if abs(size_model_factor - 1.0) > 1e-3:
+            uncorrected_kbps = video_kbps
+            total_kbps, video_kbps = calc_bitrates(
+                target_size_mb, duration, audio_bitrate_kbps,
+                container=Path(output_path).suffix, fps=info.get("video_fps"),
+                overshoot_factor=size_model_factor,
+            )
+            maxrate = int(video_kbps * 1.2)
+            bufsize = int(video_kbps * 2)
+            _publish(task_id, {"type": "log", "message": (
+                f"Size model: {actual_encoder}/{preset_val} historically lands at "
+                f"{float(size_model_entry.get('ratio') or 1.0):.3f}× its bitrate; "
+                f"video bitrate {int(uncorrected_kbps)} → {int(video_kbps)} kbps"
+            )})
+
     # Audio-only path: ignore video entirely and produce .m4a (aac) or .opus per requested audio codec
     if audio_only:
         _publish(self.request.id, {"type": "log", "message": "Audio-only mode enabled — extracting audio"})
@@ -853,21 +1402,33 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
     # Audio bitrate string
     a_bitrate_str = f"{int(audio_bitrate_kbps)}k"
 
+    # Audio passthrough: copy source audio that already matches the requested
+    # codec and container at or below the requested bitrate.
+    audio_passthrough = audio_passthrough_ok(info, chosen_audio_codec, output_path, audio_bitrate_kbps)
+    # Audio bitrate actually written; used for size accounting after encode.
+    effective_audio_kbps = float(audio_bitrate_kbps) if chosen_audio_codec else 0.0
+    if chosen_audio_codec is None:
+        audio_output_args = ["-an"]
+    elif audio_passthrough:
+        audio_output_args = ["-c:a", "copy"]
+        effective_audio_kbps = float(info.get("audio_bitrate_kbps") or audio_bitrate_kbps)
+        optimizations["audio_passthrough"] = {
+            "codec": info.get("audio_codec"),
+            "source_kbps": round(effective_audio_kbps, 1),
+        }
+        _publish(self.request.id, {"type": "log", "message": (
+            f"Audio: copying source {info.get('audio_codec')} at {effective_audio_kbps:.0f} kbps "
+            f"(≤ requested {int(audio_bitrate_kbps)} kbps)"
+        )})
+    else:
+        audio_output_args = ["-c:a", chosen_audio_codec, "-b:a", a_bitrate_str]
+
     # Add preset/tune for compatible encoders
     preset_flags = []
     tune_flags = []
     
-    # SVT-AV1 uses numeric presets 0 (slowest/best) .. 13 (fastest). p-scale mapping:
-    # p1 fastest -> 12, p7 slowest -> 4, extraquality -> 2.
-    svt_preset_map = {
-        "p1": "12", "p2": "10", "p3": "9", "p4": "8",
-        "p5": "7", "p6": "6", "p7": "4",
-    }
-    # libaom-av1 uses -cpu-used 0 (slowest) .. 8 (fastest)
-    aom_cpu_used_map = {
-        "p1": "8", "p2": "7", "p3": "6", "p4": "5",
-        "p5": "4", "p6": "4", "p7": "2",
-    }
+    # p-scale maps live in constants; extraquality uses SVT-AV1 preset 2 and
+    # libaom-av1 -cpu-used 0.
 
     # Handle "extraquality" preset (slowest, best quality) — not compatible with fixed target bitrate
     if preset_val == "extraquality" and not bitrate_mode:
@@ -891,6 +1452,8 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
             # QSV has a preset but no NVENC-style tune. Keep this conservative
             # because VAAPI encoders do not accept the same options.
             preset_flags = ["-preset", "slow"]
+        elif actual_encoder in AMF_ENCODERS:
+            preset_flags = ["-quality", AMF_QUALITY_MAP["p7"]]
         elif actual_encoder in VAAPI_ENCODERS:
             preset_flags = []
     elif actual_encoder.endswith("_nvenc"):
@@ -899,25 +1462,23 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         preset_flags = ["-preset", preset_val]
         tune_flags = ["-tune", tune_val]
     elif actual_encoder in QSV_ENCODERS:
-        qsv_preset_map = {
-            "p1": "veryfast", "p2": "faster", "p3": "fast",
-            "p4": "medium", "p5": "slow", "p6": "slower", "p7": "veryslow",
-        }
-        preset_flags = ["-preset", qsv_preset_map.get(preset_val, "medium")]
-    elif actual_encoder in VAAPI_ENCODERS or actual_encoder in AMF_ENCODERS:
+        preset_flags = ["-preset", QSV_PRESET_MAP.get(preset_val, "medium")]
+    elif actual_encoder in AMF_ENCODERS:
+        # AMF has no -preset/-tune; its -quality level is the portable
+        # speed/quality knob. Rate control stays conservative.
+        preset_flags = ["-quality", AMF_QUALITY_MAP.get(preset_val, "balanced")]
+    elif actual_encoder in VAAPI_ENCODERS:
         # VAAPI encoders use driver-specific quality/rate controls; FFmpeg's
-        # generic -preset/-tune flags are not portable here. AMF similarly
-        # varies by FFmpeg/driver version, so rate control stays conservative.
+        # generic -preset/-tune flags are not portable here.
         preset_flags = []
     elif actual_encoder in ("libx264", "libx265"):
-        cpu_preset_map = {"p1": "ultrafast", "p2": "superfast", "p3": "veryfast", "p4": "faster", "p5": "fast", "p6": "medium", "p7": "slow"}
-        preset_flags = ["-preset", cpu_preset_map.get(preset_val, "medium")]
+        preset_flags = ["-preset", CPU_PRESET_MAP.get(preset_val, "medium")]
         if actual_encoder == "libx264":
             tune_flags = ["-tune", "film"]  # Better than 'hq' for CPU
     elif actual_encoder == SVT_AV1:
-        preset_flags = ["-preset", svt_preset_map.get(preset_val, "8"), *_svtav1_params()]
+        preset_flags = ["-preset", SVT_AV1_PRESET_MAP.get(preset_val, "8"), *_svtav1_params()]
     elif actual_encoder == "libaom-av1":
-        preset_flags = ["-cpu-used", aom_cpu_used_map.get(preset_val, "4"), "-row-mt", "1"]
+        preset_flags = ["-cpu-used", AOM_CPU_USED_MAP.get(preset_val, "4"), "-row-mt", "1"]
 
     logger.debug(
         "preset/tune selection: encoder=%s preset_val=%s tune_val=%s bitrate_mode=%s "
@@ -939,11 +1500,85 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
     # Build video filter chain
     vf_filters = []
     
+    # Black-border crop ahead of the scale filter. Detection decodes like the
+    # software path (autorotate on), so the rectangle is in display
+    # orientation; GPU decode is skipped below while cropping.
+    crop_filter: str | None = None
+    if auto_crop_enabled(auto_crop) and not audio_only:
+        crop_start_s = parse_time_string(start_time) if start_time else 0.0
+        crop_result, crop_cached = cached_analysis(
+            input_path,
+            f"crop:{crop_start_s:.3f}:{float(duration):.3f}",
+            lambda: detect_crop(input_path, crop_start_s, float(duration), disp_w, disp_h, env=get_gpu_env()),
+            persist=transient_input,
+        )
+        if crop_result:
+            optimizations["crop"] = {**crop_result, "cached": crop_cached}
+            if crop_result.get("crop"):
+                crop_w, crop_h, crop_x, crop_y = crop_result["crop"]
+                crop_filter = f"crop={crop_w}:{crop_h}:{crop_x}:{crop_y}"
+                vf_filters.append(crop_filter)
+                _publish(self.request.id, {"type": "log", "message": (
+                    f"Crop: removing black borders {disp_w}x{disp_h} → {crop_w}x{crop_h} (offset {crop_x},{crop_y})"
+                )})
+                disp_w, disp_h = crop_w, crop_h
+            else:
+                _publish(self.request.id, {"type": "log", "message": f"Crop: keeping full frame ({crop_result.get('reason')})"})
+
     # Resolution scaling (explicit or auto) — use display dimensions when rotation metadata swaps W/H
+    complexity_scores: dict | None = None
+    complexity: float | None = None
+    decimation = "off" if audio_only else decimation_mode(frame_decimation)
+    if (auto_resolution and not target_resolution) or (auto_fps and not audio_only) or decimation == "auto":
+        analysis_started = time.time()
+        analysis_start_s = parse_time_string(start_time) if start_time else 0.0
+        complexity_scores, analysis_cached = cached_analysis(
+            input_path,
+            f"complexity:{analysis_start_s:.3f}:{float(duration):.3f}",
+            lambda: analyze_complexity(input_path, analysis_start_s, float(duration), env=get_gpu_env()),
+            persist=transient_input,
+        )
+        complexity = density_factor(complexity_scores)
+        if complexity_scores:
+            optimizations["complexity"] = {
+                **complexity_scores,
+                "factor": complexity,
+                "cached": analysis_cached,
+                "wall_s": round(time.time() - analysis_started, 2),
+            }
+            _publish(self.request.id, {"type": "log", "message": (
+                f"Content analysis: motion {complexity_scores['temporal']:.1f}, "
+                f"detail {complexity_scores['spatial']:.1f}, "
+                f"{complexity_scores['duplicate_ratio'] * 100:.0f}% repeated frames "
+                f"(density factor {complexity:g})"
+            )})
+
+    # Duplicate-frame decimation (screen recordings, slideshows). It runs
+    # first so dropped frames are not scaled either; output timing is kept
+    # with -fps_mode vfr.
+    decimate = False
+    if decimation != "off":
+        decimate, decimation_reason = should_decimate(decimation, output_path, complexity_scores)
+        optimizations["frame_decimation"] = {
+            "mode": decimation,
+            "applied": decimate,
+            "reason": decimation_reason,
+            "duplicate_ratio": (complexity_scores or {}).get("duplicate_ratio"),
+        }
+        if decimate:
+            vf_filters.insert(0, DECIMATE_FILTER)
+        _publish(self.request.id, {"type": "log", "message": (
+            f"Frame decimation: {'dropping repeated frames' if decimate else 'off'} ({decimation_reason})"
+        )})
+    frame_timing_args = vfr_output_args() if decimate else []
+    # Crop and decimation filters need software frames.
+    software_frames_only = crop_filter is not None or decimate
+
     if auto_resolution:
         aw, ah = choose_auto_resolution(
             disp_w, disp_h, info.get("video_bitrate_kbps"),
-            video_kbps, min_auto_resolution, target_resolution
+            video_kbps, min_auto_resolution, target_resolution,
+            complexity=complexity,
         )
         if ah:
             max_height = ah
@@ -959,6 +1594,26 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         vf_filters.append(f"scale={scale_expr}")
         _publish(self.request.id, {"type": "log", "message": f"Resolution: scaling to max {max_width or 'any'}x{max_height or 'any'}"})
 
+    # Automatic frame-rate reduction: halve (or divide further) a high-fps
+    # source when the budget leaves too few bits per pixel per frame at the
+    # output size. A lower manual cap still wins.
+    if auto_fps and not audio_only:
+        out_w, out_h = qsv_scaled_dimensions(disp_w, disp_h, max_width, max_height) or (disp_w, disp_h)
+        source_fps = float(info.get("video_fps") or 0.0)
+        if max_output_fps and 0 < float(max_output_fps) < source_fps:
+            source_fps = float(max_output_fps)
+        auto_fps_value, auto_fps_decision = choose_auto_frame_rate(
+            source_fps, out_w, out_h, float(video_kbps), complexity=complexity,
+        )
+        optimizations["auto_fps"] = auto_fps_decision
+        if auto_fps_value:
+            max_output_fps = auto_fps_value
+            _publish(self.request.id, {"type": "log", "message": (
+                f"Auto frame rate: {source_fps:g} → {auto_fps_value:g} fps ({auto_fps_decision['reason']})"
+            )})
+        else:
+            _publish(self.request.id, {"type": "log", "message": f"Auto frame rate: keeping source rate ({auto_fps_decision['reason']})"})
+
     # Build input options for trimming and decoder preferences
     input_opts = []
     duration_opts = []
@@ -995,63 +1650,47 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
     # Decide decoder strategy based on input codec and runtime capability
     in_codec = info.get("video_codec")
 
+    # Decoder capability answers are cached per hardware probe generation and
+    # shared across jobs, so a job normally spawns no probe processes here.
+    decoder_generation = str(hw_info.get("probe_generation") or "")
+
     def has_decoder(dec_name: str) -> bool:
-        try:
-            r = subprocess.run([
-                "ffmpeg", "-hide_banner", "-decoders"
-            ], capture_output=True, text=True, timeout=5, env=get_gpu_env(), **hidden_process_kwargs())
-            return (r.returncode == 0) and (dec_name in (r.stdout or ""))
-        except Exception:
-            return False
+        return decoder_listed(dec_name, decoder_generation, env=get_gpu_env())
+
+    def cached_decode_probe(decoder: str, probe) -> bool:
+        key = capability_key(decoder, info)
+        capable, source = cached_capability(decoder_generation, key, probe, redis_factory=_redis)
+        optimizations.setdefault("decoder_cache", {})[decoder] = {"key": key, "capable": capable, "source": source}
+        return capable
 
-    def can_cuda_decode(path: str) -> bool:
+    # Source classes whose hardware decode failed before on this hardware go
+    # straight to software decode instead of paying for a failed attempt.
+    decode_signature = decode_failures.hardware_signature(hw_info)
+
+    def hw_decode_known_bad(decoder: str) -> bool:
+        key = capability_key(decoder, info)
         try:
-            test_cmd = [
-                "ffmpeg", "-hide_banner", "-v", "error",
-                "-hwaccel", "cuda",
-                "-ss", "0",
-                "-t", "0.1",
-                "-i", path,
-                "-f", "null", "-"
-            ]
-            r = subprocess.run(test_cmd, capture_output=True, text=True, timeout=10, env=get_gpu_env(), **hidden_process_kwargs())
-            stderr = (r.stderr or "").lower()
-            fail_patterns = [
-                "doesn't support hardware accelerated", "failed setup for format cuda",
-                "not supported", "invalid argument", "error while opening decoder",
-                "no decoder surface",
-            ]
-            if any(s in stderr for s in fail_patterns):
+            entry = decode_failures.known_failure(decoder_generation, decode_signature, key)
+            if entry is None:
                 return False
-            return r.returncode == 0 and "error" not in stderr
-        except Exception:
+            saved_s = decode_failures.record_skip(decoder_generation, decode_signature, key)
+        except Exception as exc:
+            logger.debug("decode failure store unavailable: %s", exc)
             return False
+        record = optimizations.setdefault("decode_failures", {"skipped": 0, "time_saved_s": 0.0})
+        record["skipped"] += 1
+        record["time_saved_s"] = round(record["time_saved_s"] + saved_s, 1)
+        record.setdefault("keys", []).append(key)
+        _publish(self.request.id, {"type": "log", "message": (
+            f"Decoder: {decoder} failed {int(entry.get('failures', 0))}× on this source class; "
+            f"using software decode (~{saved_s:.0f}s saved)"
+        )})
+        return True
 
     def can_av1_cuvid_decode(path: str) -> bool:
         if not has_decoder("av1_cuvid"):
             return False
-        try:
-            test_cmd = [
-                "ffmpeg", "-hide_banner", "-v", "error",
-                "-hwaccel", "cuda", "-hwaccel_output_format", "cuda",
-                "-c:v", "av1_cuvid",
-                "-ss", "0",
-                "-t", "0.1",
-                "-i", path,
-                "-f", "null", "-"
-            ]
-            r = subprocess.run(test_cmd, capture_output=True, text=True, timeout=10, env=get_gpu_env(), **hidden_process_kwargs())
-            stderr = (r.stderr or "").lower()
-            fail_patterns = [
-                "not found", "unknown decoder", "cannot load", "init failed",
-                "device not present", "not supported", "invalid argument",
-                "error while opening decoder", "no decoder surface",
-            ]
-            if any(s in stderr for s in fail_patterns):
-                return False
-            return r.returncode == 0 and "error" not in stderr
-        except Exception:
-            return False
+        return cached_decode_probe("av1_cuvid", lambda: probe_av1_cuvid_decode(path, env=get_gpu_env()))
 
     # Log force decode preference once. This is a request, not proof that the
     # selected decoder will be usable for this source/device.
@@ -1063,7 +1702,13 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         if actual_encoder.endswith("_nvenc"):
             # Never use av1_cuvid from "decoder exists in ffmpeg" alone: force_hw_decode / preferHwDecode
             # must not bypass a runtime probe — many builds list av1_cuvid while the GPU/driver cannot decode AV1.
-            if has_decoder("av1_cuvid") and can_av1_cuvid_decode(input_path) and rot_deg % 360 == 0:
+            if (
+                not software_frames_only
+                and has_decoder("av1_cuvid")
+                and can_av1_cuvid_decode(input_path)
+                and rot_deg % 360 == 0
+                and not hw_decode_known_bad("av1_cuvid")
+            ):
                 init_hw_flags = ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"] + init_hw_flags
                 input_opts += ["-c:v", "av1_cuvid"]
                 v_flags = [f for i, f in enumerate(v_flags) if not (f == "-pix_fmt" or (i > 0 and v_flags[i-1] == "-pix_fmt"))]
@@ -1092,7 +1737,11 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
             _publish(self.request.id, {"type": "log", "message": (
                 f"Decoder: Software (libdav1d); encoder remains hardware ({actual_encoder})"
             )})
-    elif in_codec in ("h264", "hevc") and actual_encoder.endswith("_nvenc") and rot_deg % 360 == 0:
+    elif (
+        in_codec in ("h264", "hevc") and actual_encoder.endswith("_nvenc")
+        and rot_deg % 360 == 0 and not software_frames_only
+        and not hw_decode_known_bad("cuda")
+    ):
         # H.264/HEVC: NVDEC widely supported; prefer CUDA when using NVENC (software decode if rotation metadata must be honored)
         init_hw_flags = ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"] + init_hw_flags
         # Remove -pix_fmt if present (GPU surfaces)
@@ -1144,6 +1793,9 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
                     elif "hevc" in actual_encoder:
                         nvenc_pix += ["-profile:v", "main"]
                     v_flags = nvenc_pix + v_flags
+            elif decimate:
+                # Cap before decimating: fps after mpdecimate would refill the dropped frames.
+                vf_filters = [fps_filter] + vf_filters
             else:
                 if vf_filters:
                     vf_filters = vf_filters + [fps_filter]
@@ -1157,11 +1809,10 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
     # input/profile/driver combinations must return to this proven path.
     software_vf_filters = list(vf_filters)
 
-    qsv_hardware_decode = qsv_hardware_decode_supported(
-        sys.platform,
-        in_codec,
-        actual_encoder,
-        rot_deg,
+    qsv_hardware_decode = (
+        not software_frames_only
+        and qsv_hardware_decode_supported(sys.platform, in_codec, actual_encoder, rot_deg)
+        and not hw_decode_known_bad(f"{in_codec}_qsv")
     )
 
     # Upload only after all software filters have been applied on the fallback
@@ -1248,6 +1899,39 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
             "message": f"Encoder: {_encoder_display_label(actual_encoder)} ({actual_encoder}) with software decode and VAAPI hardware upload",
         })
 
+    # Reserved moov: write the MP4 index into space reserved up front instead
+    # of the +faststart pass that re-reads and rewrites the whole file. The
+    # unused part of the reservation stays in the file as padding, so the
+    # video budget gives it up; a too-small estimate falls back below.
+    if mp4_flags == ["-movflags", "+faststart"] and reserved_moov_enabled() and duration > 0:
+        moov_has_audio = bool(chosen_audio_codec and info.get("has_audio"))
+        moov_reserve = mp4_moov_reserve_bytes(
+            duration, info.get("video_fps"),
+            r_fps=info.get("video_r_fps"),
+            fps_cap=qsv_frame_rate,
+            has_audio=moov_has_audio,
+            extra_streams=int(info.get("subtitle_streams") or 0),
+        )
+        if moov_reserve:
+            mp4_flags = ["-moov_size", str(moov_reserve)]
+            encoding_portion = 0.985
+            finalize_portion = max(0.0, 1.0 - encoding_portion)
+            modeled_kbps = container_overhead_kbps(
+                Path(output_path).suffix, duration, qsv_frame_rate or info.get("video_fps"), moov_has_audio,
+            )
+            padding_kbps = max(moov_reserve * 8.0 / 1024.0 / duration - modeled_kbps, 0.0)
+            if not bitrate_mode and padding_kbps > 0:
+                video_kbps = max(float(video_kbps) - padding_kbps * 1.024, 48.0)
+                maxrate = int(video_kbps * 1.2)
+                bufsize = int(video_kbps * 2)
+            optimizations["reserved_moov"] = {
+                "reserved_bytes": moov_reserve,
+                "padding_kbps": round(padding_kbps, 2),
+            }
+            _publish(self.request.id, {"type": "log", "message": (
+                f"MP4: reserving {moov_reserve / 1024:.0f} KiB for the index up front (no faststart rewrite)"
+            )})
+
     # Note: We do not inject -extra_hw_frames here. Large values (e.g. 16) plus the
     # default H.264 decoder thread count can exceed NVDEC's ~32 decode-surface budget and
     # make cuvidCreateDecoder fail. Capping -threads to compensate then slowed decodes
@@ -1263,6 +1947,7 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         "-c:v", actual_encoder,  # Use detected encoder
         *v_flags,
         *active_color_metadata_args,
+        *frame_timing_args,
     ]
     
     if vf_filters:
@@ -1275,10 +1960,7 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
     ]
     
     # Add audio encoding or disable audio if muted
-    if chosen_audio_codec is None:
-        cmd += ["-an"]  # No audio
-    else:
-        cmd += ["-c:a", chosen_audio_codec, "-b:a", a_bitrate_str]
+    cmd += audio_output_args
     
     cmd += [
         *mp4_video_tag_args(output_path, actual_encoder),
@@ -1292,7 +1974,24 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
     logger.info("ffmpeg exec task_id=%s cmd=%s", self.request.id, cmd_str)
     _publish(self.request.id, {"type": "log", "message": f"FFmpeg command: {cmd_str}"})
 
-    def run_ffmpeg_and_stream(command: list) -> tuple[int, bool]:
+    # Early overshoot abort (size-target mode, single-process encodes only).
+    # At most one pass per job is aborted; the restarted pass runs unguarded
+    # and the normal post-encode size check stays the final safety net.
+    early_abort_allowed = (
+        not bitrate_mode
+        and duration > 0
+        and os.getenv("EARLY_OVERSHOOT_ABORT", "1").strip().lower() not in {"0", "false", "no", "off"}
+    )
+    pending_overshoot_abort: dict | None = None
+
+    def run_ffmpeg_and_stream(command: list, size_guard: bool = False, window: dict | None = None) -> tuple[int, bool]:
+        """Run one FFmpeg process and stream its progress.
+
+        ``window`` maps this process onto a slice of the progress bar
+        (``start``/``span`` fractions plus ``started_at``) for multi-pass
+        encodes; progress then only moves forward across the passes.
+        """
+        nonlocal pending_overshoot_abort
         logger.debug("ffmpeg Popen pid=launching args[0..5]=%s", command[:6])
         _popen_kw: dict = {
             "stderr": subprocess.PIPE,
@@ -1325,6 +2024,10 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         if duration and duration < 120:
             min_step = 0.00025  # 0.025% for very short content
         max_update_interval = 2.0  # Force update every 2 seconds
+        guard_target_bytes = progress_target_mb * 1024 * 1024
+        guard_fixed_bytes = reserved_moov_bytes(command)
+        guard_started = time.time()
+        last_projection_at = 0.0
         try:
             assert proc_i.stderr is not None
             # Read stderr on a thread so the main loop can poll cancel every ~250ms. A plain
@@ -1443,7 +2146,10 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
                                     size_progress = raw_size_progress
                             
                             # Simple weighted blend favoring time stability
-                            if wallclock_progress > 0.01 and elapsed > 3.0:
+                            if window is not None:
+                                overall = window["start"] + window["span"] * time_progress
+                                scaled_progress = overall * encoding_portion
+                            elif wallclock_progress > 0.01 and elapsed > 3.0:
                                 # Blend time (70%) and wallclock (30%) after speed stabilizes
                                 scaled_progress = (0.7 * time_progress + 0.3 * wallclock_progress) * encoding_portion
                             else:
@@ -1464,13 +2170,22 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
                                 elapsed > 2.0 and            # At least 2 seconds elapsed
                                 current_size_bytes > 100000  # At least 100KB output (real encoding started)
                             )
+                            if window is not None:
+                                # Analysis passes write no output, so there is no
+                                # size signal; never step back across passes.
+                                should_report = scaled_progress > last_progress
                             
                             if should_report:
                                 last_progress = scaled_progress
 
                             # Compute ETA
                             eta_seconds = None
-                            if speed_ewma and speed_ewma > 0.01 and duration > 0:
+                            if window is not None:
+                                window_elapsed = max(time.time() - window["started_at"], 0.0)
+                                overall = scaled_progress / encoding_portion
+                                if overall > 0.01 and window_elapsed > 2.0:
+                                    eta_seconds = window_elapsed * (1.0 - overall) / overall
+                            elif speed_ewma and speed_ewma > 0.01 and duration > 0:
                                 try:
                                     est_total = (duration / speed_ewma)
                                     fin_factor = 1.0
@@ -1509,6 +2224,44 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
                                         pass
                         except Exception:
                             pass
+
+                    # Project the final size and stop a pass that is clearly
+                    # going to land over target.
+                    if size_guard and key == "out_time_ms" and duration > 0 and current_time_s > 0:
+                        done_fraction = min(current_time_s / duration, 1.0)
+                        projected = project_final_size(current_size_bytes, current_time_s, duration, guard_fixed_bytes)
+                        if projected is not None and done_fraction - last_projection_at >= 0.05:
+                            last_projection_at = done_fraction
+                            _publish(task_id, {
+                                "type": "size_projection",
+                                "done_fraction": round(done_fraction, 3),
+                                "projected_mb": round(projected / (1024 * 1024), 2),
+                                "target_mb": round(progress_target_mb, 2),
+                            })
+                        if overshoot_abort_due(projected, guard_target_bytes, done_fraction):
+                            pass_elapsed = max(time.time() - guard_started, 0.0)
+                            pending_overshoot_abort = {
+                                "done_fraction": round(done_fraction, 3),
+                                "projected_bytes": int(projected),
+                                "target_bytes": int(guard_target_bytes),
+                                "elapsed_s": round(pass_elapsed, 2),
+                                # Wall time the doomed pass would still have needed.
+                                "time_saved_s": round(pass_elapsed * (1.0 - done_fraction) / done_fraction, 2),
+                            }
+                            _publish(task_id, {
+                                "type": "early_abort",
+                                "done_fraction": pending_overshoot_abort["done_fraction"],
+                                "projected_mb": round(projected / (1024 * 1024), 2),
+                                "target_mb": round(progress_target_mb, 2),
+                                "time_saved_s": pending_overshoot_abort["time_saved_s"],
+                            })
+                            _publish(task_id, {"type": "log", "message": (
+                                f"⚠️ Projected size {projected / (1024 * 1024):.2f} MB is over the "
+                                f"{progress_target_mb:.2f} MB target at {done_fraction * 100:.0f}% — "
+                                "stopping this pass early to restart with a corrected bitrate"
+                            )})
+                            _force_stop_ffmpeg(proc_i)
+                            break
                     
                     # Log non-progress keys for debugging
                     if key not in ("out_time_ms", "total_size", "bitrate", "speed"):
@@ -1526,17 +2279,482 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         finally:
             stderr_lines.extend(local_stderr)
 
+    # Segment-parallel mode (CPU encoders only): the plan is computed once,
+    # on the first command that actually uses a software encoder, so a
+    # runtime hardware -> CPU fallback can use it as well.
+    use_segments = segment_parallel_enabled(segment_parallel) and duration > 0
+    segment_plan: list[tuple[float, float]] | None = None
+    # Segments behind the current output, kept for size repair.
+    segment_output: dict | None = None
+
+    def segment_plan_for(command: list[str]) -> list[tuple[float, float]]:
+        nonlocal segment_plan
+        if not use_segments or output_video_encoder(command) not in SEGMENT_ENCODERS:
+            return []
+        if segment_plan is None:
+            range_start = float(trim_start_seconds or 0.0)
+            range_end = range_start + float(duration)
+            gate_limit = _encode_gate().current_limit()
+            count = segment_count(gate_limit, duration)
+            keyframes: list[float] = []
+            if count > 1:
+                keyframes = source_keyframes(range_start, range_end)
+            segment_plan = plan_segments(range_start, range_end, count, keyframes)
+            logger.info(
+                "segment plan task_id=%s gate_limit=%s requested=%s planned=%s keyframes=%s",
+                task_id, gate_limit, count, len(segment_plan), len(keyframes),
+            )
+        return segment_plan
+
+    def run_segmented(command: list[str], plan: list[tuple[float, float]]) -> tuple[int, bool]:
+        """Encode ``plan`` concurrently, then concat into ``command``'s output."""
+        nonlocal last_progress, segment_output
+        encoder = output_video_encoder(command)
+        scratch = _task_scratch_dir("8mblocal-segments-")
+        retained = False
+        segment_paths = [os.path.join(scratch, f"segment_{i:03d}.mp4") for i in range(len(plan))]
+        threads = encoder_threads(encoder, len(plan))
+        commands = [
+            segment_command(command, start, end - start, path, threads=threads)
+            for (start, end), path in zip(plan, segment_paths)
+        ]
+        _publish(task_id, {"type": "log", "message": (
+            f"Segment-parallel encode: {len(plan)} keyframe-aligned segments with {encoder}"
+        )})
+        started = time.time()
+        last_emit = [0.0, 0.0]
+
+        def on_progress(done_s: float, _finished: int) -> None:
+            nonlocal last_progress
+            if duration <= 0:
+                return
+            scaled = min(max(done_s / duration, 0.0), 1.0) * encoding_portion * 0.99
+            now = time.time()
+            if scaled - last_emit[0] < 0.005 and now - last_emit[1] < 2.0:
+                return
+            last_emit[0], last_emit[1] = scaled, now
+            last_progress = max(last_progress, scaled)
+            prog = round(last_progress * 100, 2)
+            _publish(task_id, {"type": "progress", "progress": prog, "phase": "encoding"})
+            try:
+                _update_task_state("PROGRESS", {"progress": prog, "phase": "encoding"})
+            except Exception:
+                pass
+
+        try:
+            rc_s, cancelled_s, tail = run_parallel(
+                commands,
+                env=get_gpu_env(),
+                cancelled=lambda: _is_cancelled(task_id),
+                stop=_force_stop_ffmpeg,
+                on_progress=on_progress,
+            )
+            stderr_lines.extend(tail)
+            if cancelled_s or rc_s != 0:
+                return rc_s or 1, cancelled_s
+            sizes = [wait_for_file(path) for path in segment_paths]
+            if any(size is None for size in sizes):
+                stderr_lines.append("segment encode produced an empty segment")
+                return 1, False
+            list_path = os.path.join(scratch, "segments.txt")
+            with open(list_path, "w", encoding="utf-8") as handle:
+                handle.write(concat_list_text(segment_paths))
+            joined = concat_command(command, list_path, plan[0][0], plan[-1][1] - plan[0][0])
+            rc_s, cancelled_s, tail = run_parallel(
+                [joined],
+                env=get_gpu_env(),
+                cancelled=lambda: _is_cancelled(task_id),
+                stop=_force_stop_ffmpeg,
+            )
+            stderr_lines.extend(tail)
+            optimizations["segment_parallel"] = {
+                "encoder": encoder,
+                "segments": len(plan),
+                "gate_limit": _encode_gate().current_limit(),
+                "threads_per_segment": threads,
+                "wall_s": round(time.time() - started, 2),
+                "segment_bytes": [int(size or 0) for size in sizes],
+                "boundaries_s": [round(start, 3) for start, _ in plan[1:]],
+            }
+            if rc_s == 0 and not cancelled_s and getattr(_TASK_SCRATCH, "dirs", None) is not None:
+                segment_output = {
+                    "command": list(command),
+                    "plan": list(plan),
+                    "paths": list(segment_paths),
+                    "sizes": [int(size or 0) for size in sizes],
+                    "encoder": encoder,
+                    "scratch": scratch,
+                }
+                retained = True
+            return rc_s, cancelled_s
+        finally:
+            if not retained:
+                shutil.rmtree(scratch, ignore_errors=True)
+
+    def plan_segment_repair(current_bytes: int, target_bytes: float) -> dict[int, float]:
+        """Pick the highest bits-per-second segments to bring the output under target."""
+        if segment_output is None or current_bytes <= 0 or target_bytes <= 0:
+            return {}
+        durations = [end - start for start, end in segment_output["plan"]]
+        # Aim 1% under target; the joined file also carries audio and mux
+        # bytes that segment repair does not change.
+        excess = current_bytes - target_bytes * 0.99
+        return plan_rate_repair(segment_output["sizes"], durations, excess)
+
+    def run_segment_repair(repair: dict[int, float], target_path: str, audio_source: str | None) -> tuple[int, bool]:
+        """Re-encode only the segments in ``repair`` and re-join into ``target_path``."""
+        nonlocal segment_output
+        state = segment_output
+        assert state is not None
+        started = time.time()
+        command = state["command"]
+        base_kbps = command_video_kbps(command)
+        threads = encoder_threads(state["encoder"], len(repair))
+        new_paths = list(state["paths"])
+        commands = []
+        for index, target in sorted(repair.items()):
+            start, end = state["plan"][index]
+            if base_kbps:
+                kbps = max(48, int(base_kbps * target / max(state["sizes"][index], 1) * 0.97))
+            else:
+                # Constant-quality segments: request the target rate directly.
+                kbps = max(48, int(target * 8.0 / 1000.0 / max(end - start, 1e-3) * 0.97))
+            new_paths[index] = os.path.join(state["scratch"], f"segment_{index:03d}_repair.mp4")
+            commands.append(segment_command(
+                abr_command(command, state["encoder"], kbps), start, end - start, new_paths[index], threads=threads,
+            ))
+        repaired_s = sum(state["plan"][i][1] - state["plan"][i][0] for i in repair)
+        _publish(task_id, {"type": "log", "message": (
+            f"Segment repair: re-encoding {len(repair)}/{len(state['plan'])} segments "
+            f"({repaired_s:.0f}s of {duration:.0f}s) with the highest bitrate"
+        )})
+        rc_r, cancelled_r, tail = run_parallel(
+            commands,
+            env=get_gpu_env(),
+            cancelled=lambda: _is_cancelled(task_id),
+            stop=_force_stop_ffmpeg,
+        )
+        stderr_lines.extend(tail)
+        if cancelled_r or rc_r != 0:
+            return rc_r or 1, cancelled_r
+        new_sizes = list(state["sizes"])
+        for index in repair:
+            size = wait_for_file(new_paths[index])
+            if size is None:
+                stderr_lines.append("segment repair produced an empty segment")
+                return 1, False
+            new_sizes[index] = size
+        list_path = os.path.join(state["scratch"], "segments_repair.txt")
+        with open(list_path, "w", encoding="utf-8") as handle:
+            handle.write(concat_list_text(new_paths))
+        plan = state["plan"]
+        joined = concat_command(
+            [*command[:-1], target_path], list_path, plan[0][0], plan[-1][1] - plan[0][0],
+            audio_source=audio_source,
+        )
+        rc_r, cancelled_r, tail = run_parallel(
+            [joined],
+            env=get_gpu_env(),
+            cancelled=lambda: _is_cancelled(task_id),
+            stop=_force_stop_ffmpeg,
+        )
+        stderr_lines.extend(tail)
+        if rc_r == 0 and not cancelled_r:
+            optimizations["segment_repair"] = {
+                "segments": sorted(repair),
+                "segment_count": len(plan),
+                "repaired_s": round(repaired_s, 2),
+                "bytes_before": [state["sizes"][i] for i in sorted(repair)],
+                "bytes_after": [new_sizes[i] for i in sorted(repair)],
+                "wall_s": round(time.time() - started, 2),
+            }
+            segment_output = {**state, "paths": new_paths, "sizes": new_sizes}
+        return rc_r, cancelled_r
+
+    def restart_after_overshoot(command: list[str], abort: dict) -> tuple[int, bool]:
+        """Re-run ``command`` with the video bitrate scaled to the projection."""
+        nonlocal video_kbps, maxrate, bufsize, last_progress
+        audio_bytes = effective_audio_kbps * 1000.0 / 8.0 * duration
+        video_budget = max(abort["target_bytes"] - audio_bytes, 1.0)
+        projected_video = max(abort["projected_bytes"] - audio_bytes, 1.0)
+        previous_kbps = int(video_kbps)
+        if command_video_kbps(command):
+            corrected_kbps = max(48, int(float(video_kbps) * video_budget / projected_video * 0.97))
+        else:
+            # A constant-quality pass has no rate to scale; switch to ABR at
+            # the rate the remaining budget allows.
+            corrected_kbps = max(48, int(video_budget * 8.0 / 1000.0 / duration * 0.97))
+        video_kbps = float(corrected_kbps)
+        maxrate = int(video_kbps * 1.2)
+        bufsize = int(video_kbps * 2)
+        optimizations["early_abort"] = {
+            **abort,
+            "previous_video_kbps": previous_kbps,
+            "corrected_video_kbps": corrected_kbps,
+        }
+        _publish_telemetry()
+        _publish(task_id, {"type": "log", "message": (
+            f"Restarting encode: video bitrate {previous_kbps} → {corrected_kbps} kbps "
+            f"(~{abort['time_saved_s']:.0f}s of a doomed pass skipped)"
+        )})
+        last_progress = 0.0
+        _publish(task_id, {"type": "progress", "progress": 1.0, "phase": "encoding"})
+        try:
+            _update_task_state("PROGRESS", {"progress": 1.0, "phase": "encoding"})
+        except Exception:
+            pass
+        _check_cancelled(task_id, "early_abort_restart")
+        return run_ffmpeg_and_stream(
+            abr_command(command, output_video_encoder(command) or actual_encoder, corrected_kbps)
+        )
+
+    # Two-pass ABR (x264/x265 single-process encodes). Pass-1 statistics are
+    # keyed by source content and video options, so retries and later jobs
+    # on the same source at another size only run pass 2.
+    use_two_pass = two_pass_enabled(two_pass) and duration > 0
+    two_pass_source: str | None = None
+
+    def two_pass_applies(command: list[str]) -> bool:
+        return (
+            use_two_pass
+            and output_video_encoder(command) in TWO_PASS_ENCODERS
+            and bool(command_video_kbps(command))
+        )
+
+    def run_two_pass(command: list[str], allow_cached: bool = True) -> tuple[int, bool]:
+        """Encode ``command`` in two passes, reusing stored pass-1 statistics."""
+        nonlocal two_pass_source
+        encoder = output_video_encoder(command) or actual_encoder
+        if two_pass_source is None:
+            two_pass_source = source_fingerprint(input_path) or uuid.uuid4().hex
+        key = stats_key(command, two_pass_source)
+        record = optimizations.setdefault("two_pass", {"encoder": encoder, "first_passes": 0, "stats_reused": 0})
+        started = time.time()
+        stats = cached_stats(key) if allow_cached else None
+        if stats is None:
+            scratch = _task_scratch_dir("8mblocal-two-pass-")
+            scratch_prefix = os.path.join(scratch, STATS_NAME)
+            _publish(task_id, {"type": "log", "message": f"Two-pass encode: analysis pass 1/2 with {encoder}"})
+            rc_p, cancelled_p = run_ffmpeg_and_stream(
+                first_pass_command(command, encoder, scratch_prefix),
+                window={"start": 0.0, "span": FIRST_PASS_WEIGHT, "started_at": started},
+            )
+            if cancelled_p or rc_p != 0:
+                return rc_p or 1, cancelled_p
+            record["first_passes"] += 1
+            record["first_pass_s"] = round(time.time() - started, 2)
+            stats = store_stats(key, scratch_prefix) or scratch_prefix
+            window = {"start": FIRST_PASS_WEIGHT, "span": 1.0 - FIRST_PASS_WEIGHT, "started_at": started}
+            _publish(task_id, {"type": "log", "message": "Two-pass encode: pass 2/2"})
+        else:
+            record["stats_reused"] += 1
+            window = {"start": 0.0, "span": 1.0, "started_at": started}
+            _publish(task_id, {"type": "log", "message": (
+                "Two-pass encode: reusing pass-1 statistics for this source (pass 2 only)"
+            )})
+        second_started = time.time()
+        rc_p, cancelled_p = run_ffmpeg_and_stream(second_pass_command(command, encoder, stats), window=window)
+        if rc_p != 0 and not cancelled_p and window["span"] == 1.0:
+            # Stored statistics the encoder rejects are discarded and
+            # rebuilt once rather than failing the job.
+            _publish(task_id, {"type": "log", "message": "Stored pass-1 statistics were rejected; re-running pass 1"})
+            discard_stats(key)
+            stderr_lines.clear()
+            return run_two_pass(command, allow_cached=False)
+        record["second_pass_s"] = round(time.time() - second_started, 2)
+        _publish_telemetry()
+        return rc_p, cancelled_p
+
+    # How the last run_encode call ran; only "single" measures throughput.
+    encode_run_mode = "single"
+
+    def run_encode(command: list[str], size_guard: bool = True) -> tuple[int, bool]:
+        """Run one encode attempt, segment-parallel when the plan allows."""
+        nonlocal pending_overshoot_abort, segment_output, encode_run_mode
+        segment_output = None
+        plan = segment_plan_for(command)
+        if len(plan) < 2 and two_pass_applies(command):
+            encode_run_mode = "two_pass"
+            return run_two_pass(command)
+        if len(plan) < 2:
+            encode_run_mode = "single"
+            guard = size_guard and early_abort_allowed and "early_abort" not in optimizations
+            rc_e, cancelled_e = run_ffmpeg_and_stream(command, size_guard=guard)
+            abort, pending_overshoot_abort = pending_overshoot_abort, None
+            if abort is not None and not cancelled_e:
+                stderr_lines.clear()
+                encode_run_mode = "restarted"
+                return restart_after_overshoot(command, abort)
+            return rc_e, cancelled_e
+        encode_run_mode = "segments"
+        rc_e, cancelled_e = run_segmented(command, plan)
+        if rc_e != 0 and not cancelled_e:
+            _publish(task_id, {"type": "log", "message": (
+                f"Segment-parallel encode failed (rc={rc_e}); retrying as a single FFmpeg pass"
+            )})
+            optimizations.pop("segment_parallel", None)
+            encode_run_mode = "segments_fallback"
+            return run_ffmpeg_and_stream(command)
+        return rc_e, cancelled_e
+
+    # Sample-based calibration (size-target mode). ``calibration_mode`` is
+    # "crf" when the main pass runs in constant quality and "abr" when only
+    # its bitrate was corrected; later rate changes switch back to ABR.
+    calibration_mode: str | None = None
+
+    def run_calibration(command: list[str]) -> list[str]:
+        """Encode short samples of ``command`` and return the calibrated command."""
+        nonlocal video_kbps, maxrate, bufsize, calibration_mode
+        encoder = output_video_encoder(command)
+        if not encoder:
+            return command
+        target_kbps = float(video_kbps)
+        candidates: list[tuple[str, float]] = [("abr", float(int(video_kbps)))]
+        if encoder in QUALITY_MODES:
+            candidates += [("crf", value) for value in QUALITY_MODES[encoder][1]]
+        windows = sample_windows(float(trim_start_seconds or 0.0), float(duration), len(candidates))
+        if not windows:
+            return command
+        started = time.time()
+        scratch = _task_scratch_dir("8mblocal-calibration-")
+        parallel = encoder in SEGMENT_ENCODERS
+        threads = encoder_threads(encoder, len(candidates) * len(windows)) if parallel else None
+        samples: list[tuple[tuple[str, float], float, str, list[str]]] = []
+        for mode, value in candidates:
+            if mode == "abr":
+                base = abr_command(command, encoder, int(value))
+            else:
+                base = quality_command(command, encoder, value, None)
+            for index, (start, length) in enumerate(windows):
+                path = os.path.join(scratch, f"{mode}_{value:g}_{index}.mp4")
+                samples.append(((mode, value), length, path, segment_command(base, start, length, path, threads=threads)))
+        _publish(task_id, {"type": "log", "message": (
+            f"Calibrating: {len(windows)} × {windows[0][1]:.1f}s samples at {len(candidates)} settings with {encoder}"
+        )})
+        try:
+            commands = [sample[3] for sample in samples]
+            # CPU encoders share the host like segment-parallel does; hardware
+            # encoders run one sample at a time to stay inside session limits.
+            for batch in ([commands] if parallel else [[c] for c in commands]):
+                rc_c, cancelled_c, tail = run_parallel(
+                    batch,
+                    env=get_gpu_env(),
+                    cancelled=lambda: _is_cancelled(task_id),
+                    stop=_force_stop_ffmpeg,
+                )
+                if cancelled_c:
+                    remove_cancelled_output()
+                    raise JobCancellationRequested("Job canceled during calibration")
+                if rc_c != 0:
+                    logger.info("calibration samples failed task_id=%s rc=%s tail=%s", task_id, rc_c, tail[-3:])
+                    _publish(task_id, {"type": "log", "message": "Calibration samples failed; encoding without calibration"})
+                    return command
+            measured: dict[tuple[str, float], float | None] = {}
+            for candidate in candidates:
+                chosen = [sample for sample in samples if sample[0] == candidate]
+                measured[candidate] = sample_kbps(
+                    [wait_for_file(sample[2]) for sample in chosen],
+                    [sample[1] for sample in chosen],
+                )
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        abr_measured = measured.get(candidates[0])
+        points = [(value, kbps) for (mode, value), kbps in measured.items() if mode == "crf" and kbps]
+        quality = fit_quality(encoder, points, target_kbps * QUALITY_TARGET_MARGIN)
+        record: dict = {
+            "encoder": encoder,
+            "samples": len(windows),
+            "encoded_s": round(sum(length for _, length in windows) * len(candidates), 2),
+            "cost_s": round(time.time() - started, 2),
+            "target_video_kbps": round(target_kbps, 1),
+            "abr_measured_kbps": round(abr_measured, 1) if abr_measured else None,
+            "points": [[value, round(kbps, 1)] for value, kbps in points],
+        }
+        record["cost_fraction"] = round(record["encoded_s"] / max(float(duration), 1e-6), 4)
+        if quality is not None:
+            calibration_mode = "crf"
+            prediction = predicted_kbps(points, quality)
+            calibrated = quality_command(command, encoder, quality, target_kbps * QUALITY_MAXRATE_FACTOR)
+            record.update({"mode": "crf", "option": QUALITY_MODES[encoder][0], "value": quality})
+            _publish(task_id, {"type": "log", "message": (
+                f"Calibration: {QUALITY_MODES[encoder][0]} {quality:g} predicted at "
+                f"~{prediction:.0f} kbps (target {target_kbps:.0f} kbps)"
+            )})
+        else:
+            calibration_mode = "abr"
+            scale = abr_correction(target_kbps, abr_measured)
+            previous_kbps = int(video_kbps)
+            video_kbps = float(max(48, int(target_kbps * scale)))
+            maxrate = int(video_kbps * 1.2)
+            bufsize = int(video_kbps * 2)
+            prediction = abr_measured * video_kbps / previous_kbps if abr_measured else None
+            calibrated = abr_command(command, encoder, int(video_kbps))
+            record.update({"mode": "abr", "value": int(video_kbps), "scale": round(scale, 4)})
+            _publish(task_id, {"type": "log", "message": (
+                f"Calibration: video bitrate {previous_kbps} → {int(video_kbps)} kbps "
+                f"(samples landed at {abr_measured or 0:.0f} kbps)"
+            )})
+        record["predicted_video_kbps"] = round(prediction, 1) if prediction else None
+        optimizations["calibration"] = record
+        _publish_telemetry()
+        logger.info("calibration task_id=%s %s", task_id, record)
+        return calibrated
+
     # Start process and optionally fall back to CPU on failure
     last_progress = 0.0
     stderr_lines: list[str] = []
     _check_cancelled(task_id, "preparing")
-    rc, was_cancelled = run_ffmpeg_and_stream(cmd)
+    if (
+        calibration_enabled(calibrate)
+        and not bitrate_mode
+        and not audio_only
+        and duration > 0
+        and preset_val != "extraquality"
+        and not two_pass_applies(cmd)
+    ):
+        cmd = run_calibration(cmd)
+        if calibration_mode is not None:
+            _publish(self.request.id, {"type": "log", "message": f"FFmpeg command: {' '.join(cmd)}"})
+    main_encode_started = time.time()
+    rc, was_cancelled = run_encode(cmd)
+    main_encode_wall = max(time.time() - main_encode_started, 0.0)
+    main_encode_mode = encode_run_mode
+    main_encode_ok = rc == 0 and not was_cancelled
+    main_encode_encoder = output_video_encoder(cmd) or actual_encoder
+    if main_encode_ok and decoder_info.get("hardware_used"):
+        try:
+            decode_failures.forget(
+                decoder_generation, decode_signature, capability_key(str(decoder_info.get("name")), info),
+            )
+        except Exception as exc:
+            logger.debug("decode failure store update failed for %s: %s", task_id[:8], exc)
     last_successful_cmd: list[str] | None = cmd.copy() if rc == 0 and not was_cancelled else None
 
     if was_cancelled:
         remove_cancelled_output()
         raise JobCancellationRequested("Job canceled during encoding")
 
+    # The reserved moov estimate was too small for this output: the muxer
+    # refuses to finish, so encode again with the +faststart rewrite.
+    if rc != 0 and "-moov_size" in cmd and ffmpeg_rejected_moov_reservation(stderr_lines):
+        _publish(self.request.id, {"type": "log", "message": (
+            "MP4: reserved index space was too small; re-encoding with faststart"
+        )})
+        mp4_flags = ["-movflags", "+faststart"]
+        encoding_portion = 0.90
+        finalize_portion = max(0.0, 1.0 - encoding_portion)
+        optimizations.setdefault("reserved_moov", {})["fallback"] = True
+        cmd = faststart_instead_of_reserved_moov(cmd)
+        _check_cancelled(task_id, "moov_retry")
+        stderr_lines = []
+        last_progress = 0.0
+        rc, was_cancelled = run_encode(cmd)
+        last_successful_cmd = cmd.copy() if rc == 0 and not was_cancelled else None
+        if was_cancelled:
+            remove_cancelled_output()
+            raise JobCancellationRequested("Job canceled during encoding")
+
     # Defense in depth for a future FFmpeg/driver-specific metadata rejection.
     # Never retry indefinitely and never classify this optional-flag failure as
     # proof that the selected hardware encoder is unavailable.
@@ -1555,7 +2773,7 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         _check_cancelled(task_id, "metadata_retry")
         stderr_lines = []
         last_progress = 0.0
-        rc, was_cancelled = run_ffmpeg_and_stream(metadata_retry_cmd)
+        rc, was_cancelled = run_encode(metadata_retry_cmd)
         if rc == 0 and not was_cancelled:
             last_successful_cmd = metadata_retry_cmd.copy()
         if was_cancelled:
@@ -1600,6 +2818,7 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         and (qsv_decode_retry or nvenc_decode_retry)
     ):
         _publish(self.request.id, {"type": "log", "message": "⚠️ Hardware decode failed. Retrying with software decoder..."})
+        failed_decoder = decoder_info.get("name") if decoder_info.get("hardware_used") else None
         sw_input_opts = strip_decode_options(input_opts)
         if in_codec == "av1":
             sw_input_opts += ["-c:v", "libdav1d"]
@@ -1638,11 +2857,9 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
             *abr_rate_control_args(actual_encoder),
             *preset_flags, *tune_flags,
             *active_color_metadata_args,
+            *frame_timing_args,
         ]
-        if chosen_audio_codec is None:
-            retry_cmd += ["-an"]
-        else:
-            retry_cmd += ["-c:a", chosen_audio_codec, "-b:a", a_bitrate_str]
+        retry_cmd += audio_output_args
         retry_cmd += [*mp4_video_tag_args(output_path, actual_encoder), *mp4_flags, "-progress", "pipe:2", output_path]
         _publish(self.request.id, {"type": "log", "message": f"FFmpeg retry: {' '.join(retry_cmd)}"})
         stderr_lines = []
@@ -1651,6 +2868,14 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         rc, was_cancelled = run_ffmpeg_and_stream(retry_cmd)
         if rc == 0 and not was_cancelled:
             last_successful_cmd = retry_cmd.copy()
+            # Software decode finished what the hardware decoder could not.
+            if failed_decoder:
+                try:
+                    decode_failures.record_failure(
+                        decoder_generation, decode_signature, capability_key(failed_decoder, info), main_encode_wall,
+                    )
+                except Exception as exc:
+                    logger.debug("decode failure store update failed for %s: %s", task_id[:8], exc)
         if was_cancelled:
             remove_cancelled_output()
             raise JobCancellationRequested("Job canceled during decode retry")
@@ -1684,6 +2909,20 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         )
         _publish(self.request.id, {"type": "log", "message": f"Encoder: CPU ({fb_encoder})"})
         actual_encoder = fb_encoder
+        # Same throughput budget as a startup fallback. Non p-level presets
+        # keep the historical defaults below (medium / -cpu-used 4).
+        fb_preset, fallback_record = choose_fallback_preset(
+            failed_encoder, fb_encoder, preset_val, size_model_height,
+            fallback_preset_mode(fallback_preset),
+        )
+        optimizations["fallback_preset"] = {"stage": fallback_stage, **fallback_record}
+        # The output is now the CPU encode at this preset; the overshoot,
+        # throughput and history records below must file it there.
+        preset_val = fb_preset
+        if fb_preset in throughput_model.PRESETS:
+            _publish(task_id, {"type": "log", "message": (
+                f"CPU fallback preset: {fb_preset.upper()} ({fallback_record['reason']})"
+            )})
         encoder_telemetry.update({
             "actual_encoder": actual_encoder,
             "hardware_used": False,
@@ -1722,25 +2961,23 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
             cmd2 += ["-vf", ",".join(cpu_vf)]
         cmd2 += abr_rate_control_args(fb_encoder)
         cmd2 += active_color_metadata_args
+        cmd2 += frame_timing_args
         if fb_encoder == "libx264":
-            cmd2 += ["-preset","medium","-tune","film"]
+            cmd2 += ["-preset",CPU_PRESET_MAP.get(fb_preset, "medium"),"-tune","film"]
         elif fb_encoder == "libx265":
-            cmd2 += ["-preset","medium"]
+            cmd2 += ["-preset",CPU_PRESET_MAP.get(fb_preset, "medium")]
         elif fb_encoder == SVT_AV1:
             cmd2 += [
-                "-preset", svt_preset_map.get(preset_val, "8"),
+                "-preset", SVT_AV1_PRESET_MAP.get(fb_preset, "8"),
                 *_svtav1_params(),
             ]
         elif fb_encoder == "libaom-av1":
-            cmd2 += ["-cpu-used","4"]
-        if chosen_audio_codec is None:
-            cmd2 += ["-an"]
-        else:
-            cmd2 += ["-c:a", chosen_audio_codec, "-b:a", a_bitrate_str]
+            cmd2 += ["-cpu-used",AOM_CPU_USED_MAP.get(fb_preset, "4")]
+        cmd2 += audio_output_args
         cmd2 += [*mp4_video_tag_args(output_path, fb_encoder), *mp4_flags, "-progress", "pipe:2", output_path]
 
         _check_cancelled(task_id, "runtime_fallback")
-        rc, was_cancelled = run_ffmpeg_and_stream(cmd2)
+        rc, was_cancelled = run_encode(cmd2)
         if rc == 0 and not was_cancelled:
             last_successful_cmd = cmd2.copy()
 
@@ -1810,6 +3047,35 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
     # Track retry attempt (stored in task metadata)
     retry_attempt = self.request.retries or 0
     max_retries = 2  # Maximum 2 retry attempts
+    # First-pass measurement for the learned overshoot model.
+    first_pass_bytes = final_size
+    first_pass_encoder = actual_encoder
+    size_retry_attempted = False
+    # Video rate the first pass produced (FFmpeg's ``k`` is 1000 bits),
+    # without the audio and mux overhead that are not rate-control error.
+    first_pass_video_kbps = 0.0
+    if first_pass_bytes > 0 and duration > 0 and not audio_only:
+        audio_bytes = effective_audio_kbps * 1000.0 / 8.0 * duration
+        overhead_bytes = container_overhead_kbps(
+            Path(output_path).suffix, duration, info.get("video_fps"), bool(chosen_audio_codec),
+        ) * 1024.0 / 8.0 * duration
+        if reserved_moov_bytes(last_successful_cmd or cmd):
+            # The unused part of a reserved moov is padding, and the requested
+            # video rate already gave it up.
+            padding_kbps = float((optimizations.get("reserved_moov") or {}).get("padding_kbps") or 0.0)
+            overhead_bytes += padding_kbps * 1024.0 / 8.0 * duration
+        first_pass_video_kbps = (first_pass_bytes - audio_bytes - overhead_bytes) * 8.0 / 1000.0 / duration
+    if calibration_mode and first_pass_video_kbps > 0:
+        calibration_record = optimizations.get("calibration") or {}
+        calibration_record["actual_video_kbps"] = round(first_pass_video_kbps, 1)
+        if calibration_record.get("predicted_video_kbps"):
+            calibration_record["prediction_error"] = round(
+                first_pass_video_kbps / calibration_record["predicted_video_kbps"] - 1.0, 4,
+            )
+    # A constant-quality first pass has no requested rate; scale what it produced.
+    retry_rate_kbps = float(video_kbps)
+    if not command_video_kbps(last_successful_cmd or cmd) and first_pass_video_kbps > 0:
+        retry_rate_kbps = first_pass_video_kbps
     
     if (not bitrate_mode) and size_overage_percent > 2.0 and final_size_mb > progress_target_mb and retry_attempt < max_retries:
         # Re-scale video bitrate from measured output size vs target (works for
@@ -1817,10 +3083,10 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         # so e.g. +144% overage only halved bitrate — often still over target,
         # forcing another full encode (2× wall time) and frustrating UX.
         size_ratio = progress_target_mb / max(final_size_mb, 1e-6)
-        adjusted_video_kbps = int(float(video_kbps) * size_ratio * 0.94)
+        adjusted_video_kbps = int(retry_rate_kbps * size_ratio * 0.94)
         adjusted_video_kbps = max(48, adjusted_video_kbps)
 
-        if adjusted_video_kbps >= int(video_kbps * 0.985):
+        if adjusted_video_kbps >= int(retry_rate_kbps * 0.985):
             _publish(self.request.id, {"type": "log", "message": (
                 f"⚠️ File is {size_overage_percent:.1f}% over target — margin too small for a reliable re-encode; "
                 f"keeping {final_size_mb:.2f} MB output."
@@ -1832,8 +3098,8 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
             _publish(self.request.id, {"type": "retry", "message": f"File too large ({final_size_mb:.2f} MB), re-encoding with optimized bitrate (attempt {retry_attempt + 1}/{max_retries})", "overage_percent": round(size_overage_percent, 1)})
 
             _publish(self.request.id, {"type": "log", "message": (
-                f"Adjusted video bitrate: {int(video_kbps)} → {adjusted_video_kbps} kbps "
-                f"(size ratio {size_ratio:.3f}×, −{100 * (1 - adjusted_video_kbps / max(video_kbps, 1e-9)):.1f}%)"
+                f"Adjusted video bitrate: {int(retry_rate_kbps)} → {adjusted_video_kbps} kbps "
+                f"(size ratio {size_ratio:.3f}×, −{100 * (1 - adjusted_video_kbps / max(retry_rate_kbps, 1e-9)):.1f}%)"
             )})
             
             # Keep a reversible backup while the retry runs.  If FFmpeg or a
@@ -1866,17 +3132,42 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
             # command; rebuilding from the stale initial command silently
             # reintroduced the failed hardware path on oversized outputs.
             retry_base = last_successful_cmd or cmd
-            retry_cmd = replace_bitrate_args(retry_base, adjusted_video_kbps)
+            retry_cmd = abr_command(retry_base, output_video_encoder(retry_base) or actual_encoder, adjusted_video_kbps)
             if retry_staging_path:
                 retry_cmd[-1] = retry_staging_path
+            # The first pass already holds finished audio; mux it rather than
+            # encoding the same audio again. Segment-parallel retries take
+            # their audio from the source in the concat step instead.
+            first_pass_audio = retry_backup_path or (output_path if retry_staging_path else None)
+            if (
+                chosen_audio_codec
+                and info.get("has_audio")
+                and first_pass_audio
+                and retry_cmd.count("-i") == 1
+                and len(segment_plan_for(retry_cmd)) < 2
+            ):
+                retry_cmd = reuse_audio_from(retry_cmd, first_pass_audio)
+                optimizations["audio_reuse_on_retry"] = True
+                _publish(self.request.id, {"type": "log", "message": "Retry reuses the first-pass audio track (no audio re-encode)"})
             
             _publish(self.request.id, {"type": "log", "message": f"Retry FFmpeg command: {' '.join(retry_cmd[:10])}..."})
             
-            # Run the retry encode
+            # Run the retry encode. A segment-parallel output is repaired by
+            # re-encoding only its highest-bitrate segments; anything else
+            # (or an excess the segments cannot absorb) runs a full pass.
+            size_retry_attempted = True
             last_progress = 0.0
             stderr_lines = []
             _check_cancelled(task_id, "retrying")
-            rc, was_cancelled = run_ffmpeg_and_stream(retry_cmd)
+            segment_repair = plan_segment_repair(final_size, progress_target_mb * 1024 * 1024)
+            if segment_repair:
+                rc, was_cancelled = run_segment_repair(
+                    segment_repair,
+                    retry_staging_path or output_path,
+                    first_pass_audio if chosen_audio_codec and info.get("has_audio") else None,
+                )
+            else:
+                rc, was_cancelled = run_encode(retry_cmd, size_guard=False)
             
             if was_cancelled:
                 if retry_staging_path and os.path.exists(retry_staging_path):
@@ -1954,7 +3245,63 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
     elif size_overage_percent > 2.0 and retry_attempt >= max_retries:
         _publish(self.request.id, {"type": "log", "message": f"⚠️ File is {size_overage_percent:.1f}% over target after {max_retries} retries. Keeping best result."})
         _publish(self.request.id, {"type": "log", "message": f"📊 Final size: {final_size_mb:.2f} MB (target was {progress_target_mb:.2f} MB)"})
-    
+
+    # Calibrated passes are not blind encoder behaviour and would pull the
+    # model towards 1.0; only uncalibrated first passes are recorded. Two-pass
+    # rate control overshoots very differently from single-pass ABR, and
+    # shares its key, so it is left out as well.
+    if (
+        size_model_active
+        and calibration_mode is None
+        and main_encode_mode != "two_pass"
+        and first_pass_bytes > 0
+        and video_kbps > 0
+    ):
+        # Compare the first pass with the rate it requested. An early-abort
+        # restart re-encodes too, so it counts as a retry.
+        size_retried = size_retry_attempted or "early_abort" in optimizations
+        try:
+            measured_ratio = first_pass_video_kbps / int(video_kbps)
+            overshoot_model.record_result(
+                first_pass_encoder, preset_val, size_model_height, duration, measured_ratio,
+                compensated=abs(size_model_factor - 1.0) > 1e-3,
+                retried=size_retried,
+            )
+            optimizations.setdefault("overshoot_model", {})["measured_ratio"] = round(measured_ratio, 4)
+            optimizations["overshoot_model"]["retried"] = size_retried
+        except Exception as exc:
+            logger.debug("overshoot model update failed for %s: %s", task_id[:8], exc)
+
+    # Throughput of the first main encode, when it ran once as planned: a
+    # restarted, retried or failed attempt does not measure the preset.
+    if (
+        main_encode_ok
+        and not audio_only
+        and duration > 0
+        and preset_val in throughput_model.PRESETS
+        and "early_abort" not in optimizations
+        and main_encode_encoder == actual_encoder
+    ):
+        try:
+            throughput_model.record_throughput(
+                main_encode_encoder, preset_val, size_model_height, duration, main_encode_wall,
+                run_mode=main_encode_mode,
+            )
+        except Exception as exc:
+            logger.debug("throughput model update failed for %s: %s", task_id[:8], exc)
+    if "deadline" in optimizations:
+        deadline_record = optimizations["deadline"]
+        elapsed = max(time.time() - task_started, 0.0)
+        deadline_record.update({
+            "actual_s": round(main_encode_wall, 1),
+            "elapsed_s": round(elapsed, 1),
+            "met": elapsed <= deadline_record["deadline_s"],
+        })
+        try:
+            throughput_model.record_deadline(deadline_record["met"])
+        except Exception as exc:
+            logger.debug("deadline counter update failed for %s: %s", task_id[:8], exc)
+
     encoder_telemetry.update({
         "actual_encoder": actual_encoder,
         "hardware_used": _is_hardware_encoder(actual_encoder),
@@ -1984,6 +3331,7 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
         "target_size_mb": target_size_mb,
         "final_size_mb": final_size_mb,
         "target_video_bitrate_kbps": int(video_kbps) if bitrate_mode else None,
+        "optimizations": dict(optimizations) if optimizations else None,
     }
     
     # Advance progress before final save - 3/4 through finalization
@@ -2061,3 +3409,286 @@ def compress_video(self, job_id: str, input_path: str, output_path: str, target_
     )
     _publish(self.request.id, {"type": "done", "stats": stats})
     return stats
+
+
+@celery_app.task(name="worker.worker.compress_video_multi", bind=True)
+@_cleanup_transient_input_after_task
+def compress_video_multi(self, job_id: str, input_path: str, outputs: list, audio_codec: str,
+                         audio_bitrate_kbps: int, preset: str, tune: str = "hq",
+                         max_width: int | None = None, max_height: int | None = None,
+                         start_time: str | None = None, end_time: str | None = None,
+                         max_output_fps: float | None = None,
+                         transient_input: bool = False):
+    """Encode several size targets from one decode of ``input_path``.
+
+    ``outputs`` holds ``task_id``, ``output_path``, ``target_size_mb``,
+    ``video_codec`` and ``target_resolution`` per target.  The first entry is
+    this task; the others are reported under their own task ids so every
+    output keeps its own status, download URL and history row.  A cancel of
+    any output stops the shared encode.
+    """
+    task_id = self.request.id
+    start_ts = time.time()
+    task_ids = [str(output["task_id"]) for output in outputs]
+    logger.info(
+        "compress_video_multi START task_id=%s job_id=%s targets=%s preset=%s audio=%s@%skbps "
+        "max_wh=%s/%s fps_cap=%s input=%s",
+        task_id, job_id,
+        [(o.get("target_size_mb"), o.get("video_codec"), o.get("target_resolution")) for o in outputs],
+        preset, audio_codec, audio_bitrate_kbps, max_width, max_height, max_output_fps, input_path,
+    )
+
+    def publish_all(event: dict) -> None:
+        for output_task_id in task_ids:
+            _publish(output_task_id, dict(event))
+
+    def set_state(output_task_id: str, state: str, meta: dict) -> None:
+        try:
+            self.update_state(task_id=output_task_id, state=state, meta=meta)
+        except Exception:
+            pass
+
+    def any_cancelled() -> bool:
+        return any(_is_cancelled(output_task_id) for output_task_id in task_ids)
+
+    def check_cancelled(phase: str) -> None:
+        for output_task_id in task_ids:
+            _check_cancelled(output_task_id, phase)
+
+    def remove_outputs(paths: list[str]) -> None:
+        for path in paths:
+            try:
+                Path(path).unlink(missing_ok=True)
+            except OSError:
+                logger.warning("Could not remove partial multi-target output: %s", path)
+
+    output_paths = [str(output["output_path"]) for output in outputs]
+    try:
+        publish_all({"type": "progress", "progress": 0.0, "phase": "probing"})
+        check_cancelled("probing_input")
+        hw_info = get_hw_info()
+        available_cpu_encoders = set(hw_info.get("available_cpu_encoders") or []) or None
+        info = ffprobe_info(input_path)
+        duration = info.get("duration", 0.0)
+        if start_time or end_time:
+            try:
+                duration = effective_trim_duration(duration, start_time, end_time)
+            except Exception as exc:
+                raise RuntimeError(f"Invalid trim range: {exc}") from exc
+        if duration <= 0:
+            raise RuntimeError("Multi-target encoding needs a known source duration")
+
+        # Trim on the input side: output-side -t/-to would only apply to the
+        # first of several outputs.
+        input_opts: list[str] = []
+        if start_time:
+            input_opts += ["-ss", str(start_time)]
+        if start_time or end_time:
+            input_opts += ["-t", f"{duration:.3f}"]
+
+        shared_filters: list[str] = []
+        source_fps = info.get("video_fps")
+        if max_output_fps and source_fps and float(source_fps) > float(max_output_fps) + 0.01:
+            shared_filters.append(f"fps=fps={float(max_output_fps)}")
+        if max_width and max_height:
+            shared_filters.append(
+                f"scale='min(iw,{max_width})':'min(ih,{max_height})':force_original_aspect_ratio=decrease"
+            )
+        elif max_width:
+            shared_filters.append(f"scale='min(iw,{max_width})':-2")
+        elif max_height:
+            shared_filters.append(f"scale=-2:'min(ih,{max_height})'")
+
+        has_audio = bool(info.get("has_audio"))
+        plans: list[dict] = []
+        for output in outputs:
+            output_path = str(output["output_path"])
+            encoder, v_flags, init_hw_flags = map_codec_to_hw(output["video_codec"], hw_info)
+            fallback_reason = None
+            if encoder not in SHARED_GRAPH_ENCODERS or init_hw_flags:
+                fallback_reason = f"{encoder} cannot encode from a shared software-decoded graph"
+                encoder, v_flags = _cpu_fallback_for(encoder, available_cpu_encoders)
+            chosen_audio = None if audio_codec == "none" or not has_audio else audio_codec
+            if chosen_audio == "libopus" and output_path.lower().endswith(".mp4"):
+                chosen_audio = "aac"
+            audio_kbps = int(audio_bitrate_kbps) if chosen_audio else 0
+            _total_kbps, video_kbps = calc_bitrates(
+                float(output["target_size_mb"]), duration, audio_kbps,
+                container=Path(output_path).suffix, fps=source_fps,
+            )
+            plans.append({
+                "task_id": str(output["task_id"]),
+                "output_path": output_path,
+                "target_size_mb": float(output["target_size_mb"]),
+                "requested_encoder": output["video_codec"],
+                "encoder": encoder,
+                "v_flags": [*v_flags, *(_svtav1_params() if encoder == SVT_AV1 else [])],
+                "video_kbps": video_kbps,
+                "audio_codec": chosen_audio,
+                "audio_bitrate_kbps": audio_kbps,
+                "height": output.get("target_resolution"),
+                "fallback_reason": fallback_reason,
+                "retried": False,
+            })
+
+        last_emit = [0.0]
+
+        def on_progress(done_s: float, _finished: int) -> None:
+            now = time.time()
+            if now - last_emit[0] < 1.0:
+                return
+            last_emit[0] = now
+            pct = round(min(max(done_s / duration, 0.0), 1.0) * 95.0, 2)
+            publish_all({"type": "progress", "progress": pct, "phase": "encoding"})
+            for output_task_id in task_ids:
+                set_state(output_task_id, "PROGRESS", {"progress": pct, "phase": "encoding"})
+
+        def encode(command: list[str], progress=None) -> int:
+            logger.info("compress_video_multi cmd: %s", " ".join(shlex.quote(part) for part in command))
+            rc, cancelled, tail = run_parallel(
+                [command], env=get_gpu_env(), cancelled=any_cancelled,
+                stop=_force_stop_ffmpeg, on_progress=progress,
+            )
+            if cancelled:
+                raise JobCancellationRequested("Job canceled during encoding")
+            if rc != 0:
+                logger.warning("compress_video_multi ffmpeg rc=%s tail=%s", rc, tail[-5:])
+            return rc
+
+        publish_all({"type": "log", "message": (
+            f"Multi-target: one decode for {len(plans)} outputs ("
+            + ", ".join(f"{p['target_size_mb']:g} MB {p['encoder']}" for p in plans) + ")"
+        )})
+        for plan in plans:
+            if plan["fallback_reason"]:
+                _publish(plan["task_id"], {"type": "log", "message": f"{plan['fallback_reason']}; using {plan['encoder']}"})
+        command_options = dict(preset=preset, tune=tune, input_opts=input_opts, shared_filters=shared_filters)
+        rc = encode(multi_output_command(input_path, plans, **command_options), on_progress)
+        if rc != 0 and any(_is_hardware_encoder(plan["encoder"]) for plan in plans):
+            publish_all({"type": "log", "message": f"Shared encode failed (rc={rc}); retrying hardware outputs on CPU"})
+            for plan in plans:
+                if _is_hardware_encoder(plan["encoder"]):
+                    plan["fallback_reason"] = f"{plan['encoder']} failed in the shared encode (rc={rc})"
+                    plan["encoder"], plan["v_flags"] = _cpu_fallback_for(plan["encoder"], available_cpu_encoders)
+                    if plan["encoder"] == SVT_AV1:
+                        plan["v_flags"] = [*plan["v_flags"], *_svtav1_params()]
+            rc = encode(multi_output_command(input_path, plans, **command_options), on_progress)
+        if rc != 0:
+            raise RuntimeError(f"Multi-target encode failed with return code {rc}")
+
+        # Size check per output; an oversized output is re-encoded on its own.
+        for plan in plans:
+            size = wait_for_file(plan["output_path"]) or 0
+            if not oversized(size, plan["target_size_mb"]):
+                continue
+            retry_kbps = retry_video_kbps(plan["video_kbps"], size, plan["target_size_mb"])
+            _publish(plan["task_id"], {"type": "log", "message": (
+                f"Output is {size / (1024 * 1024):.2f} MB (target {plan['target_size_mb']:g} MB); "
+                f"re-encoding this output alone at {int(retry_kbps)} kbps"
+            )})
+            suffix = Path(plan["output_path"]).suffix
+            staging = f"{plan['output_path']}.retry.{uuid.uuid4().hex}{suffix}"
+            retry_plan = {**plan, "video_kbps": retry_kbps, "output_path": staging}
+            try:
+                rc = encode(multi_output_command(input_path, [retry_plan], **command_options))
+                staged_size = os.path.getsize(staging) if rc == 0 and os.path.exists(staging) else 0
+                if 0 < staged_size < size:
+                    os.replace(staging, plan["output_path"])
+                    plan["video_kbps"] = retry_kbps
+                    plan["retried"] = True
+            finally:
+                remove_outputs([staging])
+
+        publish_all({"type": "progress", "progress": 98.0, "phase": "finalizing"})
+    except JobCancellationRequested as exc:
+        remove_outputs(output_paths)
+        for output_task_id in task_ids[1:]:
+            _publish(output_task_id, {"type": "canceled", "message": str(exc) or "Job canceled by user"})
+            set_state(output_task_id, "CANCELED", {"state": "canceled", "phase": "canceled", "detail": str(exc)})
+        raise
+    except Exception as exc:
+        remove_outputs(output_paths)
+        for output_task_id in task_ids[1:]:
+            _publish(output_task_id, {"type": "error", "message": str(exc)})
+            try:
+                self.backend.mark_as_failure(output_task_id, exc)
+            except Exception:
+                pass
+        raise
+
+    try:
+        original_size_mb = os.path.getsize(input_path) / (1024 * 1024)
+    except OSError:
+        original_size_mb = 0.0
+    results = []
+    for plan in plans:
+        encoder = plan["encoder"]
+        final_size_mb = round(os.path.getsize(plan["output_path"]) / (1024 * 1024), 2)
+        stats = {
+            "input_path": input_path,
+            "output_path": plan["output_path"],
+            "encoder": encoder,
+            "requested_encoder": plan["requested_encoder"],
+            "resolved_encoder": encoder,
+            "actual_encoder": encoder,
+            "hardware_used": _is_hardware_encoder(encoder),
+            "fallback_occurred": plan["fallback_reason"] is not None,
+            "fallback_stage": "multi_target" if plan["fallback_reason"] else "none",
+            "fallback_reason": plan["fallback_reason"],
+            "render_device": hw_info.get("device"),
+            "hardware_device": hw_info.get("device"),
+            "hardware_type": hw_info.get("type"),
+            "decoder": {"name": "software", "hardware_used": False, "hardware_type": None, "device": None},
+            "duration_s": duration,
+            "target_size_mb": plan["target_size_mb"],
+            "final_size_mb": final_size_mb,
+            "target_video_bitrate_kbps": None,
+            "optimizations": {"multi_target": {
+                "group": task_id,
+                "outputs": len(plans),
+                "video_kbps": int(plan["video_kbps"]),
+                "retried": plan["retried"],
+            }},
+        }
+        try:
+            if os.getenv("HISTORY_ENABLED", "true").lower() in ("true", "1", "yes"):
+                import importlib
+
+                app_root = os.getenv("BACKEND_APP_ROOT", "/app")
+                sys.path.insert(0, app_root)
+                try:
+                    history = importlib.import_module("backend.history_manager")
+                except ModuleNotFoundError:
+                    history = importlib.import_module("app.history_manager")
+                history.add_history_entry(
+                    filename=_history_filename(job_id, input_path),
+                    original_size_mb=original_size_mb,
+                    compressed_size_mb=final_size_mb,
+                    video_codec=encoder,
+                    audio_codec=plan["audio_codec"] or "none",
+                    target_mb=plan["target_size_mb"],
+                    preset=preset.lower(),
+                    duration=max(time.time() - start_ts, 0),
+                    task_id=plan["task_id"],
+                    container=Path(plan["output_path"]).suffix.lstrip(".").lower(),
+                    tune=(tune or "hq").lower(),
+                    audio_bitrate_kbps=int(audio_bitrate_kbps),
+                    max_width=max_width,
+                    max_height=plan["height"] or max_height,
+                    start_time=start_time,
+                    end_time=end_time,
+                    encoder=encoder,
+                    output_filename=Path(plan["output_path"]).name,
+                )
+        except Exception as exc:
+            _publish(plan["task_id"], {"type": "log", "message": f"Failed to save history: {exc}"})
+        _publish(plan["task_id"], {"type": "progress", "progress": 100.0, "phase": "done"})
+        set_state(plan["task_id"], "SUCCESS", {"output_path": plan["output_path"], "progress": 100.0, "detail": "done", **stats})
+        _publish(plan["task_id"], {"type": "done", "stats": stats})
+        results.append(stats)
+    logger.info(
+        "compress_video_multi DONE task_id=%s outputs=%s elapsed=%.1fs",
+        task_id, [(s["final_size_mb"], s["target_size_mb"]) for s in results],
+        max(time.time() - start_ts, 0),
+    )
+    return results[0]
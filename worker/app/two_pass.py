@@ -0,0 +1,205 @@
+"""Two-pass ABR for the x264/x265 software encoders with reusable statistics.
+
+Single-pass ABR with VBV has to guess how bits should be spread over content
+it has not seen yet, which is why CPU encodes are the ones most likely to
+miss the size target and trigger the retry.  In two-pass mode a first pass
+analyses the whole range and writes a statistics file; the second pass then
+places the requested bitrate with knowledge of the entire clip.
+
+Pass 1 uses the encoder's fast first-pass settings (FFmpeg's libx264
+``fastfirstpass``, x265 ``slow-firstpass=0``), which keep the frame-type
+decisions the second pass depends on while skipping the expensive analysis.
+Its statistics depend on the source and the video options but not on the
+bitrate, so they are stored under a key derived from the source content and
+those options.  Size retries and later jobs on the same source at another
+target only run pass 2.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Sequence
+
+from .constants import LIBX264, LIBX265
+from .ffmpeg_helpers import remove_option_pairs
+
+TWO_PASS_ENCODERS: frozenset[str] = frozenset({LIBX264, LIBX265})
+# Share of the progress bar given to pass 1.  Fast first-pass settings make
+# it roughly half as expensive as the real encode.
+FIRST_PASS_WEIGHT = 0.35
+STATS_NAME = "pass"
+STATS_MAX_ENTRIES = 24
+STATS_MAX_AGE_S = 24 * 3600.0
+# Bytes read from each end of the source for the content fingerprint.
+FINGERPRINT_BYTES = 1 << 20
+
+# Options that do not change what pass 1 analyses.
+_KEY_IGNORED_PAIRS = frozenset({
+    "-b:v", "-maxrate", "-bufsize", "-c:a", "-b:a", "-map", "-map_metadata",
+    "-movflags", "-progress", "-tag:v", "-threads", "-moov_size",
+    "-pass", "-passlogfile",
+})
+_KEY_IGNORED_SINGLES = frozenset({"-y", "-hide_banner", "-an"})
+_FIRST_PASS_DROPPED_PAIRS = frozenset({
+    "-c:a", "-b:a", "-map", "-map_metadata", "-movflags", "-tag:v", "-moov_size",
+})
+
+
+def two_pass_enabled(requested: bool | None) -> bool:
+    """Resolve the per-request flag, defaulting to ``TWO_PASS``."""
+    if requested is not None:
+        return bool(requested)
+    return os.getenv("TWO_PASS", "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def stats_root() -> Path:
+    override = os.getenv("TWO_PASS_STATS_DIR", "").strip()
+    if override:
+        return Path(override)
+    return Path(tempfile.gettempdir()) / "8mblocal-two-pass"
+
+
+def source_fingerprint(path: str, *, sample_bytes: int = FINGERPRINT_BYTES) -> Optional[str]:
+    """Hash the size plus the first and last ``sample_bytes`` of ``path``.
+
+    Content-based rather than path/mtime-based so a re-upload of the same
+    file finds the statistics of the earlier job.
+    """
+    try:
+        size = os.path.getsize(path)
+        digest = hashlib.sha1(str(size).encode("ascii"))
+        with open(path, "rb") as handle:
+            digest.update(handle.read(sample_bytes))
+            if size > sample_bytes:
+                handle.seek(max(size - sample_bytes, sample_bytes))
+                digest.update(handle.read(sample_bytes))
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def _primary_input_only(command: Sequence[str]) -> list[str]:
+    """Drop inputs after the first one (e.g. first-pass audio on retries)."""
+    first = list(command).index("-i")
+    rest = remove_option_pairs(list(command[first + 2:]), {"-i"})
+    return [*command[:first + 2], *rest]
+
+
+def stats_key(command: Sequence[str], fingerprint: str) -> str:
+    """Key for the pass-1 statistics ``command`` would produce."""
+    command = _primary_input_only(command)
+    first = command.index("-i")
+    options = [*command[1:first], "-i", fingerprint, *command[first + 2:-1]]
+    options = remove_option_pairs(options, _KEY_IGNORED_PAIRS)
+    options = [token for token in options if token not in _KEY_IGNORED_SINGLES]
+    return hashlib.sha1(json.dumps(options).encode("utf-8")).hexdigest()[:32]
+
+
+def _x265_value(path: str) -> str:
+    # ``-x265-params`` is ``key=value:key=value``; Windows drive letters and
+    # backslashes must be escaped.
+    return path.replace("\\", "\\\\").replace(":", "\\:")
+
+
+def _with_x265_params(options: list[str], params: str) -> list[str]:
+    if "-x265-params" in options:
+        index = options.index("-x265-params")
+        return [*options[:index + 1], f"{options[index + 1]}:{params}", *options[index + 2:]]
+    return [*options, "-x265-params", params]
+
+
+def _pass_args(options: list[str], encoder: str, pass_number: int, prefix: str) -> list[str]:
+    if encoder == LIBX265:
+        params = f"pass={pass_number}:stats={_x265_value(prefix + '-0.log')}"
+        if pass_number == 1:
+            params += ":slow-firstpass=0"
+        return _with_x265_params(options, params)
+    return [*options, "-pass", str(pass_number), "-passlogfile", prefix]
+
+
+def first_pass_command(command: Sequence[str], encoder: str, prefix: str) -> list[str]:
+    """Video-only analysis pass writing statistics to ``prefix``."""
+    body = _primary_input_only(command)[:-1]
+    body = remove_option_pairs(body, _FIRST_PASS_DROPPED_PAIRS)
+    body = [token for token in body if token not in {"-an", "-vn"}]
+    return [*_pass_args(body, encoder, 1, prefix), "-an", "-f", "null", "-"]
+
+
+def second_pass_command(command: Sequence[str], encoder: str, prefix: str) -> list[str]:
+    """``command`` reading pass-1 statistics from ``prefix``."""
+    return [*_pass_args(list(command[:-1]), encoder, 2, prefix), command[-1]]
+
+
+def cached_stats(key: str) -> Optional[str]:
+    """Return the stats prefix for ``key`` when a complete entry exists."""
+    entry = stats_root() / key
+    if not (entry / f"{STATS_NAME}-0.log").is_file():
+        return None
+    try:
+        os.utime(entry)
+    except OSError:
+        pass
+    return str(entry / STATS_NAME)
+
+
+def store_stats(key: str, scratch_prefix: str) -> Optional[str]:
+    """Move pass-1 statistics from the job scratch dir into the shared cache.
+
+    Returns the cached prefix, or ``None`` if the cache is unavailable (the
+    caller then keeps using the scratch copy for this job).
+    """
+    root = stats_root()
+    source = Path(scratch_prefix).parent
+    staging = root / f".{key}.{uuid.uuid4().hex}"
+    try:
+        root.mkdir(parents=True, exist_ok=True)
+        staging.mkdir()
+        for item in source.glob(f"{Path(scratch_prefix).name}-*"):
+            shutil.copy2(item, staging / item.name)
+        try:
+            os.replace(staging, root / key)
+        except OSError:
+            # Another job stored the same statistics first.
+            shutil.rmtree(staging, ignore_errors=True)
+        prune_stats(root, keep=key)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        return None
+    return cached_stats(key)
+
+
+def discard_stats(key: str) -> None:
+    shutil.rmtree(stats_root() / key, ignore_errors=True)
+
+
+def prune_stats(
+    root: Path,
+    *,
+    keep: str | None = None,
+    max_entries: int = STATS_MAX_ENTRIES,
+    max_age_s: float = STATS_MAX_AGE_S,
+) -> None:
+    """Drop entries older than ``max_age_s`` and all but the newest ``max_entries``."""
+    try:
+        entries = [entry for entry in root.iterdir() if entry.is_dir() and not entry.name.startswith(".")]
+    except OSError:
+        return
+    now = time.time()
+    dated = []
+    for entry in entries:
+        try:
+            dated.append((entry.stat().st_mtime, entry))
+        except OSError:
+            continue
+    dated.sort(reverse=True)
+    for index, (mtime, entry) in enumerate(dated):
+        if entry.name == keep:
+            continue
+        if index >= max_entries or now - mtime > max_age_s:
+            shutil.rmtree(entry, ignore_errors=True)
@@ -6,6 +6,7 @@ import os
 import subprocess
 from typing import Any, Optional
 
+from shared import container_probe, probe_cache
 from shared.subprocess_utils import hidden_process_kwargs
 
 
@@ -236,33 +237,40 @@ def transpose_filters_for_rotation_degrees(rotation_deg: int) -> list[str]:
     return []
 
 
-def ffprobe_info(input_path: str, allow_audio_only: bool = False) -> dict:
-    """Return media metadata, optionally accepting audio-only inputs.
+def _probe_json(input_path: str) -> tuple[Any, str, Optional[str]]:
+    """Run the tiered probe and cache the result.
 
-    Normal video jobs still reject audio-only media. The explicit flag keeps
-    that validation while allowing the audio extraction path to reuse the
-    same probe and upload contract.
+    Returns ``(data, tier, escalation)``: the header tier answers unless
+    :func:`probe_cache.deep_probe_reason` finds something in doubt; the deep
+    probe then runs (reduced fallback for older ffprobe).
     """
-    # Large probesize helps read moov/trak metadata for rotation on phone MP4/MOV (default probe can miss tags).
-    # Full -show_streams (not selective -show_entries) so side_data_list includes Display Matrix rotation
-    # for HEVC/Android MP4; selective entries have been observed to omit rotation while ffmpeg -i shows it.
-    cmd = [
-        "ffprobe", "-v", "error",
-        "-probesize", "100M",
-        "-analyzeduration", "20M",
-        "-show_format",
-        "-show_streams",
-        "-of", "json",
-        input_path,
-    ]
     try:
         proc = subprocess.run(
-            cmd, capture_output=True, text=True, env=get_gpu_env(), timeout=45,
-            **hidden_process_kwargs(),
+            probe_cache.header_probe_command(input_path), capture_output=True, text=True,
+            env=get_gpu_env(), timeout=45, **hidden_process_kwargs(),
         )
     except subprocess.TimeoutExpired as exc:
         raise RuntimeError("ffprobe timed out while analyzing the input") from exc
-    if proc.returncode != 0:
+    if proc.returncode == 0:
+        try:
+            data = json.loads(proc.stdout)
+        except json.JSONDecodeError:
+            data = None
+        escalation = probe_cache.deep_probe_reason(data)
+        if escalation is None:
+            probe_cache.put(input_path, data, complete=True, tier="header")
+            return data, "header", None
+    else:
+        escalation = "header probe failed"
+    try:
+        proc = subprocess.run(
+            probe_cache.full_probe_command(input_path), capture_output=True, text=True,
+            env=get_gpu_env(), timeout=45, **hidden_process_kwargs(),
+        )
+    except subprocess.TimeoutExpired as exc:
+        raise RuntimeError("ffprobe timed out while analyzing the input") from exc
+    complete = proc.returncode == 0
+    if not complete:
         # Fallback for older ffprobe without side_data_list
         cmd_fb = [
             "ffprobe", "-v", "error",
@@ -279,28 +287,52 @@ def ffprobe_info(input_path: str, allow_audio_only: bool = False) -> dict:
             raise RuntimeError("ffprobe fallback timed out while analyzing the input") from exc
         if proc.returncode != 0:
             raise RuntimeError(proc.stderr)
-        try:
-            data = json.loads(proc.stdout)
-        except json.JSONDecodeError as exc:
-            raise RuntimeError("ffprobe returned invalid JSON") from exc
-        format_tags = ((data.get("format") or {}).get("tags") or {}) if isinstance(data, dict) else {}
-    else:
-        try:
-            data = json.loads(proc.stdout)
-        except json.JSONDecodeError as exc:
-            raise RuntimeError("ffprobe returned invalid JSON") from exc
-        format_tags = ((data.get("format") or {}).get("tags") or {}) if isinstance(data, dict) else {}
+    try:
+        data = json.loads(proc.stdout)
+    except json.JSONDecodeError as exc:
+        raise RuntimeError("ffprobe returned invalid JSON") from exc
+    tier = "deep" if complete else "reduced"
+    if isinstance(data, dict):
+        probe_cache.put(input_path, data, complete=complete, tier=tier)
+    return data, tier, escalation
+
+
+def ffprobe_info(input_path: str, allow_audio_only: bool = False) -> dict:
+    """Return media metadata, optionally accepting audio-only inputs.
+
+    Normal video jobs still reject audio-only media. The explicit flag keeps
+    that validation while allowing the audio extraction path to reuse the
+    same probe and upload contract.
+    """
+    # Common MP4/MOV/MKV headers are read in process. Otherwise the API or an
+    # earlier job usually probed this file already; only a reduced fallback
+    # result lacks fields this worker needs.
+    data = container_probe.probe(input_path)
+    probe = {"tier": "container", "escalation": None, "cached": False}
+    if data is None:
+        cached = probe_cache.get(input_path)
+        if cached is not None and cached.get("complete"):
+            data = cached["data"]
+            probe = {"tier": cached.get("tier") or "deep", "escalation": None, "cached": True}
+        else:
+            data, tier, escalation = _probe_json(input_path)
+            probe = {"tier": tier, "escalation": escalation, "cached": False}
+    format_tags = ((data.get("format") or {}).get("tags") or {}) if isinstance(data, dict) else {}
     if not isinstance(data, dict):
         raise RuntimeError("ffprobe returned an unexpected JSON shape")
     duration = _parse_media_duration((data.get("format") or {}).get("duration"))
     if duration is None:
         raise RuntimeError("Input has no usable media duration")
+    # ffmpeg's input -ss/-t count from this; None when the in-process
+    # container probe answered and did not derive it.
+    start_time = _parse_finite_float((data.get("format") or {}).get("start_time"))
     v_bitrate = None
     a_bitrate = None
     v_codec = None
     v_width = None
     v_height = None
     v_fps: Optional[float] = None
+    v_r_fps: Optional[float] = None
     v_pix_fmt: Optional[str] = None
     v_profile: Optional[str] = None
     v_color_space: Optional[str] = None
@@ -309,6 +341,9 @@ def ffprobe_info(input_path: str, allow_audio_only: bool = False) -> dict:
     v_color_range: Optional[str] = None
     v_bits_per_raw_sample: Optional[int] = None
     display_aspect_ratio: Optional[str] = None
+    a_codec: Optional[str] = None
+    a_streams = 0
+    s_streams = 0
     has_audio = False
     has_video = False
     rotation_degrees = 0
@@ -362,11 +397,17 @@ def ffprobe_info(input_path: str, allow_audio_only: bool = False) -> dict:
                 if isinstance(dar, str) and dar.strip():
                     display_aspect_ratio = _normalize_aspect_ratio(dar)
                 v_fps = parse_fps_fraction(s.get("avg_frame_rate"))
+                v_r_fps = parse_fps_fraction(s.get("r_frame_rate"))
                 if v_fps is None or v_fps <= 0:
-                    v_fps = parse_fps_fraction(s.get("r_frame_rate"))
+                    v_fps = v_r_fps
                 video_seen = True
+        if s.get("codec_type") == "subtitle":
+            s_streams += 1
         if s.get("codec_type") == "audio":
             has_audio = True
+            a_streams += 1
+            if not a_codec:
+                a_codec = s.get("codec_name")
             # Bitrate on audio stream can be missing (VBR); only set when present
             bitrate = _parse_finite_float(s.get("bit_rate"))
             if bitrate is not None and bitrate >= 0:
@@ -384,8 +425,12 @@ def ffprobe_info(input_path: str, allow_audio_only: bool = False) -> dict:
     disp_w, disp_h = coded_to_display_dimensions(v_width, v_height, rotation_degrees)
     return {
         "duration": duration,
+        "start_time": start_time,
         "video_bitrate_kbps": v_bitrate,
         "audio_bitrate_kbps": a_bitrate,
+        "audio_codec": a_codec,
+        "audio_streams": a_streams,
+        "subtitle_streams": s_streams,
         "video_codec": v_codec,
         "video_pix_fmt": v_pix_fmt,
         "video_profile": v_profile,
@@ -401,15 +446,108 @@ def ffprobe_info(input_path: str, allow_audio_only: bool = False) -> dict:
         "display_aspect_ratio": display_aspect_ratio,
         "rotation_degrees": rotation_degrees,
         "video_fps": v_fps,
+        "video_r_fps": v_r_fps,
         "has_audio": has_audio,
         "has_video": has_video,
+        "probe": probe,
     }
 
 
-def calc_bitrates(target_mb: float, duration_s: float, audio_kbps: int) -> tuple[float, float]:
-    """Compute total and video bitrates (kbps) to fit target size given duration and fixed audio bitrate."""
+# Approximate container bytes per sample and per file. MP4 stores a sample
+# size, a composition offset and a share of the time-to-sample table per
+# frame in ``moov``; Matroska pays a SimpleBlock header per frame plus
+# cluster and cue entries. AAC/Opus run at roughly 47-50 packets/s.
+_MUX_OVERHEAD = {
+    "mp4": {"video_frame": 12.0, "audio_frame": 8.0, "per_second": 20.0, "fixed": 8192.0},
+    "mkv": {"video_frame": 12.0, "audio_frame": 12.0, "per_second": 36.0, "fixed": 4096.0},
+}
+_AUDIO_PACKETS_PER_SECOND = 50.0
+
+
+def container_overhead_kbps(
+    container: str | None,
+    duration_s: float,
+    fps: float | None = None,
+    has_audio: bool = True,
+) -> float:
+    """Estimate mux overhead for ``container`` in the same kbps units as ``calc_bitrates``."""
+    model = _MUX_OVERHEAD.get(str(container or "").lower().lstrip("."))
+    if model is None or duration_s <= 0:
+        return 0.0
+    frame_rate = float(fps) if fps and fps > 0 else 30.0
+    bytes_per_second = model["video_frame"] * frame_rate + model["per_second"]
+    if has_audio:
+        bytes_per_second += model["audio_frame"] * _AUDIO_PACKETS_PER_SECOND
+    bytes_per_second += model["fixed"] / duration_s
+    return bytes_per_second * 8.0 / 1024.0
+
+
+# Per-sample ``moov`` upper bounds for a reserved MP4 index. Video pays
+# stsz plus ctts (B-frames rarely form runs) plus worst-case stts and chunk
+# entries; audio pays stsz plus its share of chunk entries. The fixed part
+# covers track headers, edit lists, metadata and a chapter track.
+_MOOV_RESERVE = {"video_frame": 22.0, "audio_frame": 11.0, "fixed": 24576.0}
+# Frame-count headroom for rounding and timestamp jitter.
+_MOOV_FRAME_MARGIN = 1.1
+
+
+def reserved_moov_enabled() -> bool:
+    return os.getenv("RESERVED_MOOV", "1").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def mp4_moov_reserve_bytes(
+    duration_s: float,
+    fps: float | None,
+    *,
+    r_fps: float | None = None,
+    fps_cap: float | None = None,
+    has_audio: bool = True,
+    extra_streams: int = 0,
+) -> Optional[int]:
+    """Bytes to reserve for FFmpeg's ``moov`` box, or ``None`` if unpredictable.
+
+    MP4 output runs at a constant frame rate taken from the source's
+    ``r_frame_rate``, so the frame count follows the higher of the average
+    and real rates (or the cap). Sources whose two rates disagree wildly
+    (screen captures, broken timestamps) and outputs with additional streams
+    are not estimated.
+    """
+    if duration_s <= 0 or not fps or fps <= 0 or extra_streams > 0:
+        return None
+    rate = float(fps)
+    if r_fps and r_fps > 0:
+        if r_fps > 2.0 * rate:
+            return None
+        rate = max(rate, float(r_fps))
+    if fps_cap and fps_cap > 0:
+        rate = min(rate, float(fps_cap))
+    frames = duration_s * rate * _MOOV_FRAME_MARGIN
+    reserve = _MOOV_RESERVE["fixed"] + frames * _MOOV_RESERVE["video_frame"]
+    if has_audio:
+        reserve += duration_s * _AUDIO_PACKETS_PER_SECOND * _MOOV_FRAME_MARGIN * _MOOV_RESERVE["audio_frame"]
+    return int(math.ceil(reserve / 1024.0)) * 1024
+
+
+def calc_bitrates(
+    target_mb: float,
+    duration_s: float,
+    audio_kbps: int,
+    *,
+    container: str | None = None,
+    fps: float | None = None,
+    overshoot_factor: float = 1.0,
+) -> tuple[float, float]:
+    """Compute total and video bitrates (kbps) to fit target size given duration and fixed audio bitrate.
+
+    With ``container`` the estimated mux overhead is reserved out of the
+    video budget. ``overshoot_factor`` comes from the learned overshoot model
+    and scales the remaining video bitrate (below 1.0 for encoders that
+    historically land over target).
+    """
     if duration_s <= 0:
         return 0.0, 0.0
     total_kbps = (target_mb * 8192.0) / duration_s
-    video_kbps = max(total_kbps - float(audio_kbps), 0.0)
+    overhead_kbps = container_overhead_kbps(container, duration_s, fps, has_audio=float(audio_kbps) > 0)
+    video_kbps = max(total_kbps - float(audio_kbps) - overhead_kbps, 0.0)
+    video_kbps *= max(0.0, float(overshoot_factor))
     return total_kbps, video_kbps
@@ -20,6 +20,7 @@ from .startup_tests import run_startup_tests
 from .tasks import (  # noqa: F401
     ENCODER_TEST_CACHE,
     compress_video,
+    compress_video_multi,
     get_hardware_info_task,
     run_hardware_tests_task,
     replace_encoder_test_cache,
@@ -0,0 +1,46 @@
+"""Audio passthrough decisions and first-pass audio reuse on size retries."""
+import unittest
+
+from worker.app.ffmpeg_helpers import audio_passthrough_ok, reuse_audio_from
+
+AAC_SOURCE = {"has_audio": True, "audio_streams": 1, "audio_codec": "aac", "audio_bitrate_kbps": 96.0}
+
+
+class TestAudioPassthrough(unittest.TestCase):
+    def test_matching_codec_within_bitrate_is_copied(self):
+        self.assertTrue(audio_passthrough_ok(AAC_SOURCE, "aac", "out.mp4", 128))
+        self.assertTrue(audio_passthrough_ok(AAC_SOURCE, "aac", "out.mkv", 96))
+
+    def test_higher_bitrate_or_unknown_bitrate_is_reencoded(self):
+        self.assertFalse(audio_passthrough_ok(AAC_SOURCE, "aac", "out.mp4", 64))
+        self.assertFalse(audio_passthrough_ok({**AAC_SOURCE, "audio_bitrate_kbps": None}, "aac", "out.mp4", 128))
+
+    def test_codec_container_and_stream_count_rules(self):
+        opus = {**AAC_SOURCE, "audio_codec": "opus"}
+        self.assertTrue(audio_passthrough_ok(opus, "libopus", "out.mkv", 128))
+        self.assertFalse(audio_passthrough_ok(opus, "aac", "out.mp4", 128))
+        self.assertFalse(audio_passthrough_ok(AAC_SOURCE, "libopus", "out.mkv", 128))
+        self.assertFalse(audio_passthrough_ok({**AAC_SOURCE, "audio_streams": 2}, "aac", "out.mp4", 128))
+        self.assertFalse(audio_passthrough_ok(AAC_SOURCE, None, "out.mp4", 128))
+
+
+class TestReuseAudio(unittest.TestCase):
+    def test_first_pass_audio_is_mapped_and_copied(self):
+        cmd = [
+            "ffmpeg", "-hide_banner", "-y", "-hwaccel", "cuda", "-ss", "5", "-i", "in.mp4",
+            "-t", "60", "-c:v", "h264_nvenc", "-b:v", "900k",
+            "-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart", "-progress", "pipe:2", "out.mp4",
+        ]
+        reused = reuse_audio_from(cmd, "first.bak")
+        self.assertEqual(reused.count("-i"), 2)
+        self.assertEqual(reused[reused.index("in.mp4") + 1:reused.index("in.mp4") + 3], ["-i", "first.bak"])
+        self.assertLess(reused.index("-ss"), reused.index("in.mp4"))
+        self.assertNotIn("-b:a", reused)
+        self.assertEqual(reused[reused.index("-c:a") + 1], "copy")
+        self.assertIn("1:a:0?", reused)
+        self.assertEqual(reused[reused.index("-t") + 1], "60")
+        self.assertEqual(reused[-1], "out.mp4")
+
+
+if __name__ == "__main__":
+    unittest.main()
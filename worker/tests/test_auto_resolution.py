@@ -1,6 +1,6 @@
 import unittest
 
-from worker.app.auto_resolution import choose_auto_resolution
+from worker.app.auto_resolution import choose_auto_frame_rate, choose_auto_resolution
 
 
 class TestAutoResolution(unittest.TestCase):
@@ -33,5 +33,32 @@ class TestAutoResolution(unittest.TestCase):
         mw, mh = choose_auto_resolution(w, h, orig_video_kbps=8000, target_video_kbps=2000, explicit_target_height=720)
         self.assertEqual(mh, 720)
 
+
+class TestAutoFrameRate(unittest.TestCase):
+    def test_starved_60fps_is_halved(self):
+        fps, decision = choose_auto_frame_rate(60.0, 1920, 1080, 2000)
+        self.assertEqual(fps, 30.0)
+        self.assertEqual(decision["fps"], 30.0)
+        self.assertIn("below", decision["reason"])
+
+    def test_pal_rate_and_high_rates(self):
+        self.assertEqual(choose_auto_frame_rate(50.0, 1280, 720, 500)[0], 25.0)
+        # 120 fps: 60 is still starved, so keep dividing until ~30 fps.
+        self.assertEqual(choose_auto_frame_rate(120.0, 1920, 1080, 2000)[0], 30.0)
+        self.assertEqual(choose_auto_frame_rate(120.0, 640, 360, 700)[0], 60.0)
+
+    def test_keeps_rate_with_enough_bits_or_low_fps(self):
+        fps, decision = choose_auto_frame_rate(60.0, 1280, 720, 8000)
+        self.assertIsNone(fps)
+        self.assertEqual(decision["reason"], "enough bits per pixel per frame")
+        self.assertIsNone(choose_auto_frame_rate(30.0, 1920, 1080, 500)[0])
+        self.assertIsNone(choose_auto_frame_rate(None, 1920, 1080, 500)[0])
+
+    def test_complexity_scales_threshold(self):
+        # Starved at the plain threshold, fine for near-static content.
+        self.assertEqual(choose_auto_frame_rate(60.0, 1280, 720, 1800)[0], 30.0)
+        self.assertIsNone(choose_auto_frame_rate(60.0, 1280, 720, 1800, complexity=0.6)[0])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,65 @@
+"""Tests for the size-target bitrate budget (mux overhead, overshoot factor, moov reserve)."""
+import unittest
+
+from worker.app.ffmpeg_helpers import faststart_instead_of_reserved_moov, ffmpeg_rejected_moov_reservation
+from worker.app.utils import calc_bitrates, container_overhead_kbps, mp4_moov_reserve_bytes
+
+
+class TestBitrateBudget(unittest.TestCase):
+    def test_default_call_is_unchanged(self):
+        total, video = calc_bitrates(8.0, 64.0, 128)
+        self.assertAlmostEqual(total, 1024.0)
+        self.assertAlmostEqual(video, 896.0)
+
+    def test_container_overhead_is_reserved_from_video(self):
+        _, plain = calc_bitrates(8.0, 64.0, 128)
+        _, mp4 = calc_bitrates(8.0, 64.0, 128, container=".mp4", fps=30.0)
+        overhead = container_overhead_kbps("mp4", 64.0, 30.0)
+        self.assertGreater(overhead, 0.0)
+        self.assertAlmostEqual(plain - mp4, overhead)
+
+    def test_higher_frame_rate_costs_more_overhead(self):
+        self.assertGreater(
+            container_overhead_kbps("mkv", 60.0, 60.0),
+            container_overhead_kbps("mkv", 60.0, 24.0),
+        )
+        self.assertEqual(container_overhead_kbps("webm-unknown", 60.0, 30.0), 0.0)
+
+    def test_overshoot_factor_scales_video_only(self):
+        total, video = calc_bitrates(8.0, 64.0, 128, overshoot_factor=0.9)
+        self.assertAlmostEqual(total, 1024.0)
+        self.assertAlmostEqual(video, 896.0 * 0.9)
+
+
+class TestReservedMoov(unittest.TestCase):
+    def test_reserve_covers_modeled_index_with_limited_padding(self):
+        reserve = mp4_moov_reserve_bytes(600.0, 30.0, r_fps=30.0)
+        modeled = container_overhead_kbps("mp4", 600.0, 30.0) * 1024.0 / 8.0 * 600.0
+        self.assertGreater(reserve, modeled)
+        self.assertLess(reserve, modeled * 2.5)
+        self.assertEqual(reserve % 1024, 0)
+
+    def test_frame_count_follows_real_rate_and_cap(self):
+        base = mp4_moov_reserve_bytes(600.0, 29.5, has_audio=False)
+        self.assertGreater(mp4_moov_reserve_bytes(600.0, 29.5, r_fps=30.0, has_audio=False), base)
+        capped = mp4_moov_reserve_bytes(600.0, 60.0, r_fps=60.0, fps_cap=30.0, has_audio=False)
+        self.assertEqual(capped, mp4_moov_reserve_bytes(600.0, 30.0, has_audio=False))
+
+    def test_unpredictable_outputs_are_not_estimated(self):
+        self.assertIsNone(mp4_moov_reserve_bytes(600.0, None))
+        self.assertIsNone(mp4_moov_reserve_bytes(600.0, 10.0, r_fps=60.0))
+        self.assertIsNone(mp4_moov_reserve_bytes(600.0, 30.0, extra_streams=1))
+
+    def test_fallback_switches_to_faststart(self):
+        command = ["ffmpeg", "-i", "in.mp4", "-c:v", "libx264", "-moov_size", "65536", "-progress", "pipe:2", "out.mp4"]
+        updated = faststart_instead_of_reserved_moov(command)
+        self.assertNotIn("-moov_size", updated)
+        self.assertEqual(updated[-3:], ["-movflags", "+faststart", "out.mp4"])
+        self.assertTrue(ffmpeg_rejected_moov_reservation([
+            "[mp4 @ 0x55] reserved_moov_size is too small, needed 1234 additional",
+        ]))
+        self.assertFalse(ffmpeg_rejected_moov_reservation(["Conversion failed!"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
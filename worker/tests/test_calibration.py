@@ -0,0 +1,108 @@
+"""Sample-based rate calibration: sample windows, model fit, and commands."""
+from __future__ import annotations
+
+import math
+import unittest
+from unittest.mock import patch
+
+from worker.app.calibration import (
+    CALIBRATION_BUDGET,
+    abr_command,
+    abr_correction,
+    calibration_enabled,
+    fit_quality,
+    predicted_kbps,
+    quality_command,
+    sample_kbps,
+    sample_windows,
+)
+
+X264_COMMAND = [
+    "ffmpeg", "-hide_banner", "-y", "-i", "in.mp4",
+    "-c:v", "libx264", "-b:v", "1000k", "-maxrate", "1200k", "-bufsize", "2000k",
+    "-preset", "medium", "-c:a", "aac", "-b:a", "128k",
+    "-progress", "pipe:2", "out.mp4",
+]
+
+
+class SampleWindowTests(unittest.TestCase):
+    def test_windows_stay_within_budget_and_range(self):
+        windows = sample_windows(10.0, 600.0, 3)
+        self.assertGreaterEqual(len(windows), 2)
+        encoded = sum(length for _, length in windows) * 3
+        self.assertLessEqual(encoded, 600.0 * CALIBRATION_BUDGET + 1e-6)
+        for start, length in windows:
+            self.assertGreaterEqual(start, 10.0)
+            self.assertLessEqual(start + length, 610.0)
+
+    def test_short_jobs_are_not_calibrated(self):
+        self.assertEqual(sample_windows(0.0, 45.0, 3), [])
+        self.assertEqual(sample_windows(0.0, 600.0, 0), [])
+
+    def test_env_default_and_request_override(self):
+        with patch.dict("os.environ", {"CALIBRATION": "1"}):
+            self.assertTrue(calibration_enabled(None))
+            self.assertFalse(calibration_enabled(False))
+        with patch.dict("os.environ", {"CALIBRATION": ""}):
+            self.assertFalse(calibration_enabled(None))
+            self.assertTrue(calibration_enabled(True))
+
+
+class QualityFitTests(unittest.TestCase):
+    def test_fit_lands_on_target_and_rounds_towards_fewer_bits(self):
+        # Bitrate halves every 6 CRF steps: 2000 kbps at 22, 800 at ~29.9.
+        points = [(22.0, 2000.0), (30.0, 2000.0 * 2 ** (-8 / 6))]
+        value = fit_quality("libx264", points, 1000.0)
+        self.assertEqual(value, 28.0)
+        self.assertLessEqual(predicted_kbps(points, value), 1000.0 + 1e-6)
+        self.assertAlmostEqual(predicted_kbps(points, 22.0), 2000.0)
+
+    def test_unusable_probes_fall_back(self):
+        self.assertIsNone(fit_quality("libx264", [(22.0, 900.0), (30.0, 1100.0)], 1000.0))
+        self.assertIsNone(fit_quality("libvpx-vp9", [(22.0, 2000.0), (30.0, 800.0)], 1000.0))
+        # Far outside the probed range, the log-linear model is not trusted.
+        self.assertIsNone(fit_quality("libx264", [(22.0, 2000.0), (30.0, 1000.0)], 5.0))
+
+    def test_sample_rate_and_abr_correction(self):
+        self.assertAlmostEqual(sample_kbps([125000, 125000], [1.0, 1.0]), 1000.0)
+        self.assertIsNone(sample_kbps([125000, None], [1.0, 1.0]))
+        self.assertAlmostEqual(abr_correction(1000.0, 1050.0), 1000.0 / 1050.0)
+        self.assertEqual(abr_correction(1000.0, 5000.0), 0.75)
+        self.assertEqual(abr_correction(1000.0, 100.0), 1.10)
+        self.assertEqual(abr_correction(1000.0, None), 1.0)
+        self.assertTrue(math.isclose(abr_correction(1000.0, 1000.0), 1.0))
+
+
+class CommandTests(unittest.TestCase):
+    def test_quality_command_replaces_rate_control(self):
+        command = quality_command(X264_COMMAND, "libx264", 27.5, 1500.0)
+        self.assertNotIn("1000k", command)
+        self.assertEqual(command[command.index("-crf") + 1], "27.5")
+        self.assertEqual(command[command.index("-maxrate") + 1], "1500k")
+        self.assertEqual(command[command.index("-bufsize") + 1], "3000k")
+        self.assertEqual(command[-1], "out.mp4")
+        self.assertEqual(command[command.index("-b:a") + 1], "128k")
+
+    def test_nvenc_quality_uses_vbr_cq(self):
+        base = [*X264_COMMAND]
+        base[base.index("libx264")] = "h264_nvenc"
+        command = quality_command(base, "h264_nvenc", 30.0, None)
+        self.assertEqual(command[command.index("-rc:v") + 1], "vbr")
+        self.assertEqual(command[command.index("-cq:v") + 1], "30")
+        self.assertEqual(command[command.index("-b:v") + 1], "0")
+        self.assertNotIn("-maxrate", command)
+
+    def test_abr_command_round_trips_quality_mode(self):
+        quality = quality_command(X264_COMMAND, "libx264", 28.0, 1500.0)
+        command = abr_command(quality, "libx264", 900)
+        self.assertNotIn("-crf", command)
+        self.assertEqual(command[command.index("-b:v") + 1], "900k")
+        self.assertEqual(command[command.index("-maxrate") + 1], "1080k")
+        self.assertEqual(command.count("-maxrate"), 1)
+        self.assertEqual(command[-1], "out.mp4")
+        svt = abr_command(quality_command(X264_COMMAND, "libsvtav1", 40.0, None), "libsvtav1", 900)
+        self.assertNotIn("-maxrate", svt)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+"""Content complexity: sampling command, scores, factor and per-upload cache."""
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+
+from worker.app import complexity
+from worker.app.analysis_cache import analysis_path, cached_analysis, remove_analysis
+from worker.app.auto_resolution import choose_auto_resolution
+from worker.app.complexity import (
+    FRAMES_PER_SAMPLE,
+    SAMPLE_HEIGHT,
+    SAMPLE_WIDTH,
+    density_factor,
+    sample_command,
+    sample_times,
+    score_frames,
+)
+
+
+class SamplingTests(unittest.TestCase):
+    def test_one_process_with_a_seek_per_sample(self):
+        times = sample_times(10.0, 120.0, 3)
+        self.assertEqual(times, [40.0, 70.0, 100.0])
+        command = sample_command("in.mp4", times, ["s0.gray", "s1.gray", "s2.gray"])
+        self.assertEqual(command.count("-i"), 3)
+        graph = command[command.index("-filter_complex") + 1]
+        self.assertIn(f"trim=end_frame={FRAMES_PER_SAMPLE}", graph)
+        self.assertNotIn("concat", graph)
+        # One raw output per sample keeps each sample's real frame count.
+        self.assertEqual(command.count("-map"), 3)
+        self.assertEqual(command[command.index("[s2]") + 1:][-1], "s2.gray")
+
+
+@unittest.skipIf(complexity.np is None, "numpy not installed")
+class ScoreTests(unittest.TestCase):
+    def _frames(self, values):
+        size = SAMPLE_WIDTH * SAMPLE_HEIGHT
+        return b"".join(bytes([value]) * size for value in values)
+
+    def test_static_frames_are_all_duplicates(self):
+        scores = score_frames(self._frames([100] * 16))
+        self.assertEqual(scores["temporal"], 0.0)
+        self.assertEqual(scores["duplicate_ratio"], 1.0)
+
+    def test_pairs_across_samples_are_ignored(self):
+        # Two static samples at different brightness: the jump between them is not motion.
+        scores = score_frames(self._frames([10] * 8 + [200] * 8))
+        self.assertEqual(scores["temporal"], 0.0)
+        moving = score_frames(self._frames([(index * 20) % 256 for index in range(16)]))
+        self.assertGreater(moving["temporal"], 10.0)
+
+    def test_short_samples_use_their_own_frame_counts(self):
+        # The first sample hit the end of the source after 3 frames.
+        raw = self._frames([10] * 3 + [200] * 8 + [90] * 8)
+        scores = score_frames(raw, sample_frames=[3, 8, 8])
+        self.assertEqual(scores["temporal"], 0.0)
+        self.assertEqual(scores["duplicate_ratio"], 1.0)
+        # Assuming full samples would count the 10 -> 200 jump as motion.
+        self.assertGreater(score_frames(raw)["temporal"], 0.0)
+
+
+class FactorTests(unittest.TestCase):
+    def test_static_content_lowers_and_motion_raises_thresholds(self):
+        self.assertIsNone(density_factor(None))
+        self.assertEqual(density_factor({"temporal": 0.2, "spatial": 40, "duplicate_ratio": 0.95}), 0.6)
+        self.assertEqual(density_factor({"temporal": 30.0, "spatial": 10, "duplicate_ratio": 0.0}), 1.6)
+
+    def test_factor_moves_the_chosen_rung(self):
+        self.assertEqual(choose_auto_resolution(1920, 1080, 6000, 700), (None, 720))
+        self.assertEqual(choose_auto_resolution(1920, 1080, 6000, 700, complexity=0.6), (None, 1080))
+        self.assertEqual(choose_auto_resolution(1920, 1080, 6000, 1500), (None, 1080))
+        self.assertEqual(choose_auto_resolution(1920, 1080, 6000, 1500, complexity=1.6), (None, 720))
+
+
+class AnalysisCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = os.path.join(self.tmp.name, "in.mp4")
+        with open(self.source, "wb") as handle:
+            handle.write(b"\0" * 16)
+
+    def test_computed_once_per_source(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {"temporal": 1.0}
+
+        self.assertEqual(cached_analysis(self.source, "complexity", compute), ({"temporal": 1.0}, False))
+        self.assertEqual(cached_analysis(self.source, "complexity", compute), ({"temporal": 1.0}, True))
+        with open(self.source, "ab") as handle:
+            handle.write(b"changed")
+        cached_analysis(self.source, "complexity", compute)
+        self.assertEqual(len(calls), 2)
+        remove_analysis(self.source)
+        self.assertFalse(os.path.exists(analysis_path(self.source)))
+
+    def test_failures_and_unpersisted_results_are_not_stored(self):
+        cached_analysis(self.source, "complexity", lambda: None)
+        cached_analysis(self.source, "crop", lambda: {"w": 1}, persist=False)
+        self.assertFalse(os.path.exists(analysis_path(self.source)))
+
+
+if __name__ == "__main__":
+    unittest.main()
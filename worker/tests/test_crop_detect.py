@@ -0,0 +1,51 @@
+"""Crop detection: one sampling process, per-sample parsing and agreement."""
+from __future__ import annotations
+
+import os
+import unittest
+from unittest import mock
+
+from worker.app.crop_detect import agree_crop, auto_crop_enabled, cropdetect_command, parse_cropdetect
+
+STDERR = """\
+[Parsed_cropdetect_0 @ 0x55d0c0] x1:0 x2:1919 y1:142 y2:937 w:1920 h:796 x:0 y:142 pts:1 t:0.04 crop=1920:796:0:142
+[Parsed_cropdetect_1 @ 0x55d0c1] x1:0 x2:1919 y1:140 y2:939 w:1920 h:800 x:0 y:140 pts:1 t:0.04 crop=1920:800:0:140
+[Parsed_cropdetect_0 @ 0x55d0c0] x1:0 x2:1919 y1:140 y2:939 w:1920 h:800 x:0 y:140 pts:2 t:0.08 crop=1920:800:0:140
+[Parsed_cropdetect_2 @ 0x55d0c2] x1:0 x2:1919 y1:138 y2:941 w:1920 h:804 x:0 y:138 pts:1 t:0.04 crop=1920:804:0:138
+"""
+
+
+class CropDetectTests(unittest.TestCase):
+    def test_one_process_one_chain_per_sample(self):
+        command = cropdetect_command("in.mp4", [10.0, 20.0, 30.0])
+        self.assertEqual(command.count("-i"), 3)
+        self.assertEqual(command.count("null"), 3)
+        graph = command[command.index("-filter_complex") + 1]
+        self.assertIn("[2:v:0]cropdetect=limit=24:round=2:reset=0[c2]", graph)
+
+    def test_last_rectangle_per_sample(self):
+        self.assertEqual(parse_cropdetect(STDERR), {
+            0: (1920, 800, 0, 140),
+            1: (1920, 800, 0, 140),
+            2: (1920, 804, 0, 138),
+        })
+
+    def test_stable_samples_merge_to_the_enclosing_rectangle(self):
+        crops = list(parse_cropdetect(STDERR).values())
+        self.assertEqual(agree_crop(crops, 1920, 1080), ((1920, 804, 0, 138), "stable borders"))
+
+    def test_unstable_tiny_or_dark_results_are_rejected(self):
+        self.assertEqual(agree_crop([(1920, 800, 0, 140), (1920, 1080, 0, 0)], 1920, 1080)[1], "samples disagree")
+        self.assertEqual(agree_crop([(1920, 1072, 0, 4), (1920, 1072, 0, 4)], 1920, 1080)[1], "borders too small")
+        self.assertEqual(agree_crop([(200, 100, 800, 500), (1920, 800, 0, 140)], 1920, 1080)[1], "too few usable samples")
+
+    def test_request_flag_overrides_environment(self):
+        with mock.patch.dict(os.environ, {"AUTO_CROP": "1"}):
+            self.assertTrue(auto_crop_enabled(None))
+            self.assertFalse(auto_crop_enabled(False))
+        with mock.patch.dict(os.environ, {"AUTO_CROP": ""}):
+            self.assertFalse(auto_crop_enabled(None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+"""Frame decimation: mode resolution and the auto decision."""
+from __future__ import annotations
+
+import os
+import unittest
+from unittest import mock
+
+from worker.app.decimation import decimation_mode, should_decimate, vfr_output_args
+
+
+class DecimationTests(unittest.TestCase):
+    def test_request_mode_overrides_environment(self):
+        with mock.patch.dict(os.environ, {"FRAME_DECIMATION": "auto"}):
+            self.assertEqual(decimation_mode(None), "auto")
+            self.assertEqual(decimation_mode("off"), "off")
+        with mock.patch.dict(os.environ, {"FRAME_DECIMATION": "bogus"}):
+            self.assertEqual(decimation_mode(None), "off")
+
+    def test_auto_follows_the_repeated_frame_share(self):
+        self.assertEqual(should_decimate("auto", "out.mp4", {"duplicate_ratio": 0.85}), (True, "85% repeated frames"))
+        self.assertFalse(should_decimate("auto", "out.mp4", {"duplicate_ratio": 0.2})[0])
+        self.assertEqual(should_decimate("auto", "out.mkv", None), (False, "no content analysis"))
+
+    def test_on_needs_a_vfr_container(self):
+        self.assertEqual(should_decimate("on", "out.mkv", None), (True, "requested"))
+        self.assertFalse(should_decimate("on", "out.m4a", None)[0])
+        self.assertEqual(vfr_output_args(), ["-fps_mode", "vfr"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""Learned hardware-decode failures: thresholds, skips and hardware changes."""
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from worker.app import decode_failures
+
+HW = {"type": "nvidia", "available_encoders": {"h264": "h264_nvenc"}}
+KEY = "cuda:hevc:main 10:yuv420p10le:4k"
+
+
+class DecodeFailureTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        env = mock.patch.dict(os.environ, {
+            "DECODE_FAILURE_FILE": str(Path(self._tmp.name) / "decode_failures.json"),
+            "DECODE_FAILURE_MEMORY": "1",
+        })
+        env.start()
+        self.addCleanup(env.stop)
+        self.signature = decode_failures.hardware_signature(HW)
+
+    def _fail(self, lost_s, generation="gen-1"):
+        decode_failures.record_failure(generation, self.signature, KEY, lost_s)
+
+    def test_skip_after_repeated_failures_reports_saved_time(self):
+        self._fail(10.0)
+        self.assertIsNone(decode_failures.known_failure("gen-1", self.signature, KEY))
+        self._fail(20.0)
+        entry = decode_failures.known_failure("gen-1", self.signature, KEY)
+        self.assertEqual(entry["failures"], 2)
+        self.assertEqual(decode_failures.record_skip("gen-1", self.signature, KEY), 15.0)
+        entry = decode_failures.known_failure("gen-1", self.signature, KEY)
+        self.assertEqual((entry["skips"], entry["saved_s"]), (1, 15.0))
+
+    def test_restart_keeps_entries_only_on_the_same_hardware(self):
+        self._fail(5.0)
+        self._fail(5.0)
+        # New generation after a restart, same hardware.
+        self.assertIsNotNone(decode_failures.known_failure("gen-2", self.signature, KEY))
+        other = decode_failures.hardware_signature({**HW, "type": "intel"})
+        self.assertNotEqual(other, self.signature)
+        self.assertIsNone(decode_failures.known_failure("gen-3", other, KEY))
+
+    def test_success_and_rerun_forget_failures(self):
+        self._fail(5.0)
+        self._fail(5.0)
+        decode_failures.forget("gen-1", self.signature, KEY)
+        self.assertIsNone(decode_failures.known_failure("gen-1", self.signature, KEY))
+        self._fail(5.0)
+        self._fail(5.0)
+        decode_failures.forget_all()
+        self.assertIsNone(decode_failures.known_failure("gen-1", self.signature, KEY))
+
+    def test_old_failures_expire(self):
+        self._fail(5.0)
+        self._fail(5.0)
+        with mock.patch.object(decode_failures.time, "time", return_value=4102444800.0):
+            self.assertIsNone(decode_failures.known_failure("gen-1", self.signature, KEY))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Decoder capability cache: keys, process/shared layers, and generations."""
+from __future__ import annotations
+
+import subprocess
+import unittest
+
+from worker.app import decoder_cache
+from worker.app.decoder_cache import (
+    NEGATIVE_TTL_S,
+    POSITIVE_TTL_S,
+    cached_capability,
+    capability_key,
+    decoder_listed,
+    resolution_class,
+)
+
+AV1_1080P = {
+    "video_codec": "av1",
+    "video_profile": "Main",
+    "video_pix_fmt": "yuv420p",
+    "width": 1920,
+    "height": 1080,
+}
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def setex(self, key, seconds, value):
+        self.values[key] = value
+        self.ttls[key] = seconds
+        return True
+
+
+class DecoderCacheTests(unittest.TestCase):
+    def setUp(self):
+        decoder_cache.clear()
+        self.addCleanup(decoder_cache.clear)
+
+    def test_key_groups_sources_by_stream_properties(self):
+        other_file = {**AV1_1080P, "width": 1280, "height": 720}
+        self.assertEqual(capability_key("av1_cuvid", AV1_1080P), capability_key("av1_cuvid", other_file))
+        self.assertNotEqual(
+            capability_key("av1_cuvid", AV1_1080P),
+            capability_key("av1_cuvid", {**AV1_1080P, "video_pix_fmt": "yuv420p10le"}),
+        )
+        self.assertEqual(resolution_class(3840, 2160), "4k")
+        self.assertEqual(resolution_class(None, None), "unknown")
+
+    def test_probe_runs_once_across_jobs_and_processes(self):
+        redis = FakeRedis()
+        calls = []
+
+        def probe():
+            calls.append(1)
+            return True
+
+        key = capability_key("av1_cuvid", AV1_1080P)
+        self.assertEqual(cached_capability("gen1", key, probe, redis_factory=lambda: redis), (True, "probe"))
+        self.assertEqual(cached_capability("gen1", key, probe, redis_factory=lambda: redis), (True, "process"))
+        # Another prefork child starts with an empty process cache.
+        decoder_cache.clear()
+        self.assertEqual(cached_capability("gen1", key, probe, redis_factory=lambda: redis), (True, "shared"))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(redis.ttls[f"decoder_cap:gen1:{key}"], POSITIVE_TTL_S)
+
+    def test_new_generation_probes_again_and_negatives_expire_sooner(self):
+        redis = FakeRedis()
+        key = capability_key("av1_cuvid", AV1_1080P)
+        cached_capability("gen1", key, lambda: True, redis_factory=lambda: redis)
+        self.assertEqual(cached_capability("gen2", key, lambda: False, redis_factory=lambda: redis), (False, "probe"))
+        self.assertEqual(redis.ttls[f"decoder_cap:gen2:{key}"], NEGATIVE_TTL_S)
+
+    def test_unavailable_shared_store_still_probes(self):
+        def broken():
+            raise ConnectionError("redis down")
+
+        self.assertEqual(cached_capability("gen1", "k", lambda: True, redis_factory=broken), (True, "probe"))
+
+    def test_decoder_list_is_read_once_per_generation(self):
+        calls = []
+
+        def runner(*args, **kwargs):
+            calls.append(args)
+            return subprocess.CompletedProcess(args, 0, stdout=" V..... av1_cuvid  Nvidia CUVID AV1 decoder\n")
+
+        self.assertTrue(decoder_listed("av1_cuvid", "gen1", runner=runner))
+        self.assertFalse(decoder_listed("hevc_qsv", "gen1", runner=runner))
+        self.assertEqual(len(calls), 1)
+        decoder_listed("av1_cuvid", "gen2", runner=runner)
+        self.assertEqual(len(calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""Tests for the size projection used to abort doomed size-targeted passes."""
+import unittest
+
+from worker.app.ffmpeg_helpers import reserved_moov_bytes
+from worker.app.progress import overshoot_abort_due, project_final_size
+from worker.app.utils import mp4_moov_reserve_bytes
+
+MB = 1024 * 1024
+
+
+class TestSizeProjection(unittest.TestCase):
+    def test_projection_is_linear_in_encoded_time(self):
+        self.assertAlmostEqual(project_final_size(2 * MB, 30.0, 120.0), 8 * MB)
+        self.assertIsNone(project_final_size(0, 30.0, 120.0))
+        self.assertIsNone(project_final_size(MB, 0.0, 120.0))
+
+    def test_no_abort_before_minimum_progress(self):
+        self.assertFalse(overshoot_abort_due(20 * MB, 8 * MB, 0.10))
+
+    def test_small_overshoot_early_is_tolerated(self):
+        # +8% at 25% is inside the early noise margin.
+        self.assertFalse(overshoot_abort_due(8.64 * MB, 8 * MB, 0.25))
+
+    def test_margin_shrinks_as_encode_progresses(self):
+        self.assertTrue(overshoot_abort_due(8.64 * MB, 8 * MB, 0.90))
+        self.assertFalse(overshoot_abort_due(8.1 * MB, 8 * MB, 0.90))
+
+    def test_clear_overshoot_aborts(self):
+        self.assertTrue(overshoot_abort_due(12 * MB, 8 * MB, 0.20))
+        self.assertFalse(overshoot_abort_due(None, 8 * MB, 0.50))
+
+    def test_reserved_moov_is_not_projected_as_video(self):
+        # -moov_size bytes sit in total_size from the first progress line.
+        duration, target = 600.0, 8 * MB
+        reserve = mp4_moov_reserve_bytes(duration, 30.0)
+        self.assertEqual(reserved_moov_bytes(["ffmpeg", "-moov_size", str(reserve), "out.mp4"]), reserve)
+        self.assertEqual(reserved_moov_bytes(["ffmpeg", "-movflags", "+faststart", "out.mp4"]), 0)
+        final = 0.98 * target
+        for done in (0.2, 0.3, 0.5, 0.9):
+            size = int(reserve + (final - reserve) * done)
+            projected = project_final_size(size, done * duration, duration, reserve)
+            with self.subTest(done=done):
+                self.assertAlmostEqual(projected, final, delta=16)
+                self.assertFalse(overshoot_abort_due(projected, target, done))
+        # Scaling the reserve with the video would abort this on-target encode.
+        naive = project_final_size(int(reserve + (final - reserve) * 0.2), 120.0, duration)
+        self.assertTrue(overshoot_abort_due(naive, target, 0.2))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""CPU fallback preset: policy resolution and the throughput budget."""
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from shared import throughput_model
+from worker.app.fallback_preset import choose_fallback_preset, fallback_preset_mode
+
+
+class FallbackPresetTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        env = mock.patch.dict(os.environ, {
+            "THROUGHPUT_MODEL_FILE": str(Path(self._tmp.name) / "throughput.json"),
+            "CPU_FALLBACK_SLOWDOWN": "3",
+        })
+        env.start()
+        self.addCleanup(env.stop)
+
+    def test_request_mode_overrides_environment(self):
+        with mock.patch.dict(os.environ, {"CPU_FALLBACK_PRESET": "keep"}):
+            self.assertEqual(fallback_preset_mode(None), "keep")
+            self.assertEqual(fallback_preset_mode("p2"), "p2")
+        with mock.patch.dict(os.environ, {"CPU_FALLBACK_PRESET": "bogus"}):
+            self.assertEqual(fallback_preset_mode(None), "auto")
+
+    def test_auto_uses_priors_without_history(self):
+        # NVENC p6 at 1080p is expected at 4x real time; x265 cannot reach the
+        # 1.33x budget at any level, x264 can at p5.
+        preset, decision = choose_fallback_preset("hevc_nvenc", "libx265", "p6", 1080, "auto")
+        self.assertEqual(preset, "p1")
+        self.assertIn("fastest", decision["reason"])
+        preset, decision = choose_fallback_preset("h264_nvenc", "libx264", "p6", 1080, "auto")
+        self.assertEqual(preset, "p5")
+        self.assertEqual(decision["cpu_speed_source"], "prior")
+
+    def test_auto_never_picks_a_slower_preset_than_requested(self):
+        with mock.patch.dict(os.environ, {"CPU_FALLBACK_SLOWDOWN": "10"}):
+            preset, _ = choose_fallback_preset("h264_nvenc", "libx264", "p2", 1080, "auto")
+        self.assertEqual(preset, "p2")
+
+    def test_measured_cpu_speed_replaces_the_prior(self):
+        for _ in range(throughput_model.MIN_SAMPLES):
+            throughput_model.record_throughput("libx265", "p4", 1080, 600.0, 300.0)
+        preset, decision = choose_fallback_preset("hevc_nvenc", "libx265", "p6", 1080, "auto")
+        # p4 measured at 2x; p5 extrapolates to 1.5x, still within budget.
+        self.assertEqual(preset, "p5")
+        self.assertEqual(decision["cpu_speed_source"], "extrapolated")
+
+    def test_keep_pin_and_non_level_presets(self):
+        self.assertEqual(choose_fallback_preset("hevc_nvenc", "libx265", "p6", 1080, "keep")[0], "p6")
+        self.assertEqual(choose_fallback_preset("hevc_nvenc", "libx265", "p6", 1080, "p3")[0], "p3")
+        preset, decision = choose_fallback_preset("hevc_nvenc", "libx265", "extraquality", 1080, "auto")
+        self.assertEqual(preset, "extraquality")
+        self.assertEqual(decision["reason"], "not a p1-p7 preset")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,10 +2,13 @@
 from __future__ import annotations
 
 import json
+import os
+import tempfile
 import unittest
 from types import SimpleNamespace
 from unittest.mock import patch
 
+from shared import local_runtime, probe_cache
 from worker.app.utils import ffprobe_info
 
 
@@ -49,6 +52,93 @@ class TestWorkerFfprobeTolerance(unittest.TestCase):
         self.assertFalse(info["has_video"])
         self.assertTrue(info["has_audio"])
 
+    def test_cached_probe_skips_ffprobe_unless_incomplete(self):
+        payload = {
+            "format": {"duration": "3.0", "tags": {}},
+            "streams": [{
+                "codec_type": "video", "codec_name": "hevc", "width": "1920", "height": "1080",
+                "pix_fmt": "yuv420p", "avg_frame_rate": "30/1",
+            }],
+        }
+        result = SimpleNamespace(returncode=0, stdout=json.dumps(payload), stderr="")
+        with tempfile.TemporaryDirectory() as directory, \
+                patch.dict(os.environ, {"LOCAL_RUNTIME": "1", "PROBE_CACHE": "1"}), \
+                patch.object(probe_cache, "_CLIENT", None):
+            local_runtime.reset_for_tests()
+            path = os.path.join(directory, "phone.mp4")
+            with open(path, "wb") as handle:
+                handle.write(b"video")
+            with patch("worker.app.utils.subprocess.run", return_value=result) as run:
+                self.assertEqual(ffprobe_info(path)["probe"]["tier"], "header")
+                cached = ffprobe_info(path)
+            self.assertEqual(cached["width"], 1920)
+            self.assertEqual(cached["probe"], {"tier": "header", "escalation": None, "cached": True})
+            self.assertEqual(run.call_count, 1)
+            # A reduced fallback result (stored by another caller) is probed again.
+            probe_cache.put(path, payload, complete=False)
+            with patch("worker.app.utils.subprocess.run", return_value=result) as run:
+                ffprobe_info(path)
+            self.assertEqual(run.call_count, 1)
+            local_runtime.reset_for_tests()
+
+    def test_header_probe_escalates_only_when_metadata_is_in_doubt(self):
+        def stream(**extra):
+            return {
+                "codec_type": "video", "codec_name": "hevc", "width": 1920, "height": 1080,
+                "pix_fmt": "yuv420p", "avg_frame_rate": "30/1", **extra,
+            }
+
+        phone_tags = {"major_brand": "qt  ", "compatible_brands": "qt  "}
+        header = {"format": {"duration": "3.0", "tags": phone_tags}, "streams": [stream()]}
+        deep = {
+            "format": {"duration": "3.0", "tags": phone_tags},
+            "streams": [stream(side_data_list=[{"side_data_type": "Display Matrix", "rotation": -90}])],
+        }
+        outputs = iter([header, deep])
+
+        def fake_run(cmd, **kwargs):
+            return SimpleNamespace(returncode=0, stdout=json.dumps(next(outputs)), stderr="")
+
+        with patch.dict(os.environ, {"PROBE_CACHE": "0"}), \
+                patch("worker.app.utils.subprocess.run", side_effect=fake_run) as run:
+            info = ffprobe_info("phone.mov")
+        self.assertEqual(run.call_count, 2)
+        self.assertIn("5M", run.call_args_list[0].args[0])
+        self.assertIn("100M", run.call_args_list[1].args[0])
+        self.assertEqual(info["rotation_degrees"], 270)
+        self.assertEqual(info["probe"]["tier"], "deep")
+        self.assertEqual(info["probe"]["escalation"], "phone file without rotation metadata")
+
+        header["format"]["tags"] = {"major_brand": "isom"}
+        result = SimpleNamespace(returncode=0, stdout=json.dumps(header), stderr="")
+        with patch.dict(os.environ, {"PROBE_CACHE": "0"}), \
+                patch("worker.app.utils.subprocess.run", return_value=result) as run:
+            info = ffprobe_info("camera.mp4")
+        self.assertEqual(run.call_count, 1)
+        self.assertEqual(info["probe"]["tier"], "header")
+
+    def test_common_mp4_headers_are_read_without_ffprobe(self):
+        from shared.tests.test_container_probe import h264_sps, matrix, mp4_audio_trak, mp4_file, mp4_video_trak
+
+        with tempfile.TemporaryDirectory() as directory, patch.dict(os.environ, {"FAST_PROBE": "1"}):
+            path = os.path.join(directory, "portrait.mp4")
+            with open(path, "wb") as handle:
+                handle.write(mp4_file(
+                    mp4_video_trak(h264_sps(320, 240), rotation_matrix=matrix(0, 1, -1, 0)),
+                    mp4_audio_trak(),
+                ))
+            with patch("worker.app.utils.subprocess.run") as run:
+                info = ffprobe_info(path)
+            run.assert_not_called()
+
+        self.assertEqual(info["duration"], 2.0)
+        self.assertEqual((info["width"], info["height"]), (320, 240))
+        self.assertEqual(info["rotation_degrees"], 270)
+        self.assertEqual((info["display_width"], info["display_height"]), (240, 320))
+        self.assertEqual(info["video_fps"], 24.0)
+        self.assertEqual(info["audio_codec"], "aac")
+        self.assertEqual(info["probe"]["tier"], "container")
+
 
 if __name__ == "__main__":
     unittest.main()
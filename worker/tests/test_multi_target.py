@@ -0,0 +1,93 @@
+"""Multi-target jobs: one decode, a split graph and per-output options."""
+from __future__ import annotations
+
+import unittest
+
+from worker.app.constants import (
+    AMF_ENCODERS,
+    AV1_NVENC,
+    CPU_ENCODERS,
+    CPU_PRESET_MAP,
+    H264_NVENC,
+    HEVC_NVENC,
+    SVT_AV1_PRESET_MAP,
+)
+from worker.app.multi_target import (
+    SHARED_GRAPH_ENCODERS,
+    multi_output_command,
+    oversized,
+    preset_flags,
+    retry_video_kbps,
+    split_filter_graph,
+)
+
+
+def _output(path: str, encoder: str = "libx264", kbps: float = 1000, height=None, audio="aac") -> dict:
+    return {
+        "encoder": encoder,
+        "v_flags": ["-pix_fmt", "yuv420p"],
+        "video_kbps": kbps,
+        "audio_codec": audio,
+        "audio_bitrate_kbps": 128,
+        "output_path": path,
+        "height": height,
+    }
+
+
+class SplitGraphTests(unittest.TestCase):
+    def test_one_branch_per_output_with_shared_head(self):
+        graph, labels = split_filter_graph([720, None, 480], shared_filters=["fps=fps=30"])
+        self.assertEqual(
+            graph,
+            "[0:v:0]fps=fps=30,split=3[s0][s1][s2];"
+            "[s0]scale=-2:'min(ih,720)'[v0];[s2]scale=-2:'min(ih,480)'[v2]",
+        )
+        self.assertEqual(labels, ["[v0]", "[s1]", "[v2]"])
+
+
+class CommandTests(unittest.TestCase):
+    def test_single_input_and_one_encoder_per_output(self):
+        command = multi_output_command(
+            "in.mp4",
+            [_output("a.mp4", height=720), _output("b.mkv", encoder="h264_nvenc", kbps=4000, audio=None)],
+            preset="p4", tune="hq", input_opts=["-ss", "5", "-t", "10.000"],
+        )
+        self.assertEqual(command.count("-i"), 1)
+        self.assertLess(command.index("-t"), command.index("-i"))
+        self.assertEqual(command.count("-filter_complex"), 1)
+        first, second = command.index("a.mp4"), command.index("b.mkv")
+        first_opts, second_opts = command[:first], command[first + 1:second]
+        self.assertIn("[v0]", first_opts)
+        self.assertIn("+faststart", first_opts)
+        self.assertEqual(second_opts[second_opts.index("-c:v") + 1], "h264_nvenc")
+        self.assertEqual(second_opts[second_opts.index("-b:v") + 1], "4000k")
+        self.assertIn("-an", second_opts)
+        self.assertNotIn("-movflags", second_opts)
+
+    def test_preset_flags_follow_encoder_family(self):
+        self.assertEqual(preset_flags("libx265", "p6", "hq"), ["-preset", "medium"])
+        self.assertEqual(preset_flags("libsvtav1", "extraquality", "hq"), ["-preset", "4"])
+        self.assertEqual(preset_flags("h264_amf", "p4", "hq"), ["-quality", "balanced"])
+        self.assertEqual(preset_flags("av1_amf", "extraquality", "hq"), ["-quality", "quality"])
+        self.assertEqual(preset_flags("h264_qsv", "p4", "hq"), [])
+
+    def test_shared_graph_encoders_are_the_software_frame_families(self):
+        self.assertEqual(SHARED_GRAPH_ENCODERS, CPU_ENCODERS | AMF_ENCODERS | {H264_NVENC, HEVC_NVENC, AV1_NVENC})
+
+    def test_preset_flags_match_the_single_target_maps(self):
+        for preset in ("p1", "p2", "p3", "p4", "p5", "p6", "p7"):
+            with self.subTest(preset=preset):
+                self.assertEqual(preset_flags("libx265", preset, "hq"), ["-preset", CPU_PRESET_MAP[preset]])
+                self.assertEqual(preset_flags("libsvtav1", preset, "hq"), ["-preset", SVT_AV1_PRESET_MAP[preset]])
+
+
+class SizeCheckTests(unittest.TestCase):
+    def test_retry_rate_scales_onto_target(self):
+        mib = 1024 * 1024
+        self.assertFalse(oversized(int(10.1 * mib), 10))
+        self.assertTrue(oversized(11 * mib, 10))
+        self.assertAlmostEqual(retry_video_kbps(1100, 11 * mib, 10), 1000 * 0.97)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""Packet index: folding ffprobe rows, the sidecar format and invalidation."""
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from worker.app import packet_index
+from worker.app.packet_index import (
+    index_from_packets,
+    index_path,
+    load_packet_index,
+    read_packet_index,
+    remove_packet_index,
+    write_packet_index,
+)
+
+ROWS = [
+    "0.000000,-0.066667,5000,48,K_",
+    "0.033333,0.000000,1000,5048,__",
+    "1.500000,1.466667,2000,9000,__",
+    "2.000000,1.966667,6000,12000,K_",
+    "N/A,2.500000,500,20000,__",
+    "garbage",
+]
+
+
+class IndexTests(unittest.TestCase):
+    def test_keyframes_offsets_and_second_buckets(self):
+        index = index_from_packets(ROWS)
+        self.assertEqual(list(index.keyframe_times), [0.0, 2.0])
+        self.assertEqual(list(index.keyframe_offsets), [48, 12000])
+        self.assertEqual(list(index.second_bytes), [6000, 2000, 6500])
+        self.assertEqual(index.keyframes(0.5, 3.0), [2.0])
+        self.assertEqual(index.keyframe_before(1.9), (0.0, 48))
+        self.assertIsNone(index.keyframe_before(-1.0))
+
+    def test_video_bytes_prorates_partial_seconds(self):
+        index = index_from_packets(ROWS)
+        self.assertEqual(index.video_bytes(0.0, 3.0), 14500)
+        self.assertEqual(index.video_bytes(0.5, 1.5), 3000 + 1000)
+
+
+class SidecarTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = os.path.join(self.tmp.name, "in.mp4")
+        with open(self.source, "wb") as handle:
+            handle.write(b"\0" * 64)
+
+    def _built(self, *args, **kwargs):
+        index = index_from_packets(ROWS)
+        st = os.stat(self.source)
+        index.source_size, index.source_mtime_ns = st.st_size, st.st_mtime_ns
+        return index
+
+    def test_round_trip(self):
+        path = index_path(self.source)
+        self.assertTrue(write_packet_index(self._built(), path))
+        loaded = read_packet_index(path)
+        self.assertEqual(list(loaded.keyframe_times), [0.0, 2.0])
+        self.assertEqual(list(loaded.keyframe_offsets), [48, 12000])
+        self.assertEqual(list(loaded.second_bytes), [6000, 2000, 6500])
+        with open(path, "r+b") as handle:
+            handle.write(b"NOTINDEX")
+        self.assertIsNone(read_packet_index(path))
+
+    def test_built_once_then_rebuilt_when_source_changes(self):
+        with mock.patch.object(packet_index, "build_packet_index", side_effect=self._built) as build:
+            load_packet_index(self.source)
+            load_packet_index(self.source)
+            self.assertEqual(build.call_count, 1)
+            with open(self.source, "ab") as handle:
+                handle.write(b"more")
+            load_packet_index(self.source)
+            self.assertEqual(build.call_count, 2)
+        remove_packet_index(self.source)
+        self.assertFalse(os.path.exists(index_path(self.source)))
+
+    def test_lookup_without_build_only_reads_the_sidecar(self):
+        with mock.patch.object(packet_index, "build_packet_index", side_effect=self._built) as build:
+            self.assertIsNone(load_packet_index(self.source, build=False))
+            load_packet_index(self.source)
+            self.assertIsNotNone(load_packet_index(self.source, build=False))
+            self.assertEqual(build.call_count, 1)
+        remove_packet_index(self.source)
+
+    def test_in_memory_index_writes_nothing(self):
+        with mock.patch.object(packet_index, "build_packet_index", side_effect=self._built):
+            self.assertIsNotNone(load_packet_index(self.source, persist=False))
+        self.assertFalse(os.path.exists(index_path(self.source)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+"""Stream-copy fast path eligibility and encode-slot deferral."""
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from worker.app.remux import remux_blockers, remux_candidate, remux_command
+from worker.app.tasks import _acquire_encode_slot, _cleanup_transient_input_after_task
+
+MB = 1024 * 1024
+
+SOURCE = {
+    "video_codec": "h264",
+    "video_pix_fmt": "yuv420p",
+    "audio_codec": "aac",
+    "has_audio": True,
+    "width": 1920,
+    "height": 1080,
+    "video_fps": 30.0,
+    "video_bitrate_kbps": 2500.0,
+    "rotation_degrees": 0,
+}
+
+
+def _blockers(info=None, **overrides):
+    kwargs = {
+        "output_path": "out.mp4",
+        "input_size_bytes": 6 * MB,
+        "target_size_mb": 8.0,
+    }
+    kwargs.update(overrides)
+    return remux_blockers(info or SOURCE, **kwargs)
+
+
+class RemuxEligibilityTests(unittest.TestCase):
+    def test_fitting_compatible_source_is_eligible(self):
+        self.assertEqual(_blockers(), [])
+
+    def test_size_codec_and_filters_block_the_fast_path(self):
+        self.assertIn("source larger than target", _blockers(input_size_bytes=9 * MB))
+        self.assertTrue(_blockers({**SOURCE, "video_codec": "mpeg4"}))
+        self.assertTrue(_blockers({**SOURCE, "video_pix_fmt": "yuv422p10le"}))
+        self.assertTrue(_blockers({**SOURCE, "audio_codec": "opus"}))
+        self.assertIn("scaling requested", _blockers(max_height=720))
+        self.assertIn("frame-rate cap requested", _blockers({**SOURCE, "video_fps": 60.0}, max_output_fps=30))
+
+    def test_target_resolution_blocks_taller_sources(self):
+        self.assertIn("scaling requested", _blockers(target_resolution=720))
+        self.assertEqual(_blockers(target_resolution=2160), [])
+
+    def test_auto_crop_blocks_the_fast_path(self):
+        self.assertIn("auto crop requested", _blockers(auto_crop=True))
+
+    def test_forced_frame_decimation_blocks_the_fast_path(self):
+        self.assertIn("frame decimation requested", _blockers(frame_decimation="on"))
+        self.assertEqual(_blockers(frame_decimation="off"), [])
+
+    def test_size_check_can_be_deferred(self):
+        self.assertEqual(_blockers(input_size_bytes=0, check_size=False), [])
+        self.assertIn("scaling requested", _blockers(input_size_bytes=0, check_size=False, max_height=720))
+
+    def test_container_rules(self):
+        self.assertEqual(_blockers({**SOURCE, "video_codec": "vp9", "audio_codec": "opus"}, output_path="out.mkv"), [])
+        self.assertIn("rotation metadata", _blockers({**SOURCE, "rotation_degrees": 90}, output_path="out.mkv"))
+        self.assertEqual(_blockers({**SOURCE, "rotation_degrees": 90}), [])
+
+    def test_muted_output_ignores_source_audio_codec(self):
+        self.assertEqual(_blockers({**SOURCE, "audio_codec": "pcm_s16le"}, audio_codec="none"), [])
+
+    def test_bitrate_mode_compares_source_bitrate(self):
+        self.assertEqual(_blockers(input_size_bytes=50 * MB, target_video_bitrate_kbps=3000), [])
+        self.assertIn("source bitrate above target", _blockers(target_video_bitrate_kbps=2000))
+
+    def test_candidate_check_rejects_trims_and_large_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = Path(directory) / "in.mp4"
+            source.write_bytes(b"0" * 1024)
+            self.assertTrue(remux_candidate(str(source), "out.mp4", 1.0))
+            self.assertFalse(remux_candidate(str(source), "out.mp4", 0.0005))
+            self.assertFalse(remux_candidate(str(source), "out.mp4", 1.0, start_time="5"))
+            self.assertFalse(remux_candidate(str(source), "out.m4a", 1.0))
+            with patch.dict(os.environ, {"REMUX_FAST_PATH": "0"}):
+                self.assertFalse(remux_candidate(str(source), "out.mp4", 1.0))
+
+    def test_command_copies_streams_with_faststart(self):
+        cmd = remux_command("in.mov", "out.mp4", {**SOURCE, "video_codec": "hevc"}, keep_audio=True)
+        self.assertEqual(cmd[cmd.index("-c") + 1], "copy")
+        self.assertEqual(cmd[cmd.index("-movflags") + 1], "+faststart")
+        self.assertEqual(cmd[cmd.index("-tag:v") + 1], "hvc1")
+        muted = remux_command("in.mkv", "out.mkv", SOURCE, keep_audio=False)
+        self.assertIn("-an", muted)
+        self.assertNotIn("-movflags", muted)
+
+
+class _Task:
+    class Request:
+        id = "remux-test"
+
+    request = Request()
+
+
+class _CountingGate:
+    def __init__(self):
+        self.acquired = 0
+        self.released = 0
+
+    def current_limit(self):
+        return 1
+
+    def acquire(self, cancelled=None):
+        self.acquired += 1
+        return object()
+
+    def release(self, _lease):
+        self.released += 1
+
+
+class EncodeSlotDeferralTests(unittest.TestCase):
+    def _run(self, target_size_mb, body=lambda: None):
+        gate = _CountingGate()
+        with tempfile.TemporaryDirectory() as directory:
+            source = Path(directory) / "in.mp4"
+            source.write_bytes(b"0" * 1024)
+
+            @_cleanup_transient_input_after_task
+            def task(_self, **kwargs):
+                body()
+                return gate.acquired
+
+            with (
+                patch("worker.app.tasks._encode_gate", return_value=gate),
+                patch("worker.app.tasks._is_cancelled", return_value=False),
+            ):
+                held = task(
+                    _Task(), job_id="job", input_path=str(source),
+                    output_path=str(Path(directory) / "out.mp4"),
+                    target_size_mb=target_size_mb,
+                )
+        return gate, held
+
+    def test_remux_candidate_starts_without_a_slot(self):
+        gate, held = self._run(1.0)
+        self.assertEqual((held, gate.acquired, gate.released), (0, 0, 0))
+
+    def test_candidate_that_must_encode_takes_one_slot(self):
+        gate, held = self._run(1.0, body=lambda: (_acquire_encode_slot(), _acquire_encode_slot()))
+        self.assertEqual((held, gate.released), (1, 1))
+
+    def test_non_candidate_takes_slot_before_the_body(self):
+        gate, held = self._run(0.0005)
+        self.assertEqual((held, gate.released), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
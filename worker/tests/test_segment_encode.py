@@ -0,0 +1,164 @@
+"""Segment-parallel CPU encode planning and command derivation."""
+from __future__ import annotations
+
+import sys
+import unittest
+from unittest.mock import patch
+
+from worker.app.segments import (
+    command_video_kbps,
+    concat_command,
+    encoder_threads,
+    output_video_encoder,
+    plan_rate_repair,
+    plan_segments,
+    run_parallel,
+    segment_command,
+    segment_count,
+)
+
+
+BASE_CMD = [
+    "ffmpeg", "-hide_banner", "-y",
+    "-ss", "10", "-i", "in.mp4", "-t", "600",
+    "-c:v", "libx264", "-pix_fmt", "yuv420p",
+    "-vf", "scale=-2:'min(ih,720)'",
+    "-b:v", "900k", "-maxrate", "1080k", "-bufsize", "1800k",
+    "-preset", "faster", "-tune", "film",
+    "-c:a", "aac", "-b:a", "128k",
+    "-movflags", "+faststart",
+    "-progress", "pipe:2", "out.mp4",
+]
+
+
+class SegmentPlanTests(unittest.TestCase):
+    def test_count_follows_gate_limit_but_not_below_minimum_length(self):
+        self.assertEqual(segment_count(8, 3600), 8)
+        self.assertEqual(segment_count(8, 45), 2)
+        self.assertEqual(segment_count(8, 10), 1)
+        self.assertEqual(segment_count(0, 3600), 1)
+
+    def test_boundaries_snap_to_nearest_keyframe(self):
+        keyframes = [0.0, 98.0, 151.0, 203.0, 299.0, 390.0]
+        plan = plan_segments(0.0, 400.0, 4, keyframes)
+        self.assertEqual(plan, [(0.0, 98.0), (98.0, 203.0), (203.0, 299.0), (299.0, 400.0)])
+
+    def test_collapsed_boundaries_reduce_segment_count(self):
+        plan = plan_segments(0.0, 400.0, 4, [0.0, 200.0])
+        self.assertEqual(plan, [(0.0, 200.0), (200.0, 400.0)])
+
+    def test_missing_keyframes_use_even_split(self):
+        self.assertEqual(plan_segments(10.0, 130.0, 2), [(10.0, 70.0), (70.0, 130.0)])
+
+
+class SegmentCommandTests(unittest.TestCase):
+    def test_segment_command_is_video_only_with_own_range(self):
+        seg = segment_command(BASE_CMD, 70.0, 60.0, "seg.mp4", threads=4)
+        self.assertEqual(seg[-1], "seg.mp4")
+        self.assertIn("-an", seg)
+        for option in ("-c:a", "-b:a", "-movflags"):
+            self.assertNotIn(option, seg)
+        self.assertEqual(seg[seg.index("-ss") + 1], "70.000000")
+        self.assertLess(seg.index("-ss"), seg.index("-i"))
+        self.assertEqual(seg[seg.index("-t") + 1], "60.000000")
+        self.assertEqual(seg.count("-ss"), 1)
+        self.assertEqual(seg[seg.index("-b:v") + 1], "900k")
+        self.assertEqual(seg[seg.index("-threads") + 1], "4")
+        self.assertEqual(output_video_encoder(seg), "libx264")
+
+    def test_svtav1_segments_cap_their_level_of_parallelism(self):
+        svt = [token if token != "libx264" else "libsvtav1" for token in BASE_CMD]
+        with patch("worker.app.segments.os.cpu_count", return_value=16):
+            threads = encoder_threads("libsvtav1", 4)
+        self.assertEqual(threads, 4)
+        seg = segment_command(svt, 0.0, 60.0, "seg.mp4", threads=threads)
+        self.assertNotIn("-threads", seg)
+        self.assertEqual(seg[seg.index("-svtav1-params") + 1], "lp=3")
+
+        # An explicit SVTAV1_LP setting is merged, and a lower one is kept.
+        tuned = svt[:-3] + ["-svtav1-params", "tune=0:lp=2"] + svt[-3:]
+        seg = segment_command(tuned, 0.0, 60.0, "seg.mp4", threads=threads)
+        self.assertEqual(seg.count("-svtav1-params"), 1)
+        self.assertEqual(seg[seg.index("-svtav1-params") + 1], "tune=0:lp=2")
+
+    def test_decoder_selection_is_not_mistaken_for_the_encoder(self):
+        cmd = ["ffmpeg", "-c:v", "libdav1d", "-i", "in.mkv", "-c:v", "libsvtav1", "out.mkv"]
+        self.assertEqual(output_video_encoder(cmd), "libsvtav1")
+
+    def test_concat_copies_video_and_keeps_audio_and_container_flags(self):
+        joined = concat_command(BASE_CMD, "list.txt", 10.0, 600.0)
+        self.assertEqual(joined[joined.index("-f") + 1], "concat")
+        self.assertEqual(joined[joined.index("-c:v") + 1], "copy")
+        self.assertEqual(joined[joined.index("-c:a") + 1], "aac")
+        self.assertEqual(joined[joined.index("-movflags") + 1], "+faststart")
+        self.assertIn("in.mp4", joined)
+        self.assertEqual(joined[-1], "out.mp4")
+
+    def test_concat_for_muted_output_has_no_audio_input(self):
+        muted = [token for token in BASE_CMD if token not in {"-c:a", "aac", "-b:a", "128k"}]
+        muted.insert(muted.index("-movflags"), "-an")
+        joined = concat_command(muted, "list.txt", 0.0, 60.0)
+        self.assertNotIn("in.mp4", joined)
+        self.assertIn("-an", joined)
+
+
+class RateRepairTests(unittest.TestCase):
+    def test_only_highest_rate_segments_are_capped(self):
+        # 100 s segments at 10, 12, 20 and 30 kB/s; shed 1.2 MB.
+        sizes = [1_000_000, 1_200_000, 2_000_000, 3_000_000]
+        repair = plan_rate_repair(sizes, [100.0] * 4, 1_200_000)
+        self.assertEqual(sorted(repair), [2, 3])
+        self.assertAlmostEqual(repair[2], 1_900_000)
+        self.assertAlmostEqual(repair[3], 1_900_000)
+        self.assertAlmostEqual(sum(sizes) - sum(repair.values()) - sizes[0] - sizes[1], 1_200_000)
+
+    def test_rate_uses_segment_duration(self):
+        repair = plan_rate_repair([1_000_000, 1_000_000], [50.0, 200.0], 100_000)
+        self.assertEqual(sorted(repair), [0])
+
+    def test_nothing_to_repair_or_impossible(self):
+        self.assertEqual(plan_rate_repair([100, 100], [1.0, 1.0], 0), {})
+        self.assertEqual(plan_rate_repair([100, 100], [1.0, 1.0], 500), {})
+
+    def test_bitrate_is_read_from_command(self):
+        self.assertEqual(command_video_kbps(BASE_CMD), 900.0)
+        self.assertIsNone(command_video_kbps(["ffmpeg", "-i", "in.mp4", "out.mp4"]))
+
+    def test_repair_join_copies_audio_from_first_output(self):
+        joined = concat_command(BASE_CMD, "list.txt", 10.0, 600.0, audio_source="first.mp4")
+        self.assertIn("first.mp4", joined)
+        self.assertNotIn("in.mp4", joined)
+        self.assertEqual(joined[joined.index("-c:a") + 1], "copy")
+        self.assertNotIn("-b:a", joined)
+
+
+class RunParallelTests(unittest.TestCase):
+    def _script(self, body: str) -> list[str]:
+        return [sys.executable, "-c", body, "out"]
+
+    def test_progress_is_summed_and_success_reported(self):
+        body = "import sys; print('out_time_ms=2000000', file=sys.stderr, flush=True)"
+        seen: list[float] = []
+        rc, cancelled, _ = run_parallel(
+            [self._script(body), self._script(body)],
+            on_progress=lambda total, _done: seen.append(total),
+            poll_interval=0.05,
+        )
+        self.assertEqual((rc, cancelled), (0, False))
+        self.assertEqual(max(seen), 4.0)
+
+    def test_one_failure_stops_the_other_segments(self):
+        slow = self._script("import time; time.sleep(30)")
+        failing = self._script("import sys; print('boom', file=sys.stderr); sys.exit(3)")
+        rc, cancelled, tail = run_parallel([slow, failing], poll_interval=0.05)
+        self.assertEqual((rc, cancelled), (3, False))
+        self.assertIn("boom", tail)
+
+    def test_cancellation_stops_all_processes(self):
+        slow = self._script("import time; time.sleep(30)")
+        rc, cancelled, _ = run_parallel([slow, slow], cancelled=lambda: True, poll_interval=0.05)
+        self.assertTrue(cancelled)
+
+
+if __name__ == "__main__":
+    unittest.main()
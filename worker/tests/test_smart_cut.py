@@ -0,0 +1,88 @@
+"""Smart cut: keyframe plans, piece commands and the join."""
+from __future__ import annotations
+
+import unittest
+
+from worker.app.smart_cut import (
+    copy_command,
+    edge_command,
+    join_command,
+    plan_smart_cut,
+    range_bytes_estimate,
+    smart_cut_blockers,
+)
+
+H264_INFO = {
+    "video_codec": "h264",
+    "video_profile": "High",
+    "video_pix_fmt": "yuv420p",
+    "video_bitrate_kbps": 4000,
+}
+
+
+class PlanTests(unittest.TestCase):
+    def test_edges_are_encoded_and_whole_gops_copied(self):
+        plan = plan_smart_cut([0.0, 2.0, 4.0, 6.0, 8.0, 10.0], 1.5, 9.0)
+        self.assertEqual(plan, [("encode", 1.5, 2.0), ("copy", 2.0, 8.0), ("encode", 8.0, 9.0)])
+
+    def test_cut_on_keyframes_is_a_single_copy(self):
+        self.assertEqual(plan_smart_cut([0.0, 2.0, 4.0, 6.0], 2.0, 6.0), [("copy", 2.0, 6.0)])
+
+    def test_too_little_to_copy_returns_none(self):
+        self.assertIsNone(plan_smart_cut([0.0, 10.0], 1.0, 9.0))
+        self.assertIsNone(plan_smart_cut([0.0, 2.0, 3.0], 1.5, 3.5))
+
+    def test_keyframes_are_planned_from_the_source_start_time(self):
+        # MPEG-TS timestamps start around 1.4 s; -ss counts from there.
+        keyframes = [1.4, 3.4, 5.4, 7.4, 9.4, 11.4]
+        plan = plan_smart_cut(keyframes, 1.5, 9.0, origin_s=1.4)
+        self.assertEqual(
+            [(kind, round(start, 6), round(end, 6)) for kind, start, end in plan],
+            [("encode", 1.5, 2.0), ("copy", 2.0, 8.0), ("encode", 8.0, 9.0)],
+        )
+
+
+class CommandTests(unittest.TestCase):
+    def test_edge_matches_source_parameters(self):
+        command = edge_command("in.mp4", 1.5, 2.0, "p0.ts", H264_INFO)
+        self.assertLess(command.index("-ss"), command.index("-i"))
+        self.assertEqual(command[command.index("-c:v") + 1], "libx264")
+        self.assertEqual(command[command.index("-profile:v") + 1], "high")
+        self.assertEqual(command[command.index("-pix_fmt") + 1], "yuv420p")
+        self.assertEqual(command[command.index("-b:v") + 1], "4000k")
+        self.assertEqual(command[-3:], ["-f", "mpegts", "p0.ts"])
+
+    def test_copy_piece_seeks_past_the_keyframe(self):
+        command = copy_command("in.mp4", 2.0, 8.0, "p1.ts")
+        self.assertEqual(command[command.index("-ss") + 1], "2.001000")
+        self.assertEqual(command[command.index("-t") + 1], "6.000000")
+        self.assertEqual(command[command.index("-c:v") + 1], "copy")
+
+    def test_join_copies_audio_and_tags_in_band_parameter_sets(self):
+        command = join_command("pieces.txt", "in.mp4", 1.5, 7.5, "out.mp4", H264_INFO, keep_audio=True)
+        self.assertEqual(command.count("-i"), 2)
+        self.assertIn("1:a:0?", command)
+        self.assertEqual(command[command.index("-tag:v") + 1], "avc3")
+        mute = join_command("pieces.txt", "in.mp4", 1.5, 7.5, "out.mkv", H264_INFO, keep_audio=False)
+        self.assertEqual(mute.count("-i"), 1)
+        self.assertNotIn("-tag:v", mute)
+
+
+class BlockerTests(unittest.TestCase):
+    def test_needs_a_matching_cpu_encoder(self):
+        self.assertEqual(smart_cut_blockers(H264_INFO, {"libx264"}), [])
+        self.assertTrue(smart_cut_blockers(H264_INFO, {"libx265"}))
+        self.assertTrue(smart_cut_blockers({"video_codec": "vp9"}))
+
+    def test_rotated_sources_are_not_smart_cut(self):
+        portrait = {**H264_INFO, "rotation_degrees": 90}
+        self.assertEqual(smart_cut_blockers(portrait, {"libx264"}), ["rotation metadata"])
+        self.assertEqual(smart_cut_blockers({**H264_INFO, "rotation_degrees": 360}, {"libx264"}), [])
+
+    def test_range_estimate_uses_average_bitrate(self):
+        self.assertEqual(range_bytes_estimate(100_000, 100.0, 25.0), 25_000)
+        self.assertEqual(range_bytes_estimate(100_000, 0.0, 25.0), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
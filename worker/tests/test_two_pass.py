@@ -0,0 +1,124 @@
+"""Two-pass commands and the reusable pass-1 statistics cache."""
+from __future__ import annotations
+
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from worker.app.ffmpeg_helpers import replace_bitrate_args, reuse_audio_from
+from worker.app.two_pass import (
+    cached_stats,
+    first_pass_command,
+    prune_stats,
+    second_pass_command,
+    source_fingerprint,
+    stats_key,
+    store_stats,
+    two_pass_enabled,
+)
+
+COMMAND = [
+    "ffmpeg", "-hide_banner", "-y", "-i", "in.mp4",
+    "-c:v", "libx264", "-vf", "scale=-2:720", "-b:v", "1000k", "-maxrate", "1200k", "-bufsize", "2000k",
+    "-preset", "medium", "-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart",
+    "-progress", "pipe:2", "out.mp4",
+]
+
+
+class CommandTests(unittest.TestCase):
+    def test_x264_passes_share_the_log_prefix(self):
+        first = first_pass_command(COMMAND, "libx264", "/tmp/job/pass")
+        self.assertEqual(first[-3:], ["-f", "null", "-"])
+        self.assertIn("-an", first)
+        self.assertNotIn("-c:a", first)
+        self.assertNotIn("-movflags", first)
+        self.assertEqual(first[first.index("-pass") + 1], "1")
+        self.assertEqual(first[first.index("-progress") + 1], "pipe:2")
+        second = second_pass_command(COMMAND, "libx264", "/tmp/job/pass")
+        self.assertEqual(second[-1], "out.mp4")
+        self.assertEqual(second[second.index("-pass") + 1], "2")
+        self.assertEqual(second[second.index("-passlogfile") + 1], "/tmp/job/pass")
+        self.assertEqual(second[second.index("-b:a") + 1], "128k")
+
+    def test_x265_uses_escaped_stats_parameter(self):
+        command = [*COMMAND]
+        command[command.index("libx264")] = "libx265"
+        first = first_pass_command(command, "libx265", r"C:\tmp\pass")
+        params = first[first.index("-x265-params") + 1]
+        self.assertEqual(params, r"pass=1:stats=C\:\\tmp\\pass-0.log:slow-firstpass=0")
+        second = second_pass_command(command, "libx265", "/tmp/pass")
+        self.assertEqual(second[second.index("-x265-params") + 1], "pass=2:stats=/tmp/pass-0.log")
+
+    def test_first_pass_ignores_reused_audio_input(self):
+        retry = reuse_audio_from(COMMAND, "first.mp4")
+        first = first_pass_command(retry, "libx264", "/tmp/pass")
+        self.assertEqual(first.count("-i"), 1)
+        self.assertNotIn("-map", first)
+
+
+class StatsKeyTests(unittest.TestCase):
+    def test_key_ignores_rate_and_audio_but_not_video_options(self):
+        key = stats_key(COMMAND, "abc")
+        self.assertEqual(stats_key(replace_bitrate_args(COMMAND, 700), "abc"), key)
+        self.assertEqual(stats_key(reuse_audio_from(COMMAND, "first.mp4"), "abc"), key)
+        scaled = [*COMMAND]
+        scaled[scaled.index("scale=-2:720")] = "scale=-2:480"
+        self.assertNotEqual(stats_key(scaled, "abc"), key)
+        self.assertNotEqual(stats_key(COMMAND, "def"), key)
+
+    def test_fingerprint_follows_content_not_path(self):
+        with tempfile.TemporaryDirectory() as directory:
+            first = Path(directory, "a.mp4")
+            second = Path(directory, "b.mp4")
+            payload = os.urandom(3 * 1024)
+            first.write_bytes(payload)
+            second.write_bytes(payload)
+            self.assertEqual(
+                source_fingerprint(str(first), sample_bytes=1024),
+                source_fingerprint(str(second), sample_bytes=1024),
+            )
+            second.write_bytes(payload[:-1] + b"x")
+            self.assertNotEqual(
+                source_fingerprint(str(first), sample_bytes=1024),
+                source_fingerprint(str(second), sample_bytes=1024),
+            )
+            self.assertIsNone(source_fingerprint(str(Path(directory, "missing.mp4"))))
+
+    def test_env_default_and_request_override(self):
+        with patch.dict(os.environ, {"TWO_PASS": "1"}):
+            self.assertTrue(two_pass_enabled(None))
+            self.assertFalse(two_pass_enabled(False))
+        with patch.dict(os.environ, {"TWO_PASS": ""}):
+            self.assertFalse(two_pass_enabled(None))
+
+
+class StatsCacheTests(unittest.TestCase):
+    def test_store_then_reuse_and_prune(self):
+        with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as scratch:
+            prefix = os.path.join(scratch, "pass")
+            Path(f"{prefix}-0.log").write_text("#options: 1280x720\n", encoding="utf-8")
+            Path(f"{prefix}-0.log.mbtree").write_bytes(b"\0" * 16)
+            with patch.dict(os.environ, {"TWO_PASS_STATS_DIR": root}):
+                self.assertIsNone(cached_stats("k1"))
+                stored = store_stats("k1", prefix)
+                self.assertEqual(stored, os.path.join(root, "k1", "pass"))
+                self.assertTrue(Path(f"{stored}-0.log.mbtree").is_file())
+                self.assertEqual(cached_stats("k1"), stored)
+                # A second store of the same key keeps the first entry.
+                self.assertEqual(store_stats("k1", prefix), stored)
+
+                for name in ("k2", "k3"):
+                    Path(root, name).mkdir()
+                old = time.time() - 3600
+                os.utime(Path(root, "k2"), (old, old))
+                prune_stats(Path(root), keep="k1", max_entries=2)
+                self.assertEqual(sorted(os.listdir(root)), ["k1", "k3"])
+                prune_stats(Path(root), max_entries=10, max_age_s=0.0)
+                self.assertEqual(os.listdir(root), [])
+
+
+if __name__ == "__main__":
+    unittest.main()